@@ -5,13 +5,14 @@ Main GUI window of bacterio
 from tkinter import *
 
 import app.hexafield as hexafield
-import app.model as model
+import app.engines as engines
 import app.model_params as model_params
-import app.state_generator as state_generator
 import app.state as state
 import app.palette as palette
 import app.config as config
-from app.tracewriter import TraceWriter
+from app.tracewriter import create_trace_writer
+from app.runner import get_halt_reason, create_initial_state
+from app.simulation import SimulationClient
 
 
 DEFAULT_PALETTE_FILE = 'config/palette.ini'
@@ -26,7 +27,7 @@ class MainWindow(object):
     __slots__ = ('tk', 'height', 'width', 'conv', 'palette', 'canvas', 'model', 
         'displayCoords', 'displayTotal', 'traceWriter', 'currentStep',
         'haltReason', 'numBacteria', 'numPredators', 'currHexCoords',
-        'play', 'stepDelay')
+        'play', 'stepDelay', 'cellItems', 'cellFills', 'simulation')
     
     def __init__(self, tk):
         '''
@@ -40,36 +41,36 @@ class MainWindow(object):
         self.palette = palette.load_palette(DEFAULT_PALETTE_FILE)
         self.canvas = Canvas(self.tk, width=miscParams.width, height=miscParams.height, bg=self.palette.background)
         self.canvas.pack()
-        if conf.fieldParams.stateFile is None:
-            initState = state_generator.generate_state(conf.fieldParams.radius,conf.fieldParams.initBacteria,conf.fieldParams.initPredators,conf.modelParams)
+        self.stepDelay = miscParams.stepDelay
+        self.traceWriter = None
+        self.simulation = None
+        if miscParams.simulationProcess:
+            trace = None
+            if miscParams.writeTrace:
+                trace = (conf, miscParams.traceFilePrefix, miscParams.traceFormat, (), miscParams.traceEvery, miscParams.traceMinMax)
+            self.simulation = SimulationClient(conf.engineParams, conf.modelParams, create_initial_state(conf), trace)
+            self.simulation.wait_frame()
+            self.model = self.simulation
         else:
-            initState = state.load_state(conf.fieldParams.stateFile)
-        self.model = model.RapidBacteriaModel(conf.modelParams, initState)
+            self.model = engines.create_model(conf.engineParams, conf.modelParams, create_initial_state(conf))
         self.displayCoords = self.canvas.create_text(miscParams.width-200,miscParams.height-75, anchor=W, fill=self.palette.text,font='Consolas 14 bold', text="")
         self.displayTotal = self.canvas.create_text(15,miscParams.height-75, anchor=W, fill=self.palette.text,font='Consolas 14 bold', text="")
         self.init_board_state()
         self.canvas.bind("<Motion>", self.on_canvas_mouse_move)
         self.init_menu()
-        if miscParams.writeTrace:
-            self.traceWriter = TraceWriter(conf)
+        if miscParams.writeTrace and self.simulation is None:
+            self.traceWriter = create_trace_writer(conf, miscParams.traceFilePrefix, miscParams.traceFormat,
+                every=miscParams.traceEvery, minMax=miscParams.traceMinMax)
             self.traceWriter.write(self.currentStep, self.numBacteria, self.numPredators)
-        else:
-            self.traceWriter = None
-        self.stepDelay = miscParams.stepDelay
-    
-    def calculate_max_hex_radius(self):
-        radius = self.model.field.get_max_coord_value()
-        return min( self.width/(2.0*(2.0*radius+1)), self.height/(2.0*hexafield.SQRT3D2*(2.0*radius+1)) )
+        if self.simulation is not None:
+            self.poll_simulation()
     
     def init_board_state(self):
-        self.conv = hexafield.HexCoordConverter( 
-                    leftHex0 = self.width/2,
-                    topHex0 = self.height/2,
-                    hexRadius = self.calculate_max_hex_radius() )
+        self.conv = hexafield.fit_hex_converter(self.model.field, self.width, self.height)
         self.currentStep = 0
         self.haltReason = ''
-        self.numBacteria = self.model.count_bacteria()
-        self.numPredators = self.model.count_predators()
+        self.read_stats()
+        self.create_field()
         self.draw_field()
         self.currHexCoords = None
         self.play = False
@@ -107,35 +108,59 @@ class MainWindow(object):
         self.tk.bind('<Button-2>', lambda evt: self.clear_cell())
         
     
-    def draw_field(self): 
+    def get_cell_fill(self, numBacteria, numPredators):
+        if numBacteria>0:
+            if numPredators>0:
+                return self.palette.both
+            return self.palette.bacteria
+        if numPredators>0:
+            return self.palette.predator
+        return ''
+
+    def create_field(self):
+        '''
+        Creates polygons of all cells (once per board, draw_field only changes their fills).
+        Polygons are ordered as cells of the field's CellIndex
+        '''
         self.canvas.delete('field')
-        for hc in self.model.field._field:
-            fill = ''
-            if hc in self.model.bacteriaPositions:
-                if hc in self.model.predatorPositions:
-                    fill = self.palette.both
-                else:
-                    fill = self.palette.bacteria
-            elif hc in self.model.predatorPositions:
-                fill = self.palette.predator
-            self.canvas.create_polygon(self.conv.get_hex_vertices(hc),
-                outline=self.palette.grid, fill=fill, width=2, tag='field')
-        self.canvas.itemconfigure(self.displayTotal, text="Step %d\nBacteria: %d\nPredators: %d\n%s" 
-                % (self.currentStep, self.numBacteria, self.numPredators, self.haltReason) )
+        index = self.model.field.get_cell_index()
+        self.cellItems = [ self.canvas.create_polygon(self.conv.get_hex_vertices(index.get_cell(i)),
+            outline=self.palette.grid, fill='', width=2, tag='field') for i in range(len(index)) ]
+        self.cellFills = ['']*len(index)
+
+    def draw_field(self): 
+        cells, bacteria, predators = self.model.pop_cell_counts()
+        if cells is None:
+            cells = range(len(self.cellItems))
+        for i, numBacteria, numPredators in zip(cells, bacteria, predators):
+            fill = self.get_cell_fill(numBacteria, numPredators)
+            if fill!=self.cellFills[i]:
+                self.canvas.itemconfigure(self.cellItems[i], fill=fill)
+                self.cellFills[i] = fill
+        stats = self.model.stats
+        energy = ''
+        if stats.numPredators>0:
+            energy = 'Energy: %d/%.1f/%d' % (stats.energyMin, stats.energy_mean(), stats.energyMax)
+        self.canvas.itemconfigure(self.displayTotal, text="Step %d\nBacteria: %d in %d cells\nPredators: %d in %d cells\n%s\n%s"
+                % (self.currentStep, self.numBacteria, stats.bacteriaCells, self.numPredators, stats.predatorCells, energy, self.haltReason) )
+
+    def read_stats(self):
+        '''
+        Reads populations from model's statistics
+        '''
+        self.numBacteria = self.model.stats.numBacteria
+        self.numPredators = self.model.stats.numPredators
 
     def on_canvas_mouse_move(self, event):
         hexCoords = self.conv.plain_to_hex(event.x,event.y)
         if hexCoords!=self.currHexCoords:
             if hexCoords in self.model.field._field:
                 self.currHexCoords = hexCoords
-                numBacteria = 0
-                if hexCoords in self.model.bacteriaPositions:
-                    numBacteria = len(self.model.bacteriaPositions[hexCoords])
-                numPredators = 0
+                numBacteria = self.model.count_bacteria_at(hexCoords)
+                numPredators = self.model.count_predators_at(hexCoords)
                 prEnergy = ''
-                if hexCoords in self.model.predatorPositions:
-                    numPredators = len(self.model.predatorPositions[hexCoords])
-                    prEnergy = str([x.energy for x in self.model.predatorPositions[hexCoords]])
+                if numPredators>0 and self.simulation is None:
+                    prEnergy = str(self.model.get_predator_energies(hexCoords))
                 self.canvas.itemconfigure(self.displayCoords, text="x=%d, y=%d, z=%d\nBacteria: %d\nPredators: %d\n%s" 
                     % (hexCoords.x, hexCoords.y, -hexCoords.x-hexCoords.y, numBacteria, numPredators, prEnergy) )
             else:
@@ -146,18 +171,38 @@ class MainWindow(object):
     def stop_play_or_step(self):
         if self.play:
             self.play = False
+            if self.simulation is not None:
+                self.simulation.play(False)
         else:
             self.step()
         
     def start_play(self):
         self.play = True
+        if self.simulation is not None:
+            self.simulation.play(True)
+            return
         self.step()
         
+    def poll_simulation(self):
+        '''
+        Draws the latest step computed by simulation process (if it's new) and schedules the next poll
+        '''
+        if self.simulation.refresh():
+            self.currentStep = self.simulation.currentStep
+            self.read_stats()
+            self.haltReason = self.simulation.haltReason
+            if self.haltReason!='':
+                self.play = False
+            self.draw_field()
+        self.tk.after(self.stepDelay, self.poll_simulation)
+
     def step(self):
+        if self.simulation is not None:
+            self.simulation.step()
+            return
         self.model.step()
         self.currentStep+=1
-        self.numBacteria = self.model.count_bacteria()
-        self.numPredators = self.model.count_predators()
+        self.read_stats()
         if self.traceWriter is not None:
             self.traceWriter.write(self.currentStep, self.numBacteria, self.numPredators)
         if self.check_for_halt():
@@ -167,20 +212,15 @@ class MainWindow(object):
             self.tk.after(self.stepDelay,self.step)
     
     def check_for_halt(self):
-        if self.numPredators==0:
-            self.haltReason = 'No more predators left'
-            return True
-        if self.numBacteria==0:
-            self.haltReason = 'No more bacteria left'
-            return True
-        return False
+        self.haltReason = get_halt_reason(self.numBacteria, self.numPredators)
+        return self.haltReason!=''
     
     def open_state(self):
         self.model.parse_state(state.load_state_dlg())
         self.init_board_state()
         
     def save_state(self):
-        state.save_state_dlg(state.BacterioState(self.model.field, self.model.bacteriaPositions, self.model.predatorPositions))
+        state.save_state_dlg(self.model.get_state())
     
     
     def proceed_cell_change(self):
@@ -191,28 +231,26 @@ class MainWindow(object):
         if self.currHexCoords is None:
             return
         self.model.add_bacteria(self.currHexCoords)
-        self.numBacteria += 1
+        self.read_stats()
         self.proceed_cell_change()
     
     def add_predator(self):
         if self.currHexCoords is None:
             return
         self.model.add_predator(self.currHexCoords)
-        self.numPredators += 1
+        self.read_stats()
         self.proceed_cell_change()
     
     def clear_cell(self):
         if self.currHexCoords is None:
             return
         self.model.clear_cell(self.currHexCoords)
-        self.numBacteria = self.model.count_bacteria()
-        self.numPredators = self.model.count_predators()
+        self.read_stats()
         self.proceed_cell_change()
     
     def clear_board(self):
         self.model.clear_all()
-        self.numBacteria = 0
-        self.numPredators = 0
+        self.read_stats()
         self.proceed_cell_change()
        
        
@@ -221,4 +259,8 @@ if __name__=='__main__':
     root.title('Bacterio')
     main = MainWindow(root)
     root.mainloop()
+    if main.traceWriter is not None:
+        main.traceWriter.close()
+    if main.simulation is not None:
+        main.simulation.close()
 
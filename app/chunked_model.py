@@ -0,0 +1,41 @@
+'''
+Describes bacterio models for very large sparsely populated fields
+'''
+
+from app.counting_model import CountingCoreModel, CountingRapidBacteriaModel
+from app.hexdisc import ChunkedDiscSums
+
+
+class ChunkedCoreModel(CountingCoreModel):
+    '''
+    Describes the same model as counting_model.CountingCoreModel but nothing it keeps depends on
+    the size of the field: creatures are kept in dicts of occupied cells, overcrowd checks are answered
+    by hexdisc.ChunkedDiscSums (only chunks of the plane around occupied cells are allocated and they are
+    dropped when creatures leave) and distances to the closest bacteria are cached in a dict of predators'
+    cells instead of hexafield.CellIndex. So step time and memory are proportional to the populated area
+    and the field could be huge (e.g. implicit HexagonHexafield or RectangleHexafield) as long as
+    its population is sparse. On densely populated fields other models are faster.
+    '''
+    __slots__ = ()
+
+    discSumsClass = ChunkedDiscSums
+
+    def find_closest_bacteria(self, hexCoords):
+        '''
+        Returns position of the closest bacteria within PR_SIGHT (or None).
+        Equidistant bacteria are chosen randomly.
+        Distances found during predator phase are kept for the searched cells only (eaten bacteria
+        could make stored distance smaller than the real one but never bigger)
+        '''
+        distances = self._bacteriaDistances
+        if distances is None:
+            distances = self._bacteriaDistances = dict()
+        res, distances[hexCoords] = self.search_bacteria(hexCoords, distances.get(hexCoords, 0))
+        return res
+
+
+class ChunkedRapidBacteriaModel(ChunkedCoreModel, CountingRapidBacteriaModel):
+    '''
+    Describes the same model as counting_model.CountingRapidBacteriaModel for very large sparsely populated fields
+    '''
+    __slots__ = ()
@@ -7,16 +7,30 @@ import configparser
 
 import app.model_params as model_params
 
-Rules = namedtuple('Rules', ['fieldParams', 'modelParams'])
-FieldParams = namedtuple('FieldParams', ['stateFile', 'radius', 'initBacteria', 'initPredators'])
-MiscParams = namedtuple('MiscParams', ['height', 'width', 'writeTrace', 'traceFilePrefix', 'stepDelay'])
+Rules = namedtuple('Rules', ['fieldParams', 'modelParams', 'engineParams'])
+FieldParams = namedtuple('FieldParams', ['stateFile', 'radius', 'initBacteria', 'initPredators', 'shape', 'width', 'height',
+    'density', 'perCell', 'seed'])
+EngineParams = namedtuple('EngineParams', ['model', 'workers'])
+MiscParams = namedtuple('MiscParams', ['height', 'width', 'writeTrace', 'traceFilePrefix', 'traceFormat', 'traceEvery', 'traceMinMax', 'stepDelay', 'simulationProcess'])
 
 def default_field_params():
     return FieldParams(
             stateFile = None,
             radius = 15,
             initBacteria = 200,
-            initPredators = 20)
+            initPredators = 20,
+            shape = 'circle',
+            width = 0,
+            height = 0,
+            density = None,
+            perCell = 1,
+            seed = None)
+
+
+def default_engine_params():
+    return EngineParams(
+            model = 'rapid',
+            workers = 0)
     
             
 def default_misc_params():
@@ -25,13 +39,18 @@ def default_misc_params():
             width = 1024,
             writeTrace = False,
             traceFilePrefix = None,
-            stepDelay = 25)
+            traceFormat = 'btf',
+            traceEvery = 1,
+            traceMinMax = False,
+            stepDelay = 25,
+            simulationProcess = False)
 
 
 def default_rules():
     return Rules(
             fieldParams = default_field_params(),
-            modelParams = model_params.default_model_params())
+            modelParams = model_params.default_model_params(),
+            engineParams = default_engine_params())
 
 
 def load_rules(fileName):
@@ -50,8 +69,27 @@ def load_rules(fileName):
                     stateFile = sectionField.get('stateFile', fallback=None),
                     radius = sectionField.getint('radius', fallback=2),
                     initBacteria = sectionField.getint('initBacteria', fallback=0),
-                    initPredators = sectionField.getint('initPredators', fallback=0)),
-        modelParams = model_params.load_model_params(sectionModel))
+                    initPredators = sectionField.getint('initPredators', fallback=0),
+                    shape = sectionField.get('shape', fallback='circle'),
+                    width = sectionField.getint('width', fallback=0),
+                    height = sectionField.getint('height', fallback=0),
+                    density = sectionField.get('density', fallback=None),
+                    perCell = sectionField.getint('perCell', fallback=1),
+                    seed = sectionField.getint('seed', fallback=None)),
+        modelParams = model_params.load_model_params(sectionModel),
+        engineParams = load_engine_params(config))
+
+
+def load_engine_params(config):
+    '''
+    Loads EngineParams from 'ENGINE' section of parsed INI file (if there is no such section returns default_engine_params())
+    '''
+    if not 'ENGINE' in config:
+        return default_engine_params()
+    sectionEngine = config['ENGINE']
+    return EngineParams(
+        model = sectionEngine.get('model', fallback='rapid'),
+        workers = sectionEngine.getint('workers', fallback=0))
 
 
 def load_misc_params(fileName):
@@ -69,4 +107,8 @@ def load_misc_params(fileName):
         width = sectionMisc.getint('width'),
         writeTrace = sectionMisc.getboolean('writeTrace'),
         traceFilePrefix = sectionMisc['traceFilePrefix'],
-        stepDelay = sectionMisc.getint('stepDelay'))
+        traceFormat = sectionMisc.get('traceFormat', fallback='btf'),
+        traceEvery = sectionMisc.getint('traceEvery', fallback=1),
+        traceMinMax = sectionMisc.getboolean('traceMinMax', fallback=False),
+        stepDelay = sectionMisc.getint('stepDelay'),
+        simulationProcess = sectionMisc.getboolean('simulationProcess', fallback=False))
@@ -0,0 +1,135 @@
+'''
+Describes bacterio models which store bacteria as per-cell counts
+'''
+
+import random
+
+from app.model import CoreModel
+from app.rand_p import split_uniformly
+from app.creatures import Bacteria
+from app.state import BacterioState, PackedBacterioState
+
+
+class CountingCoreModel(CoreModel):
+    '''
+    Describes the same model as model.CoreModel but bacteria (which have no state) are stored
+    as numbers: 'bacteriaPositions' is dict with keys HexCoords and values numbers of bacteria (>0).
+    Bacteria of a cell are stepped all at once: number of divided ones is binomial (P_BACT_DIVIDE),
+    number of staying ones among the rest is binomial (P_BACT_STAY) and the rest are split
+    among possible moves uniformly (multinomial, see rand_p.split_uniformly). Both binomials and
+    the multinomial are drawn in O(1) per cell (see rand_p.BernoulliSampler.count), so there are no
+    Bacteria objects and time of a step depends on number of occupied cells, not on number of bacteria.
+    Predators are the same as in CoreModel.
+    '''
+    __slots__ = ()
+
+    def parse_state(self, state):
+        '''
+        state is state.BacretioState
+        '''
+        if isinstance(state, PackedBacterioState):
+            counts = state.get_bacteria_counts()
+        else:
+            counts = { hc:len(bacts) for hc, bacts in state.bacteriaPositions.items() if len(bacts)>0 }
+        CoreModel.parse_state(self, BacterioState(state.field, dict(), state.predatorPositions))
+        self.bacteriaPositions = counts
+        self.stats.numBacteria = sum(counts.values())
+        self.stats.bacteriaCells = len(counts)
+
+    def get_bacteria_moves(self, hexCoords):
+        '''
+        Returns tuple of HexCoords where bacterium from given cell could move
+        '''
+        return self.field.get_neighbours(hexCoords)
+
+    def step_bacteria(self):
+        self.bacteriaPositions, born = self.spread_bacteria(self.bacteriaPositions.items())
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        self.update_bacteria_stats(born)
+
+    def spread_bacteria(self, cells):
+        '''
+        Steps bacteria of given cells (iterable of (HexCoords, number of bacteria)).
+        Returns dict (HexCoords -> number of bacteria) of their new positions and number of divisions
+        '''
+        samplers = self.samplers
+        newBacteriaPositions = dict()
+        born = 0
+        for hc, n in cells:
+            divided = samplers.P_BACT_DIVIDE.count(n) if self.check_bacteria_overcrowd(hc) else 0
+            born += divided
+            stayed = samplers.P_BACT_STAY.count(n-divided)
+            moved = n-divided-stayed
+            if divided+stayed>0:
+                newBacteriaPositions[hc] = newBacteriaPositions.get(hc, 0)+2*divided+stayed
+            if moved>0:
+                moves = self.get_bacteria_moves(hc)
+                if moved==1:
+                    newPos = random.choice(moves)
+                    newBacteriaPositions[newPos] = newBacteriaPositions.get(newPos, 0)+1
+                else:
+                    for newPos, num in zip(moves, split_uniformly(moved, len(moves))):
+                        if num>0:
+                            newBacteriaPositions[newPos] = newBacteriaPositions.get(newPos, 0)+num
+        return newBacteriaPositions, born
+
+    def eat_bacteria(self, hexCoords):
+        n = self.bacteriaPositions.get(hexCoords, 0)
+        if n==0:
+            return False
+        if n==1:
+            self.bacteriaPositions.pop(hexCoords)
+        else:
+            self.bacteriaPositions[hexCoords] = n-1
+        self._bacteriaSums.valid = False
+        return True
+
+
+    def count_bacteria_at(self, hexCoords):
+        '''
+        Returns number of bacteria in given cell
+        '''
+        return self.bacteriaPositions.get(hexCoords, 0)
+
+    def get_state(self):
+        '''
+        Returns current state as state.BacterioState
+        '''
+        bacteriaPositions = { hc:[Bacteria() for i in range(n)] for hc, n in self.bacteriaPositions.items() }
+        return BacterioState(self.field, bacteriaPositions, self.predatorPositions)
+
+
+    def check_bacteria_overcrowd(self, hexCoords):
+        '''
+        Checks if number of bacteria near hexCoords in radius BACT_OVERCROWD_RADIUS less than BACT_OVERCROWD
+        '''
+        if self.modelParams.BACT_OVERCROWD<=0:
+            return True
+        sums = self._bacteriaSums
+        if not sums.valid:
+            sums.rebuild((hc.x, hc.y, n) for hc, n in self.bacteriaPositions.items())
+        return sums.get_sum(hexCoords.x, hexCoords.y)<self.modelParams.BACT_OVERCROWD
+
+    def add_bacteria(self, hexCoords):
+        '''
+        Adds bacteria to given cell
+        '''
+        if not hexCoords in self.bacteriaPositions:
+            self.stats.bacteriaCells += 1
+        self.bacteriaPositions[hexCoords] = self.bacteriaPositions.get(hexCoords, 0)+1
+        self.stats.numBacteria += 1
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        if self._changedCells is not None:
+            self._changedCells.add(hexCoords)
+
+
+class CountingRapidBacteriaModel(CountingCoreModel):
+    '''
+    Describes the same model as model.RapidBacteriaModel with bacteria stored as per-cell counts
+    '''
+    __slots__ = ()
+
+    def get_bacteria_moves(self, hexCoords):
+        return self.field.get_at_exact_range(hexCoords, self.modelParams.BACT_VELOCITY)
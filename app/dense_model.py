@@ -0,0 +1,449 @@
+'''
+Describes bacterio models which keep their state in flat per-cell arrays
+'''
+
+import random
+from array import array
+from collections import Counter
+
+from app.hexafield import OffsetTable, count_cells_within
+from app.model_params import compile_samplers
+from app.state import PackedBacterioState
+from app.hexdisc import HexDiscSums
+from app.model_stats import ModelStats
+
+
+class DenseCoreModel(object):
+    '''
+    Describes the same model as model.CoreModel but cells are addressed by dense
+    integer indices (see hexafield.CellIndex) instead of HexCoords.
+    'field' is HexafieldBase instance,
+    'modelParams' is ModelParams instance,
+    'samplers' is model_params.Samplers compiled from modelParams,
+    'index' is hexafield.CellIndex of the field,
+    'bacteria' and 'predatorCounts' are arrays of numbers of bacteria and predators per cell,
+    'predatorCells' and 'predatorEnergies' are arrays of each predator's cell index and energy,
+    'bacteriaCells' is set of indices of cells with bacteria,
+    'stats' is model_stats.ModelStats.
+    Overcrowd checks are answered by hexdisc.HexDiscSums, changed cells are tracked and 'stats' are updated
+    (see model.CoreModel). Hunting predators step along integer offsets (see hexafield.OffsetTable), a predator
+    whose step would leave the field stays (as in vector_model).
+    HexCoords are used only by public methods which are the same as CoreModel's ones.
+    '''
+    __slots__ = ('modelParams', 'samplers', 'field', 'index', 'bacteria', 'predatorCounts', 'predatorCells', 'predatorEnergies',
+        'bacteriaCells', '_spareBacteria', '_steps', '_bacteriaSums', '_predatorSums', '_bacteriaDistances',
+        '_changedCells', 'stats')
+
+    def __init__(self, modelParams, state):
+        '''
+        modelParams is ModelParams,
+        state is state.BacretioState that will be parsed as initial state
+        '''
+        self.modelParams = modelParams
+        self.samplers = compile_samplers(modelParams)
+        self.parse_state(state)
+
+    def parse_state(self, state):
+        '''
+        state is state.BacretioState
+        '''
+        self.field = state.field
+        self.index = state.field.get_cell_index()
+        numCells = len(self.index)
+        self.bacteria = array('l', bytes(array('l').itemsize*numCells))
+        self._spareBacteria = array('l', self.bacteria)
+        self.predatorCounts = array('l', self.bacteria)
+        self.predatorCells = array('l')
+        self.predatorEnergies = array('l')
+        self.bacteriaCells = set()
+        # fields which wrap around are stepped by the field itself (see hexafield.TorusHexafield.get_step_to)
+        self._steps = None if self.field.get_periods() else OffsetTable(self.modelParams.PR_SIGHT)
+        self._bacteriaSums = HexDiscSums(self.field, self.modelParams.BACT_OVERCROWD_RADIUS)
+        self._predatorSums = HexDiscSums(self.field, self.modelParams.PR_OVERCROWD_RADIUS)
+        self._bacteriaDistances = None
+        self._changedCells = None
+        if isinstance(state, PackedBacterioState):
+            self._parse_packed_state(state)
+        else:
+            self._parse_positions(state)
+        for i in self.predatorCells:
+            self.predatorCounts[i] += 1
+        self.stats = ModelStats.count((self.bacteria[i] for i in self.bacteriaCells), ())
+        self.stats.set_energies(Counter(self.predatorEnergies))
+        self.stats.predatorCells = len(set(self.predatorCells))
+
+    def _parse_positions(self, state):
+        find = self.index.find
+        for hc in state.bacteriaPositions:
+            if len(state.bacteriaPositions[hc])>0:
+                i = find(hc.x, hc.y)
+                self.bacteria[i] = len(state.bacteriaPositions[hc])
+                self.bacteriaCells.add(i)
+        for hc in state.predatorPositions:
+            i = find(hc.x, hc.y)
+            for pr in state.predatorPositions[hc]:
+                self.predatorCells.append(i)
+                self.predatorEnergies.append(pr.energy)
+
+    def _parse_packed_state(self, state):
+        '''
+        Copies per-cell numbers of PackedBacterioState (no HexCoords or creatures are created)
+        '''
+        for i, n in enumerate(state.bacteria):
+            if n>0:
+                self.bacteria[i] = n
+                self.bacteriaCells.add(i)
+        for i, n in enumerate(state.predatorCounts):
+            if n>0:
+                self.predatorCells.extend(array('l', [i])*n)
+        self.predatorEnergies.extend(state.predatorEnergies)
+
+    def step(self):
+        '''
+        Makes one turn and updates 'bacteria' and predators
+        '''
+        changed = self._changedCells
+        if changed is not None:
+            changed.update(self.bacteriaCells)
+            changed.update(self.predatorCells)
+        self.stats.start_step()
+        self.step_predators()
+        self.step_bacteria()
+        if changed is not None:
+            changed.update(self.bacteriaCells)
+            changed.update(self.predatorCells)
+
+    def pop_changed_cells(self):
+        '''
+        Returns set of HexCoords of cells whose creatures could have changed since the previous call
+        or None if all cells should be considered changed (see model.CoreModel.pop_changed_cells)
+        '''
+        res = self._changedCells
+        self._changedCells = set()
+        if res is None:
+            return None
+        get_cell = self.index.get_cell
+        return { get_cell(i) for i in res }
+
+    def pop_cell_counts(self):
+        '''
+        Returns (cells, bacteria, predators) - indices of cells changed since the previous call and their
+        numbers of creatures (see model.CoreModel.pop_cell_counts)
+        '''
+        res = self._changedCells
+        self._changedCells = set()
+        if res is None:
+            return None, array('l', self.bacteria), array('l', self.predatorCounts)
+        cells = sorted(res)
+        bacteria = self.bacteria
+        predatorCounts = self.predatorCounts
+        return cells, [ bacteria[i] for i in cells ], [ predatorCounts[i] for i in cells ]
+
+    def _step_to(self, cell, target):
+        '''
+        Returns index of the first cell on the shortest path from cell to target (cell itself if the step leaves the field)
+        '''
+        index = self.index
+        steps = self._steps
+        if steps is None:
+            step = self.field.get_step_to(index.get_cell(cell), index.get_cell(target))
+            return index.find(step.x, step.y)
+        x = index.xs[cell]
+        y = index.ys[cell]
+        k = steps.get_offset_index(index.xs[target]-x, index.ys[target]-y)
+        res = index.find(x+steps.stepXs[k], y+steps.stepYs[k])
+        return cell if res<0 else res
+
+    def step_predators(self):
+        mp = self.modelParams
+        samplers = self.samplers
+        index = self.index
+        bacteria = self.bacteria
+        counts = self.predatorCounts
+        newCells = array('l')
+        newEnergies = array('l')
+        born = died = eaten = 0
+        for i, energy in zip(self.predatorCells, self.predatorEnergies):
+            if energy>=mp.PR_DIVIDE_ENERGY and self.check_predators_overcrowd(i) and samplers.P_PR_DIVIDE()==1:
+                # DIVIDE
+                born += 1
+                offspringEnergy = (energy-mp.PR_DIVIDE_COST)//2
+                newCells.append(i)
+                newCells.append(i)
+                newEnergies.append(offspringEnergy)
+                newEnergies.append(offspringEnergy)
+                continue
+            if energy>=mp.PR_MAX_ENERGY:
+                # WELL FED
+                if samplers.P_PR_STAY()==1:
+                    newPos = i
+                else:
+                    newPos = random.choice(index.get_neighbours(i))
+                energy -= mp.PR_TURN_COST
+            else:
+                # HUNGRY
+                energy -= mp.PR_TURN_COST
+                if energy<=0:
+                    died += 1
+                    continue
+                closestBact = self.find_closest_bacteria(i)
+                if closestBact is not None:
+                    newPos = closestBact if closestBact==i else self._step_to(i, closestBact)
+                    if bacteria[newPos]>0:
+                        bacteria[newPos]-=1
+                        if bacteria[newPos]==0:
+                            self.bacteriaCells.discard(newPos)
+                        self._bacteriaSums.valid = False
+                        energy+=mp.PR_FEED_VALUE
+                        eaten += 1
+                else:
+                    newPos = random.choice(index.get_neighbours(i))
+            newCells.append(newPos)
+            newEnergies.append(energy)
+        for i in self.predatorCells:
+            counts[i] = 0
+        for i in newCells:
+            counts[i] += 1
+        self.predatorCells = newCells
+        self.predatorEnergies = newEnergies
+        self._predatorSums.valid = False
+        stats = self.stats
+        stats.predatorsBorn += born
+        stats.predatorsDied += died
+        stats.bacteriaEaten += eaten
+        stats.numBacteria -= eaten
+        stats.bacteriaCells = len(self.bacteriaCells)
+        stats.set_energies(Counter(newEnergies))
+        stats.predatorCells = len(set(newCells))
+
+    def get_bacteria_moves(self, cell):
+        '''
+        Returns sequence of cell indices where bacterium from given cell could move
+        '''
+        return self.index.get_neighbours(cell)
+
+    def step_bacteria(self):
+        samplers = self.samplers
+        bacteria = self.bacteria
+        newBacteria = self._spareBacteria
+        newBacteriaCells = set()
+        born = 0
+        for i in self.bacteriaCells:
+            notOvercrowded = self.check_bacteria_overcrowd(i)
+            for n in range(bacteria[i]):
+                if notOvercrowded and samplers.P_BACT_DIVIDE()==1:
+                    born += 1
+                    newPos = i
+                    newBacteria[i]+=2
+                elif samplers.P_BACT_STAY()==1:
+                    newPos = i
+                    newBacteria[i]+=1
+                else:
+                    newPos = random.choice(self.get_bacteria_moves(i))
+                    newBacteria[newPos]+=1
+                newBacteriaCells.add(newPos)
+        for i in self.bacteriaCells:
+            bacteria[i] = 0
+        self.bacteria, self._spareBacteria = newBacteria, bacteria
+        self.bacteriaCells = newBacteriaCells
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        self.stats.bacteriaBorn += born
+        self.stats.numBacteria += born
+        self.stats.bacteriaCells = len(newBacteriaCells)
+
+
+    def count_bacteria(self):
+        '''
+        Returns total amount of bacteria
+        '''
+        return self.stats.numBacteria
+
+    def count_predators(self):
+        '''
+        Returns total amount of predators
+        '''
+        return self.stats.numPredators
+
+    def count_bacteria_at(self, hexCoords):
+        '''
+        Returns number of bacteria in given cell
+        '''
+        i = self.index.find(hexCoords.x, hexCoords.y)
+        return 0 if i<0 else self.bacteria[i]
+
+    def count_predators_at(self, hexCoords):
+        '''
+        Returns number of predators in given cell
+        '''
+        i = self.index.find(hexCoords.x, hexCoords.y)
+        return 0 if i<0 else self.predatorCounts[i]
+
+    def get_predator_energies(self, hexCoords):
+        '''
+        Returns list of energies of predators in given cell
+        '''
+        i = self.index.find(hexCoords.x, hexCoords.y)
+        if i<0 or self.predatorCounts[i]==0:
+            return []
+        return [ energy for cell, energy in zip(self.predatorCells, self.predatorEnergies) if cell==i ]
+
+    def get_energies_at(self, cells):
+        '''
+        Returns lists of energies of predators in cells with given indices (see model.CoreModel.get_energies_at)
+        '''
+        predatorCounts = self.predatorCounts
+        byCell = { i:[] for i in cells if predatorCounts[i]>0 }
+        for cell, energy in zip(self.predatorCells, self.predatorEnergies):
+            energies = byCell.get(cell)
+            if energies is not None:
+                energies.append(energy)
+        return [ byCell.get(i, []) for i in cells ]
+
+    def get_state(self):
+        '''
+        Returns current state as state.PackedBacterioState
+        '''
+        order = sorted(range(len(self.predatorCells)), key=self.predatorCells.__getitem__)
+        energies = self.predatorEnergies
+        return PackedBacterioState(self.field, self.bacteria.tolist(), self.predatorCounts.tolist(), [energies[k] for k in order])
+
+
+    def check_bacteria_overcrowd(self, cell):
+        '''
+        Checks if number of bacteria near given cell index in radius BACT_OVERCROWD_RADIUS less than BACT_OVERCROWD
+        '''
+        if self.modelParams.BACT_OVERCROWD<=0:
+            return True
+        index = self.index
+        sums = self._bacteriaSums
+        if not sums.valid:
+            bacteria = self.bacteria
+            sums.rebuild((index.xs[i], index.ys[i], bacteria[i]) for i in self.bacteriaCells)
+        return sums.get_sum(index.xs[cell], index.ys[cell])<self.modelParams.BACT_OVERCROWD
+
+    def check_predators_overcrowd(self, cell):
+        '''
+        Checks if number of predators near given cell index in radius PR_OVERCROWD_RADIUS less than PR_OVERCROWD
+        '''
+        if self.modelParams.PR_OVERCROWD<=0:
+            return True
+        index = self.index
+        sums = self._predatorSums
+        if not sums.valid:
+            counts = self.predatorCounts
+            sums.rebuild((index.xs[i], index.ys[i], counts[i]) for i in set(self.predatorCells))
+        return sums.get_sum(index.xs[cell], index.ys[cell])<self.modelParams.PR_OVERCROWD
+
+    def find_closest_bacteria(self, cell):
+        '''
+        Returns index of the cell with the closest bacteria within PR_SIGHT (or None).
+        Distances are calculated once per predator phase (see model.CoreModel.find_closest_bacteria)
+        '''
+        bacteria = self.bacteria
+        sight = self.modelParams.PR_SIGHT
+        if self._bacteriaDistances is None:
+            if len(self.predatorCells)*count_cells_within(sight) < len(self.index):
+                self._bacteriaDistances = array('i', bytes(array('i').itemsize*len(self.index)))
+            else:
+                self._bacteriaDistances = self.index.get_distances(self.bacteriaCells, sight)
+        distance = self._bacteriaDistances[cell]
+        if distance==0:
+            if bacteria[cell]>0:
+                return cell
+            distance = 1
+        for r in range(distance, sight+1):
+            possiblePos = [i for i in self.index.get_at_exact_range(cell, r) if bacteria[i]>0]
+            if len(possiblePos)>0:
+                self._bacteriaDistances[cell] = r
+                return random.choice(possiblePos)
+        self._bacteriaDistances[cell] = sight+1
+        return None
+
+    def _find(self, hexCoords):
+        i = self.index.find(hexCoords.x, hexCoords.y)
+        if i<0:
+            raise KeyError(hexCoords)
+        return i
+
+    def add_bacteria(self, hexCoords):
+        '''
+        Adds bacteria to given cell
+        '''
+        i = self._find(hexCoords)
+        if self.bacteria[i]==0:
+            self.stats.bacteriaCells += 1
+        self.bacteria[i]+=1
+        self.bacteriaCells.add(i)
+        self.stats.numBacteria += 1
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        if self._changedCells is not None:
+            self._changedCells.add(i)
+
+    def add_predator(self, hexCoords):
+        '''
+        Adds predator to given cell
+        '''
+        i = self._find(hexCoords)
+        if self.predatorCounts[i]==0:
+            self.stats.predatorCells += 1
+        self.predatorCounts[i] += 1
+        self.predatorCells.append(i)
+        self.predatorEnergies.append(self.modelParams.PR_INIT_ENERGY)
+        self.stats.add_predators(self.modelParams.PR_INIT_ENERGY)
+        self._predatorSums.valid = False
+        if self._changedCells is not None:
+            self._changedCells.add(i)
+
+    def clear_cell(self, hexCoords):
+        '''
+        Removes all creatures from given cell
+        '''
+        i = self._find(hexCoords)
+        if self.bacteria[i]>0:
+            self.stats.numBacteria -= self.bacteria[i]
+            self.stats.bacteriaCells -= 1
+        if self.predatorCounts[i]>0:
+            keep = [ k for k, cell in enumerate(self.predatorCells) if cell!=i ]
+            self.stats.remove_predators(self.get_predator_energies(hexCoords))
+            self.stats.predatorCells -= 1
+            self.predatorCells = array('l', [self.predatorCells[k] for k in keep])
+            self.predatorEnergies = array('l', [self.predatorEnergies[k] for k in keep])
+            self.predatorCounts[i] = 0
+        self.bacteria[i] = 0
+        self.bacteriaCells.discard(i)
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        self._predatorSums.valid = False
+        if self._changedCells is not None:
+            self._changedCells.add(i)
+
+    def clear_all(self):
+        '''
+        Removes all creatures from entire board
+        '''
+        if self._changedCells is not None:
+            self._changedCells.update(self.bacteriaCells)
+            self._changedCells.update(self.predatorCells)
+        for i in self.bacteriaCells:
+            self.bacteria[i] = 0
+        for i in self.predatorCells:
+            self.predatorCounts[i] = 0
+        self.bacteriaCells.clear()
+        self.predatorCells = array('l')
+        self.predatorEnergies = array('l')
+        self.stats.clear()
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        self._predatorSums.valid = False
+
+
+class DenseRapidBacteriaModel(DenseCoreModel):
+    '''
+    Describes the same model as model.RapidBacteriaModel with dense per-cell storage
+    '''
+    __slots__ = ()
+
+    def get_bacteria_moves(self, cell):
+        return self.index.get_at_exact_range(cell, self.modelParams.BACT_VELOCITY)
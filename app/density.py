@@ -0,0 +1,268 @@
+'''
+Generates big initial states from density maps (requires numpy package)
+
+    python -m app.density STATE.bsf [--rules config/rules.ini] [--shape SHAPE] [--radius R] [--width W] [--height H]
+        [--bacteria N] [--predators N] [--density SPEC] [--per-cell K] [--seed S] [--compression zlib|lzma|bz2]
+
+writes generated state to a binary state file (field and numbers of creatures are taken from rules
+unless given as options); generate_packed_state() is used by runner when rules set 'density'.
+
+Each cell has 'perCell' places for bacteria and as many places for predators. Places are sampled without
+replacement with probabilities proportional to the density of their cells by weighted random keys
+(the places with the largest u**(1/density) for uniform u), so sampling is O(number of places) and no
+creatures or HexCoords are created. If there are fewer places with non-zero density than creatures,
+all of them are filled. Bacteria and predators are placed independently, so they could share cells.
+
+Density map (SPEC) is a sum of components separated by ';':
+    uniform                 - the same density everywhere,
+    gaussian:X,Y,SIGMA      - gaussian cluster around cell (X, Y) with standard deviation SIGMA,
+    ring:X,Y,RADIUS,WIDTH   - ring of given radius and width around cell (X, Y),
+    image:FILE              - greyscale PGM image stretched over the field (white is the densest);
+any component could be prefixed with its weight, e.g. '2*gaussian:0,0,10; uniform'.
+Distances are measured on the plane in distances between neighbour cells.
+'''
+
+import argparse
+import math
+import random
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from app.model_params import default_model_params
+from app.state import PackedBacterioState
+
+
+# density component kind -> number of its arguments
+KINDS = { 'uniform': 0, 'gaussian': 3, 'ring': 4, 'image': 1 }
+
+# 'kind' - one of KINDS, 'args' - tuple of arguments (floats, the file name for image), 'weight' - multiplier
+DensityComponent = namedtuple('DensityComponent', ['kind', 'args', 'weight'])
+
+
+def parse_density(spec):
+    '''
+    Returns list of DensityComponents of density map spec (see module description)
+    '''
+    components = []
+    for part in spec.split(';'):
+        part = part.strip()
+        if part=='':
+            continue
+        weight = 1.0
+        if '*' in part:
+            weightText, part = part.split('*', 1)
+            try:
+                weight = float(weightText)
+            except ValueError:
+                raise ValueError('Wrong density weight: %s' % weightText)
+            if weight<0:
+                raise ValueError('Density weight must not be negative: %s' % weightText)
+            part = part.strip()
+        kind, _, argsText = part.partition(':')
+        kind = kind.strip()
+        if not kind in KINDS:
+            raise ValueError('Unknown density "%s" (expected one of: %s)' % (kind, ', '.join(sorted(KINDS))))
+        if kind=='image':
+            args = (argsText.strip(),)
+        else:
+            try:
+                args = tuple(float(arg) for arg in argsText.split(',')) if argsText.strip() else ()
+            except ValueError:
+                raise ValueError('Wrong density arguments: %s' % part)
+        if len(args)!=KINDS[kind] or (kind=='image' and args[0]==''):
+            raise ValueError('Density "%s" takes %d arguments: %s' % (kind, KINDS[kind], part))
+        components.append(DensityComponent(kind, args, weight))
+    if len(components)==0:
+        raise ValueError('Empty density spec')
+    return components
+
+
+def read_pgm(fileName):
+    '''
+    Returns greyscale image from PGM file (binary P5 or plain P2) as 2D numpy array of floats
+    (rows are from top to bottom, 0 is black, 1 is white)
+    '''
+    with open(fileName, 'rb') as f:
+        data = f.read()
+    # header is magic, width, height and maximal value separated by whitespace (and comments)
+    tokens = []
+    pos = 0
+    while len(tokens)<4:
+        while pos<len(data) and data[pos:pos+1].isspace():
+            pos += 1
+        if data[pos:pos+1]==b'#':
+            while pos<len(data) and data[pos:pos+1] not in b'\r\n':
+                pos += 1
+            continue
+        start = pos
+        while pos<len(data) and not data[pos:pos+1].isspace():
+            pos += 1
+        if start==pos:
+            raise ValueError('Truncated PGM file: %s' % fileName)
+        tokens.append(data[start:pos])
+    magic = tokens[0]
+    if not magic in (b'P5', b'P2'):
+        raise ValueError('Not a greyscale PGM file: %s' % fileName)
+    try:
+        width, height, maxValue = (int(token) for token in tokens[1:])
+    except ValueError:
+        raise ValueError('Wrong PGM header: %s' % fileName)
+    if width<1 or height<1 or not 0<maxValue<65536:
+        raise ValueError('Wrong PGM header: %s' % fileName)
+    if magic==b'P5':
+        # raster starts after a single whitespace
+        dtype = np.dtype(np.uint8) if maxValue<256 else np.dtype('>u2')
+        if len(data)<pos+1+width*height*dtype.itemsize:
+            raise ValueError('Truncated PGM file: %s' % fileName)
+        pixels = np.frombuffer(data, dtype=dtype, count=width*height, offset=pos+1)
+    else:
+        pixels = np.array(data[pos:].split(), dtype=np.int64)
+        if len(pixels)<width*height:
+            raise ValueError('Truncated PGM file: %s' % fileName)
+        pixels = pixels[:width*height]
+    return pixels.reshape(height, width).astype(np.float64)/maxValue
+
+
+def get_plane_coords(xs, ys):
+    '''
+    Returns (lefts, tops) of cells' centers on the plane (the same orientation as hexafield.HexCoordConverter has,
+    distance between neighbour cells is 1)
+    '''
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    return xs*math.sqrt(3)/2, -ys-xs/2
+
+
+def get_cell_coords(field):
+    '''
+    Returns (xs, ys) - numpy arrays of coordinates of cells of the field in the order of hexafield.CellIndex.
+    They are calculated from the field's columns (see HexafieldBase.get_columns), so fields of all shapes
+    are handled without building CellIndex (only fields with gaps in columns need it)
+    '''
+    columns = field.get_columns()
+    if columns is None:
+        index = field.get_cell_index()
+        return np.frombuffer(index.xs, dtype=np.int32), np.frombuffer(index.ys, dtype=np.int32)
+    columns = np.array(columns, dtype=np.int64).reshape(-1, 3)
+    heights = columns[:, 2]-columns[:, 1]+1
+    xs = np.repeat(columns[:, 0], heights)
+    # y of cell i of a column is yMin+i-(index of the first cell of the column)
+    ys = np.arange(len(xs), dtype=np.int64)+np.repeat(columns[:, 1]-(np.cumsum(heights)-heights), heights)
+    return xs, ys
+
+
+def get_density_map(components, xs, ys):
+    '''
+    Returns numpy array of densities of cells with coordinates xs, ys (sequences) for list of DensityComponents
+    '''
+    lefts, tops = get_plane_coords(xs, ys)
+    res = np.zeros(len(lefts), dtype=np.float64)
+    for kind, args, weight in components:
+        if kind=='uniform':
+            res += weight
+            continue
+        if kind=='image':
+            image = read_pgm(args[0])
+            height, width = image.shape
+            spanLeft = lefts.max()-lefts.min() if len(lefts)>0 else 0
+            spanTop = tops.max()-tops.min() if len(tops)>0 else 0
+            columns = np.rint((lefts-lefts.min())/spanLeft*(width-1)).astype(np.int64) if spanLeft>0 else np.zeros(len(lefts), dtype=np.int64)
+            rows = np.rint((tops-tops.min())/spanTop*(height-1)).astype(np.int64) if spanTop>0 else np.zeros(len(tops), dtype=np.int64)
+            res += weight*image[rows, columns]
+            continue
+        centerLeft, centerTop = get_plane_coords(args[0], args[1])
+        distances = np.hypot(lefts-centerLeft, tops-centerTop)
+        if kind=='gaussian':
+            sigma = args[2]
+            if sigma<=0:
+                raise ValueError('Gaussian deviation must be positive: %g' % sigma)
+            res += weight*np.exp(-0.5*(distances/sigma)**2)
+        else:
+            radius, ringWidth = args[2], args[3]
+            res += weight*(np.abs(distances-radius)<=ringWidth/2)
+    return res
+
+
+def sample_places(rng, densities, perCell, count):
+    '''
+    Samples 'count' of perCell places of every cell without replacement (probabilities are proportional
+    to densities, see module description). rng is numpy.random.Generator.
+    Returns numpy array of numbers of sampled places in each cell
+    '''
+    cells = np.flatnonzero(densities>0)
+    if perCell>1:
+        cells = np.repeat(cells, perCell)
+    if count>=len(cells):
+        return np.bincount(cells, minlength=len(densities))
+    if count<=0:
+        return np.zeros(len(densities), dtype=np.int64)
+    # log(u)/density orders places the same way as u**(1/density)
+    keys = np.log1p(-rng.random(len(cells)))/densities[cells]
+    chosen = cells[np.argpartition(keys, len(cells)-count)[len(cells)-count:]]
+    return np.bincount(chosen, minlength=len(densities))
+
+
+def generate_packed_state(field, numBacteria, numPredators, modelParams=default_model_params(), density='uniform', perCell=1, seed=None):
+    '''
+    Generates initial state on given field (HexafieldBase) with creatures placed by density map
+    (spec or list of DensityComponents), at most perCell bacteria and perCell predators in each cell.
+    If seed is None the generator is seeded from 'random' module (so random.seed() makes it reproducible).
+    Returns state.PackedBacterioState
+    '''
+    if perCell<1:
+        raise ValueError('Number of creatures per cell must be positive: %d' % perCell)
+    components = parse_density(density) if isinstance(density, str) else density
+    densities = get_density_map(components, *get_cell_coords(field))
+    rng = np.random.default_rng(seed if seed is not None else random.getrandbits(64))
+    bacteria = sample_places(rng, densities, perCell, numBacteria).astype(np.int32)
+    predatorCounts = sample_places(rng, densities, perCell, numPredators).astype(np.int32)
+    predatorEnergies = np.full(int(predatorCounts.sum()), modelParams.PR_INIT_ENERGY, dtype=np.int32)
+    return PackedBacterioState(field, memoryview(bacteria), memoryview(predatorCounts), memoryview(predatorEnergies))
+
+
+def main(argv=None):
+    import time
+    import app.config as config
+    import app.hexafield as hexafield
+    from app.state import save_state, COMPRESSIONS
+
+    parser = argparse.ArgumentParser(prog='python -m app.density', description='Generates initial state from density map')
+    parser.add_argument('out', help='output state file (.bsf)')
+    parser.add_argument('--rules', default='config/rules.ini', help='rules file with field and model params (default: %(default)s)')
+    parser.add_argument('--shape', choices=sorted(hexafield.SHAPES), help='field shape')
+    parser.add_argument('--radius', type=int, help='radius of circle and hexagon fields')
+    parser.add_argument('--width', type=int, help='width of rectangle and torus fields')
+    parser.add_argument('--height', type=int, help='height of rectangle and torus fields')
+    parser.add_argument('--bacteria', type=int, help='number of bacteria')
+    parser.add_argument('--predators', type=int, help='number of predators')
+    parser.add_argument('--density', help='density map (see module description, default: uniform)')
+    parser.add_argument('--per-cell', type=int, dest='perCell', help='maximal number of creatures of each kind in a cell')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--compression', choices=[name for name in COMPRESSIONS.values() if name is not None])
+    args = parser.parse_args(argv)
+
+    rules = config.load_rules(args.rules)
+    options = { name:getattr(args, name) for name in ('shape', 'radius', 'width', 'height', 'density', 'perCell', 'seed')
+        if getattr(args, name) is not None }
+    if args.bacteria is not None:
+        options['initBacteria'] = args.bacteria
+    if args.predators is not None:
+        options['initPredators'] = args.predators
+    fieldParams = rules.fieldParams._replace(**options)
+    try:
+        start = time.perf_counter()
+        field = hexafield.create_hexafield(fieldParams.shape, fieldParams.radius, fieldParams.width, fieldParams.height)
+        state = generate_packed_state(field, fieldParams.initBacteria, fieldParams.initPredators, rules.modelParams,
+            fieldParams.density or 'uniform', fieldParams.perCell, fieldParams.seed)
+        save_state(state, args.out, args.compression)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    print('%d cells, %d bacteria, %d predators written to %s in %.1f s' % (len(state.bacteria), sum(state.bacteria),
+        len(state.predatorEnergies), args.out, time.perf_counter()-start))
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
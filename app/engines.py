@@ -0,0 +1,46 @@
+'''
+Creates bacterio model (simulation engine) by its name from rules.ini
+'''
+
+import importlib
+
+
+# model name -> (module, class). Modules are imported only when the model is selected,
+# so optional dependencies (numpy for vector_* models) are required only by their own models.
+MODELS = {
+    'core': ('app.model', 'CoreModel'),
+    'rapid': ('app.model', 'RapidBacteriaModel'),
+    'counting_core': ('app.counting_model', 'CountingCoreModel'),
+    'counting_rapid': ('app.counting_model', 'CountingRapidBacteriaModel'),
+    'dense_core': ('app.dense_model', 'DenseCoreModel'),
+    'dense_rapid': ('app.dense_model', 'DenseRapidBacteriaModel'),
+    'vector_core': ('app.vector_model', 'VectorCoreModel'),
+    'vector_rapid': ('app.vector_model', 'VectorRapidBacteriaModel'),
+    'sector_core': ('app.sector_model', 'SectorCoreModel'),
+    'sector_rapid': ('app.sector_model', 'SectorRapidBacteriaModel'),
+    'chunked_core': ('app.chunked_model', 'ChunkedCoreModel'),
+    'chunked_rapid': ('app.chunked_model', 'ChunkedRapidBacteriaModel'),
+}
+# models stepped by several processes, they take number of workers (EngineParams.workers) as the third argument
+PARALLEL_MODELS = ('sector_core', 'sector_rapid')
+
+
+def get_model_class(name):
+    '''
+    Returns model class by its name (see MODELS)
+    '''
+    if name not in MODELS:
+        raise ValueError('Unknown model "%s" (expected one of: %s)' % (name, ', '.join(sorted(MODELS))))
+    moduleName, className = MODELS[name]
+    return getattr(importlib.import_module(moduleName), className)
+
+
+def create_model(engineParams, modelParams, state):
+    '''
+    Creates model selected by engineParams (config.EngineParams).
+    modelParams is ModelParams, state is state.BacterioState that will be parsed as initial state
+    '''
+    modelClass = get_model_class(engineParams.model)
+    if engineParams.model in PARALLEL_MODELS:
+        return modelClass(modelParams, state, engineParams.workers or None)
+    return modelClass(modelParams, state)
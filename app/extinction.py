@@ -0,0 +1,253 @@
+'''
+Estimates probability that predators or bacteria die out within given number of steps
+
+    python -m app.extinction --steps 2000 --width 0.05 [--event any|predators|bacteria]
+                             [--set NAME=value ...] [--early-stop BACTERIA,PREDATORS,STEPS]
+
+Replicas (independent runs of the same rules with seeds derived from --seed, see sweep.derive_seed)
+are run in parallel processes until Wilson score interval of the estimated probability becomes
+not wider than --width (or --max-runs replicas are made). Extinction is detected with the same
+halt conditions as GUI has (see runner.get_halt_reason).
+
+Replicas which die out finish sooner than surviving ones, so results are accounted strictly in
+replica order (a finished replica waits for all previous ones) - otherwise the stopping rule
+would see extinctions first and the estimate would be biased.
+
+--early-stop is an opt-in heuristic for stable configurations: replica is counted as survived
+as soon as there were at least BACTERIA bacteria and PREDATORS predators during STEPS consecutive
+steps. It makes the estimate a lower bound (replica stopped early could still die out later),
+so thresholds should be chosen well above populations seen in extinct runs.
+'''
+
+import argparse
+from collections import namedtuple
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import random
+from statistics import NormalDist
+import sys
+import time
+
+import app.config as config
+import app.engines as engines
+from app.runner import DEFAULT_RULES_FILE, create_initial_state, get_halt_reason
+from app.sweep import derive_seed, init_worker, parse_value
+
+
+EVENTS = ('any', 'predators', 'bacteria')
+
+# Replica is considered survived once there were at least 'numBacteria' and 'numPredators'
+# during 'numSteps' consecutive steps
+EarlyStop = namedtuple('EarlyStop', ['numBacteria', 'numPredators', 'numSteps'])
+
+ReplicaTask = namedtuple('ReplicaTask', ['runId', 'seed', 'rules', 'maxSteps', 'earlyStop'])
+
+# 'steps' - steps made, 'haltReason' - as runner.get_halt_reason ('' if survived),
+# 'stoppedEarly' - True if replica was stopped by EarlyStop
+ReplicaResult = namedtuple('ReplicaResult', ['steps', 'haltReason', 'stoppedEarly'])
+
+# 'runs' - number of accounted replicas, 'predatorExtinctions' and 'bacteriaExtinctions' - number of replicas
+# halted for each reason, 'stoppedEarly' - number of replicas stopped by EarlyStop,
+# 'probability', 'low', 'high' - estimate of the event probability and its confidence interval
+Estimate = namedtuple('Estimate', ['runs', 'predatorExtinctions', 'bacteriaExtinctions', 'stoppedEarly',
+    'probability', 'low', 'high'])
+
+
+def wilson_interval(successes, n, z):
+    '''
+    Returns Wilson score interval (low, high) for binomial proportion successes/n, z is normal quantile
+    '''
+    if n==0:
+        return 0.0, 1.0
+    p = successes/n
+    z2 = z*z
+    center = (p+z2/(2*n))/(1+z2/n)
+    halfWidth = z*math.sqrt(p*(1-p)/n+z2/(4*n*n))/(1+z2/n)
+    low = 0.0 if successes==0 else max(0.0, center-halfWidth)
+    high = 1.0 if successes==n else min(1.0, center+halfWidth)
+    return low, high
+
+
+def get_z(confidence):
+    '''
+    Returns two-sided normal quantile for given confidence level (e.g. 1.96 for 0.95)
+    '''
+    return NormalDist().inv_cdf(1-(1-confidence)/2)
+
+
+# set by estimate in worker processes (see init_replica_worker) when no more results are needed
+_stopEvent = None
+
+
+def init_replica_worker(stopEvent):
+    '''
+    Initializes worker process (see sweep.init_worker); stopEvent is multiprocessing.Event
+    which makes running replicas stop
+    '''
+    global _stopEvent
+    init_worker()
+    _stopEvent = stopEvent
+
+
+def run_replica(task):
+    '''
+    Runs single ReplicaTask (in worker process). Returns ReplicaResult
+    or None if the replica was stopped by the estimate (see init_replica_worker)
+    '''
+    random.seed(task.seed)
+    rules = task.rules
+    model = engines.create_model(rules.engineParams, rules.modelParams, create_initial_state(rules))
+    earlyStop = task.earlyStop
+    haltReason = get_halt_reason(model.count_bacteria(), model.count_predators())
+    stableSteps = 0
+    step = 0
+    while step<task.maxSteps and not haltReason:
+        if _stopEvent is not None and _stopEvent.is_set():
+            return None
+        model.step()
+        step += 1
+        numBacteria = model.count_bacteria()
+        numPredators = model.count_predators()
+        haltReason = get_halt_reason(numBacteria, numPredators)
+        if earlyStop is not None:
+            if numBacteria>=earlyStop.numBacteria and numPredators>=earlyStop.numPredators:
+                stableSteps += 1
+                if stableSteps>=earlyStop.numSteps and step<task.maxSteps:
+                    return ReplicaResult(step, '', True)
+            else:
+                stableSteps = 0
+    return ReplicaResult(step, haltReason, False)
+
+
+def is_event(haltReason, event):
+    '''
+    Checks if replica halted with given reason counts as event ('any', 'predators' or 'bacteria')
+    '''
+    if event=='predators':
+        return haltReason==get_halt_reason(1, 0)
+    if event=='bacteria':
+        return haltReason==get_halt_reason(0, 1)
+    return haltReason!=''
+
+
+def estimate(rules, maxSteps, width, confidence=0.95, event='any', minRuns=20, maxRuns=10000,
+             seed=0, earlyStop=None, workers=None, progress=None):
+    '''
+    Runs replicas of rules for maxSteps in 'workers' processes (all cores if None) until confidence
+    interval of the event probability is not wider than 'width' (but at least minRuns and at most maxRuns
+    replicas). progress(Estimate) is called after each accounted replica if given.
+    Once the estimate is done (or interrupted) replicas still running are stopped, so it doesn't wait for them.
+    Returns Estimate
+    '''
+    if not event in EVENTS:
+        raise ValueError('Unknown event: %s' % event)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    z = get_z(confidence)
+    runs = numPredators = numBacteria = numEarly = numEvents = 0
+    low, high = 0.0, 1.0
+    finished = {}
+    nextRunId = 0
+    stopEvent = multiprocessing.Event()
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_replica_worker, initargs=(stopEvent,)) as executor:
+        pending = {}
+        try:
+            while True:
+                while len(pending)<2*workers and nextRunId<maxRuns:
+                    task = ReplicaTask(nextRunId, derive_seed(seed, nextRunId), rules, maxSteps, earlyStop)
+                    pending[executor.submit(run_replica, task)] = nextRunId
+                    nextRunId += 1
+                if len(pending)==0:
+                    break
+                done, notDone = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    finished[pending.pop(future)] = future.result()
+                stop = False
+                while runs in finished:
+                    result = finished.pop(runs)
+                    runs += 1
+                    numPredators += result.haltReason==get_halt_reason(1, 0)
+                    numBacteria += result.haltReason==get_halt_reason(0, 1)
+                    numEarly += result.stoppedEarly
+                    numEvents += is_event(result.haltReason, event)
+                    low, high = wilson_interval(numEvents, runs, z)
+                    if progress is not None:
+                        progress(Estimate(runs, numPredators, numBacteria, numEarly, numEvents/runs, low, high))
+                    if runs>=maxRuns or (runs>=minRuns and high-low<=width):
+                        stop = True
+                        break
+                if stop:
+                    break
+        finally:
+            stopEvent.set()
+            for future in pending:
+                future.cancel()
+    return Estimate(runs, numPredators, numBacteria, numEarly, numEvents/runs if runs>0 else 0.0, low, high)
+
+
+def parse_early_stop(text):
+    '''
+    Parses 'BACTERIA,PREDATORS,STEPS' to EarlyStop
+    '''
+    values = text.split(',')
+    if len(values)!=3:
+        raise ValueError('Expected BACTERIA,PREDATORS,STEPS but got: %s' % text)
+    return EarlyStop(*[int(v) for v in values])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.extinction', description='Estimates probability of extinction within given number of steps')
+    parser.add_argument('--rules', default=DEFAULT_RULES_FILE, help='rules file (default: %(default)s)')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=value', help='overrides model parameter (could be repeated)')
+    parser.add_argument('--model', help='model name, overrides ENGINE section of rules')
+    parser.add_argument('--steps', type=int, default=1000, help='number of steps K (default: %(default)s)')
+    parser.add_argument('--event', choices=EVENTS, default='any', help='which extinction to estimate (default: %(default)s)')
+    parser.add_argument('--width', type=float, default=0.05, help='target width of confidence interval (default: %(default)s)')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level (default: %(default)s)')
+    parser.add_argument('--min-runs', type=int, default=20, help='minimal number of replicas (default: %(default)s)')
+    parser.add_argument('--max-runs', type=int, default=10000, help='maximal number of replicas (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed replica seeds are derived from (default: %(default)s)')
+    parser.add_argument('--early-stop', metavar='BACTERIA,PREDATORS,STEPS', help='count replica as survived after STEPS steps with at least given populations')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: number of cores)')
+    args = parser.parse_args(argv)
+
+    rules = config.load_rules(args.rules)
+    try:
+        overrides = {}
+        for item in args.set:
+            name, sep, value = item.partition('=')
+            if sep=='':
+                raise ValueError('Expected NAME=value but got: %s' % item)
+            overrides[name] = parse_value(name, value)
+        earlyStop = None if args.early_stop is None else parse_early_stop(args.early_stop)
+    except ValueError as e:
+        parser.error(str(e))
+    rules = rules._replace(modelParams=rules.modelParams._replace(**overrides))
+    if args.model is not None:
+        rules = rules._replace(engineParams=rules.engineParams._replace(model=args.model))
+
+    def progress(est):
+        sys.stdout.write('\r%d runs: p=%.4f [%.4f, %.4f]' % (est.runs, est.probability, est.low, est.high))
+        sys.stdout.flush()
+    start = time.perf_counter()
+    try:
+        est = estimate(rules, args.steps, args.width, args.confidence, args.event, args.min_runs, args.max_runs,
+            args.seed, earlyStop, args.workers, progress)
+    except KeyboardInterrupt:
+        print('\nCancelled')
+        return 1
+    print()
+    print('Runs: %d (%.1f s)' % (est.runs, time.perf_counter()-start))
+    print('Predators died out: %d' % est.predatorExtinctions)
+    print('Bacteria died out: %d' % est.bacteriaExtinctions)
+    if earlyStop is not None:
+        print('Stopped early as survived: %d' % est.stoppedEarly)
+    print('P(%s extinction within %d steps) = %.4f, %g%% CI [%.4f, %.4f]' % (args.event, args.steps, est.probability,
+        100*args.confidence, est.low, est.high))
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
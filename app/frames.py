@@ -0,0 +1,293 @@
+'''
+Renders bacterio field to image frames without Tk (requires numpy package)
+
+    python -m app.frames JOURNAL.bjf OUTDIR [--size 1024x768] [--format png|ppm] [--every K] [--start S] [--stop S]
+
+renders steps of run journal (see app.journal); frames of a running model are written
+with python -m app.runner --frames OUTDIR (see FrameWriter).
+
+Geometry is the same as in GUI (hexafield.fit_hex_converter) and colours are taken from palette
+(see app.palette). FrameRenderer maps every pixel to a cell index once (see make_pixel_map), so
+rendering a frame is a single lookup of per-cell colours by the pixel map. Per-cell colours of a model
+are updated only in cells reported by model.pop_cell_counts().
+Text shown by GUI (step and populations) is not rendered, frame files are named by step instead.
+'''
+
+import argparse
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from app.hexafield import fit_hex_converter
+import app.palette as palette
+
+
+# per-cell colour codes (indices in FrameRenderer.colors)
+EMPTY = 0
+BACTERIA = 1
+PREDATOR = 2
+BOTH = 3
+GRID = 4
+BACKGROUND = 5
+
+# a few of Tk colour names, others are looked up in X11 rgb.txt (Tk uses the same names)
+COLOR_NAMES = { 'black': (0, 0, 0), 'white': (255, 255, 255), 'red': (255, 0, 0), 'green': (0, 255, 0),
+    'blue': (0, 0, 255), 'yellow': (255, 255, 0), 'cyan': (0, 255, 255), 'magenta': (255, 0, 255),
+    'gray': (190, 190, 190), 'grey': (190, 190, 190), 'dimgray': (105, 105, 105), 'dimgrey': (105, 105, 105),
+    'brown': (165, 42, 42), 'forestgreen': (34, 139, 34), 'snow': (255, 250, 250), 'ivory4': (139, 139, 131) }
+RGB_FILES = ('/usr/share/X11/rgb.txt', '/etc/X11/rgb.txt')
+
+FORMATS = ('png', 'ppm')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def parse_color(color):
+    '''
+    Converts Tk colour ('#rgb', '#rrggbb' or colour name) to (r, g, b)
+    '''
+    if color.startswith('#') and len(color) in (4, 7):
+        digits = 1 if len(color)==4 else 2
+        return tuple(int(color[1+i*digits:1+(i+1)*digits], 16)*(17 if digits==1 else 1) for i in range(3))
+    name = color.replace(' ', '').lower()
+    if name in COLOR_NAMES:
+        return COLOR_NAMES[name]
+    for fileName in RGB_FILES:
+        if os.path.exists(fileName):
+            with open(fileName) as f:
+                for line in f:
+                    values = line.split(None, 3)
+                    if len(values)==4 and not line.startswith('!') and values[3].replace(' ', '').strip().lower()==name:
+                        return tuple(int(v) for v in values[:3])
+    raise ValueError('Unknown colour: %s' % color)
+
+
+def _round(values):
+    '''
+    Vectorized hexafield.round (halves are rounded away from zero)
+    '''
+    i = np.trunc(values)
+    diff = values-i
+    return (i-(diff<=-0.5)+(diff>=0.5)).astype(np.int64)
+
+
+def make_pixel_map(field, width, height, lineWidth=2):
+    '''
+    Returns int32 array (height x width) of indices of cells (as in field.get_cell_index()) which contain
+    centers of pixels; pixels of cell outlines (lineWidth wide, as drawn by GUI) are numCells+1,
+    pixels outside of the field are numCells
+    '''
+    index = field.get_cell_index()
+    numCells = len(index)
+    conv = fit_hex_converter(field, width, height)
+    xs = np.frombuffer(index.xs, dtype=np.int32).astype(np.int64)
+    ys = np.frombuffer(index.ys, dtype=np.int32).astype(np.int64)
+    # dense (x, y) -> cell table with off-field margin of one cell
+    minX, minY = (int(xs.min())-1, int(ys.min())-1) if numCells else (-1, -1)
+    sizeX, sizeY = (int(xs.max())-minX+2, int(ys.max())-minY+2) if numCells else (3, 3)
+    table = np.full((sizeX, sizeY), numCells, dtype=np.int32)
+    table[xs-minX, ys-minY] = np.arange(numCells, dtype=np.int32)
+
+    left = np.arange(width, dtype=np.float64)+0.5
+    top = (np.arange(height, dtype=np.float64)+0.5)[:, None]
+    r, h = conv.hexRadius, conv.hexHeight
+    # approximate hex (as HexCoordConverter.plain_to_hex) and its neighbours are candidates, the closest center wins
+    x0 = np.broadcast_to(_round((left-conv.leftHex0)/(1.5*r)), (height, width))
+    y0 = _round((top-conv.topHex0+x0*h)/(-2.0*h))
+    offsets = ((0,0), (1,0), (-1,0), (0,1), (0,-1), (1,-1), (-1,1))
+    distances = np.empty((len(offsets), height, width))
+    for k, (dx, dy) in enumerate(offsets):
+        cx = x0+dx
+        cy = y0+dy
+        distances[k] = (conv.leftHex0+cx*1.5*r-left)**2 + (conv.topHex0-cy*2*h-cx*h-top)**2
+    order = np.argsort(distances, axis=0)[:2]
+    cells = []
+    for j in range(2):
+        dx = np.array([dx for dx, dy in offsets])[order[j]]
+        dy = np.array([dy for dx, dy in offsets])[order[j]]
+        cx = np.clip(x0+dx-minX, 0, sizeX-1)
+        cy = np.clip(y0+dy-minY, 0, sizeY-1)
+        inTable = (x0+dx-minX==cx) & (y0+dy-minY==cy)
+        cells.append(np.where(inTable, table[cx, cy], numCells))
+    d1 = np.take_along_axis(distances, order[:1], axis=0)[0]
+    d2 = np.take_along_axis(distances, order[1:2], axis=0)[0]
+    # distance to the edge between the closest cells (their centers are 2*hexHeight apart)
+    border = (d2-d1)/(4.0*h) < lineWidth/2.0
+    pixelMap = cells[0]
+    pixelMap[border & ((cells[0]!=numCells) | (cells[1]!=numCells))] = numCells+1
+    return pixelMap.astype(np.int32)
+
+
+class FrameRenderer(object):
+    '''
+    Renders field to RGB images.
+    'pixelMap' - see make_pixel_map,
+    'colors' - uint8 array of RGB colours of EMPTY, BACTERIA, PREDATOR, BOTH, GRID and BACKGROUND codes,
+    'codes' - array of colour codes of each cell followed by codes of off-field and outline pixels
+    '''
+    __slots__ = ('field', 'width', 'height', 'pixelMap', 'colors', 'codes', '_packedColors')
+
+    def __init__(self, field, width, height, pal=None, lineWidth=2):
+        '''
+        pal is palette.Palette (palette.default_palette() if None)
+        '''
+        if pal is None:
+            pal = palette.default_palette()
+        self.field = field
+        self.width = width
+        self.height = height
+        self.pixelMap = make_pixel_map(field, width, height, lineWidth)
+        background = parse_color(pal.background)
+        self.colors = np.array([background, parse_color(pal.bacteria), parse_color(pal.predator),
+            parse_color(pal.both), parse_color(pal.grid), background], dtype=np.uint8)
+        # colours as 32-bit RGBX words, so lookup moves one word per pixel
+        packed = np.zeros((len(self.colors), 4), dtype=np.uint8)
+        packed[:, :3] = self.colors
+        self._packedColors = packed.view(np.uint32).ravel()
+        numCells = len(field.get_cell_index())
+        self.codes = np.full(numCells+2, EMPTY, dtype=np.uint8)
+        self.codes[numCells] = BACKGROUND
+        self.codes[numCells+1] = GRID
+
+    def update_from_model(self, model, counts=None):
+        '''
+        Updates colour codes of cells changed since the previous update: 'counts' is result of
+        model.pop_cell_counts() (it is called if counts is None)
+        '''
+        cells, bacteria, predators = model.pop_cell_counts() if counts is None else counts
+        codes = (np.asarray(bacteria)>0) + 2*(np.asarray(predators)>0)
+        if cells is None:
+            self.codes[:len(self.codes)-2] = codes
+        else:
+            self.codes[np.asarray(cells, dtype=np.int64)] = codes
+
+    def update_from_state(self, state):
+        '''
+        Sets colour codes of all cells from state.PackedBacterioState
+        '''
+        numCells = len(self.codes)-2
+        self.codes[:numCells] = (np.asarray(state.bacteria)>0) + 2*(np.asarray(state.predatorCounts)>0)
+
+    def render(self):
+        '''
+        Returns uint8 array (height x width x 3) - RGB image of the field
+        '''
+        pixels = self._packedColors[self.codes].take(self.pixelMap)
+        return pixels.view(np.uint8).reshape(self.height, self.width, 4)[:, :, :3]
+
+
+def encode_ppm(image):
+    '''
+    Returns binary PPM (P6) file content with given RGB image
+    '''
+    height, width = image.shape[:2]
+    return b'P6\n%d %d\n255\n' % (width, height) + image.tobytes()
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind+data))
+
+
+def encode_png(image, level=1):
+    '''
+    Returns PNG file content with given RGB image (rows are not filtered, level is zlib compression level)
+    '''
+    height, width = image.shape[:2]
+    rows = np.zeros((height, 1+3*width), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(height, 3*width)
+    return (PNG_SIGNATURE + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + _png_chunk(b'IDAT', zlib.compress(rows.tobytes(), level)) + _png_chunk(b'IEND', b''))
+
+
+class FrameWriter(object):
+    '''
+    Writes frames to 'directory' as frame_<step>.<fileFormat> (every 'every'-th step).
+    'renderer' - FrameRenderer (created on the first frame), 'numFrames' - number of written frames
+    '''
+    __slots__ = ('directory', 'width', 'height', 'fileFormat', 'every', 'palette', 'renderer', 'numFrames')
+
+    def __init__(self, directory, width=1024, height=768, fileFormat='png', every=1, pal=None):
+        if not fileFormat in FORMATS:
+            raise ValueError('Unknown frame format: %s' % fileFormat)
+        if every<1:
+            raise ValueError('Frame interval must be positive')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.fileFormat = fileFormat
+        self.every = every
+        self.palette = pal
+        self.renderer = None
+        self.numFrames = 0
+
+    def _get_renderer(self, field):
+        if self.renderer is None or self.renderer.field is not field:
+            self.renderer = FrameRenderer(field, self.width, self.height, self.palette)
+        return self.renderer
+
+    def write(self, step, model, counts=None):
+        '''
+        Writes frame of the model if step should be written ('counts' - see FrameRenderer.update_from_model)
+        '''
+        renderer = self._get_renderer(model.field)
+        renderer.update_from_model(model, counts)
+        if step%self.every==0:
+            self._save(step, renderer.render())
+
+    def write_state(self, step, state):
+        '''
+        Writes frame of state.PackedBacterioState if step should be written
+        '''
+        if step%self.every==0:
+            renderer = self._get_renderer(state.field)
+            renderer.update_from_state(state)
+            self._save(step, renderer.render())
+
+    def _save(self, step, image):
+        data = encode_png(image) if self.fileFormat=='png' else encode_ppm(image)
+        with open(os.path.join(self.directory, 'frame_%06d.%s' % (step, self.fileFormat)), 'wb') as f:
+            f.write(data)
+        self.numFrames += 1
+
+
+def parse_size(text):
+    '''
+    Parses 'WIDTHxHEIGHT' to (width, height)
+    '''
+    width, sep, height = text.lower().partition('x')
+    if sep=='' or int(width)<=0 or int(height)<=0:
+        raise ValueError('Expected WIDTHxHEIGHT but got: %s' % text)
+    return int(width), int(height)
+
+
+def main(argv=None):
+    from app.journal import JournalReader
+
+    parser = argparse.ArgumentParser(prog='python -m app.frames', description='Renders steps of run journal to image files')
+    parser.add_argument('journal', help='run journal (.bjf)')
+    parser.add_argument('out', help='output directory')
+    parser.add_argument('--size', default='1024x768', help='frame size WIDTHxHEIGHT (default: %(default)s)')
+    parser.add_argument('--format', choices=FORMATS, default='png', help='image format (default: %(default)s)')
+    parser.add_argument('--every', type=int, default=1, metavar='K', help='render every K-th step (default: %(default)s)')
+    parser.add_argument('--start', type=int, help='the first step (default: the first recorded one)')
+    parser.add_argument('--stop', type=int, help='the last step (default: the last recorded one)')
+    parser.add_argument('--palette', default='config/palette.ini', help='palette file (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    try:
+        width, height = parse_size(args.size)
+        writer = FrameWriter(args.out, width, height, args.format, args.every, palette.load_palette(args.palette))
+        with JournalReader(args.journal) as reader:
+            for step, state in reader.iter_states(args.start, args.stop):
+                writer.write_state(step, state)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    print('%d frames written to %s' % (writer.numFrames, args.out))
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
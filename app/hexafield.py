@@ -24,6 +24,8 @@ So far every hexagon can be characterized only having 2 coords (we will use X an
 '''
 
 import math
+from array import array
+from itertools import chain
 
 class HexCoords(object):
     '''
@@ -111,67 +113,300 @@ def get_step_to(hcFrom, hcTo):
     if maxIndex==1:
         return make_hex_coords(y=sign(dy), z=-sign(dy), base=hcFrom)
     return make_hex_coords(z=sign(dz), x=-sign(dz), base=hcFrom)
-    
+
+
+class OffsetTable(object):
+    '''
+    Batch versions of get_distance_between and get_step_to for many pairs of cells given as plain coordinates.
+    Results for all offsets (dx, dy) with |dx|<='radius' and |dy|<='radius' are precomputed:
+    'distances', 'stepXs' and 'stepYs' are arrays ('i') indexed by (dx+radius)*(2*radius+1)+(dy+radius)
+    (see get_offset_index) with distance from (0,0) to (dx,dy) and offset of the first step towards it
+    ((0,0) for zero offset). Batch queries take sequences of integers (lists, arrays, NumPy arrays)
+    and return arrays ('i'), pairs outside the table are calculated by the scalar functions.
+    Vectorized code could index the tables directly (e.g. numpy.frombuffer(table.stepXs, dtype=numpy.int32)).
+    '''
+    __slots__ = ('radius', 'size', 'distances', 'stepXs', 'stepYs')
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.size = 2*radius+1
+        self.distances = array('i')
+        self.stepXs = array('i')
+        self.stepYs = array('i')
+        origin = HexCoords(0,0)
+        for dx in range(-radius, radius+1):
+            for dy in range(-radius, radius+1):
+                hc = HexCoords(dx, dy)
+                step = get_step_to(origin, hc)
+                self.distances.append(get_distance_between(origin, hc))
+                self.stepXs.append(step.x)
+                self.stepYs.append(step.y)
+
+    def get_offset_index(self, dx, dy):
+        '''
+        Returns index of offset (dx, dy) in the tables or -1 if it's out of the tables
+        '''
+        r = self.radius
+        if -r<=dx<=r and -r<=dy<=r:
+            return (dx+r)*self.size+dy+r
+        return -1
+
+    def get_distances(self, xsFrom, ysFrom, xsTo, ysTo):
+        '''
+        Returns array of distances between (xsFrom[i], ysFrom[i]) and (xsTo[i], ysTo[i]) (see get_distance_between)
+        '''
+        r = self.radius
+        size = self.size
+        distances = self.distances
+        res = array('i')
+        for x0, y0, x1, y1 in zip(xsFrom, ysFrom, xsTo, ysTo):
+            dx = x1-x0
+            dy = y1-y0
+            if -r<=dx<=r and -r<=dy<=r:
+                res.append(distances[(dx+r)*size+dy+r])
+            else:
+                res.append(get_distance_between(HexCoords(x0, y0), HexCoords(x1, y1)))
+        return res
+
+    def get_steps_to(self, xsFrom, ysFrom, xsTo, ysTo):
+        '''
+        Returns arrays (xs, ys) of the first cells on the shortest paths
+        from (xsFrom[i], ysFrom[i]) to (xsTo[i], ysTo[i]) (see get_step_to)
+        '''
+        r = self.radius
+        size = self.size
+        stepXs = self.stepXs
+        stepYs = self.stepYs
+        resXs = array('i')
+        resYs = array('i')
+        for x0, y0, x1, y1 in zip(xsFrom, ysFrom, xsTo, ysTo):
+            dx = x1-x0
+            dy = y1-y0
+            if -r<=dx<=r and -r<=dy<=r:
+                i = (dx+r)*size+dy+r
+                resXs.append(x0+stepXs[i])
+                resYs.append(y0+stepYs[i])
+            else:
+                step = get_step_to(HexCoords(x0, y0), HexCoords(x1, y1))
+                resXs.append(step.x)
+                resYs.append(step.y)
+        return resXs, resYs
+
+
+# Neighbourhood tables are built lazily, one per (query, radius) pair.
+# Table which would hold more than MAX_TABLE_ENTRIES references is never built,
+# such queries are calculated on every call instead.
+MAX_TABLE_ENTRIES = 4000000
+
+NEIGHBOURS = 0
+WITHIN = 1
+EXACT_RANGE = 2
+
+
+def count_cells_within(radius):
+    '''
+    Returns number of cells within given radius (including the central one) on unbounded field
+    '''
+    return 3*radius*(radius+1)+1
+
+
+def _get_table_row_size(kind, radius):
+    if kind==NEIGHBOURS:
+        return count_cells_within(radius)-1
+    if kind==WITHIN:
+        return count_cells_within(radius)
+    return 6*radius
+
 
 class HexafieldBase(object):
     '''
     Describes hexagonal field.
-    _field is set of HexCoords 
+    _field is set of HexCoords (or set-like object which supports 'in', iteration and len(),
+    see ImplicitHexafield)
+    _tables is dict with lazily built neighbourhood tables (see _get_table).
+    Neighbourhood queries return tuples shared between calls - they must not be modified.
+    Fields could wrap around (see TorusHexafield): all queries go through _get_cell(), and paths
+    should be taken from get_step_to() method rather than from module-level get_step_to().
     '''
-    __slots__ = ['_field']
+    __slots__ = ['_field', '_tables']
     
     def __init__(self, field):
         self._field = field
+        self._tables = dict()
+    
+    def __getstate__(self):
+        # tables are just a cache - they are rebuilt on demand after unpickling
+        state = dict()
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name!='_tables' and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return (None, state)
+    
+    def __setstate__(self, state):
+        for name, value in state[1].items():
+            setattr(self, name, value)
+        self._tables = dict()
+    
+    def _get_cells(self):
+        '''
+        Returns dict which maps every cell of the field to itself.
+        Tables store these instances so no extra HexCoords are kept in memory.
+        '''
+        cells = self._tables.get('cells')
+        if cells is None:
+            cells = self._tables['cells'] = { hc:hc for hc in self._field }
+        return cells
+    
+    def _get_cell(self, x, y):
+        '''
+        Returns HexCoords of the field's cell at (x, y) or None if there is no such cell.
+        (Fields which wrap around return cell which (x, y) is wrapped to)
+        '''
+        return self._get_cells().get(HexCoords(x, y))
+    
+    def get_periods(self):
+        '''
+        Returns tuple of (dx, dy) shifts which map every cell to itself (empty unless the field wraps around)
+        '''
+        return ()
+    
+    def wrap_coords(self, x, y):
+        '''
+        Returns (x, y) of the cell which (x, y) is wrapped to (unchanged unless the field wraps around)
+        '''
+        return x, y
+    
+    def get_columns(self):
+        '''
+        Returns list of (x, yMin, yMax) of the field's columns (cells with the same x) ordered by x
+        or None if there are gaps between columns or between cells of a column
+        '''
+        bounds = dict()
+        for hc in self._field:
+            x, y = hc._coords
+            column = bounds.get(x)
+            if column is None:
+                bounds[x] = [y, y, 1]
+            else:
+                column[0] = min(column[0], y)
+                column[1] = max(column[1], y)
+                column[2] += 1
+        columns = [ (x, yMin, yMax) for x, (yMin, yMax, count) in sorted(bounds.items()) if yMax-yMin+1==count ]
+        if len(columns)!=len(bounds) or (columns and columns[-1][0]-columns[0][0]+1!=len(columns)):
+            return None
+        return columns
+    
+    def get_step_to(self, hcFrom, hcTo):
+        '''
+        Returns the neighbour of hcFrom which is the first cell on a shortest path to hcTo
+        (see module-level get_step_to). If that step leaves the field (e.g. near the top and bottom
+        edges of RectangleHexafield, whose rows are zigzag lines), another neighbour on a shortest path
+        within the field is returned, or hcFrom if there is no such neighbour.
+        '''
+        step = get_step_to(hcFrom, hcTo)
+        if step in self._field:
+            return step
+        distance = get_distance_between(hcFrom, hcTo)-1
+        for hc in self.get_neighbours(hcFrom):
+            if get_distance_between(hc, hcTo)==distance:
+                return hc
+        return hcFrom
+    
+    def _get_table(self, kind, radius):
+        '''
+        Returns dict (HexCoords -> tuple of HexCoords) for given kind of query and radius.
+        Rows are added on the first query for each cell.
+        Returns None if the table could exceed MAX_TABLE_ENTRIES.
+        '''
+        key = (kind, radius)
+        if key in self._tables:
+            return self._tables[key]
+        if len(self._field)*_get_table_row_size(kind, radius) > MAX_TABLE_ENTRIES:
+            table = None
+        else:
+            table = dict()
+        self._tables[key] = table
+        return table
+    
+    def _query(self, kind, hexCoords, radius, find):
+        table = self._get_table(kind, radius)
+        if table is None:
+            return tuple(find(hexCoords, radius))
+        res = table.get(hexCoords)
+        if res is None:
+            res = tuple(find(hexCoords, radius))
+            if hexCoords in self._field:
+                table[hexCoords] = res
+        return res
     
     def get_neighbours(self, hexCoords, radius = 1):
         '''
-        Returns list of HexCoords of all cells close to hexCoords
+        Returns tuple of HexCoords of all cells close to hexCoords
         in given radius (excluding hexCoords itself)
         '''
+        return self._query(NEIGHBOURS, hexCoords, radius, self._find_neighbours)
+    
+    def get_all_within(self, hexCoords, radius):
+        '''
+        Returns tuple of HexCoords of all cells within the given radius
+        '''
+        return self._query(WITHIN, hexCoords, radius, self._find_all_within)
+    
+    def get_at_exact_range(self, hexCoords, radius = 1):
+        '''
+        Returns tuple of HexCoords of all cells located at
+        exact radius from hexCoords
+        '''
+        return self._query(EXACT_RANGE, hexCoords, radius, self._find_at_exact_range)
+    
+    def _find_neighbours(self, hexCoords, radius):
+        get_cell = self._get_cell
         res = []
         for dx in range(-radius, radius+1):
             for dy in range(max(-radius,-dx-radius), min(radius,radius-dx)+1):
                 if dx!=0 or dy!=0:
-                    hc = HexCoords(hexCoords.x+dx, hexCoords.y+dy)
-                    if hc in self._field:
+                    hc = get_cell(hexCoords.x+dx, hexCoords.y+dy)
+                    if hc is not None:
                         res.append(hc)
         return res
     
-    def get_all_within(self, hexCoords, radius):
-        '''
-        Returns list of HexCoords of all cells within the given radius
-        '''
+    def _find_all_within(self, hexCoords, radius):
+        get_cell = self._get_cell
         res = []
         for dx in range(-radius, radius+1):
             for dy in range(max(-radius,-dx-radius), min(radius,radius-dx)+1):
-                hc = HexCoords(hexCoords.x+dx, hexCoords.y+dy)
-                if hc in self._field:
+                hc = get_cell(hexCoords.x+dx, hexCoords.y+dy)
+                if hc is not None:
                     res.append(hc)
         return res
         
-    def get_at_exact_range(self, hexCoords, radius = 1):
-        '''
-        Returns list of HexCoords of all cells located at
-        exact radius from hexCoords
-        '''
+    def _find_at_exact_range(self, hexCoords, radius):
+        get_cell = self._get_cell
         res = []
+        def append(hc):
+            hc = get_cell(hc.x, hc.y)
+            if hc is not None: res.append(hc)
         for y in range(radius):
-            hc = make_hex_coords(x=radius, y=-y, base=hexCoords)
-            if hc in self._field: res.append(hc)
-            hc = make_hex_coords(x=-radius, y=y, base=hexCoords)
-            if hc in self._field: res.append(hc)
+            append(make_hex_coords(x=radius, y=-y, base=hexCoords))
+            append(make_hex_coords(x=-radius, y=y, base=hexCoords))
         for z in range(radius): 
-            hc = make_hex_coords(y=radius, z=-z, base=hexCoords)
-            if hc in self._field: res.append(hc)
-            hc = make_hex_coords(y=-radius, z=z, base=hexCoords)
-            if hc in self._field: res.append(hc)
+            append(make_hex_coords(y=radius, z=-z, base=hexCoords))
+            append(make_hex_coords(y=-radius, z=z, base=hexCoords))
         for x in range(radius): 
-            hc = make_hex_coords(z=radius, x=-x, base=hexCoords)
-            if hc in self._field: res.append(hc)
-            hc = make_hex_coords(z=-radius, x=x, base=hexCoords)
-            if hc in self._field: res.append(hc)
+            append(make_hex_coords(z=radius, x=-x, base=hexCoords))
+            append(make_hex_coords(z=-radius, x=x, base=hexCoords))
         return res
     
+    def get_cell_index(self):
+        '''
+        Returns CellIndex of the field (built on the first call)
+        '''
+        index = self._tables.get('index')
+        if index is None:
+            index = self._tables['index'] = CellIndex(self)
+        return index
+    
     def get_max_coord_value(self):
         '''
         Returns the maximum absolute coordinate value over all cells
@@ -187,17 +422,433 @@ class HexafieldBase(object):
         return result
 
 
+class _Plane(HexafieldBase):
+    '''
+    Unbounded field (used to get offsets of neighbourhoods)
+    '''
+    __slots__ = []
+    
+    def _get_cell(self, x, y):
+        return HexCoords(x, y)
+
+
+# (kind of query, radius) -> tuple of offsets (see get_offsets)
+_offsets = dict()
+
+
+def get_offsets(kind, radius):
+    '''
+    Returns tuple of (dx, dy) of cells found by given kind of query (NEIGHBOURS, WITHIN or EXACT_RANGE)
+    around (0,0) on unbounded field in the same order as HexafieldBase queries return them
+    '''
+    res = _offsets.get((kind, radius))
+    if res is None:
+        plane = _Plane(None)
+        find = (plane._find_neighbours, plane._find_all_within, plane._find_at_exact_range)[kind]
+        res = _offsets[(kind, radius)] = tuple(hc._coords for hc in find(HexCoords(0,0), radius))
+    return res
+
+
+# Directions to the neighbouring cells as (dx, dy), counter-clockwise starting from +X
+DIRECTIONS = ((1,-1), (1,0), (0,1), (-1,1), (-1,0), (0,-1))
+
+
+class CellIndex(object):
+    '''
+    Dense integer numbering of the cells of given field (ordered by x, then by y).
+    'xs' and 'ys' are arrays of cells' coordinates,
+    'adjacency' is array of len(DIRECTIONS) neighbour indices per cell (-1 if there is no neighbour
+    in given direction), so neighbour of cell i in direction d is adjacency[i*len(DIRECTIONS)+d]
+    (it's built on the first access - it's the largest part of the index and most users don't need it).
+    Cells of each column are consecutive on fields of all shapes, so index of a cell is calculated from
+    per-column offsets (see find) and no HexCoords are created. 'cells' (list of HexCoords) and 'indices'
+    (dict HexCoords -> cell index) are built on the first access, they are kept for compatibility
+    and for fields with gaps in columns (which are indexed by 'indices').
+    Neighbourhood queries take cell index and return array ('i') of indices (it holds no int objects,
+    so cached rows take several times less memory than tuples), rows are cached the same way HexafieldBase does.
+    '''
+    __slots__ = ('field', 'xs', 'ys', '_xMin', '_columnStarts', '_columnYMins', '_cells', '_indices', '_adjacency', '_tables')
+    
+    def __init__(self, field):
+        self.field = field
+        self._cells = None
+        self._indices = None
+        self._adjacency = None
+        self._tables = dict()
+        columns = field.get_columns()
+        if columns is None:
+            self._cells = sorted(field._field, key=lambda hc: hc._coords)
+            self.xs = array('i', [hc.x for hc in self._cells])
+            self.ys = array('i', [hc.y for hc in self._cells])
+            self._columnStarts = None
+            return
+        self.xs = array('i')
+        self.ys = array('i')
+        self._xMin = columns[0][0] if columns else 0
+        # index of the first cell of each column (and total number of cells at the end)
+        self._columnStarts = array('l')
+        self._columnYMins = array('i')
+        for x, yMin, yMax in columns:
+            self._columnStarts.append(len(self.xs))
+            self._columnYMins.append(yMin)
+            self.xs.extend(array('i', [x])*(yMax-yMin+1))
+            self.ys.extend(array('i', range(yMin, yMax+1)))
+        self._columnStarts.append(len(self.xs))
+
+    def find(self, x, y):
+        '''
+        Returns index of cell (x, y) or -1 if there is no such cell (coordinates are not wrapped, see HexafieldBase.wrap_coords)
+        '''
+        starts = self._columnStarts
+        if starts is None:
+            return self.indices.get(HexCoords(x, y), -1)
+        column = x-self._xMin
+        if 0<=column<len(starts)-1:
+            i = starts[column]+y-self._columnYMins[column]
+            if starts[column]<=i<starts[column+1]:
+                return i
+        return -1
+
+    def get_cell(self, i):
+        '''
+        Returns HexCoords of cell with given index
+        '''
+        return HexCoords(self.xs[i], self.ys[i])
+
+    @property
+    def cells(self):
+        if self._cells is None:
+            self._cells = [ HexCoords(x, y) for x, y in zip(self.xs, self.ys) ]
+        return self._cells
+
+    @property
+    def indices(self):
+        if self._indices is None:
+            self._indices = { hc:i for i, hc in enumerate(self.cells) }
+        return self._indices
+
+    @property
+    def adjacency(self):
+        if self._adjacency is None:
+            find = self.find
+            if self.field.get_periods():
+                wrap = self.field.wrap_coords
+                self._adjacency = array('i', [ find(*wrap(x+dx, y+dy)) for x, y in zip(self.xs, self.ys) for dx, dy in DIRECTIONS ])
+            else:
+                self._adjacency = array('i', [ find(x+dx, y+dy) for x, y in zip(self.xs, self.ys) for dx, dy in DIRECTIONS ])
+        return self._adjacency
+    
+    def __len__(self):
+        return len(self.xs)
+    
+    def _find(self, kind, cell, radius):
+        '''
+        Returns array ('i') of indices of cells found by given kind of query (in the same order as the field returns them)
+        '''
+        find = self.find
+        if self.field.get_periods():
+            # wrapped neighbourhoods could overlap themselves - the field knows how to handle it
+            query = (self.field._find_neighbours, self.field._find_all_within, self.field._find_at_exact_range)[kind]
+            return array('i', [ find(hc.x, hc.y) for hc in query(self.get_cell(cell), radius) ])
+        x = self.xs[cell]
+        y = self.ys[cell]
+        return array('i', [ i for i in (find(x+dx, y+dy) for dx, dy in get_offsets(kind, radius)) if i>=0 ])
+    
+    def _query(self, kind, cell, radius):
+        table = self._tables.get((kind, radius))
+        if table is None:
+            if len(self)*_get_table_row_size(kind, radius) > MAX_TABLE_ENTRIES:
+                return self._find(kind, cell, radius)
+            table = self._tables[(kind, radius)] = dict()
+        res = table.get(cell)
+        if res is None:
+            res = table[cell] = self._find(kind, cell, radius)
+        return res
+    
+    def get_neighbours(self, cell, radius = 1):
+        '''
+        Returns array of indices of all cells close to given cell index
+        in given radius (excluding the cell itself)
+        '''
+        return self._query(NEIGHBOURS, cell, radius)
+    
+    def get_all_within(self, cell, radius):
+        '''
+        Returns array of indices of all cells within the given radius
+        '''
+        return self._query(WITHIN, cell, radius)
+    
+    def get_at_exact_range(self, cell, radius = 1):
+        '''
+        Returns array of indices of all cells located at exact radius from given cell index
+        '''
+        return self._query(EXACT_RANGE, cell, radius)
+    
+    def get_distances(self, sources, maxDistance):
+        '''
+        Multi-source breadth-first search along the field (on convex fields distances are
+        the same as get_distance_between gives).
+        sources is iterable of cell indices.
+        Returns array of distances from each cell to the closest source
+        (maxDistance+1 for cells which are further than maxDistance)
+        '''
+        res = array('i', [maxDistance+1])*len(self)
+        visited = set(sources)
+        frontier = visited
+        for i in visited:
+            res[i] = 0
+        # adjacency takes several times less memory than neighbourhood table of all cells
+        adjacency = self.adjacency
+        numDirections = len(DIRECTIONS)
+        get_neighbours = lambda i: adjacency[i*numDirections:(i+1)*numDirections]
+        for distance in range(1, maxDistance+1):
+            frontier = set(chain.from_iterable(map(get_neighbours, frontier)))
+            frontier.discard(-1)
+            frontier -= visited
+            visited |= frontier
+            for i in frontier:
+                res[i] = distance
+        return res
+
+
 class CircleHexafield(HexafieldBase):
     '''
     Describes circle-shaped hexagonal field
     '''
-    __slots__ = []
+    __slots__ = ['_radius']
     def __init__(self, fieldRadius = 2):
         field = set()
         for x in range(-fieldRadius, fieldRadius+1):
             for y in range(max(-fieldRadius,-x-fieldRadius), min(fieldRadius,fieldRadius-x)+1):
                 field.add(HexCoords(x,y))
         HexafieldBase.__init__(self,field)
+        self._radius = fieldRadius
+    
+    def __setstate__(self, state):
+        HexafieldBase.__setstate__(self, state)
+        if not hasattr(self, '_radius'):
+            # pickled by older versions which didn't keep the radius
+            self._radius = max((max(abs(hc.x), abs(hc.y), abs(hc.z)) for hc in self._field), default=0)
+    
+    def get_params(self):
+        '''
+        Returns arguments of the constructor
+        '''
+        return (self._radius,)
+    
+    def get_columns(self):
+        return HexagonCells(self._radius).get_columns()
+
+
+class HexagonCells(object):
+    '''
+    Set-like collection (supports 'in', iteration and len()) of cells within 'radius' of (0,0)
+    which doesn't store cells
+    '''
+    __slots__ = ('radius',)
+    
+    def __init__(self, radius):
+        self.radius = radius
+    
+    def has(self, x, y):
+        r = self.radius
+        return -r<=x<=r and -r<=y<=r and -r<=x+y<=r
+    
+    def __contains__(self, hexCoords):
+        return self.has(*hexCoords._coords)
+    
+    def __iter__(self):
+        r = self.radius
+        for x in range(-r, r+1):
+            for y in range(max(-r,-x-r), min(r,r-x)+1):
+                yield HexCoords(x,y)
+    
+    def __len__(self):
+        return count_cells_within(self.radius)
+    
+    def get_columns(self):
+        '''
+        Returns list of (x, yMin, yMax) of columns (see HexafieldBase.get_columns)
+        '''
+        r = self.radius
+        return [ (x, max(-r,-x-r), min(r,r-x)) for x in range(-r, r+1) ]
+
+
+class RectangleCells(object):
+    '''
+    Set-like collection (supports 'in', iteration and len()) of cells of a rectangle which doesn't store cells.
+    Rectangle has 'width' columns (cells with the same x) and 'height' rows (cells with the same y+x//2,
+    on screen each row is a zigzag line), it starts at column 'x0' and row 'y0' (so that (0,0) is in the middle)
+    '''
+    __slots__ = ('width', 'height', 'x0', 'y0')
+    
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.x0 = -(width//2)
+        self.y0 = -(height//2)
+    
+    def has(self, x, y):
+        return 0<=x-self.x0<self.width and 0<=y+x//2-self.y0<self.height
+    
+    def __contains__(self, hexCoords):
+        return self.has(*hexCoords._coords)
+    
+    def __iter__(self):
+        for x in range(self.x0, self.x0+self.width):
+            for row in range(self.y0, self.y0+self.height):
+                yield HexCoords(x, row-x//2)
+    
+    def __len__(self):
+        return self.width*self.height
+    
+    def get_columns(self):
+        '''
+        Returns list of (x, yMin, yMax) of columns (see HexafieldBase.get_columns)
+        '''
+        return [ (x, self.y0-x//2, self.y0+self.height-1-x//2) for x in range(self.x0, self.x0+self.width) ]
+
+
+class ImplicitHexafield(HexafieldBase):
+    '''
+    Field whose cells are not stored: membership is arithmetic (_field is HexagonCells, RectangleCells
+    or any object with has(x, y), 'in', iteration and len()).
+    Cells are created on demand, so geometry costs no memory unless neighbourhood tables or CellIndex are built.
+    '''
+    __slots__ = []
+    
+    def _get_cells(self):
+        raise TypeError('%s does not store cells' % type(self).__name__)
+    
+    def _get_cell(self, x, y):
+        return HexCoords(x, y) if self._field.has(x, y) else None
+    
+    def get_columns(self):
+        if hasattr(self._field, 'get_columns'):
+            return self._field.get_columns()
+        return HexafieldBase.get_columns(self)
+    
+    def get_max_coord_value(self):
+        '''
+        Returns the maximum absolute coordinate value over all cells
+        '''
+        return max(max(abs(hc.x), abs(hc.y), abs(hc.z)) for hc in self._field) if len(self._field)>0 else 0
+
+
+class HexagonHexafield(ImplicitHexafield):
+    '''
+    Describes hexagon-shaped field of given radius - the same cells as CircleHexafield has, but they are not stored
+    '''
+    __slots__ = []
+    
+    def __init__(self, fieldRadius = 2):
+        ImplicitHexafield.__init__(self, HexagonCells(fieldRadius))
+    
+    def get_params(self):
+        '''
+        Returns arguments of the constructor
+        '''
+        return (self._field.radius,)
+
+
+class RectangleHexafield(ImplicitHexafield):
+    '''
+    Describes rectangular field of width x height cells (see RectangleCells)
+    '''
+    __slots__ = []
+    
+    def __init__(self, width, height):
+        if width<1 or height<1:
+            raise ValueError('Wrong field size: %dx%d' % (width, height))
+        ImplicitHexafield.__init__(self, RectangleCells(width, height))
+    
+    def get_params(self):
+        '''
+        Returns arguments of the constructor
+        '''
+        return (self._field.width, self._field.height)
+
+
+class TorusHexafield(RectangleHexafield):
+    '''
+    Describes rectangular field (see RectangleCells) which wraps around: the right column is adjacent
+    to the left one and the top row is adjacent to the bottom one, so every cell has all its neighbours.
+    Width must be even (so that wrapped columns have the same zigzag). Distances are measured along
+    the shortest way around (neighbourhoods of radius over min(width, height)//2 overlap themselves,
+    such queries return every cell once).
+    '''
+    __slots__ = []
+    
+    def __init__(self, width, height):
+        if width%2!=0:
+            raise ValueError('Width of torus field must be even: %d' % width)
+        RectangleHexafield.__init__(self, width, height)
+    
+    def _get_cell(self, x, y):
+        return HexCoords(*self.wrap_coords(x, y))
+    
+    def wrap_coords(self, x, y):
+        cells = self._field
+        wrappedX = cells.x0+(x-cells.x0)%cells.width
+        row = cells.y0+(y+x//2-cells.y0)%cells.height
+        return wrappedX, row-wrappedX//2
+    
+    def get_periods(self):
+        return ((self._field.width, -(self._field.width//2)), (0, self._field.height))
+    
+    def get_closest_image(self, hcFrom, hcTo):
+        '''
+        Returns HexCoords (possibly outside the field) which hcTo is wrapped from and which is the closest to hcFrom
+        '''
+        (px, py), (qx, qy) = self.get_periods()
+        best = None
+        for a in (-1, 0, 1):
+            for b in (-1, 0, 1):
+                image = HexCoords(hcTo.x+a*px+b*qx, hcTo.y+a*py+b*qy)
+                distance = get_distance_between(hcFrom, image)
+                if best is None or distance<bestDistance:
+                    best, bestDistance = image, distance
+        return best
+    
+    def get_step_to(self, hcFrom, hcTo):
+        step = get_step_to(hcFrom, self.get_closest_image(hcFrom, hcTo))
+        return self._get_cell(step.x, step.y)
+    
+    def _find_neighbours(self, hexCoords, radius):
+        res = RectangleHexafield._find_neighbours(self, hexCoords, radius)
+        return [ hc for hc in dict.fromkeys(res) if hc!=hexCoords ]
+    
+    def _find_all_within(self, hexCoords, radius):
+        return list(dict.fromkeys(RectangleHexafield._find_all_within(self, hexCoords, radius)))
+    
+    def _find_at_exact_range(self, hexCoords, radius):
+        res = RectangleHexafield._find_at_exact_range(self, hexCoords, radius)
+        if 2*radius<min(self._field.width, self._field.height):
+            return res
+        # ring overlaps itself: cells which are closer along another way around are excluded
+        closer = set(self._find_all_within(hexCoords, radius-1))
+        return [ hc for hc in dict.fromkeys(res) if not hc in closer ]
+
+
+# field shape name -> (class, names of constructor arguments)
+SHAPES = {
+    'circle': (CircleHexafield, ('radius',)),
+    'hexagon': (HexagonHexafield, ('radius',)),
+    'rectangle': (RectangleHexafield, ('width', 'height')),
+    'torus': (TorusHexafield, ('width', 'height')),
+}
+
+
+def create_hexafield(shape, radius=0, width=0, height=0):
+    '''
+    Returns field of given shape (see SHAPES): 'circle' and 'hexagon' fields have given radius,
+    'rectangle' and 'torus' ones are width x height
+    '''
+    if not shape in SHAPES:
+        raise ValueError('Unknown field shape: %s' % shape)
+    cls, names = SHAPES[shape]
+    args = dict(radius=radius, width=width, height=height)
+    return cls(*(args[name] for name in names))
     
 
 
@@ -263,3 +914,12 @@ class HexCoordConverter(object):
                  center[0]+self.hexRadius/2.0, center[1]+self.hexHeight,
                  center[0]-self.hexRadius/2.0, center[1]+self.hexHeight
         ]
+
+
+def fit_hex_converter(field, width, height):
+    '''
+    Returns HexCoordConverter which fits the whole field into width x height rectangle (centered)
+    '''
+    radius = field.get_max_coord_value()
+    hexRadius = min( width/(2.0*(2.0*radius+1)), height/(2.0*SQRT3D2*(2.0*radius+1)) )
+    return HexCoordConverter(leftHex0=width/2, topHex0=height/2, hexRadius=hexRadius)
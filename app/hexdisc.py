@@ -0,0 +1,233 @@
+'''
+Counts creatures within hexagonal disc around any cell in O(1)
+
+Disc of radius R around (x0,y0) is the parallelogram x0-R..x0+R, y0-R..y0+R
+without two corner triangles:
+    + cells with (x-x0)+(y-y0) > R (R*(R+1)/2 cells near (x0+R, y0+R)),
+    + cells with (x-x0)+(y-y0) < -R (R*(R+1)/2 cells near (x0-R, y0-R)).
+Parallelogram sum is taken from usual 2D prefix sums. Sums over corner triangles of fixed size
+are swept row by row using column-wise prefix sums and prefix sums along x+y=const diagonals.
+Everything is stored on a grid (rows are x, columns are y) padded by R+1 cells around
+the field bounds, so no bound checks are needed and rebuilding is O(grid size) with
+all inner loops running over whole rows. On fields which wrap around (see HexafieldBase.get_periods)
+padding holds copies of counts shifted by periods, so discs crossing the field bounds wrap too
+(discs wider than the field count some cells more than once).
+'''
+
+from itertools import accumulate
+from operator import add, sub
+
+
+class HexDiscSums(object):
+    '''
+    Answers "how many creatures are within 'radius' of given cell".
+    'valid' is False until rebuild() is called and could be reset by owner when counts change.
+    '''
+    __slots__ = ('radius', 'valid', '_xOffset', '_yOffset', '_numRows', '_numColumns', '_shifts', '_clip',
+        '_counts', '_prefix', '_upperTriangles', '_lowerTriangles')
+
+    def __init__(self, field, radius):
+        '''
+        field is HexafieldBase, radius is disc radius
+        '''
+        periods = field.get_periods()
+        cells = field.get_cell_index()
+        xs = cells.xs if len(cells)>0 else [0]
+        ys = cells.ys if len(cells)>0 else [0]
+        self._init_grid(min(xs), max(xs), min(ys), max(ys), radius, bool(periods))
+        if periods:
+            (px, py), (qx, qy) = periods
+            reach = 2+(self._numRows+self._numColumns)//max(1, min(abs(px)+abs(py), abs(qx)+abs(qy)))
+            self._shifts = [ (a*px+b*qx, a*py+b*qy) for a in range(-reach, reach+1) for b in range(-reach, reach+1)
+                if (a, b)!=(0, 0) and abs(a*px+b*qx)<self._numRows and abs(a*py+b*qy)<self._numColumns ]
+
+    @classmethod
+    def for_region(cls, xMin, xMax, yMin, yMax, radius):
+        '''
+        Returns HexDiscSums which answers only for cells with xMin<=x<=xMax and yMin<=y<=yMax of a field
+        which doesn't wrap around. Its rebuild() could be given counts of any cells (ones which are further
+        than radius from the region are ignored)
+        '''
+        res = cls.__new__(cls)
+        res._init_grid(xMin, xMax, yMin, yMax, radius, True)
+        return res
+
+    def _init_grid(self, xMin, xMax, yMin, yMax, radius, clip):
+        self.radius = radius
+        self.valid = False
+        # triangle sweeps expect empty rows near the grid bounds, so if counts are clipped (not all of them
+        # are inside the bounds) grid is padded by extra 'radius' cells which are left empty
+        pad = 2*radius+1 if clip else radius+1
+        self._clip = clip
+        self._xOffset = pad-xMin
+        self._yOffset = pad-yMin
+        self._numRows = xMax-xMin+1+2*pad
+        self._numColumns = yMax-yMin+1+2*pad
+        # shifts by combinations of periods which could move a cell into the padded grid
+        self._shifts = []
+
+    def rebuild(self, counts):
+        '''
+        counts is iterable of (x, y, count) of occupied cells
+        '''
+        R = self.radius
+        W = self._numRows
+        H = self._numColumns
+        grid = [[0]*H for x in range(W)]
+        if self._clip:
+            counts = list(counts)
+            for dx, dy in [(0, 0)]+self._shifts:
+                for x, y, count in counts:
+                    gx = x+dx+self._xOffset
+                    gy = y+dy+self._yOffset
+                    # only counts within radius from the bounds are needed
+                    if R<gx<W-1-R and R<gy<H-1-R:
+                        grid[gx][gy] += count
+        else:
+            for x, y, count in counts:
+                grid[x+self._xOffset][y+self._yOffset] += count
+        self._counts = grid
+        self.valid = True
+        if R==0:
+            return
+        zeros = [0]*(H+1)
+        # rowPrefix[x][y+1] - sum of counts (x, 0..y)
+        rowPrefix = [ list(accumulate([0]+row)) for row in grid ]
+        # prefix[x][y+1] - sum of counts (0..x, 0..y)
+        prefix = []
+        previous = zeros
+        for row in rowPrefix:
+            previous = list(map(add, previous, row))
+            prefix.append(previous)
+        # diagonals[x][y] - sum of counts (x-k, y+k) for k>=0 (extra trailing zero for y=H)
+        diagonals = []
+        previous = zeros
+        for row in grid:
+            previous = list(map(add, row, previous[1:]))+[0]
+            diagonals.append(previous)
+        # upper[X][Y-R+1] - sum of counts (X-a, Y-b) with a,b>=0 and a+b<=R-1, Y>=R-1
+        upper = []
+        previous = [0]*(H-R+1)
+        for X in range(W):
+            column = list(map(sub, rowPrefix[X][R:], rowPrefix[X][:H+1-R]))
+            diagonal = list(map(sub, diagonals[X-1][:H-R+1], diagonals[X-R-1][R:])) if X-R-1>=0 else \
+                    (diagonals[X-1][:H-R+1] if X>=1 else zeros[:H-R+1])
+            previous = list(map(sub, map(add, previous, column), diagonal))
+            upper.append(previous)
+        # lower[X][Y] - sum of counts (X+a, Y+b) with a,b>=0 and a+b<=R-1, X<=W-1-R, Y<=H-R
+        lower = [None]*W
+        previous = [0]*(H-R+1)
+        for X in range(W-1, -1, -1):
+            if X<=W-1-R:
+                row = list(map(sub, rowPrefix[X][R:], rowPrefix[X][:H+1-R]))
+                diagonal = list(map(sub, diagonals[X+R][:H-R+1], diagonals[X][R:]))
+                previous = list(map(sub, map(add, previous, row), diagonal))
+            lower[X] = previous
+        self._prefix = prefix
+        self._upperTriangles = upper
+        self._lowerTriangles = lower
+
+    def get_sum(self, x, y):
+        '''
+        Returns total count within radius from cell (x, y).
+        (Cell must belong to the field given to constructor)
+        '''
+        x += self._xOffset
+        y += self._yOffset
+        R = self.radius
+        if R==0:
+            return self._counts[x][y]
+        prefix = self._prefix
+        top = prefix[x+R]
+        bottom = prefix[x-R-1]
+        return (top[y+R+1]-bottom[y+R+1]-top[y-R]+bottom[y-R]
+                - self._upperTriangles[x+R][y+1] - self._lowerTriangles[x-R][y-R])
+
+
+# default side of chunks of ChunkedDiscSums (in cells)
+CHUNK_SIZE = 32
+
+
+class ChunkedDiscSums(object):
+    '''
+    Answers the same queries as HexDiscSums but doesn't allocate a grid for the whole field:
+    the plane is split into chunks of chunkSize x chunkSize cells (chunk of (x, y) is (x//chunkSize, y//chunkSize))
+    and counts are grouped by chunks. HexDiscSums of a chunk is built on the first query in it from counts
+    of nearby chunks, chunks without counts within radius take no memory. Chunks with few counts nearby
+    (at most chunkSize) are answered by summing these counts directly, which is cheaper than building a grid
+    for a couple of queries. So rebuilding is O(number of counts) and memory is proportional to the area
+    around non-zero counts rather than to the field's area.
+    'valid' is False until rebuild() is called and could be reset by owner when counts change.
+    '''
+    __slots__ = ('radius', 'valid', 'chunkSize', '_shifts', '_counts', '_chunks')
+
+    def __init__(self, field, radius, chunkSize=CHUNK_SIZE):
+        '''
+        field is HexafieldBase, radius is disc radius
+        '''
+        self.radius = radius
+        self.valid = False
+        self.chunkSize = chunkSize
+        periods = field.get_periods()
+        self._shifts = [(0, 0)]
+        if periods:
+            # counts are stored together with their images which could be within radius from the field
+            (px, py), (qx, qy) = periods
+            reach = 1+radius//max(1, min(abs(px)+abs(py), abs(qx)+abs(qy))//2)
+            self._shifts += [ (a*px+b*qx, a*py+b*qy) for a in range(-reach, reach+1) for b in range(-reach, reach+1)
+                if (a, b)!=(0, 0) ]
+        self._counts = dict()
+        self._chunks = dict()
+
+    def rebuild(self, counts):
+        '''
+        counts is iterable of (x, y, count) of cells of the field (cells not mentioned have zero count)
+        '''
+        S = self.chunkSize
+        chunkCounts = dict()
+        for x, y, count in counts:
+            if count!=0:
+                for dx, dy in self._shifts:
+                    key = ((x+dx)//S, (y+dy)//S)
+                    if key in chunkCounts:
+                        chunkCounts[key].append((x+dx, y+dy, count))
+                    else:
+                        chunkCounts[key] = [(x+dx, y+dy, count)]
+        self._counts = chunkCounts
+        self._chunks = dict()
+        self.valid = True
+
+    def count_chunks(self):
+        '''
+        Returns number of chunks which have non-zero counts
+        '''
+        return len(self._counts)
+
+    def _build_chunk(self, cx, cy):
+        S = self.chunkSize
+        reach = (self.radius+S-1)//S
+        counts = []
+        for i in range(cx-reach, cx+reach+1):
+            for j in range(cy-reach, cy+reach+1):
+                counts.extend(self._counts.get((i, j), ()))
+        if len(counts)<=S:
+            return counts
+        sums = HexDiscSums.for_region(cx*S, cx*S+S-1, cy*S, cy*S+S-1, self.radius)
+        sums.rebuild(counts)
+        return sums
+
+    def get_sum(self, x, y):
+        '''
+        Returns total count within radius from cell (x, y).
+        (Cell must belong to the field given to constructor)
+        '''
+        S = self.chunkSize
+        key = (x//S, y//S)
+        try:
+            sums = self._chunks[key]
+        except KeyError:
+            sums = self._chunks[key] = self._build_chunk(*key)
+        if type(sums) is list:
+            R = self.radius
+            return sum(count for cx, cy, count in sums if abs(cx-x)<=R and abs(cy-y)<=R and abs(cx-x+cy-y)<=R)
+        return sums.get_sum(x, y)
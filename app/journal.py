@@ -0,0 +1,502 @@
+'''
+Run journal - compact record of every step of a run which could be replayed from any step
+
+    python -m app.journal info JOURNAL.bjf
+    python -m app.journal extract JOURNAL.bjf STEP OUT.bsf [--compression zlib|lzma|bz2]
+
+Journal is written by JournalWriter (e.g. python -m app.runner --journal FILE) and read by JournalReader.
+Every keyframeEvery-th recorded step is stored as a full state (keyframe), other steps are stored
+as deltas - only cells where number of bacteria, number of predators or energies of predators
+changed since the previous recorded step. To get state of any step the reader jumps to the nearest
+preceding keyframe (found with the index) and applies at most keyframeEvery-1 deltas.
+
+.bjf file (version 2) is little-endian binary:
+    header (HEADER): JOURNAL_MAGIC, format version, compression of frames (see state.COMPRESSIONS),
+        number of steps between keyframes;
+    frames: FRAME_HEADER (kind - KEYFRAME or DELTA, step, payload size) and payload:
+        + keyframe payload is content of .bsf file (see state.encode_state),
+        + delta payload (compressed as a whole if compression is not 0) is DELTA_HEADER (number
+          of changed cells, number of their predators, array typecodes of four sections) and sections
+          padded to 4 bytes: gaps between indices of changed cells (the first one is the index itself),
+          changes of numbers of bacteria and of numbers of predators in changed cells, energies of their
+          predators as differences from energies of predators in the same cell and position at the
+          previous step (predators beyond the previous number are stored as is);
+    index (written by close()): INDEX_ENTRY (step, file offset) for each keyframe, then FOOTER.
+Deltas of version 1 store numbers of bacteria, numbers of predators and energies as is (such journals
+are still read). Differences are mostly small and repeated, so compression packs them better than
+the numbers themselves when a small part of the field changes per step.
+Journal which was not closed (e.g. after crash) has no index and is scanned frame by frame
+(incomplete last frame is ignored).
+'''
+
+from array import array
+import argparse
+from bisect import bisect_right
+from itertools import repeat
+import mmap
+from operator import sub
+import os
+import struct
+import sys
+
+from app.state import COMPRESSIONS, PackedBacterioState, pack_state, encode_state, unpack_state, \
+    save_state, _get_compression_module, _get_typecode
+
+
+JOURNAL_MAGIC = b'BJF\x00'
+JOURNAL_VERSION = 2
+# magic, version, compression, steps between keyframes
+HEADER = struct.Struct('<4sHBxI')
+KEYFRAME = 0
+DELTA = 1
+# kind, step, payload size
+FRAME_HEADER = struct.Struct('<BxxxqI')
+# number of changed cells, number of their predators, typecodes of sections
+DELTA_HEADER = struct.Struct('<II4s')
+# step, file offset of keyframe
+INDEX_ENTRY = struct.Struct('<qQ')
+INDEX_MAGIC = b'BJFI'
+# file offset of index, number of keyframes, the last recorded step, magic
+FOOTER = struct.Struct('<QQq4s')
+
+
+def _get_predators_by_cell(packed):
+    '''
+    Returns dict (cell index -> tuple of predators' energies) of cells with predators
+    '''
+    energies = packed.predatorEnergies
+    res = dict()
+    start = 0
+    for i, n in enumerate(packed.predatorCounts):
+        if n>0:
+            res[i] = tuple(energies[start:start+n])
+            start += n
+    return res
+
+
+def _encode_section(values, signed):
+    typecode = _get_typecode(values, signed)
+    section = array(typecode, values)
+    if sys.byteorder!='little':
+        section.byteswap()
+    section = section.tobytes()
+    return typecode, section+bytes(-len(section)%4)
+
+
+class JournalWriter(object):
+    '''
+    Writes run journal (see module description).
+    'fileName' - name of journal file, 'keyframeEvery' - number of recorded steps between keyframes,
+    'compression' - name of compression module or None,
+    'numFrames' and 'numKeyframes' - numbers of recorded steps and keyframes
+    '''
+    __slots__ = ('fileName', 'keyframeEvery', 'compression', 'numFrames', 'numKeyframes',
+        '_file', '_module', '_keyframes', '_lastStep', '_bacteria', '_predators')
+
+    def __init__(self, fileName, keyframeEvery=100, compression='zlib'):
+        self._file = None
+        codes = { name:code for code, name in COMPRESSIONS.items() }
+        if not compression in codes:
+            raise ValueError('Unknown compression: %s' % compression)
+        if keyframeEvery<1:
+            raise ValueError('Keyframe interval must be positive')
+        self.fileName = fileName
+        self.keyframeEvery = keyframeEvery
+        self.compression = compression
+        self.numFrames = 0
+        self.numKeyframes = 0
+        self._module = None if compression is None else _get_compression_module(codes[compression])
+        self._keyframes = []
+        self._lastStep = None
+        self._bacteria = None
+        self._predators = None
+        self._file = open(fileName, 'wb')
+        self._file.write(HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, codes[compression], keyframeEvery))
+
+    def record(self, step, state):
+        '''
+        Records state (BacterioState or PackedBacterioState) of given step.
+        Steps must be recorded in increasing order
+        '''
+        self._check_step(step)
+        packed = pack_state(state)
+        if self.numFrames%self.keyframeEvery==0:
+            self._write_keyframe(step, packed)
+            return
+        bacteria = packed.bacteria
+        predators = _get_predators_by_cell(packed)
+        prevPredators = self._predators
+        changed = [ i for i, (prev, n) in enumerate(zip(self._bacteria, bacteria)) if prev!=n ]
+        changed.extend(i for i in prevPredators.keys()|predators.keys() if prevPredators.get(i)!=predators.get(i))
+        self._write_delta(step, changed, [bacteria[i] for i in changed],
+            { i:predators.get(i, ()) for i in changed if i in predators or i in prevPredators })
+
+    def record_changes(self, step, model, counts=None):
+        '''
+        Records state of the model at given step reading only cells changed since the previous recorded
+        step: 'counts' is result of model.pop_cell_counts() (it is called if counts is None), energies
+        of predators in these cells are read with model.get_energies_at(). Keyframes (and steps
+        when all cells are reported changed) are read with model.get_state().
+        Changed cells of the model must not be popped by anybody else between recorded steps
+        '''
+        if counts is None:
+            counts = model.pop_cell_counts()
+        if counts[0] is None or self.numFrames%self.keyframeEvery==0:
+            self.record(step, model.get_state())
+            return
+        self._check_step(step)
+        cells, bacteria, predatorCounts = [ values.tolist() if hasattr(values, 'tolist') else values for values in counts ]
+        prevPredators = self._predators
+        predatorCells = [ i for i, n in zip(cells, predatorCounts) if n>0 or i in prevPredators ]
+        self._write_delta(step, cells, bacteria,
+            { i:tuple(energies) for i, energies in zip(predatorCells, model.get_energies_at(predatorCells)) })
+
+    def _check_step(self, step):
+        if self._lastStep is not None and step<=self._lastStep:
+            raise ValueError('Step %d is recorded after step %d' % (step, self._lastStep))
+
+    def _write_keyframe(self, step, packed):
+        self._keyframes.append((step, self._file.tell()))
+        self._write_frame(KEYFRAME, step, encode_state(packed, self.compression))
+        self.numKeyframes += 1
+        self._bacteria = list(packed.bacteria)
+        self._predators = _get_predators_by_cell(packed)
+        self._lastStep = step
+        self.numFrames += 1
+
+    def _write_delta(self, step, cells, bacteria, predators):
+        '''
+        Writes delta of given step from numbers of bacteria in given cells (cells which could have changed
+        since the previous recorded step, in any order) and dict (cell index -> tuple of energies)
+        of predators in those of them which have or had predators
+        '''
+        prevBacteria = self._bacteria
+        prevPredators = self._predators
+        bacteriaChanges = { i:n-prevBacteria[i] for i, n in zip(cells, bacteria) if n!=prevBacteria[i] }
+        predators = { i:energies for i, energies in predators.items() if energies!=prevPredators.get(i, ()) }
+        for i, change in bacteriaChanges.items():
+            prevBacteria[i] += change
+        for i in predators:
+            bacteriaChanges.setdefault(i, 0)
+        changed = sorted(bacteriaChanges)
+        predatorChanges = dict()
+        energyChanges = []
+        for i in sorted(predators):
+            energies = predators[i]
+            prevEnergies = prevPredators.get(i, ())
+            predatorChanges[i] = len(energies)-len(prevEnergies)
+            energyChanges.extend(energy-prev for energy, prev in zip(energies, prevEnergies))
+            energyChanges.extend(energies[len(prevEnergies):])
+            if energies:
+                prevPredators[i] = energies
+            else:
+                del prevPredators[i]
+        typecodes = ''
+        sections = []
+        for values, signed in ((list(map(sub, changed, [0]+changed)), False), (list(map(bacteriaChanges.__getitem__, changed)), True),
+                               (list(map(predatorChanges.get, changed, repeat(0, len(changed)))), True), (energyChanges, True)):
+            typecode, section = _encode_section(values, signed)
+            typecodes += typecode
+            sections.append(section)
+        payload = DELTA_HEADER.pack(len(changed), len(energyChanges), typecodes.encode())+b''.join(sections)
+        if self._module is not None:
+            payload = self._module.compress(payload)
+        self._write_frame(DELTA, step, payload)
+        self._lastStep = step
+        self.numFrames += 1
+
+    def _write_frame(self, kind, step, payload):
+        self._file.write(FRAME_HEADER.pack(kind, step, len(payload)))
+        self._file.write(payload)
+
+    def flush(self):
+        '''
+        Writes recorded frames to disk
+        '''
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        '''
+        Writes index and closes journal file (could be called more than once)
+        '''
+        if self._file is None:
+            return
+        indexOffset = self._file.tell()
+        for step, offset in self._keyframes:
+            self._file.write(INDEX_ENTRY.pack(step, offset))
+        lastStep = -1 if self._lastStep is None else self._lastStep
+        self._file.write(FOOTER.pack(indexOffset, len(self._keyframes), lastStep, INDEX_MAGIC))
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def _decode_delta(payload, module):
+    '''
+    Returns (changed cell indices, sections of numbers of bacteria, numbers of predators and energies of predators)
+    (changes of them since the previous step if journal version is 2 or later)
+    '''
+    if module is not None:
+        payload = module.decompress(payload)
+    payload = memoryview(payload)
+    numChanged, numEnergies, typecodes = DELTA_HEADER.unpack_from(payload)
+    offset = DELTA_HEADER.size
+    sections = []
+    for typecode, length in zip(typecodes.decode(), (numChanged, numChanged, numChanged, numEnergies)):
+        size = array(typecode).itemsize*length
+        if offset+size>len(payload):
+            raise ValueError('Truncated journal frame')
+        section = array(typecode, payload[offset:offset+size].tobytes())
+        if sys.byteorder!='little':
+            section.byteswap()
+        sections.append(section)
+        offset += size+(-size%4)
+    gaps, bacteria, predatorCounts, energies = sections
+    indices = []
+    i = 0
+    for gap in gaps:
+        i += gap
+        indices.append(i)
+    return indices, bacteria, predatorCounts, energies
+
+
+class JournalReader(object):
+    '''
+    Reads run journal (see module description).
+    'fileName' - name of journal file, 'keyframeEvery' - number of recorded steps between keyframes,
+    'compression' - name of compression module of frames or None, 'version' - format version of the file,
+    'keyframes' - list of (step, file offset) of keyframes, 'lastStep' - the last recorded step (-1 if none),
+    'indexed' - False if journal was not closed and keyframes were found by scanning
+    '''
+    __slots__ = ('fileName', 'keyframeEvery', 'compression', 'version', 'keyframes', 'lastStep', 'indexed',
+        '_file', '_data', '_end', '_module', '_field')
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self._data = None
+        self._file = None
+        self._file = open(fileName, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size<HEADER.size:
+            self._file.close()
+            raise ValueError('Not a journal file')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, compression, keyframeEvery = HEADER.unpack_from(self._data)
+        if magic!=JOURNAL_MAGIC:
+            self.close()
+            raise ValueError('Not a journal file')
+        if version>JOURNAL_VERSION:
+            self.close()
+            raise ValueError('Unsupported journal version %d (the latest supported is %d)' % (version, JOURNAL_VERSION))
+        if not compression in COMPRESSIONS:
+            self.close()
+            raise ValueError('Unknown compression: %d' % compression)
+        self._module = None if compression==0 else _get_compression_module(compression)
+        self.version = version
+        self.compression = COMPRESSIONS[compression]
+        self.keyframeEvery = keyframeEvery
+        self._field = None
+        self._end = len(self._data)
+        if not self._read_index():
+            self._scan()
+
+    def _read_index(self):
+        data = self._data
+        if len(data)<HEADER.size+FOOTER.size:
+            return False
+        indexOffset, numKeyframes, lastStep, magic = FOOTER.unpack_from(data, len(data)-FOOTER.size)
+        if magic!=INDEX_MAGIC or indexOffset+numKeyframes*INDEX_ENTRY.size+FOOTER.size!=len(data):
+            return False
+        self.keyframes = [INDEX_ENTRY.unpack_from(data, indexOffset+i*INDEX_ENTRY.size) for i in range(numKeyframes)]
+        self.lastStep = lastStep
+        self.indexed = True
+        self._end = indexOffset
+        return True
+
+    def _scan(self):
+        self.keyframes = []
+        self.lastStep = -1
+        self.indexed = False
+        for kind, step, offset, payload in self._iter_frames(HEADER.size):
+            if kind==KEYFRAME:
+                self.keyframes.append((step, offset))
+            self.lastStep = step
+
+    def _iter_frames(self, offset):
+        '''
+        Yields (kind, step, offset, payload) of frames starting at given file offset
+        '''
+        data = self._data
+        while offset+FRAME_HEADER.size<=self._end:
+            kind, step, size = FRAME_HEADER.unpack_from(data, offset)
+            start = offset+FRAME_HEADER.size
+            if not kind in (KEYFRAME, DELTA) or start+size>self._end:
+                return
+            yield kind, step, offset, data[start:start+size]
+            offset = start+size
+
+    def get_steps(self):
+        '''
+        Returns (first, last) recorded steps (None if journal is empty)
+        '''
+        if not self.keyframes:
+            return None
+        return self.keyframes[0][0], self.lastStep
+
+    def iter_states(self, start=None, stop=None):
+        '''
+        Yields (step, PackedBacterioState) for recorded steps from start (the first one if None)
+        to stop inclusive (the last one if None)
+        '''
+        if not self.keyframes:
+            return
+        if start is None:
+            start = self.keyframes[0][0]
+        k = bisect_right(self.keyframes, (start, 2**64))-1
+        if k<0:
+            raise ValueError('Step %d is before the first recorded step %d' % (start, self.keyframes[0][0]))
+        bacteria = predators = None
+        for kind, step, offset, payload in self._iter_frames(self.keyframes[k][1]):
+            if stop is not None and step>stop:
+                return
+            if kind==KEYFRAME:
+                packed = unpack_state(payload, self._field)
+                self._field = packed.field
+                bacteria = list(packed.bacteria)
+                predators = _get_predators_by_cell(packed)
+                del packed
+            else:
+                self._apply_delta(bacteria, predators, *_decode_delta(payload, self._module))
+            if step>=start:
+                yield step, self._make_state(bacteria, predators)
+
+    def _apply_delta(self, bacteria, predators, indices, counts, predatorCounts, energies):
+        '''
+        Updates list of numbers of bacteria and dict of energies of predators (see _get_predators_by_cell) with decoded delta
+        '''
+        pos = 0
+        for i, n, p in zip(indices, counts, predatorCounts):
+            if self.version>=2:
+                prevEnergies = predators.get(i, ())
+                n += bacteria[i]
+                p += len(prevEnergies)
+                cellEnergies = energies[pos:pos+p]
+                cellEnergies = tuple(energy+prev for energy, prev in zip(cellEnergies, prevEnergies))+tuple(cellEnergies[len(prevEnergies):])
+            else:
+                cellEnergies = tuple(energies[pos:pos+p])
+            bacteria[i] = n
+            if p>0:
+                predators[i] = cellEnergies
+                pos += p
+            else:
+                predators.pop(i, None)
+
+    def _make_state(self, bacteria, predators):
+        predatorCounts = [0]*len(bacteria)
+        energies = []
+        for i in sorted(predators):
+            predatorCounts[i] = len(predators[i])
+            energies.extend(predators[i])
+        return PackedBacterioState(self._field, list(bacteria), predatorCounts, energies)
+
+    def get_state(self, step):
+        '''
+        Returns PackedBacterioState of given step (or of the last recorded step before it)
+        '''
+        steps = self.get_steps()
+        if steps is None or step<steps[0] or step>steps[1]:
+            raise ValueError('Step %d is not recorded' % step)
+        res = None
+        for recordedStep, packed in self.iter_states(self.keyframes[bisect_right(self.keyframes, (step, 2**64))-1][0], step):
+            res = packed
+        return res
+
+    def count_frames(self):
+        '''
+        Returns number of recorded steps (frames are scanned)
+        '''
+        return sum(1 for frame in self._iter_frames(HEADER.size))
+
+    def get_size(self):
+        '''
+        Returns (total size of journal, total size of keyframes) in bytes
+        '''
+        keyframesSize = 0
+        for step, offset in self.keyframes:
+            kind, frameStep, size = FRAME_HEADER.unpack_from(self._data, offset)
+            keyframesSize += FRAME_HEADER.size+size
+        return len(self._data), keyframesSize
+
+    def close(self):
+        '''
+        Closes journal file (could be called more than once)
+        '''
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.journal', description='Inspects run journals')
+    commands = parser.add_subparsers(dest='command', required=True)
+    info = commands.add_parser('info', help='print summary of journal')
+    info.add_argument('journal')
+    extract = commands.add_parser('extract', help='save state of given step to .bsf file')
+    extract.add_argument('journal')
+    extract.add_argument('step', type=int)
+    extract.add_argument('out')
+    extract.add_argument('--compression', choices=('zlib', 'lzma', 'bz2'), help='compression of saved state (default: none)')
+    args = parser.parse_args(argv)
+
+    try:
+        reader = JournalReader(args.journal)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    with reader:
+        steps = reader.get_steps()
+        if args.command=='info':
+            if steps is None:
+                print('Empty journal')
+                return 0
+            size, keyframesSize = reader.get_size()
+            numKeyframes = len(reader.keyframes)
+            numFrames = reader.count_frames()
+            print('Steps: %d..%d (%d recorded)' % (steps[0], steps[1], numFrames))
+            print('Keyframes: %d (every %d steps)%s' % (numKeyframes, reader.keyframeEvery, '' if reader.indexed else ', not indexed'))
+            print('Compression: %s' % reader.compression)
+            print('Size: %d bytes' % size)
+            print('Mean frame size: keyframe %d bytes, delta %d bytes' % (keyframesSize//numKeyframes,
+                (size-keyframesSize)//max(numFrames-numKeyframes, 1)))
+            return 0
+        try:
+            packed = reader.get_state(args.step)
+        except ValueError as e:
+            parser.error(str(e))
+        save_state(packed, args.out, args.compression)
+    print('Step %d saved to %s' % (args.step, args.out))
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -3,10 +3,15 @@ Describes core model of bacterio
 '''
 
 import random
+from array import array
+from collections import Counter
 
-from app.hexafield import HexCoords, get_step_to
+from app.hexafield import HexCoords, count_cells_within
 from app.creatures import Predator, Bacteria
-from app.rand_p import rand_p
+from app.model_params import compile_samplers
+from app.state import BacterioState
+from app.hexdisc import HexDiscSums
+from app.model_stats import ModelStats
 
 
 class CoreModel(object):
@@ -14,9 +19,19 @@ class CoreModel(object):
     Describes core (the simpliest one) model of bacterio.
     'field' is HexafieldBase instance,
     'modelParams' is ModelParams instance,
-    'bacteriaPositions' and 'predatorPositions' are dicts with keys HexCoords and values lists of Bacteria and Predator
+    'samplers' is model_params.Samplers compiled from modelParams,
+    'bacteriaPositions' and 'predatorPositions' are dicts with keys HexCoords and values lists of Bacteria and Predator,
+    'stats' is model_stats.ModelStats updated during phases and edits (count_bacteria/count_predators read it).
+    Overcrowd checks are answered by hexdisc.HexDiscSums which are rebuilt on the first check
+    after positions have changed (i.e. once per phase).
+    Changed cells are tracked only after the first pop_changed_cells() call, so models which are
+    never asked (e.g. headless runs) don't pay for it.
     '''
-    __slots__ = ('modelParams', 'field', 'bacteriaPositions', 'predatorPositions')
+    __slots__ = ('modelParams', 'samplers', 'field', 'bacteriaPositions', 'predatorPositions', '_bacteriaSums', '_predatorSums', '_bacteriaDistances',
+        '_changedCells', 'stats')
+
+    # class of overcrowd sums (hexdisc.HexDiscSums or any class with the same interface)
+    discSumsClass = HexDiscSums
     
     def __init__(self, modelParams, state):
         '''
@@ -24,6 +39,7 @@ class CoreModel(object):
         state is state.BacretioState that will be parsed as initial state
         '''
         self.modelParams = modelParams
+        self.samplers = compile_samplers(modelParams)
         self.parse_state(state)
         
     def parse_state(self, state):
@@ -33,21 +49,69 @@ class CoreModel(object):
         self.field = state.field
         self.bacteriaPositions = state.bacteriaPositions
         self.predatorPositions = state.predatorPositions
+        self._bacteriaSums = self.discSumsClass(self.field, self.modelParams.BACT_OVERCROWD_RADIUS)
+        self._predatorSums = self.discSumsClass(self.field, self.modelParams.PR_OVERCROWD_RADIUS)
+        self._bacteriaDistances = None
+        self._changedCells = None
+        self.stats = ModelStats.count((len(bacts) for bacts in self.bacteriaPositions.values()),
+            ([pr.energy for pr in prs] for prs in self.predatorPositions.values()))
     
     def step(self):
         '''
         Makes one turn and updates 'bacteriaPositions' and 'predatorPositions'
         '''
+        changed = self._changedCells
+        if changed is not None:
+            changed.update(self.bacteriaPositions)
+            changed.update(self.predatorPositions)
+        self.stats.start_step()
         self.step_predators()
         self.step_bacteria()
+        if changed is not None:
+            changed.update(self.bacteriaPositions)
+            changed.update(self.predatorPositions)
+
+    def pop_changed_cells(self):
+        '''
+        Returns set of HexCoords of cells whose creatures could have changed since the previous call
+        (cells occupied before or after each step and edited cells) or None if all cells should be
+        considered changed (the first call and the first call after parse_state)
+        '''
+        res = self._changedCells
+        self._changedCells = set()
+        return res
+
+    def pop_cell_counts(self):
+        '''
+        Bulk form of pop_changed_cells for viewers which keep per-cell numbers.
+        Returns (cells, bacteria, predators): 'cells' is sequence of indices (see hexafield.CellIndex) of cells
+        whose creatures could have changed since the previous call of pop_cell_counts or pop_changed_cells,
+        'bacteria' and 'predators' are numbers of bacteria and predators in these cells (in the same order).
+        If all cells should be considered changed 'cells' is None and the numbers are given for all cells
+        '''
+        changed = self.pop_changed_cells()
+        index = self.field.get_cell_index()
+        find = index.find
+        if changed is None:
+            bacteria = array('l', bytes(8*len(index)))
+            predators = array('l', bytes(8*len(index)))
+            for hc in self.bacteriaPositions:
+                bacteria[find(hc.x, hc.y)] = self.count_bacteria_at(hc)
+            for hc in self.predatorPositions:
+                predators[find(hc.x, hc.y)] = self.count_predators_at(hc)
+            return None, bacteria, predators
+        return ([ find(hc.x, hc.y) for hc in changed ], [ self.count_bacteria_at(hc) for hc in changed ],
+            [ self.count_predators_at(hc) for hc in changed ])
     
     def step_predators(self):
         newPredatorPositions = dict()
+        born = died = eaten = 0
         for hc in self.predatorPositions:
             notOvercrowded = self.check_predators_overcrowd(hc)
             for pr in self.predatorPositions[hc]:
-                if notOvercrowded and pr.energy>=self.modelParams.PR_DIVIDE_ENERGY and rand_p(self.modelParams.P_PR_DIVIDE)==1:
+                if notOvercrowded and pr.energy>=self.modelParams.PR_DIVIDE_ENERGY and self.samplers.P_PR_DIVIDE()==1:
                     # DIVIDE
+                    born += 1
                     if not hc in newPredatorPositions:
                         newPredatorPositions[hc] = []
                     offspringEnergy = (pr.energy-self.modelParams.PR_DIVIDE_COST)//2
@@ -55,7 +119,7 @@ class CoreModel(object):
                     newPredatorPositions[hc].append(Predator(offspringEnergy))
                 elif pr.energy>=self.modelParams.PR_MAX_ENERGY:
                     # WELL FED
-                    if rand_p(self.modelParams.P_PR_STAY)==1:
+                    if self.samplers.P_PR_STAY()==1:
                         if not hc in newPredatorPositions:
                             newPredatorPositions[hc] = []
                         newPredatorPositions[hc].append(pr)
@@ -71,33 +135,59 @@ class CoreModel(object):
                     if pr.energy>0:
                         closestBact = self.find_closest_bacteria(hc)
                         if closestBact is not None:
-                            newPos = get_step_to(hc, closestBact)
+                            newPos = self.field.get_step_to(hc, closestBact)
                             if not newPos in newPredatorPositions:
                                 newPredatorPositions[newPos] = []
                             newPredatorPositions[newPos].append(pr)
-                            if newPos in self.bacteriaPositions:
-                                self.bacteriaPositions[newPos].pop()
-                                if len(self.bacteriaPositions[newPos])==0:
-                                    self.bacteriaPositions.pop(newPos)
+                            if self.eat_bacteria(newPos):
                                 pr.energy+=self.modelParams.PR_FEED_VALUE
+                                eaten += 1
                         else: #if closestBact is None
                             newPos = random.choice(self.field.get_neighbours(hc))
                             if not newPos in newPredatorPositions:
                                 newPredatorPositions[newPos] = []
                             newPredatorPositions[newPos].append(pr)
+                    else:
+                        died += 1
         self.predatorPositions = newPredatorPositions
+        self._predatorSums.valid = False
+        self.update_predator_stats(born, died, eaten)
+
+    def update_predator_stats(self, born, died, eaten):
+        '''
+        Updates 'stats' after predator phase with given numbers of divisions, starved predators and eaten bacteria
+        '''
+        stats = self.stats
+        stats.predatorsBorn += born
+        stats.predatorsDied += died
+        stats.bacteriaEaten += eaten
+        stats.numBacteria -= eaten
+        stats.bacteriaCells = len(self.bacteriaPositions)
+        stats.set_energies(Counter(pr.energy for prs in self.predatorPositions.values() for pr in prs))
+        stats.predatorCells = len(self.predatorPositions)
+
+    def update_bacteria_stats(self, born):
+        '''
+        Updates 'stats' after bacteria phase with given number of divisions
+        '''
+        stats = self.stats
+        stats.bacteriaBorn += born
+        stats.numBacteria += born
+        stats.bacteriaCells = len(self.bacteriaPositions)
 
     def step_bacteria(self):
         newBacteriaPositions = dict()
+        born = 0
         for hc in self.bacteriaPositions:
             notOvercrowded = self.check_bacteria_overcrowd(hc)
             for bact in self.bacteriaPositions[hc]:
-                if notOvercrowded and rand_p(self.modelParams.P_BACT_DIVIDE)==1:
+                if notOvercrowded and self.samplers.P_BACT_DIVIDE()==1:
+                    born += 1
                     if not hc in newBacteriaPositions:
                         newBacteriaPositions[hc] = []
                     newBacteriaPositions[hc].append(Bacteria())
                     newBacteriaPositions[hc].append(Bacteria())
-                elif rand_p(self.modelParams.P_BACT_STAY)==1:
+                elif self.samplers.P_BACT_STAY()==1:
                     if not hc in newBacteriaPositions:
                         newBacteriaPositions[hc] = []
                     newBacteriaPositions[hc].append(bact)
@@ -107,25 +197,75 @@ class CoreModel(object):
                         newBacteriaPositions[newPos] = []
                     newBacteriaPositions[newPos].append(bact)
         self.bacteriaPositions = newBacteriaPositions
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        self.update_bacteria_stats(born)
+    
+    
+    def eat_bacteria(self, hexCoords):
+        '''
+        Removes one bacterium from given cell (if there is any).
+        Returns True if bacterium was eaten
+        '''
+        if not hexCoords in self.bacteriaPositions:
+            return False
+        self.bacteriaPositions[hexCoords].pop()
+        if len(self.bacteriaPositions[hexCoords])==0:
+            self.bacteriaPositions.pop(hexCoords)
+        self._bacteriaSums.valid = False
+        return True
     
     
     def count_bacteria(self):
         '''
         Returns total amount of bacteria
         '''
-        res = 0
-        for hc in self.bacteriaPositions:
-            res += len(self.bacteriaPositions[hc])
-        return res
+        return self.stats.numBacteria
     
     def count_predators(self):
         '''
         Returns total amount of predators
         '''
-        res = 0
-        for hc in self.predatorPositions:
-            res += len(self.predatorPositions[hc])
-        return res
+        return self.stats.numPredators
+    
+    
+    def count_bacteria_at(self, hexCoords):
+        '''
+        Returns number of bacteria in given cell
+        '''
+        if hexCoords in self.bacteriaPositions:
+            return len(self.bacteriaPositions[hexCoords])
+        return 0
+    
+    def count_predators_at(self, hexCoords):
+        '''
+        Returns number of predators in given cell
+        '''
+        if hexCoords in self.predatorPositions:
+            return len(self.predatorPositions[hexCoords])
+        return 0
+    
+    def get_predator_energies(self, hexCoords):
+        '''
+        Returns list of energies of predators in given cell
+        '''
+        if hexCoords in self.predatorPositions:
+            return [pr.energy for pr in self.predatorPositions[hexCoords]]
+        return []
+
+    def get_energies_at(self, cells):
+        '''
+        Bulk form of get_predator_energies: returns lists of energies of predators in cells with given indices
+        (see hexafield.CellIndex) in the same order as in get_state()
+        '''
+        getCell = self.field.get_cell_index().get_cell
+        return [ self.get_predator_energies(getCell(i)) for i in cells ]
+    
+    def get_state(self):
+        '''
+        Returns current state as state.BacterioState
+        '''
+        return BacterioState(self.field, self.bacteriaPositions, self.predatorPositions)
     
     
     def check_bacteria_overcrowd(self, hexCoords):
@@ -134,41 +274,59 @@ class CoreModel(object):
         '''
         if self.modelParams.BACT_OVERCROWD<=0:
             return True
-        res = 0
-        coords = self.field.get_all_within(hexCoords, self.modelParams.BACT_OVERCROWD_RADIUS)
-        for hc in coords:
-            if hc in self.bacteriaPositions:
-                res+=len(self.bacteriaPositions[hc])
-        return res<self.modelParams.BACT_OVERCROWD
+        sums = self._bacteriaSums
+        if not sums.valid:
+            sums.rebuild((hc.x, hc.y, len(bacts)) for hc, bacts in self.bacteriaPositions.items())
+        return sums.get_sum(hexCoords.x, hexCoords.y)<self.modelParams.BACT_OVERCROWD
     
     def check_predators_overcrowd(self, hexCoords):
         '''
-        Checks if number of bacteria near hexCoords in radius PR_OVERCROWD_RADIUS less than PR_OVERCROWD
+        Checks if number of predators near hexCoords in radius PR_OVERCROWD_RADIUS less than PR_OVERCROWD
         '''
         if self.modelParams.PR_OVERCROWD<=0:
             return True
-        res = 0
-        coords = self.field.get_all_within(hexCoords, self.modelParams.PR_OVERCROWD_RADIUS)
-        for hc in coords:
-            if hc in self.predatorPositions:
-                res+=len(self.predatorPositions[hc])
-        return res<self.modelParams.PR_OVERCROWD
+        sums = self._predatorSums
+        if not sums.valid:
+            sums.rebuild((hc.x, hc.y, len(prs)) for hc, prs in self.predatorPositions.items())
+        return sums.get_sum(hexCoords.x, hexCoords.y)<self.modelParams.PR_OVERCROWD
     
     def find_closest_bacteria(self, hexCoords):
         '''
-        Returns position of the closest bacteria within maxRange (or None)
+        Returns position of the closest bacteria within PR_SIGHT (or None).
+        Equidistant bacteria are chosen randomly.
+        Distances to the closest bacteria are calculated for all cells at once on the first call
+        in predator phase (see hexafield.CellIndex.get_distances) unless there are so few predators
+        that it's cheaper to start every search from zero distance. Eaten bacteria could make stored
+        distance smaller than the real one but never bigger, so the search starts from the stored
+        distance and corrects it.
         '''
-        if hexCoords in self.bacteriaPositions:
-            return hexCoords
-        for r in range(1, self.modelParams.PR_SIGHT+1):
-            cells = self.field.get_at_exact_range(hexCoords, r)
-            possiblePos = []
-            for hc in cells:
-                if hc in self.bacteriaPositions:
-                    possiblePos.append(hc)
+        index = self.field.get_cell_index()
+        sight = self.modelParams.PR_SIGHT
+        if self._bacteriaDistances is None:
+            if len(self.predatorPositions)*count_cells_within(sight) < len(index):
+                # few predators - searching around each of them is cheaper than calculating all distances
+                self._bacteriaDistances = array('i', bytes(array('i').itemsize*len(index)))
+            else:
+                self._bacteriaDistances = index.get_distances((index.find(hc.x, hc.y) for hc in self.bacteriaPositions), sight)
+        i = index.find(hexCoords.x, hexCoords.y)
+        res, self._bacteriaDistances[i] = self.search_bacteria(hexCoords, self._bacteriaDistances[i])
+        return res
+
+    def search_bacteria(self, hexCoords, distance):
+        '''
+        Searches bacteria around hexCoords starting from given distance (no bacteria are closer).
+        Returns (position of the closest bacteria or None, distance to it or PR_SIGHT+1 if nothing was found)
+        '''
+        sight = self.modelParams.PR_SIGHT
+        if distance==0:
+            if hexCoords in self.bacteriaPositions:
+                return hexCoords, 0
+            distance = 1
+        for r in range(distance, sight+1):
+            possiblePos = [hc for hc in self.field.get_at_exact_range(hexCoords, r) if hc in self.bacteriaPositions]
             if len(possiblePos)>0:
-                return random.choice(possiblePos)
-        return None
+                return random.choice(possiblePos), r
+        return None, sight+1
     
     def add_bacteria(self, hexCoords):
         '''
@@ -176,7 +334,13 @@ class CoreModel(object):
         '''
         if not hexCoords in self.bacteriaPositions:
             self.bacteriaPositions[hexCoords] = []
+            self.stats.bacteriaCells += 1
         self.bacteriaPositions[hexCoords].append(Bacteria())
+        self.stats.numBacteria += 1
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        if self._changedCells is not None:
+            self._changedCells.add(hexCoords)
     
     def add_predator(self, hexCoords):
         '''
@@ -184,23 +348,43 @@ class CoreModel(object):
         '''
         if not hexCoords in self.predatorPositions:
             self.predatorPositions[hexCoords] = []
+            self.stats.predatorCells += 1
         self.predatorPositions[hexCoords].append(Predator(self.modelParams.PR_INIT_ENERGY))
+        self.stats.add_predators(self.modelParams.PR_INIT_ENERGY)
+        self._predatorSums.valid = False
+        if self._changedCells is not None:
+            self._changedCells.add(hexCoords)
         
     def clear_cell(self, hexCoords):
         '''
         Removes all creatures from given cell
         '''
         if hexCoords in self.bacteriaPositions:
+            self.stats.numBacteria -= self.count_bacteria_at(hexCoords)
+            self.stats.bacteriaCells -= 1
             self.bacteriaPositions.pop(hexCoords)
         if hexCoords in self.predatorPositions:
-            self.predatorPositions.pop(hexCoords)
+            self.stats.remove_predators([pr.energy for pr in self.predatorPositions.pop(hexCoords)])
+            self.stats.predatorCells -= 1
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        self._predatorSums.valid = False
+        if self._changedCells is not None:
+            self._changedCells.add(hexCoords)
     
     def clear_all(self):
         '''
         Removes all creatures from entire board
         '''
+        if self._changedCells is not None:
+            self._changedCells.update(self.bacteriaPositions)
+            self._changedCells.update(self.predatorPositions)
         self.bacteriaPositions.clear()
         self.predatorPositions.clear()
+        self.stats.clear()
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        self._predatorSums.valid = False
 
 class RapidBacteriaModel(CoreModel):
     '''
@@ -213,15 +397,17 @@ class RapidBacteriaModel(CoreModel):
     
     def step_bacteria(self):
         newBacteriaPositions = dict()
+        born = 0
         for hc in self.bacteriaPositions:
             notOvercrowded = self.check_bacteria_overcrowd(hc)
             for bact in self.bacteriaPositions[hc]:
-                if notOvercrowded and rand_p(self.modelParams.P_BACT_DIVIDE)==1:
+                if notOvercrowded and self.samplers.P_BACT_DIVIDE()==1:
+                    born += 1
                     if not hc in newBacteriaPositions:
                         newBacteriaPositions[hc] = []
                     newBacteriaPositions[hc].append(Bacteria())
                     newBacteriaPositions[hc].append(Bacteria())
-                elif rand_p(self.modelParams.P_BACT_STAY)==1:
+                elif self.samplers.P_BACT_STAY()==1:
                     if not hc in newBacteriaPositions:
                         newBacteriaPositions[hc] = []
                     newBacteriaPositions[hc].append(bact)
@@ -231,4 +417,7 @@ class RapidBacteriaModel(CoreModel):
                         newBacteriaPositions[newPos] = []
                     newBacteriaPositions[newPos].append(bact)
         self.bacteriaPositions = newBacteriaPositions
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        self.update_bacteria_stats(born)
     
@@ -23,6 +23,8 @@ from collections import namedtuple
 
 from decimal import Decimal
 
+from app.rand_p import BernoulliSampler
+
 ModelParams = namedtuple('ModelParams', ['P_BACT_DIVIDE', 
                                         'P_BACT_STAY',
                                         'BACT_OVERCROWD',
@@ -40,6 +42,12 @@ ModelParams = namedtuple('ModelParams', ['P_BACT_DIVIDE',
                                         'PR_OVERCROWD',
                                         'PR_OVERCROWD_RADIUS'])
 
+# Samplers (rand_p.BernoulliSampler) for each probability in ModelParams
+Samplers = namedtuple('Samplers', ['P_BACT_DIVIDE',
+                                   'P_BACT_STAY',
+                                   'P_PR_DIVIDE',
+                                   'P_PR_STAY'])
+
 
 def default_model_params():
     return ModelParams(
@@ -82,4 +90,10 @@ def load_model_params(configSection):
             P_PR_STAY=Decimal(configSection['P_PR_STAY']),
             PR_OVERCROWD=configSection.getint('PR_OVERCROWD'),
             PR_OVERCROWD_RADIUS=configSection.getint('PR_OVERCROWD_RADIUS'))
-    
+
+
+def compile_samplers(modelParams):
+    '''
+    Returns Samplers for probabilities of given ModelParams
+    '''
+    return Samplers(**{ name:BernoulliSampler(getattr(modelParams, name)) for name in Samplers._fields })
@@ -0,0 +1,155 @@
+'''
+Population statistics kept up to date by models
+
+Models update their ModelStats ('stats' attribute) during each phase and edit: totals are changed
+by births, deaths and eaten bacteria as they happen and the histogram of predators' energies is
+rebuilt while predators make their turns. So any query (count_bacteria(), halt checks, traces,
+GUI totals) is O(1) and doesn't walk the field.
+'''
+
+from collections import Counter
+
+
+class ModelStats(object):
+    '''
+    Population statistics of a model.
+    'numBacteria', 'numPredators' - total numbers of creatures,
+    'bacteriaCells', 'predatorCells' - numbers of occupied cells,
+    'bacteriaBorn', 'predatorsBorn' - divisions during the last step (each of them adds one creature),
+    'bacteriaEaten' - bacteria eaten during the last step,
+    'predatorsDied' - predators starved during the last step,
+    'energies' - Counter (energy -> number of predators),
+    'energyMin', 'energyMax' - minimal and maximal energy of predators (None if there are no predators),
+    'energyTotal' - sum of energies of all predators.
+    Edits (adding or removing creatures) change totals but are not counted as births or deaths.
+    '''
+    __slots__ = ('numBacteria', 'numPredators', 'bacteriaCells', 'predatorCells', 'bacteriaBorn', 'predatorsBorn',
+        'bacteriaEaten', 'predatorsDied', 'energies', 'energyMin', 'energyMax', 'energyTotal')
+
+    # scalar fields in the order of get_values()
+    FIELDS = ('numBacteria', 'numPredators', 'bacteriaCells', 'predatorCells', 'bacteriaBorn', 'predatorsBorn',
+        'bacteriaEaten', 'predatorsDied', 'energyMin', 'energyMax', 'energyTotal')
+
+    def __init__(self):
+        self.numBacteria = 0
+        self.bacteriaCells = 0
+        self.predatorCells = 0
+        self.start_step()
+        self.set_energies(Counter())
+
+    @classmethod
+    def count(cls, bacteria, predators):
+        '''
+        Returns ModelStats of populations: bacteria is iterable of per-cell numbers of bacteria,
+        predators is iterable of per-cell sequences of predators' energies
+        '''
+        res = cls()
+        for n in bacteria:
+            if n>0:
+                res.numBacteria += n
+                res.bacteriaCells += 1
+        energies = Counter()
+        for cellEnergies in predators:
+            if len(cellEnergies)>0:
+                energies.update(cellEnergies)
+                res.predatorCells += 1
+        res.set_energies(energies)
+        return res
+
+    def clear(self):
+        '''
+        Removes all creatures (counters of the last step are kept)
+        '''
+        self.numBacteria = 0
+        self.bacteriaCells = 0
+        self.predatorCells = 0
+        self.set_energies(Counter())
+
+    def start_step(self):
+        '''
+        Resets counters of the last step
+        '''
+        self.bacteriaBorn = 0
+        self.predatorsBorn = 0
+        self.bacteriaEaten = 0
+        self.predatorsDied = 0
+
+    def set_energies(self, energies):
+        '''
+        Replaces energies of all predators (Counter: energy -> number of predators), updates 'numPredators'
+        '''
+        self.energies = energies
+        self.numPredators = sum(energies.values())
+        self.energyTotal = sum(energy*n for energy, n in energies.items())
+        self.energyMin = min(energies) if energies else None
+        self.energyMax = max(energies) if energies else None
+
+    def add_predators(self, energy, count=1):
+        self.energies[energy] += count
+        self.numPredators += count
+        self.energyTotal += energy*count
+        self.energyMin = energy if self.energyMin is None else min(self.energyMin, energy)
+        self.energyMax = energy if self.energyMax is None else max(self.energyMax, energy)
+
+    def remove_predators(self, energies):
+        '''
+        energies is iterable of energies of removed predators
+        '''
+        counts = self.energies
+        for energy in energies:
+            counts[energy] -= 1
+            if counts[energy]==0:
+                del counts[energy]
+            self.numPredators -= 1
+            self.energyTotal -= energy
+        if self.energyMin not in counts or self.energyMax not in counts:
+            self.energyMin = min(counts) if counts else None
+            self.energyMax = max(counts) if counts else None
+
+    def energy_mean(self):
+        '''
+        Returns mean energy of predators (None if there are no predators)
+        '''
+        return self.energyTotal/self.numPredators if self.numPredators>0 else None
+
+    def get_energy_histogram(self, binWidth=10):
+        '''
+        Returns list of (lowest energy of bin, number of predators) of non-empty bins of given width
+        '''
+        bins = Counter()
+        for energy, n in self.energies.items():
+            bins[energy//binWidth*binWidth] += n
+        return sorted(bins.items())
+
+    def get_values(self):
+        '''
+        Returns tuple of scalar fields (see FIELDS)
+        '''
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    @classmethod
+    def from_values(cls, values):
+        '''
+        Returns ModelStats with scalar fields from values (see get_values()), 'energies' are empty
+        '''
+        res = cls()
+        for name, value in zip(cls.FIELDS, values):
+            setattr(res, name, value)
+        return res
+
+    @classmethod
+    def combine(cls, parts):
+        '''
+        Returns ModelStats of a model made of parts (iterable of ModelStats of disjoint regions)
+        '''
+        res = cls()
+        energies = Counter()
+        for part in parts:
+            for name in ('numBacteria', 'bacteriaCells', 'predatorCells', 'bacteriaBorn', 'predatorsBorn', 'bacteriaEaten', 'predatorsDied'):
+                setattr(res, name, getattr(res, name)+getattr(part, name))
+            energies.update(part.energies)
+        res.set_energies(energies)
+        return res
+
+    def __repr__(self):
+        return 'ModelStats(%s)' % ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.FIELDS)
@@ -0,0 +1,206 @@
+'''
+Opt-in per-phase profiler of bacterio models
+
+    profiler = enable_profiling(model)
+    ... model.step() ...
+    profiler.dump()
+    disable_profiling(model)
+
+Profiling doesn't touch model code: enable_profiling() replaces the class of given model instance
+with a generated subclass which wraps phase methods (see DEFAULT_PHASES) with timers, and
+disable_profiling() puts the original class back. So models which are not profiled run exactly
+the same code as before and pay nothing.
+
+For each phase the profiler counts calls, total (inclusive) time and self time (total minus time of
+nested profiled phases, e.g. self time of 'step_predators' is division, moves and rebuilding of
+positions without hunting and overcrowd checks). Each step also samples number of memory blocks
+allocated by the interpreter (sys.getallocatedblocks) and, if asked, number of objects tracked by gc.
+'''
+
+from collections import namedtuple, deque
+import gc
+import sys
+import time
+
+
+# Methods wrapped when present in model's class
+DEFAULT_PHASES = ('step', 'step_predators', 'step_bacteria', 'find_closest_bacteria',
+    'check_bacteria_overcrowd', 'check_predators_overcrowd', 'get_bacteria_moves',
+    '_sum_within', '_random_moves', '_steps_to', '_resolve_feeding')
+
+# 'name' - method name, 'calls' - number of calls, 'seconds' - total time, 'selfSeconds' - time without nested phases,
+# 'callsPerStep' and 'secondsPerStep' - averages over profiled steps
+PhaseStats = namedtuple('PhaseStats', ['name', 'calls', 'seconds', 'selfSeconds', 'callsPerStep', 'secondsPerStep'])
+
+# 'step' - number of step (from 1) since profiling was enabled or reset, 'seconds' - wall time of step,
+# 'allocatedBlocks' - allocated memory blocks after step, 'allocatedDelta' - change during step,
+# 'objects' - number of gc tracked objects after step (None if not sampled),
+# 'phases' - dict (phase name -> (calls, seconds)) of phases called during step
+StepSample = namedtuple('StepSample', ['step', 'seconds', 'allocatedBlocks', 'allocatedDelta', 'objects', 'phases'])
+
+
+class PhaseCounter(object):
+    '''
+    Mutable counters of single phase
+    '''
+    __slots__ = ('calls', 'seconds', 'selfSeconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.selfSeconds = 0.0
+
+
+class PhaseProfiler(object):
+    '''
+    Collects per-phase timings of a model.
+    'counters' is dict (phase name -> PhaseCounter),
+    'numSteps' is number of profiled steps,
+    'history' is deque of StepSample of the last steps,
+    'objectsEvery' - number of gc tracked objects is sampled every objectsEvery steps (never if 0)
+    '''
+    __slots__ = ('counters', 'numSteps', 'history', 'objectsEvery', '_stack')
+
+    def __init__(self, historySize=1000, objectsEvery=0):
+        self.counters = dict()
+        self.numSteps = 0
+        self.history = deque(maxlen=historySize)
+        self.objectsEvery = objectsEvery
+        self._stack = []
+
+    def reset(self):
+        '''
+        Zeroes all counters and clears history
+        '''
+        for counter in self.counters.values():
+            counter.__init__()
+        self.numSteps = 0
+        self.history.clear()
+
+    def wrap(self, name, method):
+        '''
+        Returns function which calls method and accounts its time as phase 'name'
+        '''
+        counter = self.counters.setdefault(name, PhaseCounter())
+        stack = self._stack
+        clock = time.perf_counter
+        def wrapper(model, *args, **kwargs):
+            stack.append(0.0)
+            start = clock()
+            try:
+                return method(model, *args, **kwargs)
+            finally:
+                elapsed = clock()-start
+                nested = stack.pop()
+                counter.calls += 1
+                counter.seconds += elapsed
+                counter.selfSeconds += elapsed-nested
+                if stack:
+                    stack[-1] += elapsed
+        if name=='step':
+            return self._wrap_step(wrapper)
+        return wrapper
+
+    def _wrap_step(self, timedStep):
+        counters = self.counters
+        def wrapper(model):
+            before = { name:(c.calls, c.seconds) for name, c in counters.items() }
+            blocks = sys.getallocatedblocks()
+            timedStep(model)
+            allocatedBlocks = sys.getallocatedblocks()
+            self.numSteps += 1
+            objects = None
+            if self.objectsEvery>0 and self.numSteps%self.objectsEvery==0:
+                objects = len(gc.get_objects())
+            phases = dict()
+            for name, c in counters.items():
+                calls, seconds = before[name]
+                if c.calls>calls:
+                    phases[name] = (c.calls-calls, c.seconds-seconds)
+            self.history.append(StepSample(self.numSteps, phases['step'][1], allocatedBlocks, allocatedBlocks-blocks, objects, phases))
+        return wrapper
+
+    def get_stats(self):
+        '''
+        Returns list of PhaseStats of called phases sorted by total time (descending)
+        '''
+        steps = max(self.numSteps, 1)
+        res = [ PhaseStats(name, c.calls, c.seconds, c.selfSeconds, c.calls/steps, c.seconds/steps)
+                for name, c in self.counters.items() if c.calls>0 ]
+        res.sort(key=lambda s: -s.seconds)
+        return res
+
+    def get_allocation_stats(self):
+        '''
+        Returns dict with allocation statistics over steps kept in history:
+        'allocatedBlocks' - the last sample, 'meanDelta' and 'maxDelta' - mean and maximal change during step,
+        'objects' - the last sample of gc tracked objects (None if not sampled)
+        '''
+        deltas = [s.allocatedDelta for s in self.history]
+        objects = [s.objects for s in self.history if s.objects is not None]
+        return { 'allocatedBlocks': self.history[-1].allocatedBlocks if self.history else sys.getallocatedblocks(),
+                 'meanDelta': sum(deltas)/len(deltas) if deltas else 0.0,
+                 'maxDelta': max(deltas) if deltas else 0,
+                 'objects': objects[-1] if objects else None }
+
+    def to_dict(self):
+        '''
+        Returns all statistics as JSON-serializable dict
+        '''
+        return { 'steps': self.numSteps,
+                 'phases': [s._asdict() for s in self.get_stats()],
+                 'allocations': self.get_allocation_stats() }
+
+    def dump(self, file=None):
+        '''
+        Writes statistics as a table to file (sys.stdout by default)
+        '''
+        if file is None:
+            file = sys.stdout
+        file.write('Profiled steps: %d\n' % self.numSteps)
+        file.write('%-28s %10s %10s %12s %12s %12s\n' % ('phase', 'calls', 'calls/step', 'total, s', 'self, s', 'ms/step'))
+        for s in self.get_stats():
+            file.write('%-28s %10d %10.1f %12.4f %12.4f %12.3f\n' % (s.name, s.calls, s.callsPerStep, s.seconds, s.selfSeconds, 1000*s.secondsPerStep))
+        allocations = self.get_allocation_stats()
+        file.write('Allocated blocks: %d (per step: mean change %.1f, max change %d)\n' % (
+            allocations['allocatedBlocks'], allocations['meanDelta'], allocations['maxDelta']))
+        if allocations['objects'] is not None:
+            file.write('GC tracked objects: %d\n' % allocations['objects'])
+        file.flush()
+
+
+def get_profiler(model):
+    '''
+    Returns PhaseProfiler of the model (None if profiling is not enabled)
+    '''
+    return getattr(type(model), '_profiler', None)
+
+
+def enable_profiling(model, phases=DEFAULT_PHASES, historySize=1000, objectsEvery=0):
+    '''
+    Starts profiling of given model instance (other instances of the same class are not affected).
+    Returns PhaseProfiler (the existing one if profiling is already enabled)
+    '''
+    profiler = get_profiler(model)
+    if profiler is not None:
+        return profiler
+    profiler = PhaseProfiler(historySize, objectsEvery)
+    cls = type(model)
+    namespace = { '__slots__': (), '__module__': cls.__module__, '__doc__': cls.__doc__,
+                  '_profiler': profiler, '_unprofiledClass': cls }
+    for name in phases:
+        method = getattr(cls, name, None)
+        if method is not None:
+            namespace[name] = profiler.wrap(name, method)
+    model.__class__ = type('Profiled'+cls.__name__, (cls,), namespace)
+    return profiler
+
+
+def disable_profiling(model):
+    '''
+    Stops profiling of given model. Returns its PhaseProfiler (None if it was not profiled)
+    '''
+    profiler = get_profiler(model)
+    if profiler is not None:
+        model.__class__ = type(model)._unprofiledClass
+    return profiler
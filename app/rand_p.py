@@ -3,6 +3,7 @@ Generates 0 or 1 with given probability
 '''
 
 import decimal
+import math
 import random
 
 
@@ -32,3 +33,195 @@ def rand_p(p, sig_figures=None) -> int:
     elif isinstance(p,str):
         offset = float(p)*rbound
     return 1 if random.randrange(rbound)<offset else 0
+
+
+def to_probability_bounds(p, sig_figures=None):
+    '''
+    Returns (offset, rbound) - integers such that rand_p(p, sig_figures)==1 iff random.randrange(rbound)<offset
+    '''
+    sf = count_decimal_places(p) if sig_figures is None else sig_figures
+    rbound = 10**sf
+    if isinstance(p,decimal.Decimal):
+        offset = p*rbound
+    else:
+        offset = decimal.Decimal(str(p))*rbound
+    return min(math.ceil(offset), rbound), rbound
+
+
+def randbytes(n) -> bytes:
+    '''
+    Returns n random bytes from 'random' module (the same bytes random.randbytes of Python 3.9+ returns)
+    '''
+    return random.getrandbits(8*n).to_bytes(n, 'little') if n>0 else b''
+
+
+def binomial(n, p) -> int:
+    '''
+    Returns number of successes among n independent trials with success probability p (float)
+    drawn in O(1) with 'random' module: by inversion if n*min(p,1-p)<10, otherwise by
+    BTRS (transformed rejection with squeeze, W. Hormann, 1993)
+    '''
+    if p>0.5:
+        return n-binomial(n, 1-p)
+    if n<=0 or p<=0:
+        return 0
+    q = 1-p
+    if n*p<10:
+        # inversion: walks over probabilities of 0, 1, 2, ... successes
+        s = p/q
+        a = (n+1)*s
+        while True:
+            r = q**n
+            u = random.random()
+            x = 0
+            while u>r:
+                u -= r
+                x += 1
+                if x>n:
+                    break
+                r *= a/x-s
+            else:
+                return x
+    spq = math.sqrt(n*p*q)
+    b = 1.15+2.53*spq
+    a = -0.0873+0.0248*b+0.01*p
+    c = n*p+0.5
+    vr = 0.92-4.2/b
+    alpha = (2.83+5.1/b)*spq
+    lpq = math.log(p/q)
+    m = math.floor((n+1)*p)
+    h = math.lgamma(m+1)+math.lgamma(n-m+1)
+    while True:
+        u = random.random()-0.5
+        v = random.random()
+        us = 0.5-abs(u)
+        k = math.floor((2*a/us+b)*u+c)
+        if k<0 or k>n:
+            continue
+        if us>=0.07 and v<=vr:
+            return k
+        v = math.log(v*alpha/(a/(us*us)+b))
+        if v<=h-math.lgamma(k+1)-math.lgamma(n-k+1)+(k-m)*lpq:
+            return k
+
+
+def split_uniformly(n, k) -> list:
+    '''
+    Returns list of k numbers: n items put into k bins uniformly at random (multinomial),
+    drawn as sequential conditional binomials in O(k)
+    '''
+    res = []
+    for i in range(k-1, 0, -1):
+        x = binomial(n, 1/(i+1))
+        res.append(x)
+        n -= x
+    res.append(n)
+    return res
+
+
+class BernoulliSampler(object):
+    '''
+    Pre-compiled rand_p for fixed probability p: returns 1 with probability p or 0 with probability (1-p)
+    with the same decimal-exact semantics.
+    Outcomes are drawn in chunks and buffered. Chunk is made of random words of WORD_SIZES bytes
+    (the smallest size which holds 10**sig_figures values, see randbytes): word w is 1 if w<offset*q,
+    0 if w<rbound*q and REJECTED (dropped, so that distribution is not biased) otherwise, where
+    q=2**(8*size)//rbound. Outcomes are looked up by the most significant byte of each word with bytes.translate,
+    only words whose top byte is UNDECIDED (at most 2 of 256 values) are compared as whole numbers.
+    Probabilities with more decimal places than 8-byte words hold are drawn with random.randrange.
+    Counts of 1s among more than SAMPLED_COUNT outcomes are drawn with binomial() for p=offset/rbound
+    (see probability) in O(1).
+    '''
+    __slots__ = ('p', '_offset', '_rbound', '_wordSize', '_bounds', '_table', '_buffer', '_pos')
+    
+    BUFFER_SIZE = 4096
+    REJECTED = 2
+    UNDECIDED = 3
+    WORD_SIZES = (1, 2, 4, 8)
+    SAMPLED_COUNT = 16
+    
+    def __init__(self, p, sig_figures=None):
+        self.p = p
+        self._offset, self._rbound = to_probability_bounds(p, sig_figures)
+        self._wordSize = self._bounds = self._table = None
+        for size in self.WORD_SIZES:
+            if self._rbound<=256**size:
+                q = 256**size//self._rbound
+                self._wordSize = size
+                self._bounds = (self._offset*q, self._rbound*q)
+                self._table = bytes( self._get_byte_outcome(b<<(8*size-8), (b+1)<<(8*size-8)) for b in range(256) )
+                break
+        self._buffer = b''
+        self._pos = 0
+    
+    def _get_byte_outcome(self, lo, hi):
+        '''
+        Returns outcome of all words in [lo, hi) or UNDECIDED if they have different outcomes
+        '''
+        oneBound, acceptedBound = self._bounds
+        if hi<=oneBound:
+            return 1
+        if lo>=acceptedBound:
+            return self.REJECTED
+        if lo>=oneBound and hi<=acceptedBound:
+            return 0
+        return self.UNDECIDED
+    
+    def _draw(self, n):
+        '''
+        Returns bytes with n fresh outcomes
+        '''
+        if self._offset<=0:
+            return bytes(n)
+        if self._offset>=self._rbound:
+            return b'\x01'*n
+        if self._table is None:
+            return bytes( 1 if random.randrange(self._rbound)<self._offset else 0 for i in range(n) )
+        size = self._wordSize
+        oneBound, acceptedBound = self._bounds
+        res = b''
+        while len(res)<n:
+            words = randbytes(size*(n-len(res)+16))
+            # randbytes is little-endian: the last byte of each word is the most significant one
+            outcomes = words[size-1::size].translate(self._table)
+            if self.UNDECIDED in outcomes:
+                outcomes = bytearray(outcomes)
+                i = outcomes.find(self.UNDECIDED)
+                while i>=0:
+                    w = int.from_bytes(words[i*size:(i+1)*size], 'little')
+                    outcomes[i] = 1 if w<oneBound else 0 if w<acceptedBound else self.REJECTED
+                    i = outcomes.find(self.UNDECIDED, i+1)
+            res += bytes(outcomes).replace(bytes((self.REJECTED,)), b'')
+        return res[:n]
+    
+    def __call__(self) -> int:
+        if self._pos>=len(self._buffer):
+            self._buffer = self._draw(self.BUFFER_SIZE)
+            self._pos = 0
+        res = self._buffer[self._pos]
+        self._pos += 1
+        return res
+    
+    def sample(self, n) -> bytes:
+        '''
+        Returns n outcomes as bytes (each is 0 or 1)
+        '''
+        res = self._buffer[self._pos:self._pos+n]
+        self._pos += len(res)
+        if len(res)<n:
+            res += self._draw(n-len(res))
+        return res
+    
+    def probability(self) -> float:
+        '''
+        Returns probability of 1 as offset/rbound (see to_probability_bounds)
+        '''
+        return self._offset/self._rbound
+
+    def count(self, n) -> int:
+        '''
+        Returns number of 1s among n outcomes (i.e. binomially distributed value)
+        '''
+        if n<=self.SAMPLED_COUNT:
+            return self.sample(n).count(1)
+        return binomial(n, self.probability())
@@ -0,0 +1,233 @@
+'''
+Runs bacterio model without GUI (e.g. on display-less servers)
+
+    python -m app.runner [--rules RULES] [--state STATE] [--model MODEL [--workers N]] [--steps N]
+                         [--trace PREFIX [--trace-format btf|btc] [--trace-every K [--trace-minmax]]]
+                         [--save FILE [--compression zlib|lzma|bz2]] [--seed SEED] [--profile]
+                         [--journal FILE [--keyframe-every N]]
+                         [--frames DIR [--frame-every K] [--frame-size WxH] [--frame-format png|ppm]]
+
+Initial state is loaded from --state (or 'stateFile' from rules) or generated from FIELD section of rules.
+Model is stepped as fast as possible until --steps are made or halt conditions are met
+(the same ones 'play' mode of GUI has).
+With --journal every step is recorded to run journal which could be inspected later (see app.journal).
+With --frames steps are rendered to image files without Tk (see app.frames, requires numpy).
+'''
+
+import argparse
+from collections import namedtuple
+import random
+import signal
+import sys
+import time
+
+import app.config as config
+import app.engines as engines
+import app.hexafield as hexafield
+import app.state as state
+import app.state_generator as state_generator
+import app.palette as palette
+from app.tracewriter import create_trace_writer
+from app.journal import JournalWriter
+from app.profiler import enable_profiling
+
+
+DEFAULT_RULES_FILE = 'config/rules.ini'
+DEFAULT_PALETTE_FILE = 'config/palette.ini'
+
+# 'steps' - number of steps made, 'haltReason' - '' if run was not halted,
+# 'numBacteria' and 'numPredators' - final populations, 'seconds' - wall time spent in run()
+RunResult = namedtuple('RunResult', ['steps', 'haltReason', 'numBacteria', 'numPredators', 'seconds'])
+
+
+class PopulationStats(object):
+    '''
+    Accumulates population statistics over a run. Has the same write() as TraceWriter
+    so it could be passed to run() instead of it.
+    'minBacteria', 'maxBacteria', 'minPredators', 'maxPredators' - extreme populations,
+    'numSamples' - number of written steps, 'mean_bacteria()' and 'mean_predators()' - average populations
+    '''
+    __slots__ = ('numSamples', 'minBacteria', 'maxBacteria', 'minPredators', 'maxPredators', '_totalBacteria', '_totalPredators')
+
+    def __init__(self):
+        self.numSamples = 0
+        self.minBacteria = self.maxBacteria = 0
+        self.minPredators = self.maxPredators = 0
+        self._totalBacteria = 0
+        self._totalPredators = 0
+
+    def write(self, step, numBacteria, numPredators):
+        if self.numSamples==0:
+            self.minBacteria = self.maxBacteria = numBacteria
+            self.minPredators = self.maxPredators = numPredators
+        else:
+            self.minBacteria = min(self.minBacteria, numBacteria)
+            self.maxBacteria = max(self.maxBacteria, numBacteria)
+            self.minPredators = min(self.minPredators, numPredators)
+            self.maxPredators = max(self.maxPredators, numPredators)
+        self.numSamples += 1
+        self._totalBacteria += numBacteria
+        self._totalPredators += numPredators
+
+    def mean_bacteria(self):
+        return self._totalBacteria/self.numSamples if self.numSamples>0 else 0.0
+
+    def mean_predators(self):
+        return self._totalPredators/self.numSamples if self.numSamples>0 else 0.0
+
+
+def get_halt_reason(numBacteria, numPredators):
+    '''
+    Returns reason of halting the simulation with given populations ('' if it should not be halted)
+    '''
+    if numPredators==0:
+        return 'No more predators left'
+    if numBacteria==0:
+        return 'No more bacteria left'
+    return ''
+
+
+def create_initial_state(rules):
+    '''
+    Loads initial state from rules.fieldParams.stateFile or generates it from rules.fieldParams
+    (by density.generate_packed_state if density map is given)
+    '''
+    fieldParams = rules.fieldParams
+    if fieldParams.stateFile is None:
+        field = hexafield.create_hexafield(fieldParams.shape, fieldParams.radius, fieldParams.width, fieldParams.height)
+        if fieldParams.density:
+            # numpy is required only when density map is used
+            from app.density import generate_packed_state
+            return generate_packed_state(field, fieldParams.initBacteria, fieldParams.initPredators, rules.modelParams,
+                fieldParams.density, fieldParams.perCell, fieldParams.seed)
+        return state_generator.generate_state(fieldParams.radius, fieldParams.initBacteria, fieldParams.initPredators,
+            rules.modelParams, field)
+    return state.load_state(fieldParams.stateFile)
+
+
+def _record_step(step, model, journal, frameWriter):
+    '''
+    Records step with journal and frameWriter, which share cells changed since the previous step
+    (model.pop_cell_counts is called once per step)
+    '''
+    if journal is None and frameWriter is None:
+        return
+    counts = model.pop_cell_counts()
+    if journal is not None:
+        journal.record_changes(step, model, counts)
+    if frameWriter is not None:
+        frameWriter.write(step, model, counts)
+
+
+def run(model, maxSteps, traceWriter=None, journal=None, frameWriter=None):
+    '''
+    Steps model until maxSteps are made or halt conditions are met.
+    If traceWriter (TraceWriter, PopulationStats or anything with the same write()) is not None
+    initial and each next populations are written with it.
+    If journal (journal.JournalWriter) is not None initial and each next states are recorded to it.
+    If frameWriter (frames.FrameWriter) is not None initial and each next steps are rendered with it.
+    Returns RunResult
+    '''
+    numBacteria = model.count_bacteria()
+    numPredators = model.count_predators()
+    if traceWriter is not None:
+        traceWriter.write(0, numBacteria, numPredators)
+    _record_step(0, model, journal, frameWriter)
+    haltReason = ''
+    step = 0
+    start = time.perf_counter()
+    while step<maxSteps:
+        model.step()
+        step += 1
+        numBacteria = model.count_bacteria()
+        numPredators = model.count_predators()
+        if traceWriter is not None:
+            traceWriter.write(step, numBacteria, numPredators)
+        _record_step(step, model, journal, frameWriter)
+        haltReason = get_halt_reason(numBacteria, numPredators)
+        if haltReason:
+            break
+    return RunResult(step, haltReason, numBacteria, numPredators, time.perf_counter()-start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.runner', description='Runs bacterio model without GUI')
+    parser.add_argument('--rules', default=DEFAULT_RULES_FILE, help='rules file (default: %(default)s)')
+    parser.add_argument('--state', help='initial state file (.bsf), overrides FIELD section of rules')
+    parser.add_argument('--model', help='model name, overrides ENGINE section of rules (%s)' % ', '.join(sorted(engines.MODELS)))
+    parser.add_argument('--workers', type=int, help='number of worker processes of sector_* models, overrides ENGINE section of rules (default: number of cores)')
+    parser.add_argument('--steps', type=int, default=1000, help='maximum number of steps (default: %(default)s)')
+    parser.add_argument('--trace', metavar='PREFIX', help='write trace with given file prefix')
+    parser.add_argument('--trace-format', choices=('btf', 'btc'), default='btf', help='trace format: text or binary columns (default: %(default)s)')
+    parser.add_argument('--trace-every', type=int, default=1, metavar='K', help='write every K-th step (default: %(default)s)')
+    parser.add_argument('--trace-minmax', action='store_true', help='write steps with minimal and maximal populations of each K steps instead')
+    parser.add_argument('--save', metavar='FILE', help='save final state to given file')
+    parser.add_argument('--compression', choices=('zlib', 'lzma', 'bz2'), help='compression of saved state (default: none)')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--journal', metavar='FILE', help='record every step to run journal (.bjf)')
+    parser.add_argument('--keyframe-every', type=int, default=100, metavar='N', help='steps between full states in journal (default: %(default)s)')
+    parser.add_argument('--frames', metavar='DIR', help='render steps to image files in given directory')
+    parser.add_argument('--frame-every', type=int, default=1, metavar='K', help='render every K-th step (default: %(default)s)')
+    parser.add_argument('--frame-size', default='1024x768', metavar='WxH', help='size of frames (default: %(default)s)')
+    parser.add_argument('--frame-format', choices=('png', 'ppm'), default='png', help='image format of frames (default: %(default)s)')
+    parser.add_argument('--profile', action='store_true', help='profile model phases and print statistics at the end (and on SIGUSR1)')
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    rules = config.load_rules(args.rules)
+    if args.state is not None:
+        rules = rules._replace(fieldParams=rules.fieldParams._replace(stateFile=args.state))
+    if args.model is not None:
+        rules = rules._replace(engineParams=rules.engineParams._replace(model=args.model))
+    if args.workers is not None:
+        rules = rules._replace(engineParams=rules.engineParams._replace(workers=args.workers))
+    model = engines.create_model(rules.engineParams, rules.modelParams, create_initial_state(rules))
+    profiler = None
+    if args.profile:
+        profiler = enable_profiling(model)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.dump(sys.stderr))
+    traceWriter = None
+    if args.trace is not None:
+        traceWriter = create_trace_writer(rules, args.trace, args.trace_format, every=args.trace_every, minMax=args.trace_minmax)
+    frameWriter = None
+    if args.frames is not None:
+        import app.frames as frames
+        try:
+            width, height = frames.parse_size(args.frame_size)
+        except ValueError as e:
+            parser.error(str(e))
+        frameWriter = frames.FrameWriter(args.frames, width, height, args.frame_format, args.frame_every,
+            palette.load_palette(DEFAULT_PALETTE_FILE))
+    journal = None
+    if args.journal is not None:
+        journal = JournalWriter(args.journal, args.keyframe_every)
+    try:
+        result = run(model, args.steps, traceWriter, journal, frameWriter)
+    finally:
+        if traceWriter is not None:
+            traceWriter.close()
+        if journal is not None:
+            journal.close()
+    if args.save is not None:
+        state.save_state(model.get_state(), args.save, args.compression)
+    print('Steps: %d' % result.steps)
+    print('Bacteria: %d' % result.numBacteria)
+    print('Predators: %d' % result.numPredators)
+    if result.haltReason:
+        print('Halted: %s' % result.haltReason)
+    print('Steps/sec: %.2f' % (result.steps/result.seconds if result.seconds>0 else float('inf')))
+    if traceWriter is not None:
+        print('Trace: %s' % traceWriter.fileName)
+    if journal is not None:
+        print('Journal: %s' % journal.fileName)
+    if frameWriter is not None:
+        print('Frames: %d in %s' % (frameWriter.numFrames, frameWriter.directory))
+    if profiler is not None:
+        profiler.dump()
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
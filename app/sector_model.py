@@ -0,0 +1,692 @@
+'''
+Describes bacterio models stepped by several worker processes (for very big fields)
+
+The field is split into sectors - bands of consecutive columns (cells with the same x) with about
+the same number of cells (see split_sectors). Each sector is owned by a worker process which steps
+creatures of its own cells and keeps copies of creatures of the halo - cells of neighbouring
+sectors within get_halo() columns. Halo is as wide as the furthest cell any creature looks at or
+moves to (PR_SIGHT, BACT_VELOCITY and the overcrowd radii), and every sector is at least as wide as
+the halo, so each worker talks only to the workers of the left and the right sectors.
+
+Step is synchronous:
+1. predators of each sector make their turns (overcrowd checks and hunting use the state at the
+   beginning of the phase, including halo). Hungry predators choose their targets simultaneously
+   (as in vector_model) and don't eat yet;
+2. predators which stepped to other sectors are passed to their new owners;
+3. each worker feeds hunters which stepped into its cells: if more predators step into a cell than
+   there are bacteria in it, randomly chosen ones feed (no matter which sector they came from);
+4. bacteria counts of cells within BACT_OVERCROWD_RADIUS of the sector bounds are sent to neighbours
+   (eaten bacteria don't count in overcrowd checks);
+5. bacteria of each sector are stepped exactly as in counting_model (overcrowd checks use the state
+   at the beginning of the phase), ones which moved to other sectors are passed to their owners;
+6. halo (bacteria and predators) is sent to neighbours for the next step.
+So results are the same (in distribution) as of vector_core/vector_rapid models and don't depend
+on the number of sectors. Workers are seeded from 'random' module of the main process, so runs are
+reproducible with random.seed() for the same number of workers.
+Halo and creatures crossing sector bounds are found through precomputed lists of cells of the boundary
+and halo columns, so the per-step exchange costs in proportion to the height of the field, not to the
+number of occupied cells of the sector.
+Fields which wrap around (torus) are not split: the whole field is stepped by a single worker, so sector
+models are no faster than counting models on them.
+'''
+
+from bisect import bisect_right
+from collections import Counter
+import multiprocessing
+import os
+import random
+import signal
+import traceback
+
+from app.hexafield import HexafieldBase, HexCoords
+from app.creatures import Predator
+from app.counting_model import CountingCoreModel, CountingRapidBacteriaModel
+from app.state import BacterioState, PackedBacterioState
+from app.model_stats import ModelStats
+
+
+def get_halo(modelParams):
+    '''
+    Returns number of columns of neighbouring sectors each sector must see:
+    predators look for bacteria within PR_SIGHT, bacteria move by up to BACT_VELOCITY cells
+    and overcrowd checks count creatures within overcrowd radii (if they are on)
+    '''
+    p = modelParams
+    return max(1, p.PR_SIGHT, p.BACT_VELOCITY,
+        p.BACT_OVERCROWD_RADIUS if p.BACT_OVERCROWD>0 else 0,
+        p.PR_OVERCROWD_RADIUS if p.PR_OVERCROWD>0 else 0)
+
+
+def split_sectors(field, halo, numSectors):
+    '''
+    Splits columns of the field into at most numSectors sectors of consecutive columns with about
+    the same number of cells. Every sector is at least 'halo' columns wide (so there are fewer
+    sectors on narrow fields). Fields which wrap around (see HexafieldBase.get_periods) are not split.
+    Returns list of (xLo, xHi) - the first and the last column of each sector
+    '''
+    sizes = Counter(field.get_cell_index().xs)
+    columns = sorted(sizes)
+    numSectors = max(1, min(numSectors, len(columns)//halo))
+    if field.get_periods():
+        numSectors = 1
+    sectors = []
+    start = 0
+    remaining = sum(sizes.values())
+    for left in range(numSectors-1, 0, -1):
+        # 'left' sectors follow this one, each of them needs at least 'halo' columns
+        target = remaining/(left+1)
+        size = 0
+        end = start
+        while True:
+            size += sizes[columns[end]]
+            end += 1
+            if end-start>=halo and (size>=target or len(columns)-end<=left*halo):
+                break
+        sectors.append((columns[start], columns[end-1]))
+        remaining -= size
+        start = end
+    sectors.append((columns[start], columns[-1]))
+    return sectors
+
+
+class SectorCoreWorker(CountingCoreModel):
+    '''
+    Model of a single sector (worker side). Follows counting_model.CountingCoreModel but steps only
+    creatures of own cells ('xLo'<=x<='xHi'); 'field' is the sector with its halo ('halo' columns
+    on both sides). 'sectorIndex' is index of the sector, 'left' and 'right' are connections
+    (multiprocessing.Pipe) to workers of neighbouring sectors (None at the field bounds),
+    'hunters' is list of (HexCoords, Predator) of hungry predators which stepped into own cells
+    during the current predator phase, 'stepStats' is ModelStats of own cells after the last step.
+    Creatures are exchanged with neighbours as lists of tuples: bacteria as (x, y, number),
+    predators as (x, y, energies) in halo and as (x, y, energy, hunting) when they move.
+    '''
+    __slots__ = ('xLo', 'xHi', 'halo', 'sectorIndex', 'left', 'right', 'hunters', 'stepStats', '_columns', '_haloCells')
+
+    def __init__(self, modelParams, field, sectorIndex, bounds, halo, bacteria, predators, left=None, right=None):
+        '''
+        field is HexafieldBase of the sector with its halo, bounds is (xLo, xHi),
+        bacteria and predators are creatures of the sector and halo (see class description)
+        '''
+        self.sectorIndex = sectorIndex
+        self.xLo, self.xHi = bounds
+        self.halo = halo
+        self.left = left
+        self.right = right
+        self.hunters = []
+        self.stepStats = None
+        self._columns = dict()
+        for hc in field.get_cell_index().cells:
+            self._columns.setdefault(hc.x, []).append(hc)
+        self._haloCells = [ hc for x, cells in self._columns.items() if not self.xLo<=x<=self.xHi for hc in cells ]
+        predatorPositions = { HexCoords(x, y):[Predator(energy) for energy in energies] for x, y, energies in predators }
+        CountingCoreModel.__init__(self, modelParams, BacterioState(field, dict(), predatorPositions))
+        self.bacteriaPositions = { HexCoords(x, y):n for x, y, n in bacteria }
+
+    def exchange(self, toLeft, toRight):
+        '''
+        Sends toLeft and toRight to neighbours, returns (fromLeft, fromRight) (None if there is no such neighbour).
+        Pairs of sectors (0,1), (2,3)... exchange first, then (1,2), (3,4)...; the left sector of a pair
+        sends first, so workers never wait for each other in a cycle (even if messages don't fit pipe buffers)
+        '''
+        fromLeft = fromRight = None
+        for toRightFirst in ((True, False) if self.sectorIndex%2==0 else (False, True)):
+            if toRightFirst and self.right is not None:
+                self.right.send(toRight)
+                fromRight = self.right.recv()
+            elif not toRightFirst and self.left is not None:
+                fromLeft = self.left.recv()
+                self.left.send(toLeft)
+        return fromLeft, fromRight
+
+    def step(self):
+        changed = self._changedCells
+        if changed is not None:
+            changed.update(self.bacteriaPositions)
+            changed.update(self.predatorPositions)
+        self.stats.start_step()
+        self.receive_predators(*self.exchange(*self.step_predators()))
+        self.feed_hunters()
+        if self.modelParams.BACT_OVERCROWD>0:
+            self.set_halo(*self.exchange(*self.get_boundary(self.modelParams.BACT_OVERCROWD_RADIUS, False)))
+        self.receive_bacteria(*self.exchange(*self.step_bacteria()))
+        # creatures of the halo are not received yet
+        self.stepStats = self.count_stats()
+        self.sync_halo()
+        if changed is not None:
+            changed.update(self.bacteriaPositions)
+            changed.update(self.predatorPositions)
+
+    def sync_halo(self):
+        '''
+        Exchanges all halo creatures with neighbours
+        '''
+        self.set_halo(*self.exchange(*self.get_boundary(self.halo)))
+
+    def step_predators(self):
+        '''
+        Steps predators of own cells, hungry predators which have a target are put to 'hunters'.
+        Returns predators which stepped out of the sector: (toLeft, toRight)
+        '''
+        params = self.modelParams
+        samplers = self.samplers
+        newPredatorPositions = dict()
+        hunters = self.hunters = []
+        toLeft = []
+        toRight = []
+        for hc, prs in self.predatorPositions.items():
+            if not self.xLo<=hc.x<=self.xHi:
+                continue
+            notOvercrowded = self.check_predators_overcrowd(hc)
+            for pr in prs:
+                hunting = False
+                if notOvercrowded and pr.energy>=params.PR_DIVIDE_ENERGY and samplers.P_PR_DIVIDE()==1:
+                    # DIVIDE
+                    offspringEnergy = (pr.energy-params.PR_DIVIDE_COST)//2
+                    newPredatorPositions.setdefault(hc, []).extend((Predator(offspringEnergy), Predator(offspringEnergy)))
+                    self.stats.predatorsBorn += 1
+                    continue
+                elif pr.energy>=params.PR_MAX_ENERGY:
+                    # WELL FED
+                    newPos = hc if samplers.P_PR_STAY()==1 else random.choice(self.field.get_neighbours(hc))
+                    pr.energy -= params.PR_TURN_COST
+                else:
+                    # HUNGRY
+                    pr.energy -= params.PR_TURN_COST
+                    if pr.energy<=0:
+                        self.stats.predatorsDied += 1
+                        continue
+                    closestBact = self.find_closest_bacteria(hc)
+                    if closestBact is not None:
+                        newPos = self.field.get_step_to(hc, closestBact)
+                        hunting = True
+                    else:
+                        newPos = random.choice(self.field.get_neighbours(hc))
+                if newPos.x<self.xLo:
+                    toLeft.append((newPos.x, newPos.y, pr.energy, hunting))
+                elif newPos.x>self.xHi:
+                    toRight.append((newPos.x, newPos.y, pr.energy, hunting))
+                else:
+                    newPredatorPositions.setdefault(newPos, []).append(pr)
+                    if hunting:
+                        hunters.append((newPos, pr))
+        self.predatorPositions = newPredatorPositions
+        self._predatorSums.valid = False
+        return toLeft, toRight
+
+    def receive_predators(self, *migrants):
+        for predators in migrants:
+            for x, y, energy, hunting in predators or ():
+                hc = HexCoords(x, y)
+                pr = Predator(energy)
+                self.predatorPositions.setdefault(hc, []).append(pr)
+                if hunting:
+                    self.hunters.append((hc, pr))
+        self._predatorSums.valid = False
+
+    def feed_hunters(self):
+        '''
+        Feeds hunters in random order while there are bacteria in their cells
+        '''
+        hunters = self.hunters
+        random.shuffle(hunters)
+        feedValue = self.modelParams.PR_FEED_VALUE
+        for hc, pr in hunters:
+            if self.eat_bacteria(hc):
+                pr.energy += feedValue
+                self.stats.bacteriaEaten += 1
+        self.hunters = []
+        self._bacteriaDistances = None
+
+    def step_bacteria(self):
+        '''
+        Steps bacteria of own cells. Returns bacteria which moved out of the sector: (toLeft, toRight)
+        '''
+        xLo, xHi = self.xLo, self.xHi
+        moved, born = self.spread_bacteria((hc, n) for hc, n in self.bacteriaPositions.items() if xLo<=hc.x<=xHi)
+        toLeft = []
+        toRight = []
+        for hc in self._haloCells:
+            n = moved.pop(hc, 0)
+            if n>0:
+                (toLeft if hc.x<xLo else toRight).append((hc.x, hc.y, n))
+        self.bacteriaPositions = moved
+        self.stats.bacteriaBorn += born
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        return toLeft, toRight
+
+    def receive_bacteria(self, *migrants):
+        bacteriaPositions = self.bacteriaPositions
+        for bacteria in migrants:
+            for x, y, n in bacteria or ():
+                hc = HexCoords(x, y)
+                bacteriaPositions[hc] = bacteriaPositions.get(hc, 0)+n
+
+    def get_boundary(self, columns, withPredators=True):
+        '''
+        Returns creatures of own cells within given number of columns from the left and the right bounds
+        as (toLeft, toRight), each of them is (bacteria, predators) (predators are None unless withPredators)
+        '''
+        def get_side(xs):
+            cells = [ hc for x in xs for hc in self._columns.get(x, ()) ]
+            bacteriaPositions = self.bacteriaPositions
+            bacteria = [ (hc.x, hc.y, bacteriaPositions[hc]) for hc in cells if hc in bacteriaPositions ]
+            if not withPredators:
+                return bacteria, None
+            predatorPositions = self.predatorPositions
+            return bacteria, [ (hc.x, hc.y, [pr.energy for pr in predatorPositions[hc]]) for hc in cells if hc in predatorPositions ]
+        xLo, xHi = self.xLo, self.xHi
+        toLeft = get_side(range(xLo, xLo+columns)) if self.left is not None else None
+        toRight = get_side(range(xHi-columns+1, xHi+1)) if self.right is not None else None
+        return toLeft, toRight
+
+    def set_halo(self, fromLeft, fromRight):
+        '''
+        Replaces halo creatures with ones received from neighbours (see get_boundary)
+        '''
+        withPredators = any(side is not None and side[1] is not None for side in (fromLeft, fromRight))
+        bacteriaPositions = self.bacteriaPositions
+        predatorPositions = self.predatorPositions
+        for hc in self._haloCells:
+            bacteriaPositions.pop(hc, None)
+            if withPredators:
+                predatorPositions.pop(hc, None)
+        for side in (fromLeft, fromRight):
+            if side is None:
+                continue
+            bacteria, predators = side
+            for x, y, n in bacteria:
+                bacteriaPositions[HexCoords(x, y)] = n
+            if withPredators:
+                for x, y, energies in predators:
+                    predatorPositions[HexCoords(x, y)] = [Predator(energy) for energy in energies]
+        self._bacteriaSums.valid = False
+        self._bacteriaDistances = None
+        if withPredators:
+            self._predatorSums.valid = False
+
+    def count_bacteria(self):
+        return sum(n for hc, n in self.bacteriaPositions.items() if self.xLo<=hc.x<=self.xHi)
+
+    def count_predators(self):
+        return sum(len(prs) for hc, prs in self.predatorPositions.items() if self.xLo<=hc.x<=self.xHi)
+
+    def get_own_creatures(self):
+        '''
+        Returns creatures of own cells as (bacteria, predators) (see class description)
+        '''
+        bacteria = [ (hc.x, hc.y, n) for hc, n in self.bacteriaPositions.items() if self.xLo<=hc.x<=self.xHi ]
+        predators = [ (hc.x, hc.y, [pr.energy for pr in prs]) for hc, prs in self.predatorPositions.items()
+                        if self.xLo<=hc.x<=self.xHi and len(prs)>0 ]
+        return bacteria, predators
+
+    def get_own_stats(self):
+        '''
+        Returns ModelStats of own cells with counters of the last step
+        '''
+        xLo, xHi = self.xLo, self.xHi
+        res = ModelStats.count((n for hc, n in self.bacteriaPositions.items() if xLo<=hc.x<=xHi),
+            ([pr.energy for pr in prs] for hc, prs in self.predatorPositions.items() if xLo<=hc.x<=xHi))
+        return self._add_step_counters(res)
+
+    def count_stats(self):
+        '''
+        Returns ModelStats of all creatures of the worker with counters of the last step
+        (the same as get_own_stats() while there are no creatures in the halo, without checking every cell)
+        '''
+        res = ModelStats()
+        res.numBacteria = sum(self.bacteriaPositions.values())
+        res.bacteriaCells = len(self.bacteriaPositions)
+        res.predatorCells = sum(1 for prs in self.predatorPositions.values() if prs)
+        res.set_energies(Counter(pr.energy for prs in self.predatorPositions.values() for pr in prs))
+        return self._add_step_counters(res)
+
+    def _add_step_counters(self, stats):
+        for name in ('bacteriaBorn', 'predatorsBorn', 'bacteriaEaten', 'predatorsDied'):
+            setattr(stats, name, getattr(self.stats, name))
+        return stats
+
+    def pop_changed_cells(self):
+        changed = CountingCoreModel.pop_changed_cells(self)
+        if changed is None:
+            return None
+        return [ (hc.x, hc.y) for hc in changed if self.xLo<=hc.x<=self.xHi ]
+
+    def pop_cell_counts(self):
+        '''
+        Returns list of (x, y, number of bacteria, number of predators) of own cells changed since
+        the previous call or None (see model.CoreModel.pop_cell_counts)
+        '''
+        changed = CountingCoreModel.pop_changed_cells(self)
+        if changed is None:
+            return None
+        return [ (hc.x, hc.y, self.bacteriaPositions.get(hc, 0), len(self.predatorPositions.get(hc, ())))
+                 for hc in changed if self.xLo<=hc.x<=self.xHi ]
+
+
+class SectorRapidWorker(SectorCoreWorker):
+    '''
+    Model of a single sector with rapid moving bacteria (see model.RapidBacteriaModel)
+    '''
+    __slots__ = ()
+
+    get_bacteria_moves = CountingRapidBacteriaModel.get_bacteria_moves
+
+
+def run_sector(workerClass, modelParams, sectorIndex, bounds, halo, cells, bacteria, predators, seed, control, left, right):
+    '''
+    Worker process of a sector: creates SectorCoreWorker (or its subclass) and executes commands from
+    control connection until 'stop' command. Every command is answered with ('ok', result) or
+    ('error', formatted traceback); after an error the worker stops. Steps and edits are answered
+    with ModelStats of the sector (see SectorCoreWorker.get_own_stats).
+    cells is (xs, ys) - coordinates of the cells of the sector and its halo, or the whole field if it
+    wraps around (such fields are not split, see split_sectors).
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    random.seed(seed)
+    try:
+        field = cells if isinstance(cells, HexafieldBase) else HexafieldBase({ HexCoords(x, y) for x, y in zip(*cells) })
+        model = workerClass(modelParams, field, sectorIndex, bounds, halo, bacteria, predators, left, right)
+        while True:
+            command = control.recv()
+            name = command[0]
+            if name=='stop':
+                break
+            if name=='step':
+                if command[1]:
+                    model.sync_halo()
+                model.step()
+                control.send(('ok', model.stepStats))
+                continue
+            elif name=='get_state':
+                control.send(('ok', model.get_own_creatures()))
+                continue
+            elif name in ('pop_changed_cells', 'pop_cell_counts'):
+                control.send(('ok', getattr(model, name)()))
+                continue
+            elif name=='get_predator_energies':
+                control.send(('ok', [ model.get_predator_energies(HexCoords(x, y)) for x, y in command[1] ]))
+                continue
+            elif name in ('add_bacteria', 'add_predator', 'clear_cell'):
+                getattr(model, name)(HexCoords(*command[1:]))
+            elif name=='clear_all':
+                model.clear_all()
+            control.send(('ok', model.get_own_stats()))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception:
+        control.send(('error', traceback.format_exc()))
+
+
+class SectorCoreModel(object):
+    '''
+    Describes the same model as model.CoreModel stepped by worker processes (see module description).
+    'field' is HexafieldBase instance,
+    'modelParams' is ModelParams instance,
+    'numWorkers' is maximal number of worker processes (there are fewer of them if the field is narrow),
+    'halo' is width of halo (see get_halo),
+    'sectors' is list of (xLo, xHi) of sectors (see split_sectors),
+    'stats' is model_stats.ModelStats combined from stats of sectors which workers send after every
+    step and edit.
+    Creatures live in workers: per-cell queries (count_bacteria_at...) are answered from a copy of
+    the whole state which is fetched on the first query after the state has changed, so viewers
+    which query every cell pay one round trip per step.
+    Models should be closed (see close()) to stop workers.
+    '''
+    __slots__ = ('modelParams', 'field', 'numWorkers', 'halo', 'sectors', '_starts', '_processes', '_controls',
+        'stats', '_sectorStats', '_haloStale', '_snapshot')
+
+    workerClass = SectorCoreWorker
+
+    def __init__(self, modelParams, state, numWorkers=None):
+        '''
+        modelParams is ModelParams,
+        state is state.BacretioState that will be parsed as initial state,
+        numWorkers is number of worker processes (number of cores if None)
+        '''
+        self.modelParams = modelParams
+        self.numWorkers = numWorkers or os.cpu_count() or 1
+        self._processes = []
+        self._controls = []
+        self.parse_state(state)
+
+    def parse_state(self, state):
+        '''
+        state is state.BacretioState. Workers are restarted
+        '''
+        self.close()
+        self.field = state.field
+        self.halo = get_halo(self.modelParams)
+        self.sectors = split_sectors(self.field, self.halo, self.numWorkers)
+        self._starts = [ xLo for xLo, xHi in self.sectors ]
+        if isinstance(state, PackedBacterioState):
+            bacteria = state.get_bacteria_counts()
+        else:
+            bacteria = { hc:len(bacts) for hc, bacts in state.bacteriaPositions.items() if len(bacts)>0 }
+        numSectors = len(self.sectors)
+        sectorBacteria = [ [] for i in range(numSectors) ]
+        sectorPredators = [ [] for i in range(numSectors) ]
+        for positions, sectorCreatures, get_value in ((bacteria, sectorBacteria, lambda n: n),
+                (state.predatorPositions, sectorPredators, lambda prs: [pr.energy for pr in prs])):
+            for hc, value in positions.items():
+                value = get_value(value)
+                for i in self._get_sectors_within(hc.x, self.halo):
+                    sectorCreatures[i].append((hc.x, hc.y, value))
+        index = self.field.get_cell_index()
+        links = [ multiprocessing.Pipe() for i in range(numSectors-1) ]
+        childEnds = []
+        for i, (xLo, xHi) in enumerate(self.sectors):
+            first = bisect_right(index.xs, xLo-self.halo-1)
+            last = bisect_right(index.xs, xHi+self.halo)
+            control, childControl = multiprocessing.Pipe()
+            left = links[i-1][1] if i>0 else None
+            right = links[i][0] if i<numSectors-1 else None
+            cells = self.field if self.field.get_periods() else (index.xs[first:last], index.ys[first:last])
+            process = multiprocessing.Process(target=run_sector, daemon=True, args=(self.workerClass, self.modelParams,
+                i, (xLo, xHi), self.halo, cells, sectorBacteria[i], sectorPredators[i],
+                random.getrandbits(64), childControl, left, right))
+            process.start()
+            self._processes.append(process)
+            self._controls.append(control)
+            childEnds.append(childControl)
+        for conn in childEnds+[ conn for link in links for conn in link ]:
+            conn.close()
+        self._sectorStats = [ ModelStats.count((n for x, y, n in sectorBacteria[i] if xLo<=x<=xHi),
+                                               (energies for x, y, energies in sectorPredators[i] if xLo<=x<=xHi))
+                              for i, (xLo, xHi) in enumerate(self.sectors) ]
+        self.stats = ModelStats.combine(self._sectorStats)
+        self._haloStale = False
+        self._snapshot = None
+
+    def _get_sectors_within(self, x, columns):
+        '''
+        Returns range of indices of sectors which own or see (within given number of columns) column x
+        '''
+        first = max(0, bisect_right(self._starts, x-columns)-1)
+        last = max(1, bisect_right(self._starts, x+columns))
+        return range(first, last)
+
+    def get_sector(self, hexCoords):
+        '''
+        Returns index of the sector which owns given cell
+        '''
+        return max(0, bisect_right(self._starts, hexCoords.x)-1)
+
+    def _receive(self, control):
+        try:
+            status, result = control.recv()
+        except EOFError:
+            raise RuntimeError('Sector worker has stopped unexpectedly')
+        if status=='error':
+            raise RuntimeError('Sector worker failed:\n'+result)
+        return result
+
+    def _call_all(self, command):
+        for control in self._controls:
+            control.send(command)
+        return [ self._receive(control) for control in self._controls ]
+
+    def _call(self, sector, command):
+        self._controls[sector].send(command)
+        self._sectorStats[sector] = self._receive(self._controls[sector])
+        self._update_stats()
+
+    def _update_stats(self):
+        self.stats = ModelStats.combine(self._sectorStats)
+        self._snapshot = None
+
+    def step(self):
+        '''
+        Makes one turn in all sectors
+        '''
+        self._sectorStats = self._call_all(('step', self._haloStale))
+        self._haloStale = False
+        self._update_stats()
+
+    def pop_changed_cells(self):
+        '''
+        Returns set of HexCoords of cells whose creatures could have changed since the previous call
+        or None (see model.CoreModel.pop_changed_cells)
+        '''
+        res = set()
+        for changed in self._call_all(('pop_changed_cells',)):
+            if changed is None:
+                res = None
+            elif res is not None:
+                res.update(HexCoords(x, y) for x, y in changed)
+        return res
+
+    def pop_cell_counts(self):
+        '''
+        Returns (cells, bacteria, predators) - indices of cells changed since the previous call and their
+        numbers of creatures (see model.CoreModel.pop_cell_counts); workers send only changed cells
+        '''
+        results = self._call_all(('pop_cell_counts',))
+        if any(changed is None for changed in results):
+            state = self.get_state()
+            return None, state.bacteria, state.predatorCounts
+        find = self.field.get_cell_index().find
+        cells = []
+        bacteria = []
+        predators = []
+        for changed in results:
+            for x, y, numBacteria, numPredators in changed:
+                cells.append(find(x, y))
+                bacteria.append(numBacteria)
+                predators.append(numPredators)
+        return cells, bacteria, predators
+
+    def count_bacteria(self):
+        return self.stats.numBacteria
+
+    def count_predators(self):
+        return self.stats.numPredators
+
+    def _get_snapshot(self):
+        '''
+        Returns (bacteria, predators) - dicts (HexCoords -> number of bacteria) and (HexCoords -> list of energies)
+        '''
+        if self._snapshot is None:
+            bacteria = dict()
+            predators = dict()
+            for sectorBacteria, sectorPredators in self._call_all(('get_state',)):
+                bacteria.update((HexCoords(x, y), n) for x, y, n in sectorBacteria)
+                predators.update((HexCoords(x, y), energies) for x, y, energies in sectorPredators)
+            self._snapshot = (bacteria, predators)
+        return self._snapshot
+
+    def count_bacteria_at(self, hexCoords):
+        return self._get_snapshot()[0].get(hexCoords, 0)
+
+    def count_predators_at(self, hexCoords):
+        return len(self._get_snapshot()[1].get(hexCoords, ()))
+
+    def get_predator_energies(self, hexCoords):
+        return list(self._get_snapshot()[1].get(hexCoords, ()))
+
+    def get_energies_at(self, cells):
+        '''
+        Returns lists of energies of predators in cells with given indices (see model.CoreModel.get_energies_at),
+        workers are asked only about these cells
+        '''
+        getCell = self.field.get_cell_index().get_cell
+        cells = [ getCell(i) for i in cells ]
+        sectors = [ self.get_sector(hc) for hc in cells ]
+        sectorCells = [ [] for control in self._controls ]
+        for hc, sector in zip(cells, sectors):
+            sectorCells[sector].append((hc.x, hc.y))
+        for control, coords in zip(self._controls, sectorCells):
+            control.send(('get_predator_energies', coords))
+        results = [ iter(self._receive(control)) for control in self._controls ]
+        return [ next(results[sector]) for sector in sectors ]
+
+    def get_state(self):
+        '''
+        Returns current state as state.PackedBacterioState
+        '''
+        bacteria, predators = self._get_snapshot()
+        index = self.field.get_cell_index()
+        find = index.find
+        bacteriaCounts = [0]*len(index)
+        for hc, n in bacteria.items():
+            bacteriaCounts[find(hc.x, hc.y)] = n
+        predatorCounts = [0]*len(index)
+        byCell = []
+        for hc, energies in predators.items():
+            i = find(hc.x, hc.y)
+            predatorCounts[i] = len(energies)
+            byCell.append((i, energies))
+        byCell.sort()
+        return PackedBacterioState(self.field, bacteriaCounts, predatorCounts, [e for i, energies in byCell for e in energies])
+
+    def add_bacteria(self, hexCoords):
+        self._call(self.get_sector(hexCoords), ('add_bacteria', hexCoords.x, hexCoords.y))
+        self._haloStale = True
+
+    def add_predator(self, hexCoords):
+        self._call(self.get_sector(hexCoords), ('add_predator', hexCoords.x, hexCoords.y))
+        self._haloStale = True
+
+    def clear_cell(self, hexCoords):
+        self._call(self.get_sector(hexCoords), ('clear_cell', hexCoords.x, hexCoords.y))
+        self._haloStale = True
+
+    def clear_all(self):
+        self._sectorStats = self._call_all(('clear_all',))
+        self._update_stats()
+
+    def close(self):
+        '''
+        Stops workers (could be called more than once)
+        '''
+        for control in self._controls:
+            try:
+                control.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        for control in self._controls:
+            control.close()
+        self._processes = []
+        self._controls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class SectorRapidBacteriaModel(SectorCoreModel):
+    '''
+    Describes the same model as model.RapidBacteriaModel stepped by worker processes
+    '''
+    __slots__ = ()
+
+    workerClass = SectorRapidWorker
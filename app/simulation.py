@@ -0,0 +1,393 @@
+'''
+Runs bacterio model in a separate (worker) process
+
+SimulationClient starts worker process (run_simulation) which owns the model and publishes frames -
+per-cell numbers of bacteria and predators and populations - to shared memory (multiprocessing.shared_memory).
+Viewer reads the latest complete frame in place whenever it wants (see SimulationClient.refresh)
+while worker writes next frames to other buffers, so neither slow steps freeze the viewer nor slow
+drawing throttles the model. Edits and play/stop commands are sent to worker through a command queue.
+
+Shared memory layout:
+    CONTROL: index of the latest complete buffer, index of the buffer claimed by viewer (NO_BUFFER if none);
+    NUM_BUFFERS buffers, each is FRAME_HEADER (frame number, step, scalar fields of ModelStats, halt code, play flag)
+    then numbers of bacteria and numbers of predators in each cell (int32, cells are ordered as in
+    hexafield.CellIndex).
+Both indices are changed only under a lock. Worker writes the next frame to a buffer which is neither
+the latest one nor the claimed one, then makes it the latest. So viewer could hold its frame as long
+as it needs (e.g. between redraws) while worker keeps publishing, frames are never torn and only
+frames published between two refreshes are skipped by viewer.
+'''
+
+from array import array
+import multiprocessing
+from multiprocessing import shared_memory
+import queue
+import struct
+import time
+
+import app.engines as engines
+from app.model_stats import ModelStats
+from app.runner import get_halt_reason
+from app.state import pack_state
+from app.tracewriter import create_trace_writer
+
+
+# latest buffer, buffer claimed by viewer
+CONTROL = struct.Struct('<BBxxxxxx')
+NO_BUFFER = 255
+# the latest frame, the claimed one and the one being written
+NUM_BUFFERS = 3
+# frame number, step, ModelStats.FIELDS (NO_ENERGY instead of None), halt code (see HALT_REASONS), play flag
+FRAME_HEADER = struct.Struct('<qq%dqBBxxxxxx' % len(ModelStats.FIELDS))
+NO_ENERGY = -1
+HALT_REASONS = ('', get_halt_reason(1, 0), get_halt_reason(0, 1))
+
+
+def get_buffer_size(numCells):
+    return FRAME_HEADER.size+2*4*numCells
+
+
+def get_buffer_offset(buffer, numCells):
+    return CONTROL.size+buffer*get_buffer_size(numCells)
+
+
+def _to_list(values):
+    '''
+    Converts arrays (array.array or numpy arrays some models return) to lists of ints at once
+    '''
+    return values.tolist() if hasattr(values, 'tolist') else values
+
+
+class FramePublisher(object):
+    '''
+    Writes frames of the model to shared memory (worker side).
+    'bacteria' and 'predators' are arrays of per-cell numbers of the model which are updated
+    only in cells reported by model.pop_cell_counts()
+    '''
+    __slots__ = ('model', 'numCells', 'bacteria', 'predators', 'frameNumber', '_shm', '_lock')
+
+    def __init__(self, model, shm, lock):
+        self.model = model
+        self._shm = shm
+        self._lock = lock
+        self.numCells = len(model.field.get_cell_index())
+        self.bacteria = array('i', bytes(4*self.numCells))
+        self.predators = array('i', bytes(4*self.numCells))
+        self.frameNumber = 0
+
+    def update(self):
+        '''
+        Updates per-cell numbers from the model (see model.pop_cell_counts)
+        '''
+        cells, bacteria, predators = [ _to_list(values) for values in self.model.pop_cell_counts() ]
+        if cells is None:
+            self.bacteria = array('i', bacteria)
+            self.predators = array('i', predators)
+            return
+        for i, numBacteria, numPredators in zip(cells, bacteria, predators):
+            self.bacteria[i] = numBacteria
+            self.predators[i] = numPredators
+
+    def publish(self, step, stats, haltReason, playing):
+        '''
+        Writes frame to a free buffer and makes it the latest one, stats is ModelStats of the model
+        '''
+        buf = self._shm.buf
+        with self._lock:
+            latest, reading = CONTROL.unpack_from(buf)
+        target = (latest+1)%NUM_BUFFERS
+        if target==reading:
+            target = (latest+2)%NUM_BUFFERS
+        self.frameNumber += 1
+        offset = get_buffer_offset(target, self.numCells)
+        values = [ NO_ENERGY if value is None else value for value in stats.get_values() ]
+        FRAME_HEADER.pack_into(buf, offset, self.frameNumber, step, *values, HALT_REASONS.index(haltReason), playing)
+        offset += FRAME_HEADER.size
+        size = 4*self.numCells
+        buf[offset:offset+size] = memoryview(self.bacteria).cast('B')
+        buf[offset+size:offset+2*size] = memoryview(self.predators).cast('B')
+        with self._lock:
+            CONTROL.pack_into(buf, 0, target, CONTROL.unpack_from(buf)[1])
+
+
+def diff_cells(previous, current, blockSize=1024):
+    '''
+    previous and current are bytes of int32 per-cell numbers (of the same length).
+    Returns list of indices of cells whose numbers differ; blocks of blockSize cells are compared
+    as bytes first, so only blocks with changes are compared cell by cell
+    '''
+    res = []
+    size = 4*blockSize
+    for start in range(0, len(current), size):
+        if previous[start:start+size]!=current[start:start+size]:
+            for offset in range(start, min(start+size, len(current)), 4):
+                if previous[offset:offset+4]!=current[offset:offset+4]:
+                    res.append(offset//4)
+    return res
+
+
+def run_simulation(shmName, lock, commands, replies, engineParams, modelParams, state, trace=None):
+    '''
+    Worker process: creates the model, executes commands and publishes frames until 'stop' command.
+    Commands are tuples: ('step',), ('play', flag), ('add_bacteria', hexCoords), ('add_predator', hexCoords),
+    ('clear_cell', hexCoords), ('clear_all',), ('get_state',) (PackedBacterioState is put to replies), ('stop',).
+    trace is None or tuple of create_trace_writer arguments
+    '''
+    shm = shared_memory.SharedMemory(name=shmName)
+    model = engines.create_model(engineParams, modelParams, state)
+    publisher = FramePublisher(model, shm, lock)
+    traceWriter = None if trace is None else create_trace_writer(*trace)
+    step = 0
+    playing = False
+    haltReason = ''
+    stats = model.stats
+    if traceWriter is not None:
+        traceWriter.write(step, stats.numBacteria, stats.numPredators)
+    publisher.update()
+    publisher.publish(step, stats, haltReason, playing)
+    try:
+        while True:
+            try:
+                if playing:
+                    command = commands.get_nowait()
+                else:
+                    command = commands.get()
+            except queue.Empty:
+                command = None
+            doStep = playing
+            changed = False
+            if command is not None:
+                name = command[0]
+                if name=='stop':
+                    break
+                elif name=='step':
+                    doStep = True
+                elif name=='play':
+                    playing = command[1]
+                    doStep = doStep or playing
+                    changed = True
+                elif name=='get_state':
+                    replies.put(pack_state(model.get_state()))
+                elif name in ('add_bacteria', 'add_predator', 'clear_cell', 'clear_all'):
+                    getattr(model, name)(*command[1:])
+                    haltReason = ''
+                    changed = True
+            if doStep:
+                model.step()
+                step += 1
+                stats = model.stats
+                if traceWriter is not None:
+                    traceWriter.write(step, stats.numBacteria, stats.numPredators)
+                haltReason = get_halt_reason(stats.numBacteria, stats.numPredators)
+                if haltReason:
+                    playing = False
+                changed = True
+            if changed:
+                publisher.update()
+                publisher.publish(step, model.stats, haltReason, playing)
+    finally:
+        if traceWriter is not None:
+            traceWriter.close()
+        if hasattr(model, 'close'):
+            # parallel models (see engines.PARALLEL_MODELS) stop their own worker processes
+            model.close()
+        shm.close()
+
+
+class SimulationClient(object):
+    '''
+    Starts model in worker process and reads its frames (viewer side).
+    Has the same methods as models have (count_bacteria_at, add_bacteria, get_state...), so it could be
+    used by viewer instead of model. Counts are read from the frame claimed by the last refresh()
+    in place. Changed cells (see pop_cell_counts) are cells whose numbers differ between the claimed frame
+    and the frame claimed at the previous pop. Predators' energies are not published, so
+    get_predator_energies() returns [] and 'energies' of 'stats' are empty.
+    'field' - field of the model,
+    'currentStep', 'numBacteria', 'numPredators', 'stats' (ModelStats), 'haltReason', 'playing' - values
+    of the claimed frame
+    '''
+    __slots__ = ('field', 'currentStep', 'numBacteria', 'numPredators', 'stats', 'haltReason', 'playing',
+        '_engineParams', '_modelParams', '_trace', '_index', '_shm', '_lock', '_commands', '_replies', '_process',
+        '_bacteria', '_predators', '_frameNumber', '_seen')
+
+    def __init__(self, engineParams, modelParams, state, trace=None):
+        '''
+        state is state.BacterioState to start from,
+        trace is None or tuple of tracewriter.create_trace_writer arguments (trace is written by worker)
+        '''
+        self._engineParams = engineParams
+        self._modelParams = modelParams
+        self._trace = trace
+        self._shm = None
+        self._process = None
+        self._start(state)
+
+    def _start(self, state):
+        self.field = state.field
+        self._index = state.field.get_cell_index()
+        numCells = len(self._index)
+        self._shm = shared_memory.SharedMemory(create=True, size=CONTROL.size+NUM_BUFFERS*get_buffer_size(numCells))
+        CONTROL.pack_into(self._shm.buf, 0, 0, NO_BUFFER)
+        offset = get_buffer_offset(0, numCells)
+        self._shm.buf[offset:offset+FRAME_HEADER.size] = bytes(FRAME_HEADER.size)
+        self._lock = multiprocessing.Lock()
+        self._commands = multiprocessing.Queue()
+        self._replies = multiprocessing.Queue()
+        self._bacteria = self._predators = None
+        self._seen = None
+        self._frameNumber = 0
+        self.currentStep = self.numBacteria = self.numPredators = 0
+        self.stats = ModelStats()
+        self.haltReason = ''
+        self.playing = False
+        # not a daemon: parallel models (see engines.PARALLEL_MODELS) start worker processes of their own,
+        # which daemonic processes are not allowed to do. close() stops it
+        self._process = multiprocessing.Process(target=run_simulation, daemon=False, args=(self._shm.name, self._lock,
+            self._commands, self._replies, self._engineParams, self._modelParams, pack_state(state), self._trace))
+        self._process.start()
+
+    def refresh(self):
+        '''
+        Releases previously claimed frame and claims the latest one.
+        Returns True if it is a new frame
+        '''
+        buf = self._shm.buf
+        numCells = len(self._index)
+        with self._lock:
+            latest, reading = CONTROL.unpack_from(buf)
+            CONTROL.pack_into(buf, 0, latest, latest)
+        offset = get_buffer_offset(latest, numCells)
+        frameNumber, step, *values, haltCode, playing = FRAME_HEADER.unpack_from(buf, offset)
+        if frameNumber==self._frameNumber:
+            return False
+        self._release_views()
+        offset += FRAME_HEADER.size
+        self._bacteria = buf[offset:offset+4*numCells].cast('i')
+        self._predators = buf[offset+4*numCells:offset+8*numCells].cast('i')
+        self._frameNumber = frameNumber
+        self.currentStep = step
+        self.stats = ModelStats.from_values(None if value==NO_ENERGY else value for value in values)
+        self.numBacteria = self.stats.numBacteria
+        self.numPredators = self.stats.numPredators
+        self.haltReason = HALT_REASONS[haltCode]
+        self.playing = bool(playing)
+        return True
+
+    def wait_frame(self, timeout=10.0):
+        '''
+        Waits until worker publishes a new frame and claims it. Returns False on timeout
+        '''
+        deadline = time.monotonic()+timeout
+        while not self.refresh():
+            if time.monotonic()>deadline or not self._process.is_alive():
+                return False
+            time.sleep(0.005)
+        return True
+
+    def _release_views(self):
+        for view in (self._bacteria, self._predators):
+            if view is not None:
+                view.release()
+        self._bacteria = self._predators = None
+
+    def step(self):
+        self._commands.put(('step',))
+
+    def play(self, flag):
+        '''
+        Starts (flag is True) or stops 'play' mode of worker (it steps as fast as possible until halt)
+        '''
+        self._commands.put(('play', flag))
+
+    def count_bacteria(self):
+        return self.numBacteria
+
+    def count_predators(self):
+        return self.numPredators
+
+    def count_bacteria_at(self, hexCoords):
+        i = self._index.find(hexCoords.x, hexCoords.y)
+        return 0 if i<0 or self._bacteria is None else self._bacteria[i]
+
+    def count_predators_at(self, hexCoords):
+        i = self._index.find(hexCoords.x, hexCoords.y)
+        return 0 if i<0 or self._predators is None else self._predators[i]
+
+    def get_predator_energies(self, hexCoords):
+        return []
+
+    def pop_cell_counts(self):
+        '''
+        Returns (cells, bacteria, predators) - indices of cells whose numbers differ between the claimed
+        frame and the frame claimed at the previous call (of pop_cell_counts or pop_changed_cells) and their
+        numbers (see model.CoreModel.pop_cell_counts); cells is None at the first call after a (re)start
+        '''
+        numCells = len(self._index)
+        if self._bacteria is None:
+            return None, array('i', bytes(4*numCells)), array('i', bytes(4*numCells))
+        seen = self._seen
+        self._seen = (self._bacteria.tobytes(), self._predators.tobytes())
+        bacteria = array('i', self._seen[0])
+        predators = array('i', self._seen[1])
+        if seen is None:
+            return None, bacteria, predators
+        cells = sorted(set(diff_cells(seen[0], self._seen[0])).union(diff_cells(seen[1], self._seen[1])))
+        return cells, [ bacteria[i] for i in cells ], [ predators[i] for i in cells ]
+
+    def pop_changed_cells(self):
+        '''
+        Returns set of HexCoords of cells changed since the previous call or None (see pop_cell_counts)
+        '''
+        cells = self.pop_cell_counts()[0]
+        if cells is None:
+            return None
+        return { self._index.get_cell(i) for i in cells }
+
+    def add_bacteria(self, hexCoords):
+        self._commands.put(('add_bacteria', hexCoords))
+
+    def add_predator(self, hexCoords):
+        self._commands.put(('add_predator', hexCoords))
+
+    def clear_cell(self, hexCoords):
+        self._commands.put(('clear_cell', hexCoords))
+
+    def clear_all(self):
+        self._commands.put(('clear_all',))
+
+    def get_state(self):
+        '''
+        Returns current state of worker's model as state.PackedBacterioState (waits for the current step to finish)
+        '''
+        self._commands.put(('get_state',))
+        return self._replies.get()
+
+    def parse_state(self, state):
+        '''
+        Restarts worker with given state (trace is restarted as well)
+        '''
+        self.close()
+        self._start(state)
+        self.wait_frame()
+
+    def close(self):
+        '''
+        Stops worker and frees shared memory (could be called more than once)
+        '''
+        if self._process is not None:
+            self._commands.put(('stop',))
+            self._process.join(5)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+        if self._shm is not None:
+            self._release_views()
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
@@ -1,11 +1,29 @@
 '''
-Describes a single bacterio state - field with creatures' positions
+Describes a single bacterio state - field with creatures' positions - and .bsf state files
+
+.bsf file (version 1) is little-endian binary:
+    header (HEADER, 32 bytes): MAGIC, format version, compression (see COMPRESSIONS), field shape
+        (see FIELD_SHAPES), field size (radius or width*65536+height), number of cells, total number of predators,
+        array typecodes of three payload sections, payload size in bytes;
+    payload (compressed as a whole if compression is not 0), sections are padded to 4 bytes:
+        + numbers of bacteria in each cell (cells are ordered as in hexafield.CellIndex),
+        + numbers of predators in each cell,
+        + energies of all predators ordered by cell.
+Typecodes of sections are the smallest ones which fit the values ('B', 'H', 'I' for numbers and
+'b', 'h', 'i' for energies). Uncompressed files are loaded with mmap and sections are used
+in place (see PackedBacterioState), so loading doesn't create any per-cell objects.
+Files which don't start with MAGIC are legacy pickled BacterioState (see LegacyUnpickler).
 '''
 
+from array import array
+import importlib
+import mmap
 import pickle
-from tkinter import filedialog
+import struct
+import sys
 
-from app.hexafield import CircleHexafield
+from app.hexafield import CircleHexafield, HexagonHexafield, RectangleHexafield, TorusHexafield, count_cells_within
+from app.creatures import Bacteria, Predator
 
 class BacterioState(object):
     '''
@@ -21,27 +39,249 @@ class BacterioState(object):
         self.predatorPositions = predatorPositions
 
 
-def save_state(state, fileName):
+MAGIC = b'BSF\x00'
+FORMAT_VERSION = 1
+# compression code -> stdlib module (imported only when used)
+COMPRESSIONS = { 0:None, 1:'zlib', 2:'lzma', 3:'bz2' }
+# field shape code -> class, constructed as class(radius) or class(width, height) (see _decode_field_size)
+FIELD_SHAPES = { 1:CircleHexafield, 2:HexagonHexafield, 3:RectangleHexafield, 4:TorusHexafield }
+# width and height of fields are stored in one header field
+MAX_FIELD_SIDE = 32767
+# magic, version, compression, field shape, field size, numCells, numPredators, typecodes, payload size
+HEADER = struct.Struct('<4sHBBiII3sxQ')
+
+# pickled modules of old versions (before 'app' package) -> current modules
+LEGACY_MODULES = { 'state':'app.state', 'hexafield':'app.hexafield', 'creatures':'app.creatures', 'model_params':'app.model_params' }
+
+
+class PackedBacterioState(object):
+    '''
+    BacterioState stored as per-cell numbers (cells are ordered as in field.get_cell_index()).
+    'field' is HexafieldBase instance,
+    'bacteria' and 'predatorCounts' are sequences (array, memoryview or list) of numbers of bacteria and predators in each cell,
+    'predatorEnergies' is sequence of energies of all predators ordered by cell.
+    'bacteriaPositions' and 'predatorPositions' are built on the first access (the same as BacterioState has),
+    so PackedBacterioState could be used everywhere BacterioState is expected.
+    '''
+    __slots__ = ('field', 'bacteria', 'predatorCounts', 'predatorEnergies', '_bacteriaPositions', '_predatorPositions')
+
+    def __init__(self, field, bacteria, predatorCounts, predatorEnergies):
+        self.field = field
+        self.bacteria = bacteria
+        self.predatorCounts = predatorCounts
+        self.predatorEnergies = predatorEnergies
+        self._bacteriaPositions = None
+        self._predatorPositions = None
+
+    def get_bacteria_counts(self):
+        '''
+        Returns dict (HexCoords -> number of bacteria) of occupied cells
+        '''
+        get_cell = self.field.get_cell_index().get_cell
+        return { get_cell(i):n for i, n in enumerate(self.bacteria) if n>0 }
+
+    @property
+    def bacteriaPositions(self):
+        if self._bacteriaPositions is None:
+            self._bacteriaPositions = { hc:[Bacteria() for i in range(n)] for hc, n in self.get_bacteria_counts().items() }
+        return self._bacteriaPositions
+
+    @property
+    def predatorPositions(self):
+        if self._predatorPositions is None:
+            get_cell = self.field.get_cell_index().get_cell
+            energies = self.predatorEnergies
+            positions = dict()
+            start = 0
+            for i, n in enumerate(self.predatorCounts):
+                if n>0:
+                    positions[get_cell(i)] = [Predator(energy) for energy in energies[start:start+n]]
+                    start += n
+            self._predatorPositions = positions
+        return self._predatorPositions
+
+
+def pack_state(state):
+    '''
+    Returns PackedBacterioState with the same content as given BacterioState
+    '''
+    if isinstance(state, PackedBacterioState):
+        return state
+    index = state.field.get_cell_index()
+    find = index.find
+    bacteria = [0]*len(index)
+    for hc, bacts in state.bacteriaPositions.items():
+        bacteria[find(hc.x, hc.y)] = len(bacts)
+    predatorCounts = [0]*len(index)
+    for hc, prs in state.predatorPositions.items():
+        predatorCounts[find(hc.x, hc.y)] = len(prs)
+    byCell = sorted((find(hc.x, hc.y), prs) for hc, prs in state.predatorPositions.items())
+    predatorEnergies = [pr.energy for i, prs in byCell for pr in prs]
+    return PackedBacterioState(state.field, bacteria, predatorCounts, predatorEnergies)
+
+
+def _get_typecode(values, signed):
+    '''
+    Returns the smallest array typecode which fits all values
+    '''
+    low = min(values, default=0)
+    high = max(values, default=0)
+    for typecode in ('bhi' if signed else 'BHI'):
+        bits = 8*array(typecode).itemsize
+        if signed and -2**(bits-1)<=low and high<2**(bits-1):
+            return typecode
+        if not signed and 0<=low and high<2**bits:
+            return typecode
+    raise ValueError('Values do not fit into 32-bit integers')
+
+
+def _get_field_shape(field):
+    '''
+    Returns (shape code, size) of the field (see FIELD_SHAPES)
+    '''
+    for shape, cls in FIELD_SHAPES.items():
+        if type(field) is not cls:
+            continue
+        if cls is CircleHexafield:
+            index = field.get_cell_index()
+            radius = max(index.xs)
+            if len(index)==count_cells_within(radius):
+                return shape, radius
+            break
+        params = field.get_params()
+        if len(params)==1:
+            return shape, params[0]
+        width, height = params
+        if width>MAX_FIELD_SIDE or height>MAX_FIELD_SIDE:
+            raise ValueError('Field %dx%d is too big to be saved' % (width, height))
+        return shape, width*65536+height
+    raise ValueError('Field %s could not be saved' % type(field).__name__)
+
+
+def _decode_field_size(shape, size):
+    '''
+    Returns arguments of constructor of FIELD_SHAPES[shape] stored as size (see _get_field_shape)
+    '''
+    if FIELD_SHAPES[shape] in (RectangleHexafield, TorusHexafield):
+        return (size//65536, size%65536)
+    return (size,)
+
+
+def _get_compression_module(code):
+    if not code in COMPRESSIONS:
+        raise ValueError('Unknown compression: %d' % code)
+    return importlib.import_module(COMPRESSIONS[code])
+
+
+def save_state(state, fileName, compression=None):
     '''
-    Pickles BacterionState using given file
+    Saves BacterioState (or PackedBacterioState) to .bsf file.
+    compression is None or name of stdlib compression module ('zlib', 'lzma' or 'bz2')
     '''
+    data = encode_state(state, compression)
     with open(fileName, 'wb') as f:
-        pickle.dump(state,f)
-    
+        f.write(data)
 
-def load_state(fileName):
+
+def encode_state(state, compression=None):
     '''
-    Unpickles BacterioState from given file.
-    Returns BacterionState
+    Returns content of .bsf file with given BacterioState (or PackedBacterioState) as bytes (see save_state)
+    '''
+    codes = { name:code for code, name in COMPRESSIONS.items() }
+    if not compression in codes:
+        raise ValueError('Unknown compression: %s' % compression)
+    packed = pack_state(state)
+    shape, size = _get_field_shape(packed.field)
+    typecodes = ''
+    sections = []
+    for values, signed in ((packed.bacteria, False), (packed.predatorCounts, False), (packed.predatorEnergies, True)):
+        typecode = _get_typecode(values, signed)
+        section = array(typecode, values)
+        if sys.byteorder!='little':
+            section.byteswap()
+        section = section.tobytes()
+        typecodes += typecode
+        sections.append(section+bytes(-len(section)%4))
+    payload = b''.join(sections)
+    if codes[compression]!=0:
+        payload = _get_compression_module(codes[compression]).compress(payload)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, codes[compression], shape, size, len(packed.bacteria),
+        len(packed.predatorEnergies), typecodes.encode(), len(payload))
+    return header+payload
+
+
+def unpack_state(data, field=None):
+    '''
+    data is bytes-like content of binary .bsf file (sections of uncompressed data are used in place).
+    If field is given it is used instead of a new one (it must have the same shape and radius).
+    Returns PackedBacterioState
+    '''
+    if len(data)<HEADER.size:
+        raise ValueError('Truncated state file')
+    magic, version, compression, shape, size, numCells, numPredators, typecodes, payloadSize = HEADER.unpack_from(data)
+    if magic!=MAGIC:
+        raise ValueError('Not a binary state file')
+    if version>FORMAT_VERSION:
+        raise ValueError('Unsupported state file version %d (the latest supported is %d)' % (version, FORMAT_VERSION))
+    if not shape in FIELD_SHAPES:
+        raise ValueError('Unknown field shape: %d' % shape)
+    payload = memoryview(data)[HEADER.size:HEADER.size+payloadSize]
+    if len(payload)<payloadSize:
+        raise ValueError('Truncated state file')
+    if compression!=0:
+        payload = memoryview(_get_compression_module(compression).decompress(payload))
+    if field is None:
+        field = FIELD_SHAPES[shape](*_decode_field_size(shape, size))
+    if len(field.get_cell_index())!=numCells:
+        raise ValueError('Wrong number of cells: %d' % numCells)
+    sections = []
+    offset = 0
+    for typecode, length in zip(typecodes.decode(), (numCells, numCells, numPredators)):
+        size = array(typecode).itemsize*length
+        if offset+size>len(payload):
+            raise ValueError('Truncated state file')
+        section = payload[offset:offset+size].cast(typecode)
+        if sys.byteorder!='little':
+            section = array(typecode, section.tobytes())
+            section.byteswap()
+        sections.append(section)
+        offset += size+(-size%4)
+    return PackedBacterioState(field, *sections)
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    '''
+    Unpickles BacterioState saved by older versions (pickled modules are mapped with LEGACY_MODULES)
+    '''
+    def find_class(self, module, name):
+        return pickle.Unpickler.find_class(self, LEGACY_MODULES.get(module, module), name)
+
+
+def load_state(fileName, useMmap=True):
+    '''
+    Loads state from .bsf file (binary or legacy pickled one).
+    Uncompressed binary files are memory mapped unless useMmap is False.
+    Returns PackedBacterioState (or BacterioState for legacy files)
     '''
     with open(fileName, 'rb') as f:
-        return pickle.load(f)
+        magic = f.read(len(MAGIC))
+        f.seek(0)
+        if magic!=MAGIC:
+            return LegacyUnpickler(f).load()
+        header = f.read(HEADER.size)
+        f.seek(0)
+        if useMmap and len(header)==HEADER.size and HEADER.unpack(header)[2]==0:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = f.read()
+    return unpack_state(data)
 
 
 def save_state_dlg(state):
     '''
-    Calls 'Save File' dialog then pickles BacterioState
+    Calls 'Save File' dialog then saves BacterioState
     '''
+    from tkinter import filedialog
     fileName = filedialog.asksaveasfilename(title = "Select file",filetypes = (("Bacterio state files","*.bsf"),("all files","*.*")))
     if fileName=='':
         return
@@ -52,9 +292,10 @@ def save_state_dlg(state):
 
 def load_state_dlg():
     '''
-    Calls 'Open File' dialog then unpickles BacterioState.
+    Calls 'Open File' dialog then loads BacterioState.
     Returns BacterionState
     '''
+    from tkinter import filedialog
     fileName = filedialog.askopenfilename(title = "Select file",filetypes = (("Bacterio state files","*.bsf"),("all files","*.*")))
     if fileName=='': 
         return None
@@ -9,29 +9,21 @@ from app.creatures import Predator, Bacteria
 from app.state import BacterioState
 from app.model_params import default_model_params
 
-def generate_state(fieldRadius, numBacteria, numPredators, modelParams = default_model_params()):
+def generate_state(fieldRadius, numBacteria, numPredators, modelParams = default_model_params(), field = None):
     '''
-    Generates initial state on CircleHexafield with given fieldRadius.
+    Generates initial state on given field (CircleHexafield with given fieldRadius if field is None).
     Each object placed on different cell. If there are more objects (numBacteria+numPredators) than
     cells, function fills the entire field than returns.
+    Cells are sampled without replacement at once, so generation is linear in the field size
+    (see density.generate_packed_state for huge fields, density maps and several creatures per cell).
     Returns state.BacterioState
     '''
-    field = CircleHexafield(fieldRadius)
-    bacteriaPositions = dict()
-    predatorPositions = dict()
-    unoccupiedCells = [ x for x in field._field ]
-    for i in range(numBacteria):
-        hc = random.choice(unoccupiedCells)
-        bacteriaPositions[hc] = [Bacteria()]
-        unoccupiedCells.remove(hc)
-        if len(unoccupiedCells)==0:
-            return BacterioState(field, bacteriaPositions, predatorPositions)
-        
-    for i in range(numPredators):
-        hc = random.choice(unoccupiedCells)
-        predatorPositions[hc] = [Predator(modelParams.PR_INIT_ENERGY)]
-        unoccupiedCells.remove(hc)
-        if len(unoccupiedCells)==0:
-            return BacterioState(field, bacteriaPositions, predatorPositions)
- 
+    if field is None:
+        field = CircleHexafield(fieldRadius)
+    cells = list(field._field)
+    numBacteria = max(0, min(numBacteria, len(cells)))
+    numPredators = max(0, min(numPredators, len(cells)-numBacteria))
+    occupied = random.sample(cells, numBacteria+numPredators)
+    bacteriaPositions = { hc:[Bacteria()] for hc in occupied[:numBacteria] }
+    predatorPositions = { hc:[Predator(modelParams.PR_INIT_ENERGY)] for hc in occupied[numBacteria:] }
     return BacterioState(field, bacteriaPositions, predatorPositions)
@@ -0,0 +1,290 @@
+'''
+Runs bacterio model over grids (or lists) of ModelParams overrides in parallel processes
+
+    python -m app.sweep --grid P_BACT_DIVIDE=0.3,0.5 --grid PR_SIGHT=3,4,5 --seeds 20 --steps 5000 --out sweep.tsv
+    python -m app.sweep --cases cases.txt --seeds 20 --out sweep.tsv
+
+Every case (set of overrides) is run with --seeds different seeds. Each run gets its own seed derived
+from --base-seed and its run id, so any single run could be reproduced independently of worker
+count and order of completion (see derive_seed). Results are appended to --out as tab separated
+table row by row as runs complete, so memory used doesn't depend on number of runs.
+Sweep could be cancelled with Ctrl+C (runs in progress are finished and written) and resumed by
+running the same command again - runs already present in --out are skipped. The first line of --out
+('# ' and settings of the sweep, see describe_sweep) is checked before resuming, so runs of different
+cases, seeds, base seed, steps or rules are never mixed in one table.
+'''
+
+import argparse
+from collections import namedtuple
+import concurrent.futures
+from decimal import Decimal
+import hashlib
+from itertools import product
+import os
+import random
+import signal
+import sys
+import time
+
+import app.config as config
+import app.engines as engines
+from app.model_params import ModelParams, default_model_params
+from app.runner import DEFAULT_RULES_FILE, PopulationStats, create_initial_state, run
+
+
+# 'runId' - index of run in the sweep, 'seed' - seed of random,
+# 'overrides' - tuple of (name, value) pairs applied to rules.modelParams, 'maxSteps' - steps limit
+SweepTask = namedtuple('SweepTask', ['runId', 'seed', 'overrides', 'rules', 'maxSteps'])
+
+RESULT_COLUMNS = ('steps', 'haltReason', 'bacteria', 'predators',
+    'minBacteria', 'maxBacteria', 'meanBacteria', 'minPredators', 'maxPredators', 'meanPredators', 'seconds')
+
+
+def parse_value(name, text):
+    '''
+    Converts text to the type of ModelParams field 'name' (Decimal for probabilities, int for the rest)
+    '''
+    if not name in ModelParams._fields:
+        raise ValueError('Unknown model parameter: %s' % name)
+    if isinstance(getattr(default_model_params(), name), Decimal):
+        return Decimal(text)
+    return int(text)
+
+
+def parse_grid_option(text):
+    '''
+    Parses 'NAME=v1,v2,...' to (name, [values])
+    '''
+    name, sep, values = text.partition('=')
+    name = name.strip()
+    if sep=='' or values.strip()=='':
+        raise ValueError('Expected NAME=v1,v2,... but got: %s' % text)
+    return name, [parse_value(name, v.strip()) for v in values.split(',')]
+
+
+def iter_grid(grid):
+    '''
+    grid is list of (name, values).
+    Yields tuples of (name, value) pairs for every combination of values (the last parameter changes first)
+    '''
+    names = [name for name, values in grid]
+    for values in product(*[values for name, values in grid]):
+        yield tuple(zip(names, values))
+
+
+def load_cases(fileName):
+    '''
+    Loads list of cases from text file. Each non-empty line (except ones started with ';' or '#')
+    is a case - space separated NAME=value overrides.
+    Returns list of tuples of (name, value) pairs
+    '''
+    cases = []
+    with open(fileName) as f:
+        for line in f:
+            line = line.strip()
+            if line=='' or line[0] in ';#':
+                continue
+            case = []
+            for item in line.split():
+                name, sep, value = item.partition('=')
+                if sep=='':
+                    raise ValueError('Expected NAME=value but got: %s' % item)
+                case.append((name, parse_value(name, value)))
+            cases.append(tuple(case))
+    return cases
+
+
+def derive_seed(baseSeed, runId):
+    '''
+    Returns 64-bit seed of run 'runId' (independent streams for different runs)
+    '''
+    digest = hashlib.sha256(('%d:%d' % (baseSeed, runId)).encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def iter_tasks(rules, cases, numSeeds, baseSeed, maxSteps, skip=frozenset()):
+    '''
+    Yields SweepTask for each case and each of numSeeds seeds except runs with ids in 'skip'.
+    Run id is case index * numSeeds + seed index, so it is stable as long as cases are the same
+    '''
+    runId = 0
+    for overrides in cases:
+        caseRules = rules._replace(modelParams=rules.modelParams._replace(**dict(overrides)))
+        for n in range(numSeeds):
+            if not runId in skip:
+                yield SweepTask(runId, derive_seed(baseSeed, runId), overrides, caseRules, maxSteps)
+            runId += 1
+
+
+def describe_sweep(rules, cases, numSeeds, baseSeed, maxSteps):
+    '''
+    Returns the first line of output table: '# ' and space separated NAME=value settings of the sweep
+    (cases and rules are identified by digest of their repr)
+    '''
+    digest = hashlib.sha256(repr((cases, rules)).encode()).hexdigest()[:16]
+    return '# cases=%d seeds=%d base-seed=%d steps=%d digest=%s\n' % (len(cases), numSeeds, baseSeed, maxSteps, digest)
+
+
+def run_task(task):
+    '''
+    Runs single SweepTask (in worker process).
+    Returns tuple of values for RESULT_COLUMNS
+    '''
+    random.seed(task.seed)
+    rules = task.rules
+    model = engines.create_model(rules.engineParams, rules.modelParams, create_initial_state(rules))
+    stats = PopulationStats()
+    result = run(model, task.maxSteps, stats)
+    return (result.steps, result.haltReason, result.numBacteria, result.numPredators,
+        stats.minBacteria, stats.maxBacteria, stats.mean_bacteria(),
+        stats.minPredators, stats.maxPredators, stats.mean_predators(), result.seconds)
+
+
+def format_row(task, paramNames, result):
+    '''
+    Returns line of output table for the task and its result
+    '''
+    overrides = dict(task.overrides)
+    values = [task.runId, task.seed]
+    values.extend(overrides.get(name, '') for name in paramNames)
+    values.extend('%.3f' % v if isinstance(v, float) else v for v in result)
+    return '\t'.join(str(v) for v in values)+'\n'
+
+
+def read_done_runs(fileName, description=None):
+    '''
+    Returns set of run ids written to existing output table (empty set if there is no file or it is empty).
+    If description (see describe_sweep) is given it should be the first line of the table,
+    otherwise ValueError is raised (the table is left as it is).
+    Incomplete last line (left by killed sweep) is removed from the file
+    '''
+    if not os.path.exists(fileName):
+        return set()
+    with open(fileName, 'rb+') as f:
+        data = f.read()
+        if data==b'':
+            return set()
+        lines = data.decode().split('\n')
+        if description is not None and lines[0]+'\n'!=description:
+            raise ValueError('%s was written by a different sweep (%s), expected %s' %
+                (fileName, lines[0] if lines[0].startswith('#') else 'no settings line', description.strip()))
+        if not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n')+1)
+    lines = [line for line in lines[:-1] if not line.startswith('#')][1:]
+    return set(int(line.split('\t', 1)[0]) for line in lines if line!='')
+
+
+def init_worker():
+    '''
+    Initializes worker process: Ctrl+C is ignored since it is handled by the main process
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_sweep(tasks, fileName, paramNames, workers=None, window=None, progress=None, description=None):
+    '''
+    Runs tasks (iterable of SweepTask) in ProcessPoolExecutor with 'workers' processes (all cores if None)
+    and appends results to tab separated table 'fileName' (if file is empty, description line is written
+    if given and then header).
+    At most 'window' tasks (4 per worker by default) are submitted at once, so tasks could be a lazy
+    iterable of any length. progress(numDone) is called after each written run if given.
+    On KeyboardInterrupt pending tasks are cancelled, running ones are waited for and written,
+    then KeyboardInterrupt is re-raised.
+    Returns number of runs written
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if window is None:
+        window = 4*workers
+    tasks = iter(tasks)
+    numDone = 0
+    with open(fileName, 'a') as out:
+        if out.tell()==0:
+            if description is not None:
+                out.write(description)
+            out.write('\t'.join(('runId', 'seed')+tuple(paramNames)+RESULT_COLUMNS)+'\n')
+            out.flush()
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker) as executor:
+            pending = {}
+            try:
+                while True:
+                    for task in tasks:
+                        pending[executor.submit(run_task, task)] = task
+                        if len(pending)>=window:
+                            break
+                    if len(pending)==0:
+                        break
+                    done, notDone = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        out.write(format_row(pending.pop(future), paramNames, future.result()))
+                        numDone += 1
+                    out.flush()
+                    if progress is not None:
+                        progress(numDone)
+            except KeyboardInterrupt:
+                for future in pending:
+                    future.cancel()
+                for future in concurrent.futures.as_completed(pending):
+                    if not future.cancelled() and future.exception() is None:
+                        out.write(format_row(pending[future], paramNames, future.result()))
+                        numDone += 1
+                out.flush()
+                raise
+    return numDone
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.sweep', description='Runs bacterio model over grid of parameters in parallel')
+    parser.add_argument('--rules', default=DEFAULT_RULES_FILE, help='base rules file (default: %(default)s)')
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=v1,v2,...', help='values of model parameter (could be repeated, all combinations are run)')
+    parser.add_argument('--cases', metavar='FILE', help='file with cases - one line of space separated NAME=value overrides per case')
+    parser.add_argument('--model', help='model name, overrides ENGINE section of rules')
+    parser.add_argument('--seeds', type=int, default=10, help='runs per case (default: %(default)s)')
+    parser.add_argument('--base-seed', type=int, default=0, help='seed all run seeds are derived from (default: %(default)s)')
+    parser.add_argument('--steps', type=int, default=1000, help='maximum number of steps of each run (default: %(default)s)')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: number of cores)')
+    parser.add_argument('--out', required=True, help='output table (.tsv); if it exists the sweep is resumed')
+    args = parser.parse_args(argv)
+
+    if args.grid and args.cases:
+        parser.error('--grid and --cases could not be used together')
+    try:
+        if args.cases is not None:
+            cases = load_cases(args.cases)
+        else:
+            cases = list(iter_grid([parse_grid_option(g) for g in args.grid])) if args.grid else [()]
+    except ValueError as e:
+        parser.error(str(e))
+    paramNames = []
+    for case in cases:
+        for name, value in case:
+            if not name in paramNames:
+                paramNames.append(name)
+
+    rules = config.load_rules(args.rules)
+    if args.model is not None:
+        rules = rules._replace(engineParams=rules.engineParams._replace(model=args.model))
+    description = describe_sweep(rules, cases, args.seeds, args.base_seed, args.steps)
+    try:
+        done = read_done_runs(args.out, description)
+    except ValueError as e:
+        parser.error(str(e))
+    total = len(cases)*args.seeds
+    toRun = total-sum(1 for runId in done if runId<total)
+    print('Runs: %d total, %d done, %d to run' % (total, total-toRun, toRun))
+    start = time.perf_counter()
+    def progress(numDone):
+        sys.stdout.write('\r%d/%d' % (numDone, toRun))
+        sys.stdout.flush()
+    try:
+        numDone = run_sweep(iter_tasks(rules, cases, args.seeds, args.base_seed, args.steps, done),
+            args.out, paramNames, args.workers, progress=progress, description=description)
+    except KeyboardInterrupt:
+        print('\nCancelled. Run the same command again to resume')
+        return 1
+    print('\n%d runs in %.1f s' % (numDone, time.perf_counter()-start))
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,330 @@
+'''
+Analyses bacterio traces (.btf or .btc, see app.tracewriter) in constant memory
+
+    python -m app.trace_analysis TRACE... [--window STEPS] [--skip STEPS] [--hysteresis H] [--workers N]
+                                 [--out SUMMARY.tsv] [--windows WINDOWS.tsv]
+
+Traces are read chunk by chunk (see tracewriter.TraceReader), so traces of any length could be analysed;
+several traces are analysed in parallel processes. The summary table (printed or written to --out) has
+one row per trace (SUMMARY_COLUMNS):
++ number of rows, the first and the last step;
++ mean and variance of both populations;
++ steps when bacteria and predators died out (the first step with zero population, empty if they survived);
++ number of oscillation cycles, their mean period (in steps) and mean amplitude (half of the difference
+  between maximum and minimum within a cycle) of each population;
++ mean phase lag of predators behind bacteria (steps from upward crossing of bacteria to the next
+  upward crossing of predators).
+Cycles are delimited by upward crossings of population through its moving average (exponential, with
+time constant of --window steps, plain mean over the first rows) with hysteresis: population has to fall below the average by --hysteresis
+(relative) before the next crossing counts, so noise doesn't produce extra cycles.
+With --windows means and variances of both populations over consecutive windows of --window steps
+are written to separate table (WINDOW_COLUMNS, one row per window of each trace); each worker writes
+rows of its trace to a temporary file which is appended to the table, so windows are not kept in memory.
+Rows before --skip steps (transient) are ignored by everything except extinction steps.
+'''
+
+import argparse
+from collections import namedtuple
+import concurrent.futures
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+from app.sweep import init_worker
+from app.tracewriter import TraceReader
+
+
+DEFAULT_WINDOW = 1000
+DEFAULT_HYSTERESIS = 0.05
+
+SUMMARY_COLUMNS = ('trace', 'rows', 'firstStep', 'lastStep', 'meanBacteria', 'varBacteria', 'meanPredators', 'varPredators',
+    'bacteriaExtinct', 'predatorsExtinct', 'bacteriaCycles', 'bacteriaPeriod', 'bacteriaAmplitude',
+    'predatorCycles', 'predatorPeriod', 'predatorAmplitude', 'phaseLag')
+TraceSummary = namedtuple('TraceSummary', SUMMARY_COLUMNS)
+
+WINDOW_COLUMNS = ('trace', 'firstStep', 'lastStep', 'rows', 'meanBacteria', 'varBacteria', 'meanPredators', 'varPredators')
+WindowStats = namedtuple('WindowStats', WINDOW_COLUMNS)
+
+
+class RunningMoments(object):
+    '''
+    Mean and variance of a stream of values (Welford's algorithm).
+    'count' - number of values, 'mean' - their mean
+    '''
+    __slots__ = ('count', 'mean', '_m2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, value):
+        self.count += 1
+        delta = value-self.mean
+        self.mean += delta/self.count
+        self._m2 += delta*(value-self.mean)
+
+    def variance(self):
+        '''
+        Returns (population) variance of pushed values (0 if there are none)
+        '''
+        return self._m2/self.count if self.count>0 else 0.0
+
+
+class OscillationDetector(object):
+    '''
+    Detects cycles of oscillating value (see module description).
+    'lastCrossing' - step of the last upward crossing (None if there were none),
+    'numCycles' - number of complete cycles (between consecutive upward crossings)
+    '''
+    __slots__ = ('timeConstant', 'hysteresis', 'lastCrossing', 'numCycles', '_average', '_count', '_lastStep', '_below',
+        '_cycleMin', '_cycleMax', '_totalPeriod', '_totalAmplitude')
+
+    def __init__(self, timeConstant, hysteresis):
+        self.timeConstant = timeConstant
+        self.hysteresis = hysteresis
+        self.lastCrossing = None
+        self.numCycles = 0
+        self._average = None
+        self._count = 0
+        self._lastStep = None
+        self._below = False
+        self._cycleMin = self._cycleMax = 0
+        self._totalPeriod = 0
+        self._totalAmplitude = 0.0
+
+    def push(self, step, value):
+        '''
+        Returns True if value crosses its moving average upwards at given step
+        '''
+        # average starts as plain mean of pushed values, so it doesn't depend on the first value too much
+        self._count += 1
+        if self._average is None:
+            self._average = float(value)
+        else:
+            alpha = 1-math.exp(-(step-self._lastStep)/self.timeConstant)
+            self._average += (value-self._average)*max(alpha, 1/self._count)
+        self._lastStep = step
+        self._cycleMin = min(self._cycleMin, value)
+        self._cycleMax = max(self._cycleMax, value)
+        if value<self._average*(1-self.hysteresis):
+            self._below = True
+        elif self._below and value>self._average*(1+self.hysteresis):
+            self._below = False
+            if self.lastCrossing is not None:
+                self.numCycles += 1
+                self._totalPeriod += step-self.lastCrossing
+                self._totalAmplitude += (self._cycleMax-self._cycleMin)/2
+            self.lastCrossing = step
+            self._cycleMin = self._cycleMax = value
+            return True
+        return False
+
+    def period(self):
+        '''
+        Returns mean period of cycles (None if there were no complete cycles)
+        '''
+        return self._totalPeriod/self.numCycles if self.numCycles>0 else None
+
+    def amplitude(self):
+        '''
+        Returns mean amplitude of cycles (None if there were no complete cycles)
+        '''
+        return self._totalAmplitude/self.numCycles if self.numCycles>0 else None
+
+
+class TraceAnalyzer(object):
+    '''
+    Accumulates statistics of one trace pushed row by row or chunk by chunk (see module description).
+    'window' - length of windows and time constant of moving averages (in steps),
+    'skip' - rows before this step are ignored (except for extinction steps),
+    'keepWindows' - if True statistics of completed windows are collected (see pop_windows())
+    '''
+    __slots__ = ('window', 'skip', 'keepWindows', 'numRows', 'firstStep', 'lastStep', 'bacteriaExtinct', 'predatorsExtinct',
+        '_bacteria', '_predators', '_bacteriaCycles', '_predatorCycles', '_numLags', '_totalLag',
+        '_windowIndex', '_windowFirst', '_windowLast', '_windowBacteria', '_windowPredators', '_windows')
+
+    def __init__(self, window=DEFAULT_WINDOW, skip=0, hysteresis=DEFAULT_HYSTERESIS, keepWindows=False):
+        if window<1:
+            raise ValueError('Window must be positive: %d' % window)
+        self.window = window
+        self.skip = skip
+        self.keepWindows = keepWindows
+        self.numRows = 0
+        self.firstStep = self.lastStep = None
+        self.bacteriaExtinct = self.predatorsExtinct = None
+        self._bacteria = RunningMoments()
+        self._predators = RunningMoments()
+        self._bacteriaCycles = OscillationDetector(window, hysteresis)
+        self._predatorCycles = OscillationDetector(window, hysteresis)
+        self._numLags = 0
+        self._totalLag = 0
+        self._windowIndex = None
+        self._windows = []
+
+    def push(self, step, numBacteria, numPredators):
+        if numBacteria==0 and self.bacteriaExtinct is None:
+            self.bacteriaExtinct = step
+        if numPredators==0 and self.predatorsExtinct is None:
+            self.predatorsExtinct = step
+        if step<self.skip:
+            return
+        if self.firstStep is None:
+            self.firstStep = step
+        self.lastStep = step
+        self.numRows += 1
+        self._bacteria.push(numBacteria)
+        self._predators.push(numPredators)
+        self._bacteriaCycles.push(step, numBacteria)
+        if self._predatorCycles.push(step, numPredators) and self._bacteriaCycles.lastCrossing is not None:
+            self._numLags += 1
+            self._totalLag += step-self._bacteriaCycles.lastCrossing
+        if self.keepWindows:
+            index = step//self.window
+            if index!=self._windowIndex:
+                self._close_window()
+                self._windowIndex = index
+                self._windowFirst = step
+                self._windowBacteria = RunningMoments()
+                self._windowPredators = RunningMoments()
+            self._windowLast = step
+            self._windowBacteria.push(numBacteria)
+            self._windowPredators.push(numPredators)
+
+    def push_chunk(self, steps, bacteria, predators):
+        '''
+        Pushes rows given as sequences of values of Step, Bacteria and Predators columns
+        '''
+        push = self.push
+        for step, numBacteria, numPredators in zip(steps, bacteria, predators):
+            push(step, numBacteria, numPredators)
+
+    def _close_window(self):
+        if self._windowIndex is not None:
+            self._windows.append(WindowStats('', self._windowFirst, self._windowLast, self._windowBacteria.count,
+                self._windowBacteria.mean, self._windowBacteria.variance(),
+                self._windowPredators.mean, self._windowPredators.variance()))
+
+    def pop_windows(self, final=False):
+        '''
+        Returns list of WindowStats of windows completed since the previous call ('trace' is empty),
+        the current window is included if final is True
+        '''
+        if final:
+            self._close_window()
+            self._windowIndex = None
+        res, self._windows = self._windows, []
+        return res
+
+    def get_summary(self, name):
+        '''
+        Returns TraceSummary of pushed rows
+        '''
+        bacteriaCycles = self._bacteriaCycles
+        predatorCycles = self._predatorCycles
+        return TraceSummary(name, self.numRows, self.firstStep, self.lastStep,
+            self._bacteria.mean, self._bacteria.variance(), self._predators.mean, self._predators.variance(),
+            self.bacteriaExtinct, self.predatorsExtinct,
+            bacteriaCycles.numCycles, bacteriaCycles.period(), bacteriaCycles.amplitude(),
+            predatorCycles.numCycles, predatorCycles.period(), predatorCycles.amplitude(),
+            self._totalLag/self._numLags if self._numLags>0 else None)
+
+
+def analyze_trace(task):
+    '''
+    Analyses trace file (in worker process). task is (fileName, window, skip, hysteresis, windowsFile):
+    if windowsFile is not None rows of WINDOW_COLUMNS are written to it as windows are completed.
+    Returns TraceSummary
+    '''
+    fileName, window, skip, hysteresis, windowsFile = task
+    analyzer = TraceAnalyzer(window, skip, hysteresis, windowsFile is not None)
+    with TraceReader(fileName) as reader:
+        if windowsFile is None:
+            for chunk in reader.iter_chunks():
+                analyzer.push_chunk(chunk[0], chunk[1], chunk[2])
+            return analyzer.get_summary(fileName)
+        with open(windowsFile, 'w') as windowsOut:
+            for chunk in reader.iter_chunks():
+                analyzer.push_chunk(chunk[0], chunk[1], chunk[2])
+                windowsOut.writelines(format_row(w._replace(trace=fileName)) for w in analyzer.pop_windows())
+            windowsOut.writelines(format_row(w._replace(trace=fileName)) for w in analyzer.pop_windows(final=True))
+    return analyzer.get_summary(fileName)
+
+
+def analyze_traces(fileNames, window=DEFAULT_WINDOW, skip=0, hysteresis=DEFAULT_HYSTERESIS, windowsOut=None, workers=None):
+    '''
+    Analyses trace files in 'workers' processes (all cores if None, in this process if 1).
+    Yields TraceSummary of each trace in order of fileNames. If windowsOut (text file) is not None
+    rows of windows of each trace are appended to it before its summary is yielded (workers write them
+    to temporary files, so no trace's windows are kept in memory)
+    '''
+    if windowsOut is None:
+        for summary in _analyze_traces([ (fileName, window, skip, hysteresis, None) for fileName in fileNames ], workers):
+            yield summary
+        return
+    with tempfile.TemporaryDirectory() as tmpDir:
+        tasks = [ (fileName, window, skip, hysteresis, os.path.join(tmpDir, '%d.tsv' % i)) for i, fileName in enumerate(fileNames) ]
+        for task, summary in zip(tasks, _analyze_traces(tasks, workers)):
+            with open(task[4]) as f:
+                shutil.copyfileobj(f, windowsOut)
+            os.remove(task[4])
+            yield summary
+
+
+def _analyze_traces(tasks, workers):
+    if workers is None:
+        workers = min(len(tasks), os.cpu_count() or 1)
+    if workers<=1:
+        for task in tasks:
+            yield analyze_trace(task)
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker) as executor:
+        for summary in executor.map(analyze_trace, tasks):
+            yield summary
+
+
+def format_row(values):
+    '''
+    Returns line of output table (None is written as empty value)
+    '''
+    return '\t'.join('' if v is None else '%.3f' % v if isinstance(v, float) else str(v) for v in values)+'\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.trace_analysis', description='Analyses bacterio traces (.btf or .btc)')
+    parser.add_argument('traces', nargs='+', help='trace files')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='window and moving average time constant in steps (default: %(default)s)')
+    parser.add_argument('--skip', type=int, default=0, help='ignore rows before this step (default: %(default)s)')
+    parser.add_argument('--hysteresis', type=float, default=DEFAULT_HYSTERESIS, help='relative hysteresis of cycle detection (default: %(default)s)')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: number of cores)')
+    parser.add_argument('--out', help='summary table (.tsv, default: standard output)')
+    parser.add_argument('--windows', metavar='FILE', help='table of per-window means and variances (.tsv)')
+    args = parser.parse_args(argv)
+
+    if args.window<1:
+        parser.error('--window must be positive')
+    out = open(args.out, 'w') if args.out is not None else sys.stdout
+    windowsOut = open(args.windows, 'w') if args.windows is not None else None
+    try:
+        out.write('\t'.join(SUMMARY_COLUMNS)+'\n')
+        if windowsOut is not None:
+            windowsOut.write('\t'.join(WINDOW_COLUMNS)+'\n')
+        for summary in analyze_traces(args.traces, args.window, args.skip, args.hysteresis, windowsOut, args.workers):
+            out.write(format_row(summary))
+            out.flush()
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if windowsOut is not None:
+            windowsOut.close()
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -1,32 +1,418 @@
 '''
-TraceWriter - writes bacterio traces to .btf file
+Writes bacterio traces (populations on each step)
+
+Two formats are supported:
+    + .btf - tab separated text (parameters of the run, blank line, header and one line per row),
+    + .btc - binary columns (see ColumnarTraceWriter) which could be exported to .btf with
+        python -m app.tracewriter TRACE.btc [OUT.btf]
+Both writers buffer rows and write them in chunks, could be flushed at any time and closed
+(or used as context managers), and decimate rows (see Decimator).
+Traces of both formats could be read chunk by chunk in constant memory with TraceReader.
 '''
 
+from array import array
+from collections import namedtuple
 from datetime import datetime
+import struct
+import sys
+
+
+BASE_COLUMNS = ('Step', 'Bacteria', 'Predators')
+CHUNK_ROWS = 65536
+
+COLUMNAR_MAGIC = b'BTC\x00'
+COLUMNAR_VERSION = 1
+# magic, version, number of columns
+COLUMNAR_HEADER = struct.Struct('<4sHH')
+# number of rows in chunk
+CHUNK_HEADER = struct.Struct('<I')
+
+# 'text' - the first lines of .btf (parameters of the run), 'columns' - list of column names,
+# 'data' - dict (column name -> array of values)
+TraceData = namedtuple('TraceData', ['text', 'columns', 'data'])
+
+
+class Decimator(object):
+    '''
+    Selects rows to be written.
+    'every' - every k-th row is kept (and the last row is always kept) if 'minMax' is False,
+    otherwise rows are grouped into windows of 'every' rows and for each window only rows with
+    minimal and maximal value of every column except the first one (step) are kept, so
+    the envelope of the trace is preserved.
+    '''
+    __slots__ = ('every', 'minMax', '_count', '_window', '_last')
+
+    def __init__(self, every=1, minMax=False):
+        if every<1:
+            raise ValueError('Decimation step must be positive')
+        self.every = every
+        self.minMax = minMax
+        self._count = 0
+        self._window = []
+        self._last = None
+
+    def push(self, row):
+        '''
+        row is tuple of values. Returns list of rows to be written
+        '''
+        self._count += 1
+        if self.every==1:
+            return [row]
+        if not self.minMax:
+            if (self._count-1)%self.every==0:
+                self._last = None
+                return [row]
+            self._last = row
+            return []
+        self._window.append(row)
+        if len(self._window)>=self.every:
+            return self._select()
+        return []
+
+    def flush(self):
+        '''
+        Returns rows which are held back (the last row or incomplete window). Should be called at the end of trace
+        '''
+        if self.minMax:
+            return self._select()
+        last, self._last = self._last, None
+        return [] if last is None else [last]
+
+    def _select(self):
+        window, self._window = self._window, []
+        if len(window)==0:
+            return []
+        keep = set()
+        for column in range(1, len(window[0])):
+            values = [row[column] for row in window]
+            keep.add(values.index(min(values)))
+            keep.add(values.index(max(values)))
+        return [window[i] for i in sorted(keep)]
+
+
+def make_trace_file_name(traceFilePrefix, extension):
+    '''
+    Returns trace file name - prefix with current datetime suffix
+    '''
+    dt = datetime.now()
+    return '%s_%04d%02d%02d-%02d-%02d-%02d.%s' % (traceFilePrefix, dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, extension)
+
+
+def get_trace_text(config):
+    '''
+    Returns description of the run which heads traces
+    '''
+    return repr(config.fieldParams)+'\n'+repr(config.modelParams)+'\n'
 
 
 class TraceWriter(object):
     '''
-    TraceWriter - writes bacterio traces to .btf file
+    TraceWriter - writes bacterio traces to .btf file.
+    'fileName' - name of trace file, 'columns' - names of columns,
+    'decimator' - Decimator which selects written rows
     '''
-    __slots__ = ('_file')
-    
-    def __init__(self, config):
+    __slots__ = ('fileName', 'columns', 'decimator', '_file', '_rows')
+
+    EXTENSION = 'btf'
+
+    def __init__(self, config, traceFilePrefix, extraColumns=(), every=1, minMax=False):
         '''
-        'config' is bacterio config.Config object
+        'config' is bacterio config.Rules object,
+        'traceFilePrefix' is prefix of trace file name (suffix is current datetime),
+        'extraColumns' are names of columns written after Step, Bacteria and Predators,
+        'every' and 'minMax' are decimation parameters (see Decimator)
         '''
-        dt = datetime.now()
-        fileName = '%s_%04d%02d%02d-%02d-%02d-%02d.btf' % (config.miscParams.traceFilePrefix, dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
-        self._file = open(fileName, 'w')
-        self._file.write(repr(config.fieldParams)+'\n')
-        self._file.write(repr(config.modelParams)+'\n')
-        self._file.write('\nStep\tBacteria\tPredators\n')
-    
-    def write(self, step, numBacteria, numPredators):
+        self._file = None
+        self.fileName = make_trace_file_name(traceFilePrefix, self.EXTENSION)
+        self.columns = BASE_COLUMNS+tuple(name for name, typecode in map(_parse_column, extraColumns))
+        self.decimator = Decimator(every, minMax)
+        self._rows = []
+        self._file = open(self.fileName, 'wb')
+        self._write_header(get_trace_text(config))
+
+    def _write_header(self, text):
+        self._file.write((text+'\n'+'\t'.join(self.columns)+'\n').encode())
+
+    def write(self, step, numBacteria, numPredators, *extra):
         '''
-        Writes one trace row
+        Writes one trace row (extra are values of extra columns)
         '''
-        self._file.write(str(step)+'\t'+str(numBacteria)+'\t'+str(numPredators)+'\n')
-        
-    def __del__(self):
+        rows = self.decimator.push((step, numBacteria, numPredators)+extra)
+        if rows:
+            self._rows.extend(rows)
+            if len(self._rows)>=CHUNK_ROWS:
+                self._write_rows()
+
+    def _write_rows(self):
+        self._file.write(''.join('\t'.join(map(str, row))+'\n' for row in self._rows).encode())
+        self._rows = []
+
+    def flush(self):
+        '''
+        Writes buffered rows to file (rows held back by decimation are written only by close())
+        '''
+        if self._file is None:
+            return
+        self._write_rows()
+        self._file.flush()
+
+    def close(self):
+        '''
+        Writes all remaining rows and closes trace file (could be called more than once)
+        '''
+        if self._file is None:
+            return
+        self._rows.extend(self.decimator.flush())
+        self._write_rows()
         self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def _parse_column(column):
+    '''
+    column is name (int32 column) or (name, typecode) where typecode is 'i' (int32), 'q' (int64) or 'd' (float64).
+    Returns (name, typecode)
+    '''
+    if isinstance(column, str):
+        return column, 'i'
+    name, typecode = column
+    if not typecode in ('i', 'q', 'd'):
+        raise ValueError('Unsupported column typecode: %s' % typecode)
+    return name, typecode
+
+
+class ColumnarTraceWriter(TraceWriter):
+    '''
+    Writes bacterio traces to binary .btc file:
+        header (COLUMNAR_HEADER): magic, version, number of columns;
+        for each column: typecode ('i' - int32, 'q' - int64 or 'd' - float64), length of name, name (UTF-8);
+        length of text and text (the first lines of .btf) as uint32 and UTF-8;
+        chunks: number of rows as uint32 then values of each column (little-endian).
+    Rows are kept in per-column arrays until CHUNK_ROWS rows are collected or flush() is called.
+    Incomplete chunk at the end of file (e.g. after crash) is ignored by read_columnar_trace.
+    '''
+    __slots__ = ('_typecodes', '_columns')
+
+    EXTENSION = 'btc'
+
+    def __init__(self, config, traceFilePrefix, extraColumns=(), every=1, minMax=False):
+        self._file = None
+        extraColumns = [_parse_column(column) for column in extraColumns]
+        self._typecodes = ('i',)*len(BASE_COLUMNS)+tuple(typecode for name, typecode in extraColumns)
+        self._columns = [array(typecode) for typecode in self._typecodes]
+        TraceWriter.__init__(self, config, traceFilePrefix, extraColumns, every, minMax)
+
+    def _write_header(self, text):
+        f = self._file
+        f.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, len(self.columns)))
+        for name, typecode in zip(self.columns, self._typecodes):
+            name = name.encode()
+            f.write(typecode.encode()+bytes((len(name),))+name)
+        text = text.encode()
+        f.write(struct.pack('<I', len(text))+text)
+
+    def write(self, step, numBacteria, numPredators, *extra):
+        '''
+        Writes one trace row (extra are values of extra columns)
+        '''
+        columns = self._columns
+        if self.decimator.every==1:
+            columns[0].append(step)
+            columns[1].append(numBacteria)
+            columns[2].append(numPredators)
+            for column, value in zip(columns[3:], extra):
+                column.append(value)
+        else:
+            for row in self.decimator.push((step, numBacteria, numPredators)+extra):
+                for column, value in zip(columns, row):
+                    column.append(value)
+        if len(columns[0])>=CHUNK_ROWS:
+            self._write_rows()
+
+    def _write_rows(self):
+        for row in self._rows:
+            for column, value in zip(self._columns, row):
+                column.append(value)
+        self._rows = []
+        numRows = len(self._columns[0])
+        if numRows==0:
+            return
+        self._file.write(CHUNK_HEADER.pack(numRows))
+        for i, column in enumerate(self._columns):
+            if sys.byteorder!='little':
+                column.byteswap()
+            self._file.write(column.tobytes())
+            self._columns[i] = array(column.typecode)
+
+
+class TraceReader(object):
+    '''
+    Reads .btf or .btc trace (format is detected by content) chunk by chunk, so memory used doesn't depend
+    on the trace length. 'fileName' - name of trace file, 'columnar' - True for .btc,
+    'text' - the first lines of .btf (parameters of the run), 'columns' - list of column names.
+    Incomplete chunk (.btc) or line (.btf) at the end of file (e.g. after crash) is ignored.
+    '''
+    __slots__ = ('fileName', 'columnar', 'text', 'columns', '_typecodes', '_file')
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self._file = open(fileName, 'rb')
+        try:
+            self.columnar = self._file.read(len(COLUMNAR_MAGIC))==COLUMNAR_MAGIC
+            self._file.seek(0)
+            if self.columnar:
+                self._read_columnar_header()
+            else:
+                self._read_text_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_exactly(self, size):
+        data = self._file.read(size)
+        if len(data)<size:
+            raise ValueError('Truncated trace file: %s' % self.fileName)
+        return data
+
+    def _read_columnar_header(self):
+        magic, version, numColumns = COLUMNAR_HEADER.unpack(self._read_exactly(COLUMNAR_HEADER.size))
+        if version>COLUMNAR_VERSION:
+            raise ValueError('Unsupported trace file version %d' % version)
+        self.columns = []
+        self._typecodes = []
+        for i in range(numColumns):
+            typecode, length = self._read_exactly(2)
+            self._typecodes.append(chr(typecode))
+            self.columns.append(self._read_exactly(length).decode())
+        length, = struct.unpack('<I', self._read_exactly(4))
+        self.text = self._read_exactly(length).decode()
+
+    def _read_text_header(self):
+        lines = []
+        for line in self._file:
+            if line.strip()==b'':
+                break
+            lines.append(line.decode())
+        else:
+            raise ValueError('Not a trace file: %s' % self.fileName)
+        self.text = ''.join(lines)
+        self.columns = self._file.readline().decode().rstrip('\r\n').split('\t')
+        if tuple(self.columns[:len(BASE_COLUMNS)])!=BASE_COLUMNS:
+            raise ValueError('Not a trace file: %s' % self.fileName)
+
+    def iter_chunks(self):
+        '''
+        Yields chunks of rows: each chunk is list of sequences of values (one per column)
+        '''
+        if self.columnar:
+            return self._iter_columnar_chunks()
+        return self._iter_text_chunks()
+
+    def _iter_columnar_chunks(self):
+        rowSize = sum(array(typecode).itemsize for typecode in self._typecodes)
+        while True:
+            header = self._file.read(CHUNK_HEADER.size)
+            if len(header)<CHUNK_HEADER.size:
+                return
+            numRows, = CHUNK_HEADER.unpack(header)
+            data = self._file.read(numRows*rowSize)
+            if len(data)<numRows*rowSize:
+                return
+            chunk = []
+            pos = 0
+            for typecode in self._typecodes:
+                column = array(typecode)
+                size = numRows*column.itemsize
+                column.frombytes(data[pos:pos+size])
+                if sys.byteorder!='little':
+                    column.byteswap()
+                chunk.append(column)
+                pos += size
+            yield chunk
+
+    def _iter_text_chunks(self):
+        numColumns = len(self.columns)
+        rows = []
+        for line in self._file:
+            if not line.endswith(b'\n'):
+                break
+            rows.append(line.split(b'\t'))
+            if len(rows)>=CHUNK_ROWS:
+                yield self._parse_rows(rows, numColumns)
+                rows = []
+        if rows:
+            yield self._parse_rows(rows, numColumns)
+
+    def _parse_rows(self, rows, numColumns):
+        if any(len(row)!=numColumns for row in rows):
+            raise ValueError('Wrong number of values in trace file: %s' % self.fileName)
+        chunk = []
+        for values in zip(*rows):
+            try:
+                chunk.append([int(value) for value in values])
+            except ValueError:
+                chunk.append([float(value) for value in values])
+        return chunk
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def read_columnar_trace(fileName):
+    '''
+    Reads .btc file. Returns TraceData
+    '''
+    with TraceReader(fileName) as reader:
+        if not reader.columnar:
+            raise ValueError('Not a columnar trace file')
+        values = [array(typecode) for typecode in reader._typecodes]
+        for chunk in reader.iter_chunks():
+            for column, chunkValues in zip(values, chunk):
+                column.extend(chunkValues)
+        return TraceData(reader.text, reader.columns, dict(zip(reader.columns, values)))
+
+
+def export_btf(fileName, btfFileName):
+    '''
+    Exports .btc file to tab separated .btf file
+    '''
+    trace = read_columnar_trace(fileName)
+    columns = [trace.data[name] for name in trace.columns]
+    with open(btfFileName, 'w') as f:
+        f.write(trace.text+'\n'+'\t'.join(trace.columns)+'\n')
+        for row in zip(*columns):
+            f.write('\t'.join(map(str, row))+'\n')
+
+
+def create_trace_writer(config, traceFilePrefix, traceFormat='btf', extraColumns=(), every=1, minMax=False):
+    '''
+    Creates TraceWriter ('btf' format) or ColumnarTraceWriter ('btc' format)
+    '''
+    if traceFormat=='btf':
+        return TraceWriter(config, traceFilePrefix, extraColumns, every, minMax)
+    if traceFormat=='btc':
+        return ColumnarTraceWriter(config, traceFilePrefix, extraColumns, every, minMax)
+    raise ValueError('Unknown trace format: %s' % traceFormat)
+
+
+if __name__=='__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit('Usage: python -m app.tracewriter TRACE.btc [OUT.btf]')
+    export_btf(sys.argv[1], sys.argv[2] if len(sys.argv)==3 else sys.argv[1].rsplit('.', 1)[0]+'.btf')
@@ -0,0 +1,489 @@
+'''
+Describes bacterio models vectorized with NumPy (requires numpy package)
+
+Both phases process all creatures at once:
++ bacteria phase is exactly the same as in model.CoreModel - number of dividing, staying and moving bacteria
+  of each cell is drawn from binomial distributions with the samplers' exact probabilities (see
+  rand_p.BernoulliSampler.probability) and movers are scattered to random allowed cells;
++ predator phase follows the same rules but hungry predators choose their targets simultaneously
+  (from bacteria at the beginning of the phase). If more predators step into a cell than there are
+  bacteria in it, the ones which feed are chosen randomly. In model.CoreModel predators hunt one by one,
+  so a predator never targets bacterium already eaten by other predator during the same phase.
+'''
+
+import random
+from collections import Counter
+
+import numpy as np
+
+from app.hexafield import OffsetTable
+from app.model_params import compile_samplers
+from app.state import PackedBacterioState
+from app.model_stats import ModelStats
+
+
+def get_ring_offsets(radius):
+    '''
+    Returns list of (dx, dy) of all cells located at exact radius from (0,0)
+    '''
+    return [ (dx,dy) for dx in range(-radius, radius+1) for dy in range(-radius, radius+1)
+                if max(abs(dx), abs(dy), abs(dx+dy))==radius ]
+
+
+def get_disc_offsets(radius):
+    '''
+    Returns list of (dx, dy) of all cells within radius from (0,0)
+    '''
+    return [ (dx,dy) for dx in range(-radius, radius+1) for dy in range(-radius, radius+1)
+                if max(abs(dx), abs(dy), abs(dx+dy))<=radius ]
+
+
+class VectorCoreModel(object):
+    '''
+    Describes the same model as model.CoreModel vectorized with NumPy (see module description for the differences).
+    'field' is HexafieldBase instance,
+    'modelParams' is ModelParams instance,
+    'samplers' is model_params.Samplers compiled from modelParams,
+    'index' is hexafield.CellIndex of the field,
+    'bacteria' is numpy array of bacteria counts per cell,
+    'predatorCells' and 'predatorEnergies' are numpy arrays of each predator's cell index and energy,
+    'rng' is numpy.random.Generator (seeded from 'random' module, so random.seed() makes runs reproducible),
+    'stats' is model_stats.ModelStats updated by phases and edits (see model.CoreModel).
+    Cells are also laid out on a padded 2D grid (see _build_grid) so that neighbourhood of any cell
+    is a fixed set of offsets; off-field grid positions hold sentinel index len(index).
+    Changed cells are tracked as in model.CoreModel ('_changedCells' is boolean mask of cells).
+    '''
+    __slots__ = ('modelParams', 'samplers', 'field', 'index', 'rng', 'bacteria', 'predatorCells', 'predatorEnergies',
+        '_grid', '_cellFlat', '_rowSize', '_stepTable', '_changedCells', 'stats')
+
+    def __init__(self, modelParams, state):
+        '''
+        modelParams is ModelParams,
+        state is state.BacretioState that will be parsed as initial state
+        '''
+        self.modelParams = modelParams
+        self.samplers = compile_samplers(modelParams)
+        self.rng = np.random.default_rng(random.getrandbits(64))
+        self.parse_state(state)
+
+    def parse_state(self, state):
+        '''
+        state is state.BacretioState
+        '''
+        self.field = state.field
+        self.index = state.field.get_cell_index()
+        self._build_grid()
+        self._changedCells = None
+        if isinstance(state, PackedBacterioState):
+            # per-cell numbers are used as they are - no HexCoords or creatures are created
+            self.bacteria = np.array(state.bacteria, dtype=np.int64)
+            self.predatorCells = np.repeat(np.arange(len(self.index), dtype=np.int64), np.asarray(state.predatorCounts, dtype=np.int64))
+            self.predatorEnergies = np.array(state.predatorEnergies, dtype=np.int64)
+        else:
+            self._parse_positions(state)
+        self.stats = ModelStats()
+        self.stats.numBacteria = int(self.bacteria.sum())
+        self.stats.bacteriaCells = int(np.count_nonzero(self.bacteria))
+        self._update_energy_stats()
+
+    def _parse_positions(self, state):
+        find = self.index.find
+        self.bacteria = np.zeros(len(self.index), dtype=np.int64)
+        for hc in state.bacteriaPositions:
+            self.bacteria[find(hc.x, hc.y)] = len(state.bacteriaPositions[hc])
+        cells = []
+        energies = []
+        for hc in state.predatorPositions:
+            for pr in state.predatorPositions[hc]:
+                cells.append(find(hc.x, hc.y))
+                energies.append(pr.energy)
+        self.predatorCells = np.array(cells, dtype=np.int64)
+        self.predatorEnergies = np.array(energies, dtype=np.int64)
+
+    def _update_energy_stats(self):
+        values, counts = np.unique(self.predatorEnergies, return_counts=True)
+        self.stats.set_energies(Counter(dict(zip(values.tolist(), counts.tolist()))))
+        self.stats.predatorCells = len(np.unique(self.predatorCells))
+
+    def get_bacteria_velocity(self):
+        return 1
+
+    def _build_grid(self):
+        '''
+        Lays cells out on 2D grid (x, y) padded with enough off-field positions
+        for any neighbourhood query made by the model (on fields which wrap around
+        off-field positions hold the cells they are wrapped to)
+        '''
+        mp = self.modelParams
+        pad = max(1, mp.PR_SIGHT, mp.BACT_OVERCROWD_RADIUS, mp.PR_OVERCROWD_RADIUS, self.get_bacteria_velocity())
+        xs = np.frombuffer(self.index.xs, dtype=np.int32).astype(np.int64)
+        ys = np.frombuffer(self.index.ys, dtype=np.int32).astype(np.int64)
+        numCells = len(self.index)
+        if numCells==0:
+            xs = ys = np.zeros(1, dtype=np.int64)
+        self._rowSize = int(ys.max()-ys.min()) + 1 + 2*pad
+        numRows = int(xs.max()-xs.min()) + 1 + 2*pad
+        self._cellFlat = (xs[:numCells]-xs.min()+pad)*self._rowSize + (ys[:numCells]-ys.min()+pad)
+        self._grid = np.full(numRows*self._rowSize, numCells, dtype=np.int64)
+        self._grid[self._cellFlat] = np.arange(numCells)
+        if self.field.get_periods() and numCells>0:
+            wrap = self.field.wrap_coords
+            find = self.index.find
+            xMin = int(xs.min())-pad
+            yMin = int(ys.min())-pad
+            for flat in np.flatnonzero(self._grid==numCells).tolist():
+                self._grid[flat] = find(*wrap(xMin+flat//self._rowSize, yMin+flat%self._rowSize))
+        # flat offsets of the first steps indexed by offsets to targets (see hexafield.OffsetTable)
+        steps = OffsetTable(mp.PR_SIGHT)
+        self._stepTable = self._to_flat(np.frombuffer(steps.stepXs, dtype=np.int32).astype(np.int64),
+            np.frombuffer(steps.stepYs, dtype=np.int32).astype(np.int64))
+
+    def _to_flat(self, dx, dy):
+        return dx*self._rowSize + dy
+
+    def _flat_offsets(self, offsets):
+        return np.array([self._to_flat(dx, dy) for dx, dy in offsets], dtype=np.int64)
+
+    def _draw(self, sampler, n):
+        '''
+        Returns boolean array of n outcomes of given rand_p.BernoulliSampler
+        '''
+        return np.frombuffer(sampler.sample(n), dtype=np.uint8).astype(bool)
+
+    def _count(self, sampler, counts):
+        '''
+        Returns array of numbers of 1s among counts[i] outcomes of given rand_p.BernoulliSampler
+        (binomials with the sampler's exact probability, as BernoulliSampler.count draws)
+        '''
+        return self.rng.binomial(counts, sampler.probability())
+
+    def _sum_within(self, counts, cells, radius):
+        '''
+        counts is array of per-cell values with extra trailing zero (sentinel).
+        Returns array of sums of counts within radius around each of cells
+        '''
+        flat = self._cellFlat[cells]
+        res = np.zeros(len(cells), dtype=np.int64)
+        for offset in self._flat_offsets(get_disc_offsets(radius)):
+            res += counts[self._grid[flat+offset]]
+        return res
+
+    def _random_moves(self, cells, radius):
+        '''
+        Returns array of random cells located at exact radius from each of cells
+        (the cell itself if there are no such cells)
+        '''
+        offsets = self._flat_offsets(get_ring_offsets(radius))
+        flat = self._cellFlat[cells]
+        res = np.array(cells, dtype=np.int64)
+        pending = np.arange(len(cells))
+        sentinel = len(self.index)
+        # rejection sampling keeps choice uniform among allowed cells
+        for attempt in range(64):
+            if len(pending)==0:
+                break
+            targets = self._grid[flat[pending] + offsets[self.rng.integers(0, len(offsets), size=len(pending))]]
+            ok = targets!=sentinel
+            res[pending[ok]] = targets[ok]
+            pending = pending[~ok]
+        return res
+
+    def step(self):
+        '''
+        Makes one turn and updates 'bacteria', 'predatorCells' and 'predatorEnergies'
+        '''
+        self._mark_occupied_cells()
+        self.stats.start_step()
+        self.step_predators()
+        self.step_bacteria()
+        self._mark_occupied_cells()
+
+    def _mark_occupied_cells(self):
+        changed = self._changedCells
+        if changed is not None:
+            changed |= self.bacteria>0
+            changed[self.predatorCells] = True
+
+    def pop_changed_cells(self):
+        '''
+        Returns set of HexCoords of cells whose creatures could have changed since the previous call
+        or None if all cells should be considered changed (see model.CoreModel.pop_changed_cells)
+        '''
+        res = self._changedCells
+        self._changedCells = np.zeros(len(self.index), dtype=bool)
+        if res is None:
+            return None
+        get_cell = self.index.get_cell
+        return { get_cell(i) for i in np.flatnonzero(res).tolist() }
+
+    def pop_cell_counts(self):
+        '''
+        Returns (cells, bacteria, predators) - numpy arrays of indices of cells changed since the previous call
+        and their numbers of creatures (see model.CoreModel.pop_cell_counts)
+        '''
+        res = self._changedCells
+        self._changedCells = np.zeros(len(self.index), dtype=bool)
+        predators = np.bincount(self.predatorCells, minlength=len(self.index))
+        if res is None:
+            return None, self.bacteria.copy(), predators
+        cells = np.flatnonzero(res)
+        return cells, self.bacteria[cells], predators[cells]
+
+    def step_predators(self):
+        mp = self.modelParams
+        numCells = len(self.index)
+        cells = self.predatorCells
+        energies = self.predatorEnergies
+        if mp.PR_OVERCROWD>0:
+            counts = np.bincount(cells, minlength=numCells+1)
+            occupied = np.flatnonzero(counts[:numCells])
+            notOvercrowded = np.zeros(numCells, dtype=bool)
+            notOvercrowded[occupied] = self._sum_within(counts, occupied, mp.PR_OVERCROWD_RADIUS)<mp.PR_OVERCROWD
+            notOvercrowded = notOvercrowded[cells]
+        else:
+            notOvercrowded = np.ones(len(cells), dtype=bool)
+        divide = notOvercrowded & (energies>=mp.PR_DIVIDE_ENERGY) & self._draw(self.samplers.P_PR_DIVIDE, len(cells))
+        # DIVIDE
+        offspringCells = np.repeat(cells[divide], 2)
+        offspringEnergies = np.repeat((energies[divide]-mp.PR_DIVIDE_COST)//2, 2)
+        # WELL FED
+        fed = ~divide & (energies>=mp.PR_MAX_ENERGY)
+        fedCells = cells[fed]
+        move = ~self._draw(self.samplers.P_PR_STAY, len(fedCells))
+        fedCells[move] = self._random_moves(fedCells[move], 1)
+        fedEnergies = energies[fed]-mp.PR_TURN_COST
+        # HUNGRY
+        hungry = ~divide & ~fed
+        hungryEnergies = energies[hungry]-mp.PR_TURN_COST
+        alive = hungryEnergies>0
+        hungryCells = cells[hungry][alive]
+        hungryEnergies = hungryEnergies[alive]
+        targets = self.find_closest_bacteria(hungryCells)
+        blind = targets<0
+        newCells = np.array(hungryCells)
+        newCells[blind] = self._random_moves(hungryCells[blind], 1)
+        hunting = ~blind
+        newCells[hunting] = self._steps_to(hungryCells[hunting], targets[hunting])
+        hunters = np.flatnonzero(hunting)
+        eat = self._resolve_feeding(newCells[hunters])
+        hungryEnergies[hunters[eat]] += mp.PR_FEED_VALUE
+        self.predatorCells = np.concatenate((offspringCells, fedCells, newCells))
+        self.predatorEnergies = np.concatenate((offspringEnergies, fedEnergies, hungryEnergies))
+        stats = self.stats
+        eaten = int(eat.sum())
+        stats.predatorsBorn += int(divide.sum())
+        stats.predatorsDied += int(len(alive)-alive.sum())
+        stats.bacteriaEaten += eaten
+        stats.numBacteria -= eaten
+        stats.bacteriaCells = int(np.count_nonzero(self.bacteria))
+        self._update_energy_stats()
+
+    def _steps_to(self, cells, targets):
+        '''
+        Returns array of the first cells on the shortest paths from cells to targets (see hexafield.get_step_to)
+        '''
+        sight = self.modelParams.PR_SIGHT
+        xs = np.frombuffer(self.index.xs, dtype=np.int32)
+        ys = np.frombuffer(self.index.ys, dtype=np.int32)
+        dx = xs[targets].astype(np.int64)-xs[cells]
+        dy = ys[targets].astype(np.int64)-ys[cells]
+        periods = self.field.get_periods()
+        if periods:
+            # the closest copy of the target (see hexafield.TorusHexafield.get_closest_image)
+            (px, py), (qx, qy) = periods
+            shifts = np.array([ (a*px+b*qx, a*py+b*qy) for a in (-1, 0, 1) for b in (-1, 0, 1) ], dtype=np.int64)
+            shiftedX = dx[:,None]+shifts[:,0]
+            shiftedY = dy[:,None]+shifts[:,1]
+            best = np.maximum(np.maximum(abs(shiftedX), abs(shiftedY)), abs(shiftedX+shiftedY)).argmin(axis=1)
+            rows = np.arange(len(dx))
+            dx = shiftedX[rows, best]
+            dy = shiftedY[rows, best]
+        steps = self._grid[self._cellFlat[cells] + self._stepTable[(dx+sight)*(2*sight+1)+dy+sight]]
+        return np.where(steps==len(self.index), cells, steps)
+
+    def _resolve_feeding(self, cells):
+        '''
+        Hungry predators moved to cells (array) eat bacteria there, one bacterium per predator.
+        If there are not enough bacteria in a cell, random ones of predators feed.
+        Returns boolean array - True for predators which ate bacterium
+        '''
+        order = self.rng.permutation(len(cells))
+        order = order[np.argsort(cells[order], kind='stable')]
+        sortedCells = cells[order]
+        firsts = np.flatnonzero(np.r_[True, sortedCells[1:]!=sortedCells[:-1]]) if len(cells)>0 else np.zeros(0, dtype=np.int64)
+        groupStarts = np.repeat(firsts, np.diff(np.r_[firsts, len(cells)]))
+        rank = np.arange(len(cells))-groupStarts
+        eat = np.zeros(len(cells), dtype=bool)
+        eat[order] = rank<self.bacteria[sortedCells]
+        np.subtract.at(self.bacteria, cells[eat], 1)
+        return eat
+
+    def find_closest_bacteria(self, cells):
+        '''
+        Returns array of indices of the cells with the closest bacteria within PR_SIGHT
+        for each of cells (-1 if there are no bacteria in sight).
+        Equidistant bacteria are chosen randomly.
+        '''
+        bacteria = np.append(self.bacteria, 0)
+        targets = np.full(len(cells), -1, dtype=np.int64)
+        here = bacteria[cells]>0
+        targets[here] = cells[here]
+        pending = np.flatnonzero(~here)
+        for r in range(1, self.modelParams.PR_SIGHT+1):
+            if len(pending)==0:
+                break
+            candidates = self._grid[self._cellFlat[cells[pending]][:,None] + self._flat_offsets(get_ring_offsets(r))[None,:]]
+            occupied = bacteria[candidates]>0
+            found = occupied.any(axis=1)
+            choice = (self.rng.random(occupied.shape)*occupied).argmax(axis=1)
+            targets[pending[found]] = candidates[found, choice[found]]
+            pending = pending[~found]
+        return targets
+
+    def step_bacteria(self):
+        mp = self.modelParams
+        numCells = len(self.index)
+        occupied = np.flatnonzero(self.bacteria)
+        counts = self.bacteria[occupied]
+        if mp.BACT_OVERCROWD>0:
+            notOvercrowded = self._sum_within(np.append(self.bacteria, 0), occupied, mp.BACT_OVERCROWD_RADIUS)<mp.BACT_OVERCROWD
+        else:
+            notOvercrowded = np.ones(len(occupied), dtype=bool)
+        divided = self._count(self.samplers.P_BACT_DIVIDE, counts*notOvercrowded)
+        rest = counts-divided
+        stayed = self._count(self.samplers.P_BACT_STAY, rest)
+        movers = rest-stayed
+        newBacteria = np.zeros(numCells, dtype=np.int64)
+        newBacteria[occupied] = 2*divided+stayed
+        targets = self._random_moves(np.repeat(occupied, movers), self.get_bacteria_velocity())
+        newBacteria += np.bincount(targets, minlength=numCells)
+        self.bacteria = newBacteria
+        born = int(divided.sum())
+        self.stats.bacteriaBorn += born
+        self.stats.numBacteria += born
+        self.stats.bacteriaCells = int(np.count_nonzero(newBacteria))
+
+
+    def count_bacteria(self):
+        '''
+        Returns total amount of bacteria
+        '''
+        return self.stats.numBacteria
+
+    def count_predators(self):
+        '''
+        Returns total amount of predators
+        '''
+        return self.stats.numPredators
+
+    def count_bacteria_at(self, hexCoords):
+        '''
+        Returns number of bacteria in given cell
+        '''
+        i = self.index.find(hexCoords.x, hexCoords.y)
+        return 0 if i<0 else int(self.bacteria[i])
+
+    def count_predators_at(self, hexCoords):
+        '''
+        Returns number of predators in given cell
+        '''
+        return len(self.get_predator_energies(hexCoords))
+
+    def get_predator_energies(self, hexCoords):
+        '''
+        Returns list of energies of predators in given cell
+        '''
+        i = self.index.find(hexCoords.x, hexCoords.y)
+        if i<0:
+            return []
+        return self.predatorEnergies[self.predatorCells==i].tolist()
+
+    def get_energies_at(self, cells):
+        '''
+        Returns lists of energies of predators in cells with given indices (see model.CoreModel.get_energies_at)
+        '''
+        order = np.argsort(self.predatorCells, kind='stable')
+        sortedCells = self.predatorCells[order]
+        cells = np.asarray(cells, dtype=sortedCells.dtype)
+        starts = np.searchsorted(sortedCells, cells, 'left').tolist()
+        ends = np.searchsorted(sortedCells, cells, 'right').tolist()
+        energies = self.predatorEnergies[order].tolist()
+        return [ energies[start:end] for start, end in zip(starts, ends) ]
+
+    def get_state(self):
+        '''
+        Returns current state as state.PackedBacterioState
+        '''
+        order = np.argsort(self.predatorCells, kind='stable')
+        return PackedBacterioState(self.field, self.bacteria.tolist(),
+            np.bincount(self.predatorCells, minlength=len(self.index)).tolist(), self.predatorEnergies[order].tolist())
+
+    def add_bacteria(self, hexCoords):
+        '''
+        Adds bacteria to given cell
+        '''
+        i = self._find(hexCoords)
+        if self.bacteria[i]==0:
+            self.stats.bacteriaCells += 1
+        self.bacteria[i] += 1
+        self.stats.numBacteria += 1
+        self._add_changed_cell(hexCoords)
+
+    def _find(self, hexCoords):
+        i = self.index.find(hexCoords.x, hexCoords.y)
+        if i<0:
+            raise KeyError(hexCoords)
+        return i
+
+    def _add_changed_cell(self, hexCoords):
+        if self._changedCells is not None:
+            self._changedCells[self._find(hexCoords)] = True
+
+    def add_predator(self, hexCoords):
+        '''
+        Adds predator to given cell
+        '''
+        i = self._find(hexCoords)
+        if not (self.predatorCells==i).any():
+            self.stats.predatorCells += 1
+        self.predatorCells = np.append(self.predatorCells, i)
+        self.predatorEnergies = np.append(self.predatorEnergies, self.modelParams.PR_INIT_ENERGY)
+        self.stats.add_predators(self.modelParams.PR_INIT_ENERGY)
+        self._add_changed_cell(hexCoords)
+
+    def clear_cell(self, hexCoords):
+        '''
+        Removes all creatures from given cell
+        '''
+        i = self._find(hexCoords)
+        if self.bacteria[i]>0:
+            self.stats.numBacteria -= int(self.bacteria[i])
+            self.stats.bacteriaCells -= 1
+        self.bacteria[i] = 0
+        keep = self.predatorCells!=i
+        if not keep.all():
+            self.stats.remove_predators(self.predatorEnergies[~keep].tolist())
+            self.stats.predatorCells -= 1
+        self.predatorCells = self.predatorCells[keep]
+        self.predatorEnergies = self.predatorEnergies[keep]
+        self._add_changed_cell(hexCoords)
+
+    def clear_all(self):
+        '''
+        Removes all creatures from entire board
+        '''
+        self._mark_occupied_cells()
+        self.bacteria[:] = 0
+        self.predatorCells = np.zeros(0, dtype=np.int64)
+        self.predatorEnergies = np.zeros(0, dtype=np.int64)
+        self.stats.clear()
+
+
+class VectorRapidBacteriaModel(VectorCoreModel):
+    '''
+    Describes the same model as model.RapidBacteriaModel vectorized with NumPy
+    '''
+    __slots__ = ()
+
+    def get_bacteria_velocity(self):
+        return self.modelParams.BACT_VELOCITY
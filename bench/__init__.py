@@ -0,0 +1,8 @@
+'''
+Performance benchmarks of bacterio models and hexafield geometry
+
+    python -m bench run [--quick] [-k REGEX] [--models core,rapid] [--out results.json]
+    python -m bench compare OLD.json NEW.json [--threshold 0.15]
+
+See bench/cases.py for the benchmark matrix and bench/timing.py for result files format.
+'''
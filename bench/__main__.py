@@ -0,0 +1,80 @@
+'''
+Command line interface of benchmarks (see bench/__init__.py)
+'''
+
+import argparse
+import re
+import sys
+
+from bench.cases import get_cases, RADII, QUICK_RADII, MODELS
+from bench.timing import time_case, save_results, load_results, compare_results
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds>=scale:
+            return '%.3f %s' % (seconds/scale, unit)
+    return '%.1f ns' % (seconds/1e-9)
+
+
+def run(args):
+    radii = QUICK_RADII if args.quick else RADII
+    if args.radii is not None:
+        radii = [int(r) for r in args.radii.split(',')]
+    models = MODELS if args.models is None else args.models.split(',')
+    cases = get_cases(radii, models)
+    if args.k is not None:
+        pattern = re.compile(args.k)
+        cases = [case for case in cases if pattern.search(case.name)]
+    results = {}
+    for case in cases:
+        result = time_case(case, args.repeat)
+        results[case.name] = result
+        print('%-60s %12s/op' % (case.name, format_time(result['best'])))
+        sys.stdout.flush()
+    if args.out is not None:
+        save_results(results, args.out)
+        print('Results saved to %s' % args.out)
+    return 0
+
+
+def compare(args):
+    old = load_results(args.old)
+    new = load_results(args.new)
+    comparisons = compare_results(old, new, args.threshold)
+    numRegressions = 0
+    for c in comparisons:
+        if args.all or c.status:
+            print('%-60s %12s %12s %7.2fx %s' % (c.name, format_time(c.old), format_time(c.new), c.ratio, c.status.upper()))
+        numRegressions += c.status=='regression'
+    missing = sorted(set(old) ^ set(new))
+    if missing:
+        print('%d cases are present in only one file' % len(missing))
+    print('%d cases compared, %d regressions, %d improvements' % (len(comparisons), numRegressions,
+        sum(1 for c in comparisons if c.status=='improvement')))
+    return 1 if numRegressions>0 else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Benchmarks of bacterio models and geometry')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parserRun = subparsers.add_parser('run', help='run benchmarks')
+    parserRun.add_argument('--quick', action='store_true', help='only field radii %s' % (QUICK_RADII,))
+    parserRun.add_argument('--radii', help='comma separated field radii (default: %s)' % ','.join(map(str, RADII)))
+    parserRun.add_argument('--models', help='comma separated model names (default: %s)' % ','.join(MODELS))
+    parserRun.add_argument('-k', metavar='REGEX', help='run only cases with matching names')
+    parserRun.add_argument('--repeat', type=int, default=3, help='repeats of each case (default: %(default)s)')
+    parserRun.add_argument('--out', help='JSON file to save results to')
+    parserRun.set_defaults(func=run)
+    parserCompare = subparsers.add_parser('compare', help='compare two result files (exit code is 1 if there are regressions)')
+    parserCompare.add_argument('old')
+    parserCompare.add_argument('new')
+    parserCompare.add_argument('--threshold', type=float, default=0.15, help='relative slowdown treated as regression (default: %(default)s)')
+    parserCompare.add_argument('--all', action='store_true', help='print all cases, not only changed ones')
+    parserCompare.set_defaults(func=compare)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+'''
+Benchmark cases.
+
+Model cases time model.step() on a matrix of field radii, bacteria densities (bacteria per cell,
+there are 10 times fewer predators) and (overcrowd radius, predator sight) pairs.
+Geometry cases time every primitive of app.hexafield on fields of the same radii.
+Everything is seeded, so the same case does the same work on every run.
+'''
+
+from collections import namedtuple
+import random
+
+from app.hexafield import CircleHexafield, HexCoords, HexCoordConverter, OffsetTable, get_step_to, get_distance_between
+from app.hexdisc import HexDiscSums
+from app.creatures import Predator, Bacteria
+from app.state import BacterioState
+from app.model_params import default_model_params
+import app.engines as engines
+from app.config import EngineParams
+
+
+RADII = (15, 50, 100, 200)
+QUICK_RADII = (15, 50)
+DENSITIES = (0.05, 0.3)
+# (overcrowd radius, predator sight)
+RANGES = ((2, 4), (6, 8))
+MODELS = ('core', 'rapid')
+SEED = 12345
+# number of cells queried by each geometry case
+NUM_QUERIES = 2000
+
+# 'name' - unique name (group/...), 'group' - 'model' or 'geometry',
+# 'setup' - function without arguments which returns (func, ops): func() is timed and does 'ops' operations
+Case = namedtuple('Case', ['name', 'group', 'setup'])
+
+
+def make_state(radius, density, seed=SEED):
+    '''
+    Returns BacterioState on CircleHexafield(radius) with round(density*cells) bacteria and
+    10 times fewer predators placed on random distinct cells
+    '''
+    field = CircleHexafield(radius)
+    cells = sorted(field._field, key=lambda hc: (hc.x, hc.y))
+    rng = random.Random(seed)
+    numBacteria = max(1, int(round(density*len(cells))))
+    numPredators = max(1, numBacteria//10)
+    bacteriaPositions = { hc:[Bacteria()] for hc in rng.sample(cells, numBacteria) }
+    predatorPositions = { hc:[Predator(100)] for hc in rng.sample(cells, numPredators) }
+    return BacterioState(field, bacteriaPositions, predatorPositions)
+
+
+def get_model_steps(radius):
+    '''
+    Returns number of timed steps for field radius (fewer steps on big fields)
+    '''
+    return max(2, 20*15//radius)
+
+
+def make_model_case(modelName, radius, density, overcrowdRadius, sight):
+    name = 'model/%s/r%d/d%g/oc%d/s%d' % (modelName, radius, density, overcrowdRadius, sight)
+    def setup():
+        params = default_model_params()._replace(BACT_OVERCROWD_RADIUS=overcrowdRadius,
+            PR_OVERCROWD_RADIUS=overcrowdRadius, PR_SIGHT=sight, BACT_VELOCITY=2)
+        state = make_state(radius, density)
+        random.seed(SEED)
+        model = engines.create_model(EngineParams(modelName, 0), params, state)
+        steps = get_model_steps(radius)
+        def func():
+            for i in range(steps):
+                model.step()
+        return func, steps
+    return Case(name, 'model', setup)
+
+
+def get_query_cells(field, seed=SEED):
+    cells = sorted(field._field, key=lambda hc: (hc.x, hc.y))
+    rng = random.Random(seed)
+    return [rng.choice(cells) for i in range(NUM_QUERIES)]
+
+
+def make_query_case(radius, method, queryRadius, cached):
+    name = 'geometry/%s/r%d/q%d/%s' % (method, radius, queryRadius, 'cached' if cached else 'cold')
+    def setup():
+        field = CircleHexafield(radius)
+        cells = get_query_cells(field)
+        query = getattr(field, method)
+        if cached:
+            for hc in cells:
+                query(hc, queryRadius)
+        def func():
+            if not cached:
+                field._tables.clear()
+            for hc in cells:
+                query(hc, queryRadius)
+        return func, len(cells)
+    return Case(name, 'geometry', setup)
+
+
+def make_pairs_case(radius, funcName, func2):
+    name = 'geometry/%s/r%d' % (funcName, radius)
+    def setup():
+        field = CircleHexafield(radius)
+        pairs = list(zip(get_query_cells(field, SEED), get_query_cells(field, SEED+1)))
+        def func():
+            for a, b in pairs:
+                func2(a, b)
+        return func, len(pairs)
+    return Case(name, 'geometry', setup)
+
+
+def make_offset_table_case(radius, method, sight):
+    name = 'geometry/offset_table_%s/r%d/s%d' % (method, radius, sight)
+    def setup():
+        field = CircleHexafield(radius)
+        cells = get_query_cells(field)
+        rng = random.Random(SEED)
+        xsFrom = [hc.x for hc in cells]
+        ysFrom = [hc.y for hc in cells]
+        # targets are within sight as they are for hunting predators
+        xsTo = [x+rng.randint(-sight, sight) for x in xsFrom]
+        ysTo = [y+rng.randint(-sight, sight) for y in ysFrom]
+        table = OffsetTable(sight)
+        query = getattr(table, method)
+        def func():
+            query(xsFrom, ysFrom, xsTo, ysTo)
+        return func, len(cells)
+    return Case(name, 'geometry', setup)
+
+
+def make_converter_case(radius):
+    name = 'geometry/hex_coord_converter/r%d' % radius
+    def setup():
+        field = CircleHexafield(radius)
+        cells = get_query_cells(field)
+        converter = HexCoordConverter(512.0, 384.0, 7.0)
+        def func():
+            for hc in cells:
+                left, top = converter.hex_to_plain(hc)
+                converter.plain_to_hex(left, top)
+                converter.get_hex_vertices(hc)
+        return func, len(cells)
+    return Case(name, 'geometry', setup)
+
+
+def make_field_case(radius):
+    name = 'geometry/create_field/r%d' % radius
+    def setup():
+        def func():
+            CircleHexafield(radius).get_cell_index()
+        return func, 1
+    return Case(name, 'geometry', setup)
+
+
+def make_distances_case(radius, density, sight):
+    name = 'geometry/get_distances/r%d/d%g/s%d' % (radius, density, sight)
+    def setup():
+        state = make_state(radius, density)
+        index = state.field.get_cell_index()
+        sources = [index.find(hc.x, hc.y) for hc in state.bacteriaPositions]
+        # the first call builds neighbour table - it's not timed
+        index.get_distances(sources, sight)
+        def func():
+            index.get_distances(sources, sight)
+        return func, 1
+    return Case(name, 'geometry', setup)
+
+
+def make_disc_sums_case(radius, density, discRadius):
+    name = 'geometry/hex_disc_sums/r%d/d%g/oc%d' % (radius, density, discRadius)
+    def setup():
+        state = make_state(radius, density)
+        sums = HexDiscSums(state.field, discRadius)
+        counts = [(hc.x, hc.y, len(b)) for hc, b in state.bacteriaPositions.items()]
+        cells = get_query_cells(state.field)
+        def func():
+            sums.rebuild(counts)
+            for hc in cells:
+                sums.get_sum(hc.x, hc.y)
+        return func, 1
+    return Case(name, 'geometry', setup)
+
+
+def get_cases(radii=RADII, models=MODELS):
+    '''
+    Returns list of all Cases for given field radii and model names
+    '''
+    cases = []
+    for radius in radii:
+        for modelName in models:
+            for density in DENSITIES:
+                for overcrowdRadius, sight in RANGES:
+                    cases.append(make_model_case(modelName, radius, density, overcrowdRadius, sight))
+    for radius in radii:
+        cases.append(make_field_case(radius))
+        for cached in (False, True):
+            cases.append(make_query_case(radius, 'get_neighbours', 1, cached))
+            for overcrowdRadius, sight in RANGES:
+                cases.append(make_query_case(radius, 'get_all_within', overcrowdRadius, cached))
+                cases.append(make_query_case(radius, 'get_at_exact_range', sight, cached))
+        cases.append(make_pairs_case(radius, 'get_step_to', get_step_to))
+        cases.append(make_pairs_case(radius, 'get_distance_between', get_distance_between))
+        for overcrowdRadius, sight in RANGES:
+            cases.append(make_offset_table_case(radius, 'get_steps_to', sight))
+            cases.append(make_offset_table_case(radius, 'get_distances', sight))
+        cases.append(make_converter_case(radius))
+        for density in DENSITIES:
+            for overcrowdRadius, sight in RANGES:
+                cases.append(make_distances_case(radius, density, sight))
+                cases.append(make_disc_sums_case(radius, density, overcrowdRadius))
+    return cases
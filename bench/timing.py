@@ -0,0 +1,93 @@
+'''
+Runs benchmark cases and stores/compares results.
+
+Result file is JSON:
+    {
+        "version": 1,
+        "meta": { "python": ..., "platform": ..., "commit": ..., "time": ... },
+        "results": { case name: { "group": ..., "ops": operations per call,
+                                  "times": [seconds of each repeat], "best": best seconds per operation,
+                                  "median": median seconds per operation } }
+    }
+Compare uses "best" times (the least noisy ones).
+'''
+
+from collections import namedtuple
+from datetime import datetime
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+
+VERSION = 1
+
+# 'name' - case name, 'old' and 'new' - best seconds per operation, 'ratio' - new/old,
+# 'status' - 'regression', 'improvement' or '' (within threshold)
+Comparison = namedtuple('Comparison', ['name', 'old', 'new', 'ratio', 'status'])
+
+
+def time_case(case, repeat=3):
+    '''
+    Sets up case and times it 'repeat' times (every repeat has its own setup which is not timed).
+    Returns result dict (see module docstring)
+    '''
+    times = []
+    for i in range(repeat):
+        func, ops = case.setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter()-start)
+    return { 'group': case.group, 'ops': ops, 'times': times,
+             'best': min(times)/ops, 'median': statistics.median(times)/ops }
+
+
+def get_meta():
+    '''
+    Returns description of environment results are measured in
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return { 'python': platform.python_version(), 'implementation': platform.python_implementation(),
+             'platform': platform.platform(), 'commit': commit, 'time': datetime.now().isoformat(timespec='seconds') }
+
+
+def save_results(results, fileName):
+    with open(fileName, 'w') as f:
+        json.dump({ 'version': VERSION, 'meta': get_meta(), 'results': results }, f, indent=1, sort_keys=True)
+
+
+def load_results(fileName):
+    '''
+    Returns 'results' dict of result file
+    '''
+    with open(fileName) as f:
+        data = json.load(f)
+    if data.get('version')!=VERSION:
+        raise ValueError('Unsupported result file version: %s' % data.get('version'))
+    return data['results']
+
+
+def compare_results(old, new, threshold=0.15):
+    '''
+    Compares cases present in both old and new results dicts.
+    Case is a regression if it became more than 'threshold' (relative) slower and an improvement
+    if it became more than 'threshold' faster.
+    Returns list of Comparison sorted by name
+    '''
+    res = []
+    for name in sorted(set(old) & set(new)):
+        oldTime = old[name]['best']
+        newTime = new[name]['best']
+        ratio = newTime/oldTime if oldTime>0 else float('inf')
+        if ratio>1+threshold:
+            status = 'regression'
+        elif ratio<1/(1+threshold):
+            status = 'improvement'
+        else:
+            status = ''
+        res.append(Comparison(name, oldTime, newTime, ratio, status))
+    return res
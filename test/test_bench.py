@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+
+from bench.cases import get_cases, make_state
+from bench.timing import time_case, compare_results, save_results, load_results
+
+
+class TestBench(unittest.TestCase):
+
+    def test_case_names_are_unique(self):
+        names = [case.name for case in get_cases()]
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_state_is_reproducible(self):
+        first = make_state(10, 0.3)
+        second = make_state(10, 0.3)
+        self.assertEqual(set(first.bacteriaPositions), set(second.bacteriaPositions))
+        self.assertEqual(set(first.predatorPositions), set(second.predatorPositions))
+        self.assertEqual(len(first.bacteriaPositions), round(0.3*len(first.field._field)))
+
+    def test_time_and_save(self):
+        cases = [case for case in get_cases((5,)) if case.name in ('model/core/r5/d0.05/oc2/s4', 'geometry/get_step_to/r5')]
+        self.assertEqual(len(cases), 2)
+        results = { case.name:time_case(case, 2) for case in cases }
+        with tempfile.TemporaryDirectory() as dirName:
+            fileName = os.path.join(dirName, 'results.json')
+            save_results(results, fileName)
+            loaded = load_results(fileName)
+        self.assertEqual(set(loaded), set(results))
+        self.assertEqual(len(loaded['geometry/get_step_to/r5']['times']), 2)
+
+    def test_compare(self):
+        old = { 'a':{'best':1.0}, 'b':{'best':1.0}, 'c':{'best':1.0}, 'd':{'best':1.0} }
+        new = { 'a':{'best':1.1}, 'b':{'best':1.5}, 'c':{'best':0.5}, 'e':{'best':1.0} }
+        comparisons = compare_results(old, new, 0.15)
+        self.assertEqual([c.name for c in comparisons], ['a', 'b', 'c'])
+        self.assertEqual([c.status for c in comparisons], ['', 'regression', 'improvement'])
+        self.assertAlmostEqual(comparisons[1].ratio, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
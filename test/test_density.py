@@ -0,0 +1,149 @@
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from app.density import parse_density, read_pgm, get_cell_coords, get_density_map, sample_places, generate_packed_state, \
+    DensityComponent, main
+from app.hexafield import CircleHexafield, HexagonHexafield, HexafieldBase, HexCoords, create_hexafield
+from app.counting_model import CountingCoreModel
+from app.state import load_state
+from test.test_model import make_params
+
+
+class TestDensitySpec(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_density('uniform'), [DensityComponent('uniform', (), 1.0)])
+        self.assertEqual(parse_density(' 2*gaussian:1,-2,3.5 ; ring:0,0,10,2; image: map.pgm'), [
+            DensityComponent('gaussian', (1.0, -2.0, 3.5), 2.0),
+            DensityComponent('ring', (0.0, 0.0, 10.0, 2.0), 1.0),
+            DensityComponent('image', ('map.pgm',), 1.0)])
+
+    def test_errors(self):
+        for spec in ('', 'blob:1', 'gaussian:0,0', 'ring:a,0,1,1', 'x*uniform', '-1*uniform', 'image:', 'uniform:1'):
+            self.assertRaises(ValueError, parse_density, spec)
+
+    def test_maps(self):
+        xs = np.array([0, 1, 0, 3, 0])
+        ys = np.array([0, 0, 2, 0, -5])
+        densities = get_density_map(parse_density('gaussian:0,0,1'), xs, ys)
+        self.assertEqual(densities[0], 1.0)
+        self.assertAlmostEqual(densities[1], np.exp(-0.5))
+        self.assertAlmostEqual(densities[2], np.exp(-2))
+        densities = get_density_map(parse_density('ring:0,0,3,1; 0.5*uniform'), xs, ys)
+        self.assertEqual(densities.tolist(), [0.5, 0.5, 0.5, 1.5, 0.5])
+        self.assertRaises(ValueError, get_density_map, parse_density('gaussian:0,0,0'), xs, ys)
+
+
+class TestPgm(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpDir.cleanup)
+
+    def write(self, name, data):
+        fileName = os.path.join(self.tmpDir.name, name)
+        with open(fileName, 'wb') as f:
+            f.write(data)
+        return fileName
+
+    def test_read(self):
+        binary = self.write('a.pgm', b'P5\n# comment\n3 2\n255\n' + bytes([0, 51, 255, 255, 0, 102]))
+        self.assertEqual(read_pgm(binary).tolist(), [[0.0, 0.2, 1.0], [1.0, 0.0, 0.4]])
+        plain = self.write('b.pgm', b'P2 3 2 10\n0 2 10\n10 0 4\n')
+        self.assertEqual(read_pgm(plain).tolist(), [[0.0, 0.2, 1.0], [1.0, 0.0, 0.4]])
+        wide = self.write('c.pgm', b'P5 2 1 1000\n' + bytes([0, 0, 3, 232]))
+        self.assertEqual(read_pgm(wide).tolist(), [[0.0, 1.0]])
+        self.assertRaises(ValueError, read_pgm, self.write('d.pgm', b'P5 3 2 255\n' + bytes(5)))
+        self.assertRaises(ValueError, read_pgm, self.write('e.pgm', b'P6 1 1 255\n' + bytes(3)))
+
+    def test_image_map(self):
+        # left half of the image is black, right half is white
+        fileName = self.write('half.pgm', b'P2 4 4 1\n' + b'0 0 1 1\n'*4)
+        field = CircleHexafield(6)
+        index = field.get_cell_index()
+        densities = get_density_map(parse_density('image:'+fileName), index.xs, index.ys)
+        for i, hc in enumerate(index.cells):
+            if hc.x<=-2:
+                self.assertEqual(densities[i], 0)
+            if hc.x>=2:
+                self.assertEqual(densities[i], 1)
+
+
+class TestSampling(unittest.TestCase):
+
+    def test_sample_places(self):
+        rng = np.random.default_rng(1)
+        densities = np.array([0.0, 1.0, 5.0, 1.0, 0.0, 2.0])
+        counts = sample_places(rng, densities, 3, 7)
+        self.assertEqual(counts.sum(), 7)
+        self.assertTrue((counts<=3).all())
+        self.assertEqual((counts[0], counts[4]), (0, 0))
+        self.assertEqual(sample_places(rng, densities, 2, 100).tolist(), [0, 2, 2, 2, 0, 2])
+        self.assertEqual(sample_places(rng, densities, 1, 0).tolist(), [0]*6)
+
+    def test_weighted(self):
+        rng = np.random.default_rng(2)
+        densities = np.array([1.0, 3.0])
+        hits = sum(sample_places(rng, densities, 1, 1) for i in range(4000))
+        self.assertLess(abs(hits[1]/4000-0.75), 0.03)
+
+
+class TestGeneratePackedState(unittest.TestCase):
+
+    def test_generate(self):
+        field = HexagonHexafield(40)
+        state = generate_packed_state(field, 500, 200, make_params(), 'gaussian:10,-5,6; 0.01*uniform', 2, seed=5)
+        self.assertEqual(sum(state.bacteria), 500)
+        self.assertEqual(sum(state.predatorCounts), 200)
+        self.assertEqual(list(state.predatorEnergies), [make_params().PR_INIT_ENERGY]*200)
+        self.assertLessEqual(max(state.bacteria), 2)
+        # most bacteria are near the cluster center
+        cells = field.get_cell_index().cells
+        near = sum(n for hc, n in zip(cells, state.bacteria) if max(abs(hc.x-10), abs(hc.y+5), abs(hc.x+hc.y-5))<=15)
+        self.assertGreater(near, 350)
+        model = CountingCoreModel(make_params(), state)
+        self.assertEqual((model.count_bacteria(), model.count_predators()), (500, 200))
+        again = generate_packed_state(field, 500, 200, make_params(), 'gaussian:10,-5,6; 0.01*uniform', 2, seed=5)
+        self.assertEqual(list(again.bacteria), list(state.bacteria))
+        self.assertRaises(ValueError, generate_packed_state, field, 1, 1, make_params(), 'uniform', 0)
+
+    def test_cell_coords(self):
+        for field in (CircleHexafield(7), HexagonHexafield(9), create_hexafield('rectangle', width=7, height=5),
+                      create_hexafield('torus', width=8, height=6), HexafieldBase({HexCoords(0,0), HexCoords(0,2), HexCoords(1,0)})):
+            xs, ys = get_cell_coords(field)
+            index = field.get_cell_index()
+            self.assertEqual((list(xs), list(ys)), (list(index.xs), list(index.ys)))
+
+    def test_big_field(self):
+        # 3 million cells: coordinates are calculated from columns and CellIndex is not built
+        field = HexagonHexafield(1000)
+        start = time.perf_counter()
+        state = generate_packed_state(field, 1000000, 100000, make_params(), 'gaussian:0,0,300; uniform', seed=1)
+        elapsed = time.perf_counter()-start
+        self.assertEqual(len(state.bacteria), 3003001)
+        self.assertEqual((sum(state.bacteria), len(state.predatorEnergies)), (1000000, 100000))
+        self.assertNotIn('index', field._tables)
+        self.assertLess(elapsed, 5)
+
+    def test_overflow(self):
+        state = generate_packed_state(CircleHexafield(1), 100, 3, make_params(), 'uniform', 2)
+        self.assertEqual(list(state.bacteria), [2]*7)
+        self.assertEqual(sum(state.predatorCounts), 3)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as dirName:
+            fileName = os.path.join(dirName, 'state.bsf')
+            self.assertEqual(main([fileName, '--shape', 'hexagon', '--radius', '30', '--bacteria', '500', '--predators', '20',
+                '--density', 'ring:0,0,20,4', '--seed', '3']), 0)
+            state = load_state(fileName, useMmap=False)
+            self.assertEqual(len(state.bacteria), 2791)
+            self.assertEqual((sum(state.bacteria), sum(state.predatorCounts)), (500, 20))
+            self.assertEqual(state.get_bacteria_counts().get(HexCoords(0,0)), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import multiprocessing
+import unittest
+from unittest import mock
+
+import app.extinction as extinction
+from app.extinction import wilson_interval, get_z, run_replica, estimate, is_event, parse_early_stop, \
+    ReplicaTask, EarlyStop
+from app.config import Rules, FieldParams, default_engine_params
+from app.model_params import default_model_params
+
+
+def make_rules(**kwargs):
+    return Rules(FieldParams(None, 4, 10, 2, 'circle', 0, 0, None, 1, None), default_model_params()._replace(**kwargs), default_engine_params())
+
+
+class TestWilsonInterval(unittest.TestCase):
+
+    def test_known_values(self):
+        z = get_z(0.95)
+        self.assertAlmostEqual(z, 1.959964, places=5)
+        low, high = wilson_interval(0, 10, z)
+        self.assertEqual(low, 0.0)
+        self.assertAlmostEqual(high, 0.2775, places=4)
+        low, high = wilson_interval(5, 10, z)
+        self.assertAlmostEqual(low, 0.2366, places=4)
+        self.assertAlmostEqual(high, 0.7634, places=4)
+
+    def test_no_runs(self):
+        self.assertEqual(wilson_interval(0, 0, 1.96), (0.0, 1.0))
+
+
+class TestReplicas(unittest.TestCase):
+
+    def test_starving_predators_die_out(self):
+        # predators can't live longer than one turn
+        result = run_replica(ReplicaTask(0, 1, make_rules(PR_INIT_ENERGY=5, PR_TURN_COST=10), 100, None))
+        self.assertEqual(result.steps, 1)
+        self.assertTrue(is_event(result.haltReason, 'predators'))
+        self.assertTrue(is_event(result.haltReason, 'any'))
+        self.assertFalse(is_event(result.haltReason, 'bacteria'))
+        self.assertFalse(result.stoppedEarly)
+
+    def test_early_stop(self):
+        rules = make_rules(PR_INIT_ENERGY=1000, PR_TURN_COST=0, PR_FEED_VALUE=0)
+        result = run_replica(ReplicaTask(0, 1, rules, 100, EarlyStop(0, 1, 5)))
+        self.assertEqual(result, (5, '', True))
+        result = run_replica(ReplicaTask(0, 1, rules, 5, EarlyStop(0, 1, 5)))
+        self.assertFalse(result.stoppedEarly)
+
+    def test_stop_event(self):
+        rules = make_rules(PR_INIT_ENERGY=1000, PR_TURN_COST=0, PR_FEED_VALUE=0)
+        stopEvent = multiprocessing.Event()
+        with mock.patch.object(extinction, '_stopEvent', stopEvent):
+            self.assertEqual(run_replica(ReplicaTask(0, 1, rules, 5, None)).steps, 5)
+            stopEvent.set()
+            self.assertEqual(run_replica(ReplicaTask(0, 1, rules, 10**9, None)), None)
+
+    def test_parse_early_stop(self):
+        self.assertEqual(parse_early_stop('100,10,50'), EarlyStop(100, 10, 50))
+        self.assertRaises(ValueError, parse_early_stop, '100,10')
+
+    def test_estimate_stops_at_target_width(self):
+        est = estimate(make_rules(PR_INIT_ENERGY=5, PR_TURN_COST=10), 10, 0.1, minRuns=5, maxRuns=1000, workers=2)
+        self.assertEqual(est.probability, 1.0)
+        self.assertEqual(est.predatorExtinctions, est.runs)
+        self.assertLessEqual(est.high-est.low, 0.1)
+        self.assertGreater(wilson_interval(est.runs-1, est.runs-1, get_z(0.95))[1]-wilson_interval(est.runs-1, est.runs-1, get_z(0.95))[0], 0.1)
+
+    def test_estimate_max_runs(self):
+        est = estimate(make_rules(PR_INIT_ENERGY=5, PR_TURN_COST=10), 10, 0.0, minRuns=1, maxRuns=7, workers=2)
+        self.assertEqual(est.runs, 7)
+
+    def test_unknown_event(self):
+        self.assertRaises(ValueError, estimate, make_rules(), 10, 0.1, event='everything')
+
+
+if __name__ == '__main__':
+    unittest.main()
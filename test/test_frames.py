@@ -0,0 +1,107 @@
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+
+from app.frames import parse_color, make_pixel_map, FrameRenderer, FrameWriter, encode_png, encode_ppm, parse_size
+from app.hexafield import CircleHexafield, HexCoords, fit_hex_converter
+from app.model import CoreModel
+from app.palette import default_palette
+from app.state import pack_state
+from test.test_model import make_params, make_state
+
+
+class TestColors(unittest.TestCase):
+
+    def test_parse_color(self):
+        self.assertEqual(parse_color('#ff8000'), (255, 128, 0))
+        self.assertEqual(parse_color('#f80'), (255, 136, 0))
+        self.assertEqual(parse_color('dim gray'), (105, 105, 105))
+        self.assertEqual(parse_color('DimGray'), (105, 105, 105))
+        self.assertRaises(ValueError, parse_color, 'no such colour')
+
+
+class TestPixelMap(unittest.TestCase):
+
+    def test_closest_center(self):
+        field = CircleHexafield(4)
+        width, height = 200, 150
+        pixelMap = make_pixel_map(field, width, height)
+        index = field.get_cell_index()
+        conv = fit_hex_converter(field, width, height)
+        centers = np.array([conv.hex_to_plain(hc) for hc in index.cells])
+        for y in range(0, height, 7):
+            for x in range(0, width, 5):
+                distances = (centers[:,0]-x-0.5)**2+(centers[:,1]-y-0.5)**2
+                if pixelMap[y,x]<len(index):
+                    self.assertEqual(pixelMap[y,x], distances.argmin())
+        for hc in index.cells:
+            left, top = conv.hex_to_plain(hc)
+            self.assertEqual(pixelMap[int(top), int(left)], index.indices[hc])
+        self.assertEqual(pixelMap[0,0], len(index))
+        self.assertTrue((pixelMap==len(index)+1).any())
+
+
+class TestRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.model = CoreModel(make_params(), make_state(4, {HexCoords(1,0):2, HexCoords(0,0):1},
+            {HexCoords(0,0):[100], HexCoords(-2,1):[100]}))
+        self.renderer = FrameRenderer(self.model.field, 120, 100)
+        self.conv = fit_hex_converter(self.model.field, 120, 100)
+
+    def color_at(self, image, hc):
+        left, top = self.conv.hex_to_plain(hc)
+        return tuple(image[int(top), int(left)])
+
+    def test_render(self):
+        self.renderer.update_from_model(self.model)
+        image = self.renderer.render()
+        self.assertEqual(image.shape, (100, 120, 3))
+        pal = default_palette()
+        self.assertEqual(self.color_at(image, HexCoords(1,0)), parse_color(pal.bacteria))
+        self.assertEqual(self.color_at(image, HexCoords(0,0)), parse_color(pal.both))
+        self.assertEqual(self.color_at(image, HexCoords(-2,1)), parse_color(pal.predator))
+        self.assertEqual(self.color_at(image, HexCoords(0,1)), parse_color(pal.background))
+        self.model.step()
+        self.renderer.update_from_model(self.model)
+        image = self.renderer.render()
+        other = FrameRenderer(self.model.field, 120, 100)
+        other.update_from_state(pack_state(self.model.get_state()))
+        self.assertTrue((image==other.render()).all())
+
+    def test_encode(self):
+        self.renderer.update_from_model(self.model)
+        image = self.renderer.render()
+        ppm = encode_ppm(image)
+        self.assertTrue(ppm.startswith(b'P6\n120 100\n255\n'))
+        self.assertEqual(ppm[len(b'P6\n120 100\n255\n'):], image.tobytes())
+        png = encode_png(image)
+        self.assertEqual(png[:8], b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(struct.unpack('>II', png[16:24]), (120, 100))
+        length, = struct.unpack('>I', png[33:37])
+        self.assertEqual(png[37:41], b'IDAT')
+        rows = np.frombuffer(zlib.decompress(png[41:41+length]), dtype=np.uint8).reshape(100, 1+3*120)
+        self.assertTrue((rows[:,0]==0).all())
+        self.assertTrue((rows[:,1:].reshape(100, 120, 3)==image).all())
+
+    def test_writer(self):
+        with tempfile.TemporaryDirectory() as dirName:
+            writer = FrameWriter(os.path.join(dirName, 'frames'), 60, 50, 'ppm', every=2)
+            for step in range(5):
+                writer.write(step, self.model)
+                self.model.step()
+            self.assertEqual(sorted(os.listdir(writer.directory)), ['frame_000000.ppm', 'frame_000002.ppm', 'frame_000004.ppm'])
+            self.assertEqual(writer.numFrames, 3)
+        self.assertRaises(ValueError, FrameWriter, dirName, fileFormat='gif')
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size('640x480'), (640, 480))
+        self.assertRaises(ValueError, parse_size, '640')
+
+
+if __name__ == '__main__':
+    unittest.main()
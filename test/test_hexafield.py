@@ -1,6 +1,10 @@
 import unittest
+import pickle
+
+import app.hexafield as hexafield
 
 from app.hexafield import HexCoords, HexCoordConverter, CircleHexafield, get_step_to, get_distance_between, SQRT3D2
+from app.hexafield import HexagonHexafield, RectangleHexafield, TorusHexafield, HexafieldBase, create_hexafield, OffsetTable
 
 class TestRound(unittest.TestCase):
 
@@ -60,6 +64,35 @@ class TestHexCoords(unittest.TestCase):
         self.assertTrue(hc==HexCoords(0,0) or hc==HexCoords(1,-1))
 
 
+class TestOffsetTable(unittest.TestCase):
+
+    def test_agrees_with_scalar_functions(self):
+        table = OffsetTable(3)
+        cells = list(CircleHexafield(4)._field)
+        pairs = [ (a, b) for a in cells for b in cells ]
+        xsFrom = [a.x for a, b in pairs]
+        ysFrom = [a.y for a, b in pairs]
+        xsTo = [b.x for a, b in pairs]
+        ysTo = [b.y for a, b in pairs]
+        distances = table.get_distances(xsFrom, ysFrom, xsTo, ysTo)
+        stepXs, stepYs = table.get_steps_to(xsFrom, ysFrom, xsTo, ysTo)
+        self.assertEqual(len(distances), len(pairs))
+        for i, (a, b) in enumerate(pairs):
+            self.assertEqual(distances[i], get_distance_between(a, b))
+            self.assertEqual(HexCoords(stepXs[i], stepYs[i]), get_step_to(a, b))
+
+    def test_tables(self):
+        table = OffsetTable(2)
+        self.assertEqual(len(table.distances), 25)
+        i = table.get_offset_index(2, -1)
+        self.assertEqual(table.distances[i], 2)
+        self.assertEqual((table.stepXs[i], table.stepYs[i]), (1, -1))
+        i = table.get_offset_index(0, 0)
+        self.assertEqual((table.distances[i], table.stepXs[i], table.stepYs[i]), (0, 0, 0))
+        self.assertEqual(table.get_offset_index(3, 0), -1)
+        self.assertEqual(table.get_distances([], [], [], []).tolist(), [])
+
+
 class TestHexCoordConverter(unittest.TestCase):
 
     def test_hex_to_plain(self):
@@ -131,3 +164,182 @@ class TestCircleHexafield(unittest.TestCase):
     def test_max_coord_value(self):
         hf = CircleHexafield(7)
         self.assertEqual(hf.get_max_coord_value(), 7)
+
+
+class TestNeighbourhoodTables(unittest.TestCase):
+
+    def test_tables_are_reused(self):
+        hf = CircleHexafield(3)
+        self.assertIs(hf.get_neighbours(HexCoords(1,0)), hf.get_neighbours(HexCoords(1,0)))
+        self.assertIs(hf.get_all_within(HexCoords(1,0),2), hf.get_all_within(HexCoords(1,0),2))
+        self.assertIs(hf.get_at_exact_range(HexCoords(1,0),2), hf.get_at_exact_range(HexCoords(1,0),2))
+
+    def test_tables_match_uncached_queries(self):
+        hf = CircleHexafield(4)
+        limit = hexafield.MAX_TABLE_ENTRIES
+        hexafield.MAX_TABLE_ENTRIES = 0
+        try:
+            huge = CircleHexafield(4)
+            for hc in hf._field:
+                for radius in range(4):
+                    self.assertEqual(hf.get_neighbours(hc,radius), huge.get_neighbours(hc,radius))
+                    self.assertEqual(hf.get_all_within(hc,radius), huge.get_all_within(hc,radius))
+                    self.assertEqual(hf.get_at_exact_range(hc,radius), huge.get_at_exact_range(hc,radius))
+            self.assertIsNot(huge.get_neighbours(HexCoords(0,0)), huge.get_neighbours(HexCoords(0,0)))
+        finally:
+            hexafield.MAX_TABLE_ENTRIES = limit
+
+    def test_cells_outside_field(self):
+        hf = CircleHexafield(2)
+        self.assertEqual(hf.get_neighbours(HexCoords(3,0)), (HexCoords(2,0),))
+        self.assertFalse(HexCoords(3,0) in hf._tables[(hexafield.NEIGHBOURS,1)])
+
+    def test_pickling_skips_tables(self):
+        hf = CircleHexafield(2)
+        hf.get_neighbours(HexCoords(0,0))
+        hf1 = pickle.loads(pickle.dumps(hf))
+        self.assertEqual(hf1._field, hf._field)
+        self.assertEqual(hf1._tables, dict())
+        self.assertEqual(len(hf1.get_neighbours(HexCoords(0,0))), 6)
+
+
+class TestImplicitFields(unittest.TestCase):
+
+    def test_hexagon(self):
+        hf = HexagonHexafield(4)
+        circle = CircleHexafield(4)
+        self.assertEqual(set(hf._field), circle._field)
+        self.assertEqual(len(hf._field), len(circle._field))
+        self.assertNotIn(HexCoords(3,2), hf._field)
+        for hc in circle._field:
+            for radius in range(4):
+                self.assertEqual(hf.get_neighbours(hc,radius), circle.get_neighbours(hc,radius))
+                self.assertEqual(hf.get_at_exact_range(hc,radius), circle.get_at_exact_range(hc,radius))
+        self.assertEqual(hf.get_max_coord_value(), 4)
+
+    def test_rectangle(self):
+        hf = RectangleHexafield(5, 3)
+        cells = list(hf._field)
+        self.assertEqual(len(cells), 15)
+        self.assertEqual(len(set(cells)), 15)
+        self.assertEqual(sorted(set(hc.x for hc in cells)), [-2, -1, 0, 1, 2])
+        for hc in cells:
+            self.assertIn(hc, hf._field)
+            self.assertIn(hc.y+hc.x//2, (-1, 0, 1))
+        self.assertNotIn(HexCoords(3,0), hf._field)
+        self.assertEqual(len(hf.get_neighbours(HexCoords(0,0))), 6)
+        self.assertEqual(len(hf.get_neighbours(HexCoords(2,-2))), 2)
+        self.assertRaises(ValueError, RectangleHexafield, 0, 3)
+
+    def test_torus(self):
+        hf = TorusHexafield(8, 6)
+        index = hf.get_cell_index()
+        self.assertEqual(len(index), 48)
+        self.assertNotIn(-1, index.adjacency)
+        for hc in hf._field:
+            self.assertEqual(len(hf.get_neighbours(hc)), 6)
+            self.assertEqual(len(hf.get_all_within(hc, 2)), 19)
+            self.assertEqual(len(hf.get_at_exact_range(hc, 2)), 12)
+            rings = [ hf.get_at_exact_range(hc, r) for r in range(1, 6) ]
+            self.assertEqual(len(set().union(*rings)), 47)
+            self.assertEqual(sum(map(len, rings)), 47)
+        # the right column is adjacent to the left one, the top row to the bottom one
+        self.assertIn(HexCoords(-4,3), hf.get_neighbours(HexCoords(3,-1)))
+        self.assertIn(HexCoords(0,-3), hf.get_neighbours(HexCoords(0,2)))
+        for (dx, dy) in hf.get_periods():
+            self.assertEqual(hf._get_cell(1+dx, 1+dy), HexCoords(1,1))
+        # small torus: every cell is returned once
+        small = TorusHexafield(4, 3)
+        self.assertEqual(len(small.get_all_within(HexCoords(0,0), 5)), 12)
+        self.assertEqual(len(small.get_neighbours(HexCoords(0,0), 5)), 11)
+        self.assertRaises(ValueError, TorusHexafield, 7, 6)
+
+    def test_torus_paths(self):
+        hf = TorusHexafield(8, 6)
+        index = hf.get_cell_index()
+        for target in (HexCoords(3,-1), HexCoords(-4,1)):
+            distances = index.get_distances([index.indices[target]], 10)
+            for hc in hf._field:
+                distance = distances[index.indices[hc]]
+                self.assertEqual(get_distance_between(hc, hf.get_closest_image(hc, target)), distance)
+                if hc!=target:
+                    step = hf.get_step_to(hc, target)
+                    self.assertIn(step, hf.get_neighbours(hc))
+                    self.assertEqual(distances[index.indices[step]], distance-1)
+
+    def test_rectangle_paths(self):
+        # zigzag rows: the step of module-level get_step_to from (1,2) to (-1,3) is (0,3) which is above the field
+        hf = RectangleHexafield(6, 5)
+        self.assertNotIn(get_step_to(HexCoords(1,2), HexCoords(-1,3)), hf._field)
+        self.assertEqual(hf.get_step_to(HexCoords(1,2), HexCoords(-1,3)), HexCoords(0,2))
+        for hcFrom in hf._field:
+            for hcTo in hf._field:
+                if hcFrom!=hcTo:
+                    step = hf.get_step_to(hcFrom, hcTo)
+                    self.assertIn(step, hf.get_neighbours(hcFrom))
+                    self.assertEqual(get_distance_between(step, hcTo), get_distance_between(hcFrom, hcTo)-1)
+
+    def test_pickling(self):
+        hf = TorusHexafield(6, 4)
+        hf.get_neighbours(HexCoords(0,0))
+        hf1 = pickle.loads(pickle.dumps(hf))
+        self.assertEqual(hf1.get_params(), (6, 4))
+        self.assertEqual(hf1._tables, dict())
+        self.assertEqual(hf1.get_neighbours(HexCoords(0,0)), hf.get_neighbours(HexCoords(0,0)))
+
+    def test_create(self):
+        self.assertIsInstance(create_hexafield('circle', radius=3), CircleHexafield)
+        self.assertEqual(create_hexafield('hexagon', radius=3).get_params(), (3,))
+        self.assertEqual(create_hexafield('torus', width=6, height=5).get_params(), (6, 5))
+        self.assertRaises(ValueError, create_hexafield, 'sphere', 3)
+
+
+class TestCellIndex(unittest.TestCase):
+
+    def test_index(self):
+        hf = CircleHexafield(3)
+        index = hf.get_cell_index()
+        self.assertIs(index, hf.get_cell_index())
+        self.assertEqual(len(index), len(hf._field))
+        self.assertEqual(set(index.cells), hf._field)
+        for i, hc in enumerate(index.cells):
+            self.assertEqual(index.indices[hc], i)
+            self.assertEqual((index.xs[i], index.ys[i]), (hc.x, hc.y))
+
+    def test_find(self):
+        for hf in (CircleHexafield(3), HexagonHexafield(3), RectangleHexafield(5, 4), TorusHexafield(6, 3),
+                HexafieldBase({HexCoords(0,0), HexCoords(0,2), HexCoords(1,0)})):
+            index = hf.get_cell_index()
+            cells = sorted(hf._field, key=lambda hc: (hc.x, hc.y))
+            self.assertEqual(list(zip(index.xs, index.ys)), [(hc.x, hc.y) for hc in cells])
+            for i, hc in enumerate(cells):
+                self.assertEqual(index.find(hc.x, hc.y), i)
+                self.assertEqual(index.get_cell(i), hc)
+            self.assertEqual(index.find(10, 0), -1)
+            self.assertEqual(index.find(0, 10), -1)
+        # HexCoords are not created unless they are asked for
+        index = HexagonHexafield(3).get_cell_index()
+        index.get_at_exact_range(index.find(0, 0), 2)
+        self.assertIsNone(index._cells)
+        self.assertIsNone(index._indices)
+
+    def test_adjacency(self):
+        hf = CircleHexafield(3)
+        index = hf.get_cell_index()
+        numDirections = len(hexafield.DIRECTIONS)
+        for i, hc in enumerate(index.cells):
+            adjacent = [j for j in index.adjacency[i*numDirections:(i+1)*numDirections] if j>=0]
+            self.assertEqual(sorted(adjacent), sorted(index.get_neighbours(i)))
+            self.assertEqual([index.cells[j] for j in index.get_neighbours(i)], list(hf.get_neighbours(hc)))
+            self.assertEqual([index.cells[j] for j in index.get_all_within(i,2)], list(hf.get_all_within(hc,2)))
+            self.assertEqual([index.cells[j] for j in index.get_at_exact_range(i,2)], list(hf.get_at_exact_range(hc,2)))
+
+    def test_get_distances(self):
+        hf = CircleHexafield(5)
+        index = hf.get_cell_index()
+        sources = [index.indices[HexCoords(0,0)], index.indices[HexCoords(4,-1)]]
+        distances = index.get_distances(sources, 3)
+        for i, hc in enumerate(index.cells):
+            expected = min(get_distance_between(hc, index.cells[j]) for j in sources)
+            self.assertEqual(distances[i], min(expected, 4))
+        self.assertEqual(list(index.get_distances([], 2)), [3]*len(index))
@@ -0,0 +1,62 @@
+import unittest
+import random
+
+from app.hexdisc import HexDiscSums, ChunkedDiscSums
+from app.hexafield import CircleHexafield, HexagonHexafield, HexCoords, RectangleHexafield, TorusHexafield
+
+
+class TestHexDiscSums(unittest.TestCase):
+
+    def make_sums(self, field, radius):
+        return HexDiscSums(field, radius)
+
+    def check_field(self, field, radius, occupied):
+        counts = { hc:random.randint(1,5) for hc in random.sample(sorted(field._field, key=lambda hc: hc._coords), occupied) }
+        sums = self.make_sums(field, radius)
+        self.assertFalse(sums.valid)
+        sums.rebuild((hc.x, hc.y, n) for hc, n in counts.items())
+        self.assertTrue(sums.valid)
+        for hc in field._field:
+            expected = sum(counts.get(c, 0) for c in field.get_all_within(hc, radius))
+            self.assertEqual(sums.get_sum(hc.x, hc.y), expected)
+
+    def test_circle_field(self):
+        for radius in range(5):
+            self.check_field(CircleHexafield(6), radius, 40)
+
+    def test_big_radius(self):
+        self.check_field(CircleHexafield(3), 9, 20)
+
+    def test_full_field(self):
+        self.check_field(CircleHexafield(4), 2, 61)
+
+    def test_irregular_field(self):
+        field = CircleHexafield(5)
+        field._field = { hc for hc in field._field if hc.x>=-1 and hc.y<=3 }
+        self.check_field(field, 3, 30)
+
+    def test_rectangle_field(self):
+        self.check_field(RectangleHexafield(9, 6), 2, 25)
+
+    def test_torus_field(self):
+        for radius in range(4):
+            self.check_field(TorusHexafield(8, 7), radius, 25)
+
+
+class TestChunkedDiscSums(TestHexDiscSums):
+    '''
+    The same checks with small chunks, so discs cross chunk bounds
+    '''
+
+    def make_sums(self, field, radius):
+        return ChunkedDiscSums(field, radius, 3)
+
+    def test_sparse_field(self):
+        field = HexagonHexafield(100000)
+        sums = ChunkedDiscSums(field, 2)
+        sums.rebuild([(-50000, 20, 1), (-50001, 21, 2), (70000, -3, 4), (70002, -3, 0)])
+        self.assertEqual(sums.count_chunks(), 2)
+        self.assertEqual(sums.get_sum(-50000, 21), 3)
+        self.assertEqual(sums.get_sum(70001, -4), 4)
+        self.assertEqual(sums.get_sum(70003, -3), 0)
+        self.assertEqual(sums.get_sum(0, 0), 0)
@@ -0,0 +1,166 @@
+import gc
+import os
+import random
+import sys
+import tempfile
+import unittest
+from decimal import Decimal
+
+from app.journal import JournalWriter, JournalReader, FOOTER
+from app.model import CoreModel
+from app.counting_model import CountingCoreModel
+from app.dense_model import DenseCoreModel
+from app.vector_model import VectorCoreModel
+from app.runner import run
+from app.hexafield import HexCoords, CircleHexafield
+from app.state import pack_state
+from test.test_model import make_params, make_state
+
+
+def get_content(state):
+    packed = pack_state(state)
+    return list(packed.bacteria), list(packed.predatorCounts), list(packed.predatorEnergies)
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpDir.name, 'run.bjf')
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def make_model(self):
+        random.seed(7)
+        bacteria = { HexCoords(x, 0):3 for x in range(-4, 5) }
+        predators = { HexCoords(0, 3):[40, 60], HexCoords(0, -3):[50] }
+        return CoreModel(make_params(), make_state(6, bacteria, predators))
+
+    def record(self, numSteps, keyframeEvery, compression='zlib', close=True):
+        model = self.make_model()
+        contents = [get_content(model.get_state())]
+        writer = JournalWriter(self.fileName, keyframeEvery, compression)
+        writer.record(0, model.get_state())
+        for step in range(1, numSteps+1):
+            model.step()
+            contents.append(get_content(model.get_state()))
+            writer.record(step, model.get_state())
+        if close:
+            writer.close()
+        else:
+            writer.flush()
+        return writer, contents
+
+    def test_seek(self):
+        for compression in (None, 'zlib', 'lzma'):
+            writer, contents = self.record(30, 7, compression)
+            self.assertEqual(writer.numKeyframes, 5)
+            with JournalReader(self.fileName) as reader:
+                self.assertTrue(reader.indexed)
+                self.assertEqual(reader.compression, compression)
+                self.assertEqual(reader.get_steps(), (0, 30))
+                self.assertEqual([step for step, offset in reader.keyframes], [0, 7, 14, 21, 28])
+                for step in (30, 0, 6, 7, 8, 20, 29, 13):
+                    self.assertEqual(get_content(reader.get_state(step)), contents[step])
+                self.assertRaises(ValueError, reader.get_state, 31)
+
+    def test_iter_states(self):
+        writer, contents = self.record(20, 6)
+        with JournalReader(self.fileName) as reader:
+            self.assertEqual([(step, get_content(state)) for step, state in reader.iter_states()], list(enumerate(contents)))
+            self.assertEqual([step for step, state in reader.iter_states(9, 13)], [9, 10, 11, 12, 13])
+
+    def test_not_closed(self):
+        writer, contents = self.record(15, 4, close=False)
+        with open(self.fileName, 'rb') as f:
+            data = f.read()
+        crashedFileName = os.path.join(self.tmpDir.name, 'crashed.bjf')
+        with open(crashedFileName, 'wb') as f:
+            f.write(data[:-5])
+        with JournalReader(crashedFileName) as reader:
+            self.assertFalse(reader.indexed)
+            self.assertEqual(reader.get_steps(), (0, 14))
+            self.assertEqual(get_content(reader.get_state(13)), contents[13])
+        writer.close()
+        with JournalReader(self.fileName) as reader:
+            self.assertTrue(reader.indexed)
+
+    def test_deltas_are_small(self):
+        writer, contents = self.record(10, 100)
+        with JournalReader(self.fileName) as reader:
+            size, keyframesSize = reader.get_size()
+            self.assertEqual(reader.count_frames(), 11)
+        self.assertLess(size-keyframesSize-FOOTER.size, 10*keyframesSize)
+
+    def test_deltas_of_slow_run(self):
+        # bacteria mostly stay and rarely divide, so few cells change per step
+        random.seed(3)
+        params = make_params(P_BACT_STAY=Decimal('0.98'), P_BACT_DIVIDE=Decimal('0.01'), P_PR_STAY=Decimal('0.95'))
+        field = CircleHexafield(20)
+        cells = [ field.get_cell_index().get_cell(i) for i in range(0, len(field.get_cell_index()), 2) ]
+        bacteria = { hc:random.randint(1, 3) for hc in cells if random.random()<0.7 }
+        predators = { hc:[random.randint(100, 140)] for hc in cells if random.random()<0.1 }
+        model = CountingCoreModel(params, make_state(field, bacteria, predators))
+        with JournalWriter(self.fileName, 25) as writer:
+            run(model, 99, journal=writer)
+        with JournalReader(self.fileName) as reader:
+            size, keyframesSize = reader.get_size()
+            self.assertEqual((reader.count_frames(), len(reader.keyframes)), (100, 4))
+            self.assertEqual(get_content(reader.get_state(99)), get_content(model.get_state()))
+        meanKeyframe = keyframesSize/4
+        meanDelta = (size-keyframesSize-FOOTER.size)/96
+        self.assertLess(meanDelta, meanKeyframe/2)
+
+    def test_record_changes(self):
+        for modelClass in (CoreModel, CountingCoreModel, DenseCoreModel, VectorCoreModel):
+            random.seed(5)
+            cells = CircleHexafield(7).get_cell_index().cells
+            bacteria = { hc:random.randint(1, 5) for hc in cells[::2] }
+            predators = { hc:[random.randint(20, 160) for i in range(random.randint(1, 3))] for hc in cells[::9] }
+            model = modelClass(make_params(P_BACT_STAY=Decimal('0.5'), P_PR_STAY=Decimal('0.5'), P_PR_DIVIDE=Decimal('0.5')),
+                make_state(7, bacteria, predators))
+            contents = []
+            with JournalWriter(self.fileName, 4) as writer:
+                for step in range(15):
+                    if step==9:
+                        model.add_predator(HexCoords(1, 1))
+                    contents.append(get_content(model.get_state()))
+                    writer.record_changes(step, model)
+                    model.step()
+            with JournalReader(self.fileName) as reader:
+                self.assertEqual([get_content(state) for step, state in reader.iter_states()], contents, modelClass.__name__)
+
+    def test_missing_file(self):
+        unraisable = []
+        hook = sys.unraisablehook
+        sys.unraisablehook = unraisable.append
+        try:
+            self.assertRaises(FileNotFoundError, JournalReader, os.path.join(self.tmpDir.name, 'missing.bjf'))
+            gc.collect()
+        finally:
+            sys.unraisablehook = hook
+        self.assertEqual(unraisable, [])
+
+    def test_steps_must_increase(self):
+        with JournalWriter(self.fileName) as writer:
+            model = self.make_model()
+            writer.record(5, model.get_state())
+            self.assertRaises(ValueError, writer.record, 5, model.get_state())
+
+    def test_run(self):
+        model = self.make_model()
+        with JournalWriter(self.fileName, 3) as writer:
+            result = run(model, 10, journal=writer)
+        with JournalReader(self.fileName) as reader:
+            self.assertEqual(reader.get_steps(), (0, result.steps))
+            self.assertEqual(get_content(reader.get_state(result.steps)), get_content(model.get_state()))
+
+    def test_not_journal(self):
+        with open(self.fileName, 'wb') as f:
+            f.write(b'not a journal file at all')
+        self.assertRaises(ValueError, JournalReader, self.fileName)
+
+
+if __name__ == '__main__':
+    unittest.main()
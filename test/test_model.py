@@ -0,0 +1,387 @@
+import random
+import unittest
+from unittest import mock
+from collections import Counter
+from decimal import Decimal
+
+from app.model import CoreModel, RapidBacteriaModel
+from app.counting_model import CountingCoreModel, CountingRapidBacteriaModel
+from app.dense_model import DenseCoreModel, DenseRapidBacteriaModel
+from app.vector_model import VectorCoreModel, VectorRapidBacteriaModel
+from app.chunked_model import ChunkedCoreModel, ChunkedRapidBacteriaModel
+from app.model_params import default_model_params
+from app.model_stats import ModelStats
+from app.state import BacterioState, pack_state
+from app.hexafield import CircleHexafield, HexafieldBase, HexagonHexafield, HexCoords, RectangleHexafield, TorusHexafield
+from app.creatures import Predator, Bacteria
+
+
+def make_params(**kwargs):
+    '''
+    Returns deterministic model params (all probabilities are 0 or 1) updated with kwargs
+    '''
+    params = dict(P_BACT_DIVIDE=Decimal('0'), P_BACT_STAY=Decimal('1'), BACT_OVERCROWD=0,
+        P_PR_DIVIDE=Decimal('0'), P_PR_STAY=Decimal('1'), PR_OVERCROWD=0)
+    params.update(kwargs)
+    return default_model_params()._replace(**params)
+
+
+def make_state(radius, bacteria, predators):
+    '''
+    radius is radius of CircleHexafield or the field itself,
+    bacteria is dict (HexCoords -> number of bacteria), predators is dict (HexCoords -> list of energies)
+    '''
+    return BacterioState(radius if isinstance(radius, HexafieldBase) else CircleHexafield(radius),
+        { hc:[Bacteria() for i in range(n)] for hc, n in bacteria.items() },
+        { hc:[Predator(e) for e in energies] for hc, energies in predators.items() })
+
+
+def count_state_stats(state):
+    '''
+    Returns ModelStats of state (counters of the last step are zeros)
+    '''
+    state = pack_state(state)
+    energies = iter(state.predatorEnergies)
+    return ModelStats.count(state.bacteria, [ [next(energies) for i in range(n)] for n in state.predatorCounts ])
+
+
+class ModelTestMixin(object):
+    '''
+    Checks deterministic behaviour shared by all models.
+    Subclasses set 'modelClass'
+    '''
+    modelClass = None
+
+    def make_model(self, params, radius, bacteria, predators):
+        return self.modelClass(params, make_state(radius, bacteria, predators))
+
+    def test_counts(self):
+        model = self.make_model(make_params(), 3, {HexCoords(0,0):2, HexCoords(1,0):1}, {HexCoords(0,1):[100,50]})
+        self.assertEqual(model.count_bacteria(), 3)
+        self.assertEqual(model.count_predators(), 2)
+        self.assertEqual(model.count_bacteria_at(HexCoords(0,0)), 2)
+        self.assertEqual(model.count_bacteria_at(HexCoords(0,1)), 0)
+        self.assertEqual(model.count_predators_at(HexCoords(0,1)), 2)
+        self.assertEqual(sorted(model.get_predator_energies(HexCoords(0,1))), [50,100])
+        self.assertEqual(model.get_predator_energies(HexCoords(0,0)), [])
+        find = model.field.get_cell_index().find
+        energies = model.get_energies_at([find(0,0), find(0,1), find(1,0)])
+        self.assertEqual(energies, [[], model.get_predator_energies(HexCoords(0,1)), []])
+        self.assertEqual(sorted(energies[1]), [50,100])
+
+    def test_edit(self):
+        model = self.make_model(make_params(), 3, {HexCoords(0,0):2}, {HexCoords(0,0):[100]})
+        model.add_bacteria(HexCoords(1,0))
+        model.add_predator(HexCoords(1,0))
+        self.assertEqual(model.count_bacteria(), 3)
+        self.assertEqual(model.get_predator_energies(HexCoords(1,0)), [model.modelParams.PR_INIT_ENERGY])
+        model.clear_cell(HexCoords(0,0))
+        self.assertEqual(model.count_bacteria(), 1)
+        self.assertEqual(model.count_predators(), 1)
+        model.clear_all()
+        self.assertEqual(model.count_bacteria(), 0)
+        self.assertEqual(model.count_predators(), 0)
+
+    def test_get_state(self):
+        model = self.make_model(make_params(), 3, {HexCoords(0,0):2}, {HexCoords(1,0):[100, 20]})
+        state = model.get_state()
+        self.assertEqual({ hc:len(v) for hc, v in state.bacteriaPositions.items() }, {HexCoords(0,0):2})
+        self.assertEqual(sorted(pr.energy for pr in state.predatorPositions[HexCoords(1,0)]), [20, 100])
+
+    def get_cells(self, model):
+        return { hc:(model.count_bacteria_at(hc), sorted(model.get_predator_energies(hc)))
+                 for hc in model.field.get_cell_index().cells }
+
+    def test_changed_cells(self):
+        model = self.make_model(make_params(), 4, {HexCoords(2,0):1, HexCoords(-3,0):2}, {HexCoords(0,0):[100]})
+        self.assertIsNone(model.pop_changed_cells())
+        self.assertEqual(model.pop_changed_cells(), set())
+        before = self.get_cells(model)
+        model.step()
+        after = self.get_cells(model)
+        changed = model.pop_changed_cells()
+        self.assertTrue({ hc for hc in before if before[hc]!=after[hc] }<=changed)
+        self.assertTrue({HexCoords(0,0), HexCoords(1,0)}<=changed)
+        model.add_bacteria(HexCoords(0,3))
+        model.clear_cell(HexCoords(-3,0))
+        model.add_predator(HexCoords(0,-3))
+        self.assertEqual(model.pop_changed_cells(), {HexCoords(0,3), HexCoords(-3,0), HexCoords(0,-3)})
+        occupied = { hc for hc, (n, energies) in self.get_cells(model).items() if n>0 or energies }
+        model.clear_all()
+        self.assertTrue(occupied<=model.pop_changed_cells())
+        model.parse_state(model.get_state())
+        self.assertIsNone(model.pop_changed_cells())
+
+    def test_cell_counts(self):
+        model = self.make_model(make_params(), 4, {HexCoords(2,0):1, HexCoords(-3,0):2}, {HexCoords(0,0):[100, 50]})
+        cells, bacteria, predators = model.pop_cell_counts()
+        state = pack_state(model.get_state())
+        self.assertIsNone(cells)
+        self.assertEqual((list(bacteria), list(predators)), (list(state.bacteria), list(state.predatorCounts)))
+        seen = (list(bacteria), list(predators))
+        model.step()
+        model.add_bacteria(HexCoords(0,3))
+        model.clear_cell(HexCoords(-3,0))
+        cells, bacteria, predators = model.pop_cell_counts()
+        self.assertEqual(len(cells), len(bacteria))
+        for i, numBacteria, numPredators in zip(cells, bacteria, predators):
+            seen[0][i] = numBacteria
+            seen[1][i] = numPredators
+        state = pack_state(model.get_state())
+        self.assertEqual(seen, (list(state.bacteria), list(state.predatorCounts)))
+        self.assertEqual(len(model.pop_cell_counts()[0]), 0)
+
+    def test_hungry_predator_eats(self):
+        model = self.make_model(make_params(), 3, {HexCoords(2,0):1}, {HexCoords(0,0):[100]})
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(1,0)), [90])
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(2,0)), [160])
+        self.assertEqual(model.count_bacteria(), 0)
+
+    def test_hungry_predator_stays_with_bacteria(self):
+        model = self.make_model(make_params(), 3, {HexCoords(0,0):2}, {HexCoords(0,0):[100]})
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(0,0)), [170])
+        self.assertEqual(model.count_bacteria_at(HexCoords(0,0)), 1)
+
+    def test_hunting_ties_are_random(self):
+        model = self.make_model(make_params(), 4, {HexCoords(2,0):1, HexCoords(-2,0):1}, {HexCoords(0,0):[100]*40})
+        model.step()
+        self.assertEqual(model.count_predators_at(HexCoords(1,0))+model.count_predators_at(HexCoords(-1,0)), 40)
+        self.assertGreater(model.count_predators_at(HexCoords(1,0)), 5)
+        self.assertGreater(model.count_predators_at(HexCoords(-1,0)), 5)
+
+    def test_hunting_after_bacteria_eaten(self):
+        model = self.make_model(make_params(), 5, {HexCoords(1,0):1, HexCoords(-3,0):1}, {HexCoords(0,0):[100]*2})
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(1,0)), [170])
+        self.assertEqual(model.get_predator_energies(HexCoords(-1,0)), [90])
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(-2,0)), [80])
+
+    def test_predator_starves(self):
+        model = self.make_model(make_params(), 3, {}, {HexCoords(0,0):[10]})
+        model.step()
+        self.assertEqual(model.count_predators(), 0)
+
+    def test_predator_divides(self):
+        model = self.make_model(make_params(P_PR_DIVIDE=Decimal('1'), PR_DIVIDE_COST=8), 3, {}, {HexCoords(0,0):[148]})
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(0,0)), [70, 70])
+
+    def test_predator_overcrowd(self):
+        params = make_params(P_PR_DIVIDE=Decimal('1'), PR_OVERCROWD=2, PR_OVERCROWD_RADIUS=2)
+        model = self.make_model(params, 3, {}, {HexCoords(0,0):[200], HexCoords(2,0):[200]})
+        model.step()
+        self.assertEqual(model.count_predators(), 2)
+        model = self.make_model(params, 3, {}, {HexCoords(0,0):[200], HexCoords(3,0):[200]})
+        model.step()
+        self.assertEqual(model.count_predators(), 4)
+
+    def test_well_fed_predator_stays(self):
+        model = self.make_model(make_params(), 3, {}, {HexCoords(0,0):[160]})
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(0,0)), [150])
+
+    def test_bacteria_divide(self):
+        model = self.make_model(make_params(P_BACT_DIVIDE=Decimal('1')), 3, {HexCoords(0,0):3}, {})
+        model.step()
+        self.assertEqual(model.count_bacteria_at(HexCoords(0,0)), 6)
+
+    def test_bacteria_overcrowd(self):
+        params = make_params(P_BACT_DIVIDE=Decimal('1'), BACT_OVERCROWD=3, BACT_OVERCROWD_RADIUS=1)
+        model = self.make_model(params, 3, {HexCoords(0,0):2, HexCoords(1,0):1, HexCoords(3,0):1}, {})
+        model.step()
+        self.assertEqual(model.count_bacteria_at(HexCoords(0,0)), 2)
+        self.assertEqual(model.count_bacteria_at(HexCoords(1,0)), 1)
+        self.assertEqual(model.count_bacteria_at(HexCoords(3,0)), 2)
+
+    def test_bacteria_move(self):
+        model = self.make_model(make_params(P_BACT_STAY=Decimal('0')), 3, {HexCoords(0,0):50}, {})
+        model.step()
+        self.assertEqual(model.count_bacteria(), 50)
+        self.assertEqual(model.count_bacteria_at(HexCoords(0,0)), 0)
+        velocity = model.modelParams.BACT_VELOCITY if self.rapid else 1
+        for hc in model.get_state().bacteriaPositions:
+            self.assertEqual(max(abs(hc.x), abs(hc.y), abs(hc.z)), velocity)
+
+    def test_torus_hunting(self):
+        # (4,-1) and (5,-1) are wrapped to (-4,3) and (-3,3)
+        model = self.make_model(make_params(), TorusHexafield(8, 6), {HexCoords(-3,3):1}, {HexCoords(3,-1):[100]})
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(-4,3)), [90])
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(-3,3)), [160])
+        self.assertEqual(model.count_bacteria(), 0)
+
+    def test_rectangle_edge_hunting(self):
+        # the shortest step from (1,2) to (-1,3) could leave the field through its top row
+        field = RectangleHexafield(6, 5)
+        model = self.make_model(make_params(), field, {HexCoords(-1,3):1}, {HexCoords(1,2):[100]})
+        model.step()
+        self.assertEqual(model.count_predators(), 1)
+        self.assertTrue(all(hc in field._field for hc in model.get_state().predatorPositions))
+        self.assertEqual(model.get_predator_energies(HexCoords(0,3)), [])
+
+    def test_torus_overcrowd(self):
+        params = make_params(P_BACT_DIVIDE=Decimal('1'), BACT_OVERCROWD=2, BACT_OVERCROWD_RADIUS=1)
+        model = self.make_model(params, TorusHexafield(8, 6), {HexCoords(3,-1):1, HexCoords(-4,3):1, HexCoords(0,0):1}, {})
+        model.step()
+        self.assertEqual(model.count_bacteria_at(HexCoords(3,-1)), 1)
+        self.assertEqual(model.count_bacteria_at(HexCoords(-4,3)), 1)
+        self.assertEqual(model.count_bacteria_at(HexCoords(0,0)), 2)
+
+    def test_stats(self):
+        params = make_params(P_BACT_DIVIDE=Decimal('1'))
+        model = self.make_model(params, 3, {HexCoords(1,0):2, HexCoords(-2,0):1}, {HexCoords(0,0):[100], HexCoords(-3,0):[5]})
+        self.assertEqual(model.stats.get_values(), (3, 2, 2, 2, 0, 0, 0, 0, 5, 100, 105))
+        model.step()
+        stats = model.stats
+        self.assertEqual(stats.get_values(), (4, 1, 2, 1, 2, 0, 1, 1, 170, 170, 170))
+        self.assertEqual(stats.get_energy_histogram(), [(170, 1)])
+        model.add_bacteria(HexCoords(0,3))
+        model.add_predator(HexCoords(0,3))
+        model.clear_cell(HexCoords(1,0))
+        self.assertEqual(model.stats.get_values()[:4], (3, 1, 2, 1))
+        self.assertEqual(model.stats.energies, Counter({model.modelParams.PR_INIT_ENERGY:1}))
+        model.clear_all()
+        self.assertEqual(model.stats.get_values()[:4], (0, 0, 0, 0))
+
+    def test_stats_follow_state(self):
+        random.seed(5)
+        params = make_params(P_BACT_DIVIDE=Decimal('0.3'), P_BACT_STAY=Decimal('0.5'), P_PR_DIVIDE=Decimal('0.5'),
+            P_PR_STAY=Decimal('0.5'), BACT_OVERCROWD=4, PR_DIVIDE_ENERGY=120)
+        cells = sorted(CircleHexafield(6)._field, key=lambda hc: hc._coords)
+        model = self.make_model(params, 6, { hc:random.randint(1, 3) for hc in random.sample(cells, 40) },
+            { hc:[random.randint(20, 160)] for hc in random.sample(cells, 15) })
+        for i in range(8):
+            before = model.stats
+            numBacteria, numPredators = before.numBacteria, before.numPredators
+            model.step()
+            stats = model.stats
+            self.assertEqual(stats.numBacteria, numBacteria+stats.bacteriaBorn-stats.bacteriaEaten)
+            self.assertEqual(stats.numPredators, numPredators+stats.predatorsBorn-stats.predatorsDied)
+            expected = count_state_stats(model.get_state())
+            self.assertEqual(stats.get_values()[:4], expected.get_values()[:4])
+            self.assertEqual(stats.get_values()[-3:], expected.get_values()[-3:])
+            self.assertEqual(stats.energies, expected.energies)
+            self.assertEqual((model.count_bacteria(), model.count_predators()), (stats.numBacteria, stats.numPredators))
+
+
+class TestCoreModel(ModelTestMixin, unittest.TestCase):
+    modelClass = CoreModel
+    rapid = False
+
+
+class TestRapidBacteriaModel(ModelTestMixin, unittest.TestCase):
+    modelClass = RapidBacteriaModel
+    rapid = True
+
+    def make_model(self, params, radius, bacteria, predators):
+        return self.modelClass(params._replace(BACT_VELOCITY=2), make_state(radius, bacteria, predators))
+
+
+class TestCountingCoreModel(ModelTestMixin, unittest.TestCase):
+    modelClass = CountingCoreModel
+    rapid = False
+
+    def test_aggregate_splits(self):
+        params = make_params(P_BACT_DIVIDE=Decimal('0.5'), P_BACT_STAY=Decimal('0.5'))
+        model = self.make_model(params, 5, {HexCoords(0,0):4000}, {})
+        model.step_bacteria()
+        # ~2000 divide, ~1000 stay and ~1000 move to 6 neighbours
+        self.assertLess(abs(model.count_bacteria()-6000), 200)
+        self.assertLess(abs(model.count_bacteria_at(HexCoords(0,0))-5000), 300)
+        for hc in model.field.get_neighbours(HexCoords(0,0)):
+            self.assertLess(abs(model.count_bacteria_at(hc)-1000/6), 70)
+
+    def test_step_cost(self):
+        # number of random draws per cell doesn't grow with number of bacteria per cell
+        params = make_params(P_BACT_DIVIDE=Decimal('0.3'), P_BACT_STAY=Decimal('0.5'))
+        calls = []
+        for n in (10, 1000):
+            model = self.make_model(params, 10, {}, {})
+            cells = model.field.get_all_within(HexCoords(0,0), 10)
+            with mock.patch('random.random', wraps=random.random) as rand, \
+                    mock.patch('random.getrandbits', wraps=random.getrandbits) as getrandbits:
+                positions, born = model.spread_bacteria((hc, n) for hc in cells)
+            self.assertEqual(sum(positions.values()), n*len(cells)+born)
+            self.assertLess(abs(born-0.3*n*len(cells)), 0.05*n*len(cells))
+            calls.append(rand.call_count+getrandbits.call_count)
+        self.assertLess(calls[1], 5*calls[0])
+
+
+class TestCountingRapidBacteriaModel(TestRapidBacteriaModel):
+    modelClass = CountingRapidBacteriaModel
+
+
+class TestDenseCoreModel(ModelTestMixin, unittest.TestCase):
+    modelClass = DenseCoreModel
+    rapid = False
+
+    def test_no_hex_coords(self):
+        # cells are found arithmetically, HexCoords of cells are never listed or hashed by steps
+        params = make_params(P_BACT_DIVIDE=Decimal('0.5'), P_BACT_STAY=Decimal('0.5'), P_PR_STAY=Decimal('0.5'))
+        field = HexagonHexafield(6)
+        state = pack_state(make_state(field, {HexCoords(0,0):3, HexCoords(3,-1):2}, {HexCoords(1,1):[100, 200], HexCoords(-4,0):[30]}))
+        model = self.modelClass(params, state)
+        for i in range(5):
+            model.step()
+        self.assertIsNone(model.index._cells)
+        self.assertIsNone(model.index._indices)
+        self.assertEqual(list(model.predatorCounts), [ list(model.predatorCells).count(i) for i in range(len(model.index)) ])
+        self.assertEqual(model.count_predators(), len(model.predatorEnergies))
+
+
+class TestDenseRapidBacteriaModel(TestRapidBacteriaModel):
+    modelClass = DenseRapidBacteriaModel
+
+
+class TestChunkedCoreModel(ModelTestMixin, unittest.TestCase):
+    modelClass = ChunkedCoreModel
+    rapid = False
+
+    def test_huge_field(self):
+        params = make_params(P_BACT_DIVIDE=Decimal('1'), BACT_OVERCROWD=3, BACT_OVERCROWD_RADIUS=2, PR_OVERCROWD=2)
+        field = HexagonHexafield(20000)
+        model = self.make_model(params, field, {HexCoords(-19000,5):1, HexCoords(19000,-5):1}, {HexCoords(-19000,7):[100]})
+        for i in range(3):
+            model.step()
+        # predator eats twice and bacteria stop dividing when there are 4 of them
+        self.assertEqual(model.get_predator_energies(HexCoords(-19000,5)), [150])
+        self.assertEqual(model.count_bacteria_at(HexCoords(-19000,5)), 4)
+        self.assertEqual(model.count_bacteria_at(HexCoords(19000,-5)), 4)
+        self.assertEqual(model._bacteriaSums.count_chunks(), 2)
+        self.assertNotIn('index', field._tables)
+
+
+class TestChunkedRapidBacteriaModel(TestRapidBacteriaModel):
+    modelClass = ChunkedRapidBacteriaModel
+
+
+class VectorModelTestMixin(ModelTestMixin):
+    '''
+    Vectorized models resolve hunting simultaneously
+    '''
+
+    def test_hunting_after_bacteria_eaten(self):
+        # both predators target the same bacterium
+        model = self.make_model(make_params(), 5, {HexCoords(1,0):1, HexCoords(-3,0):1}, {HexCoords(0,0):[100]*2})
+        model.step()
+        self.assertEqual(sorted(model.get_predator_energies(HexCoords(1,0))), [90, 170])
+
+    def test_feeding_conflict(self):
+        model = self.make_model(make_params(), 3, {HexCoords(0,0):1}, {HexCoords(1,0):[100], HexCoords(-1,0):[100]})
+        model.step()
+        self.assertEqual(model.count_bacteria(), 0)
+        self.assertEqual(sorted(model.get_predator_energies(HexCoords(0,0))), [90, 170])
+
+
+class TestVectorCoreModel(VectorModelTestMixin, unittest.TestCase):
+    modelClass = VectorCoreModel
+    rapid = False
+
+
+class TestVectorRapidBacteriaModel(VectorModelTestMixin, TestRapidBacteriaModel):
+    modelClass = VectorRapidBacteriaModel
@@ -0,0 +1,51 @@
+import unittest
+from collections import Counter
+
+from app.model_stats import ModelStats
+
+
+class TestModelStats(unittest.TestCase):
+
+    def test_count(self):
+        stats = ModelStats.count([0, 2, 1, 0], [[], [100, 40], [], [100]])
+        self.assertEqual((stats.numBacteria, stats.bacteriaCells), (3, 2))
+        self.assertEqual((stats.numPredators, stats.predatorCells), (3, 2))
+        self.assertEqual((stats.energyMin, stats.energyMax, stats.energyTotal), (40, 100, 240))
+        self.assertEqual(stats.energy_mean(), 80)
+        self.assertEqual(stats.energies, Counter({100:2, 40:1}))
+
+    def test_empty(self):
+        stats = ModelStats()
+        self.assertEqual(stats.get_values(), (0, 0, 0, 0, 0, 0, 0, 0, None, None, 0))
+        self.assertIsNone(stats.energy_mean())
+        self.assertEqual(stats.get_energy_histogram(), [])
+
+    def test_add_remove_predators(self):
+        stats = ModelStats()
+        stats.add_predators(100, 2)
+        stats.add_predators(30)
+        self.assertEqual((stats.numPredators, stats.energyMin, stats.energyMax, stats.energyTotal), (3, 30, 100, 230))
+        stats.remove_predators([30, 100])
+        self.assertEqual((stats.numPredators, stats.energyMin, stats.energyMax, stats.energyTotal), (1, 100, 100, 100))
+        self.assertEqual(stats.energies, Counter({100:1}))
+        stats.remove_predators([100])
+        self.assertEqual((stats.numPredators, stats.energyMin, stats.energyMax), (0, None, None))
+
+    def test_histogram(self):
+        stats = ModelStats.count([], [[5, 9, 10], [25, 160]])
+        self.assertEqual(stats.get_energy_histogram(), [(0, 2), (10, 1), (20, 1), (160, 1)])
+        self.assertEqual(stats.get_energy_histogram(100), [(0, 4), (100, 1)])
+
+    def test_combine(self):
+        first = ModelStats.count([1, 3], [[100], []])
+        first.bacteriaBorn = 2
+        second = ModelStats.count([0, 1], [[50, 70], [10]])
+        second.bacteriaBorn = 1
+        second.predatorsDied = 4
+        stats = ModelStats.combine([first, second])
+        self.assertEqual(stats.get_values(), (5, 4, 3, 3, 3, 0, 0, 4, 10, 100, 230))
+        self.assertEqual(ModelStats.from_values(stats.get_values()).get_values(), stats.get_values())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import io
+import json
+import unittest
+
+from app.profiler import enable_profiling, disable_profiling, get_profiler
+from app.model import CoreModel
+from app.dense_model import DenseCoreModel
+from app.hexafield import HexCoords
+from test.test_model import make_params, make_state
+
+
+def make_model(modelClass=CoreModel):
+    return modelClass(make_params(BACT_OVERCROWD=5), make_state(5, {HexCoords(3,0):2}, {HexCoords(-3,0):[50], HexCoords(0,0):[50]}))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_enable_disable(self):
+        model = make_model()
+        other = make_model()
+        self.assertIsNone(get_profiler(model))
+        profiler = enable_profiling(model)
+        self.assertIs(get_profiler(model), profiler)
+        self.assertIs(enable_profiling(model), profiler)
+        self.assertIsInstance(model, CoreModel)
+        self.assertIs(type(other), CoreModel)
+        self.assertIs(disable_profiling(model), profiler)
+        self.assertIs(type(model), CoreModel)
+        self.assertIsNone(disable_profiling(model))
+
+    def test_counts_phases(self):
+        for modelClass in (CoreModel, DenseCoreModel):
+            model = make_model(modelClass)
+            profiler = enable_profiling(model, objectsEvery=2)
+            for i in range(3):
+                model.step()
+            stats = { s.name:s for s in profiler.get_stats() }
+            self.assertEqual(profiler.numSteps, 3)
+            self.assertEqual(stats['step'].calls, 3)
+            self.assertEqual(stats['step_predators'].calls, 3)
+            self.assertEqual(stats['step_bacteria'].calls, 3)
+            self.assertEqual(stats['find_closest_bacteria'].calls, 6)
+            self.assertEqual(stats['check_bacteria_overcrowd'].calls, 3)
+            self.assertAlmostEqual(stats['find_closest_bacteria'].callsPerStep, 2.0)
+            for s in stats.values():
+                self.assertLessEqual(s.selfSeconds, s.seconds+1e-9)
+            self.assertLessEqual(stats['step_predators'].seconds, stats['step'].seconds)
+            self.assertEqual([s.step for s in profiler.history], [1, 2, 3])
+            self.assertEqual(profiler.history[0].phases['find_closest_bacteria'][0], 2)
+            self.assertIsNone(profiler.history[0].objects)
+            self.assertIsNotNone(profiler.history[1].objects)
+            # the model still works the same way
+            plain = make_model(modelClass)
+            for i in range(3):
+                plain.step()
+            self.assertEqual(model.get_predator_energies(HexCoords(2,0)), plain.get_predator_energies(HexCoords(2,0)))
+            self.assertEqual((model.count_bacteria(), model.count_predators()), (plain.count_bacteria(), plain.count_predators()))
+
+    def test_reset_and_dump(self):
+        model = make_model()
+        profiler = enable_profiling(model)
+        model.step()
+        out = io.StringIO()
+        profiler.dump(out)
+        self.assertIn('step_predators', out.getvalue())
+        self.assertEqual(json.loads(json.dumps(profiler.to_dict()))['steps'], 1)
+        profiler.reset()
+        self.assertEqual(profiler.numSteps, 0)
+        self.assertEqual(profiler.get_stats(), [])
+        self.assertEqual(len(profiler.history), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 import unittest
 import decimal
+import random
+from unittest import mock
 
-from app.rand_p import count_decimal_places, rand_p
+from app.rand_p import count_decimal_places, rand_p, to_probability_bounds, randbytes, binomial, split_uniformly, \
+    BernoulliSampler
 
 class TestCountDecimalPlaces(unittest.TestCase):
     def test_float(self):
@@ -41,3 +44,110 @@ class TestRandP(unittest.TestCase):
             s+=rand_p(p,sf)
         self.assertGreaterEqual(s,69500)
         self.assertLessEqual(s,70500)
+
+
+class TestBinomial(unittest.TestCase):
+    def check_moments(self, n, p):
+        values = [binomial(n, p) for i in range(20000)]
+        mean = sum(values)/len(values)
+        variance = sum((v-mean)**2 for v in values)/len(values)
+        self.assertTrue(all(0<=v<=n for v in values))
+        self.assertAlmostEqual(mean, n*p, delta=0.05*n*p+0.05)
+        self.assertAlmostEqual(variance, n*p*(1-p), delta=0.1*n*p*(1-p)+0.05)
+
+    def test_inversion(self):
+        self.check_moments(5, 0.3)
+        self.check_moments(40, 0.1)
+        self.check_moments(12, 0.75)
+
+    def test_rejection(self):
+        self.check_moments(1000, 0.3)
+        self.check_moments(1000, 0.95)
+        self.check_moments(10**9, 0.5)
+
+    def test_edges(self):
+        self.assertEqual(binomial(0, 0.5), 0)
+        self.assertEqual(binomial(10, 0), 0)
+        self.assertEqual(binomial(10, 1), 10)
+
+    def test_split(self):
+        self.assertEqual(split_uniformly(0, 3), [0, 0, 0])
+        self.assertEqual(split_uniformly(5, 1), [5])
+        totals = [0]*6
+        for i in range(1000):
+            split = split_uniformly(600, 6)
+            self.assertEqual(sum(split), 600)
+            totals = [t+x for t, x in zip(totals, split)]
+        for t in totals:
+            self.assertAlmostEqual(t, 100000, delta=1500)
+
+
+class TestBernoulliSampler(unittest.TestCase):
+    def check_frequency(self, p, expected):
+        sampler = BernoulliSampler(p)
+        s = 0
+        for x in range(100000):
+            s+=sampler()
+        self.assertGreaterEqual(s,(expected-0.005)*100000)
+        self.assertLessEqual(s,(expected+0.005)*100000)
+        s = sampler.count(100000)
+        self.assertGreaterEqual(s,(expected-0.005)*100000)
+        self.assertLessEqual(s,(expected+0.005)*100000)
+
+    def test_byte_table(self):
+        self.check_frequency(decimal.Decimal('0.7'), 0.7)
+        self.check_frequency('0.05', 0.05)
+        self.check_frequency(0.5, 0.5)
+
+    def test_words(self):
+        self.check_frequency(decimal.Decimal('0.1234'), 0.1234)
+        self.check_frequency('0.123', 0.123)
+        self.check_frequency('0.123456789012', 0.123456789012)
+
+    def test_exact_words(self):
+        # every 2-byte word once: each of 1000 values is drawn by the same number of words
+        words = b''.join(w.to_bytes(2, 'little') for w in range(65536))
+        for p in ('0.123', '0.500', '0.999', '0.001'):
+            sampler = BernoulliSampler(p)
+            with mock.patch('app.rand_p.randbytes', side_effect=[words, b'\x00'*1000]):
+                outcomes = sampler._draw(65536//1000*1000)
+            self.assertEqual(outcomes.count(1), 65536//1000*int(decimal.Decimal(p)*1000))
+            self.assertEqual(outcomes.count(0)+outcomes.count(1), len(outcomes))
+
+    def test_randrange(self):
+        sampler = BernoulliSampler('0.'+'3'*25)
+        self.assertIsNone(sampler._table)
+        self.check_frequency('0.'+'3'*25, 1/3)
+
+    def test_bounds(self):
+        self.assertEqual(to_probability_bounds(decimal.Decimal('0.05')), (5, 100))
+        self.assertEqual(to_probability_bounds(0.7), (7, 10))
+        self.assertEqual(to_probability_bounds('0.75', 1), (8, 10))
+
+    def test_certain(self):
+        self.assertEqual(BernoulliSampler(decimal.Decimal('0')).count(1000), 0)
+        self.assertEqual(BernoulliSampler(decimal.Decimal('1')).count(1000), 1000)
+        self.assertEqual(BernoulliSampler('1.0')(), 1)
+
+    def test_probability(self):
+        self.assertEqual(BernoulliSampler('0.75', 1).probability(), 0.8)
+        self.assertEqual(BernoulliSampler(decimal.Decimal('0.05')).probability(), 0.05)
+        self.assertEqual(BernoulliSampler('0').probability(), 0)
+
+    def test_sample(self):
+        sampler = BernoulliSampler('0.5')
+        sampler()
+        for n in (0, 1, 10, 5000, 20000):
+            outcomes = sampler.sample(n)
+            self.assertEqual(len(outcomes), n)
+            self.assertEqual(outcomes.count(0)+outcomes.count(1), n)
+
+    def test_randbytes(self):
+        random.seed(3)
+        res = randbytes(1000)
+        self.assertEqual(len(res), 1000)
+        self.assertEqual(randbytes(0), b'')
+        # the same bytes as random.randbytes (Python 3.9+) gives
+        if hasattr(random, 'randbytes'):
+            random.seed(3)
+            self.assertEqual(random.randbytes(1000), res)
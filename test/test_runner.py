@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from app.runner import get_halt_reason, run
+from app.model import CoreModel
+from app.hexafield import HexCoords
+from app.tracewriter import TraceWriter
+from app.config import Rules, default_field_params, default_engine_params
+from test.test_model import make_params, make_state
+
+
+class TestHaltReason(unittest.TestCase):
+
+    def test_not_halted(self):
+        self.assertEqual(get_halt_reason(1, 1), '')
+
+    def test_no_predators(self):
+        self.assertEqual(get_halt_reason(5, 0), 'No more predators left')
+        self.assertEqual(get_halt_reason(0, 0), 'No more predators left')
+
+    def test_no_bacteria(self):
+        self.assertEqual(get_halt_reason(0, 3), 'No more bacteria left')
+
+
+class TestRun(unittest.TestCase):
+
+    def test_runs_max_steps(self):
+        model = CoreModel(make_params(), make_state(5, {HexCoords(3,0):2}, {HexCoords(-3,0):[1000]}))
+        result = run(model, 3)
+        self.assertEqual(result.steps, 3)
+        self.assertEqual(result.haltReason, '')
+        self.assertEqual((result.numBacteria, result.numPredators), (2, 1))
+
+    def test_halts_when_bacteria_eaten(self):
+        model = CoreModel(make_params(), make_state(5, {HexCoords(2,0):1}, {HexCoords(0,0):[50]}))
+        result = run(model, 100)
+        self.assertEqual(result.steps, 2)
+        self.assertEqual(result.haltReason, 'No more bacteria left')
+        self.assertEqual((result.numBacteria, result.numPredators), (0, 1))
+
+    def test_halts_when_predators_starve(self):
+        model = CoreModel(make_params(PR_TURN_COST=10), make_state(5, {HexCoords(0,0):1}, {HexCoords(5,0):[15]}))
+        result = run(model, 100)
+        self.assertEqual(result.steps, 2)
+        self.assertEqual(result.haltReason, 'No more predators left')
+
+    def test_writes_trace(self):
+        model = CoreModel(make_params(), make_state(5, {HexCoords(2,0):1}, {HexCoords(0,0):[50]}))
+        rules = Rules(default_field_params(), model.modelParams, default_engine_params())
+        with tempfile.TemporaryDirectory() as dirName:
+            traceWriter = TraceWriter(rules, os.path.join(dirName, 'trace'))
+            run(model, 100, traceWriter)
+            traceWriter.close()
+            with open(traceWriter.fileName) as f:
+                lines = f.read().splitlines()
+        self.assertEqual(lines[-3:], ['0\t1\t1', '1\t1\t1', '2\t0\t1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
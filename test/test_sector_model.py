@@ -0,0 +1,182 @@
+import random
+import unittest
+from decimal import Decimal
+
+from app.sector_model import SectorCoreModel, SectorRapidBacteriaModel, split_sectors, get_halo
+from app.hexafield import CircleHexafield, HexCoords, create_hexafield
+from test.test_model import VectorModelTestMixin, TestRapidBacteriaModel, make_params, make_state, count_state_stats
+
+
+class TestSplitSectors(unittest.TestCase):
+
+    def test_split(self):
+        field = CircleHexafield(20)
+        sectors = split_sectors(field, 4, 5)
+        self.assertEqual(len(sectors), 5)
+        self.assertEqual(sectors[0][0], -20)
+        self.assertEqual(sectors[-1][1], 20)
+        sizes = []
+        for i, (xLo, xHi) in enumerate(sectors):
+            self.assertGreaterEqual(xHi-xLo+1, 4)
+            if i>0:
+                self.assertEqual(xLo, sectors[i-1][1]+1)
+            sizes.append(sum(1 for hc in field._field if xLo<=hc.x<=xHi))
+        self.assertLess(max(sizes)-min(sizes), 2*41)
+
+    def test_narrow_field(self):
+        self.assertEqual(split_sectors(CircleHexafield(5), 4, 8), [(-5, 0), (1, 5)])
+        self.assertEqual(split_sectors(CircleHexafield(1), 4, 8), [(-1, 1)])
+
+    def test_torus_is_not_split(self):
+        field = create_hexafield('torus', width=40, height=20)
+        xs = field.get_cell_index().xs
+        self.assertEqual(split_sectors(field, 4, 8), [(min(xs), max(xs))])
+
+    def test_halo(self):
+        params = make_params(PR_SIGHT=3, BACT_VELOCITY=2, BACT_OVERCROWD=2, BACT_OVERCROWD_RADIUS=4, PR_OVERCROWD_RADIUS=7)
+        self.assertEqual(get_halo(params), 4)
+        self.assertEqual(get_halo(params._replace(PR_OVERCROWD=2)), 7)
+
+
+class SectorModelTestMixin(VectorModelTestMixin):
+    '''
+    Sector models resolve hunting simultaneously (as vector models do) on any number of sectors
+    '''
+
+    def make_model(self, params, radius, bacteria, predators):
+        model = self.modelClass(params, make_state(radius, bacteria, predators), 3)
+        self.addCleanup(model.close)
+        return model
+
+
+class TestSectorCoreModel(SectorModelTestMixin, unittest.TestCase):
+    modelClass = SectorCoreModel
+    rapid = False
+
+
+class TestSectorRapidBacteriaModel(SectorModelTestMixin, TestRapidBacteriaModel):
+    modelClass = SectorRapidBacteriaModel
+
+    def make_model(self, params, radius, bacteria, predators):
+        return SectorModelTestMixin.make_model(self, params._replace(BACT_VELOCITY=2), radius, bacteria, predators)
+
+
+class TestCrossSector(unittest.TestCase):
+    '''
+    Creatures near sector bounds on a field split into several sectors (halo is 2 columns)
+    '''
+
+    def make_model(self, bacteria, predators, **kwargs):
+        params = make_params(PR_SIGHT=2, **kwargs)
+        model = SectorCoreModel(params, make_state(8, bacteria, predators), 4)
+        self.addCleanup(model.close)
+        self.assertEqual(model.halo, 2)
+        self.assertEqual(len(model.sectors), 4)
+        return model
+
+    def test_hunting_across_bound(self):
+        x = self.make_model({}, {}).sectors[1][1]
+        model = self.make_model({HexCoords(x+2,0):1}, {HexCoords(x,0):[100]})
+        self.assertNotEqual(model.get_sector(HexCoords(x,0)), model.get_sector(HexCoords(x+1,0)))
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(x+1,0)), [90])
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(x+2,0)), [160])
+        self.assertEqual(model.count_bacteria(), 0)
+
+    def test_feeding_conflict_across_bound(self):
+        x = self.make_model({}, {}).sectors[2][0]
+        model = self.make_model({HexCoords(x,0):1}, {HexCoords(x-1,0):[100], HexCoords(x+1,0):[100]})
+        model.step()
+        self.assertEqual(model.count_bacteria(), 0)
+        self.assertEqual(sorted(model.get_predator_energies(HexCoords(x,0))), [90, 170])
+
+    def test_bacteria_overcrowd_across_bound(self):
+        x = self.make_model({}, {}).sectors[0][1]
+        model = self.make_model({HexCoords(x,0):1, HexCoords(x+1,0):1, HexCoords(x+1,-4):1}, {},
+            P_BACT_DIVIDE=Decimal('1'), BACT_OVERCROWD=2, BACT_OVERCROWD_RADIUS=1)
+        model.step()
+        self.assertEqual(model.count_bacteria_at(HexCoords(x,0)), 1)
+        self.assertEqual(model.count_bacteria_at(HexCoords(x+1,0)), 1)
+        self.assertEqual(model.count_bacteria_at(HexCoords(x+1,-4)), 2)
+
+    def test_edits_update_halo(self):
+        x = self.make_model({}, {}).sectors[1][0]
+        model = self.make_model({}, {HexCoords(x-1,0):[100]})
+        model.add_bacteria(HexCoords(x+1,0))
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(x,0)), [90])
+        model.clear_cell(HexCoords(x+1,0))
+        model.add_bacteria(HexCoords(x-2,0))
+        model.step()
+        self.assertEqual(model.get_predator_energies(HexCoords(x-1,0)), [80])
+
+    def test_migrations_keep_creatures(self):
+        random.seed(3)
+        cells = sorted(CircleHexafield(8)._field, key=lambda hc: hc._coords)
+        bacteria = { hc:random.randint(1, 3) for hc in random.sample(cells, 60) }
+        predators = { hc:[160] for hc in random.sample(cells, 20) }
+        model = self.make_model(bacteria, predators, P_BACT_STAY=Decimal('0'), P_PR_STAY=Decimal('0'), PR_TURN_COST=0)
+        numBacteria = sum(bacteria.values())
+        self.assertIsNone(model.pop_changed_cells())
+        for i in range(10):
+            before = model.get_state()
+            model.step()
+            state = model.get_state()
+            self.assertEqual((sum(state.bacteria), sum(state.predatorCounts)), (numBacteria, 20))
+            self.assertEqual((model.count_bacteria(), model.count_predators()), (numBacteria, 20))
+            changed = model.pop_changed_cells()
+            index = model.field.get_cell_index()
+            for i, hc in enumerate(index.cells):
+                if before.bacteria[i]!=state.bacteria[i] or before.predatorCounts[i]!=state.predatorCounts[i]:
+                    self.assertIn(hc, changed)
+
+    def test_cell_counts(self):
+        random.seed(5)
+        cells = sorted(CircleHexafield(8)._field, key=lambda hc: hc._coords)
+        model = self.make_model({ hc:2 for hc in random.sample(cells, 60) }, { hc:[160] for hc in random.sample(cells, 20) },
+            P_BACT_STAY=Decimal('0'), P_PR_STAY=Decimal('0'), PR_TURN_COST=0)
+        changed, bacteria, predators = model.pop_cell_counts()
+        self.assertIsNone(changed)
+        seen = (list(bacteria), list(predators))
+        for i in range(5):
+            model.step()
+            changed, bacteria, predators = model.pop_cell_counts()
+            for i, numBacteria, numPredators in zip(changed, bacteria, predators):
+                seen[0][i] = numBacteria
+                seen[1][i] = numPredators
+            state = model.get_state()
+            self.assertEqual(seen, (list(state.bacteria), list(state.predatorCounts)))
+
+    def test_stats_and_energies(self):
+        random.seed(7)
+        cells = sorted(CircleHexafield(8)._field, key=lambda hc: hc._coords)
+        model = self.make_model({ hc:random.randint(1, 4) for hc in random.sample(cells, 80) },
+            { hc:[random.randint(20, 160)] for hc in random.sample(cells, 25) },
+            P_BACT_DIVIDE=Decimal('0.3'), P_BACT_STAY=Decimal('0.3'), P_PR_STAY=Decimal('0.3'), P_PR_DIVIDE=Decimal('0.5'),
+            BACT_OVERCROWD=6, BACT_OVERCROWD_RADIUS=1)
+        index = model.field.get_cell_index()
+        for i in range(8):
+            model.step()
+            state = model.get_state()
+            stats = count_state_stats(state)
+            self.assertEqual(model.stats.get_values()[:4], stats.get_values()[:4])
+            self.assertEqual(model.stats.energies, stats.energies)
+            occupied = [ i for i, n in enumerate(state.predatorCounts) if n>0 ]
+            self.assertEqual(model.get_energies_at(occupied+[0]),
+                [ model.get_predator_energies(index.get_cell(i)) for i in occupied+[0] ])
+
+    def test_reproducible(self):
+        def run():
+            random.seed(11)
+            model = self.make_model({ HexCoords(x,0):2 for x in range(-8, 9) }, {HexCoords(0,3):[100], HexCoords(0,-3):[100]},
+                P_BACT_DIVIDE=Decimal('0.3'), P_BACT_STAY=Decimal('0.2'))
+            for i in range(10):
+                model.step()
+            state = model.get_state()
+            return list(state.bacteria), list(state.predatorEnergies)
+        self.assertEqual(run(), run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+from array import array
+import unittest
+
+from app.simulation import SimulationClient, diff_cells
+from app.config import default_engine_params
+from app.hexafield import HexCoords
+from test.test_model import make_params, make_state
+
+
+class TestSimulationClient(unittest.TestCase):
+
+    def setUp(self):
+        state = make_state(5, {HexCoords(3,0):2, HexCoords(-2,0):1}, {HexCoords(0,0):[100]})
+        self.client = SimulationClient(default_engine_params()._replace(model='core'), make_params(), state)
+        self.assertTrue(self.client.wait_frame())
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_initial_frame(self):
+        client = self.client
+        self.assertEqual((client.currentStep, client.count_bacteria(), client.count_predators()), (0, 3, 1))
+        self.assertEqual(client.count_bacteria_at(HexCoords(3,0)), 2)
+        self.assertEqual(client.count_predators_at(HexCoords(0,0)), 1)
+        self.assertEqual(client.count_bacteria_at(HexCoords(0,0)), 0)
+        self.assertEqual(client.count_bacteria_at(HexCoords(10,0)), 0)
+        self.assertFalse(client.refresh())
+
+    def test_step_and_edit(self):
+        client = self.client
+        client.step()
+        self.assertTrue(client.wait_frame())
+        self.assertEqual(client.currentStep, 1)
+        self.assertEqual(client.count_predators_at(HexCoords(0,0))+client.count_predators_at(HexCoords(-1,0)), 1)
+        client.add_bacteria(HexCoords(0,4))
+        client.add_predator(HexCoords(0,-4))
+        client.clear_cell(HexCoords(3,0))
+        client.get_state()
+        client.refresh()
+        self.assertEqual(client.count_bacteria_at(HexCoords(0,4)), 1)
+        self.assertEqual(client.count_predators_at(HexCoords(0,-4)), 1)
+        self.assertEqual(client.count_bacteria_at(HexCoords(3,0)), 0)
+        state = client.get_state()
+        self.assertEqual(sum(state.bacteria), client.count_bacteria())
+        client.clear_all()
+        client.get_state()
+        client.refresh()
+        self.assertEqual((client.count_bacteria(), client.count_predators()), (0, 0))
+
+    def test_changed_cells(self):
+        client = self.client
+        index = client.field.get_cell_index()
+        cells, bacteria, predators = client.pop_cell_counts()
+        self.assertIsNone(cells)
+        self.assertEqual(bacteria[index.find(3, 0)], 2)
+        self.assertEqual(client.pop_cell_counts(), ([], [], []))
+        client.add_bacteria(HexCoords(0,4))
+        client.clear_cell(HexCoords(3,0))
+        client.get_state()
+        client.refresh()
+        self.assertEqual(client.pop_cell_counts(), ([index.find(0, 4), index.find(3, 0)], [1, 0], [0, 0]))
+        client.add_predator(HexCoords(0,-4))
+        client.get_state()
+        client.refresh()
+        self.assertEqual(client.pop_changed_cells(), {HexCoords(0,-4)})
+        self.assertEqual(client.pop_changed_cells(), set())
+
+    def test_diff_cells(self):
+        previous = array('i', range(3000))
+        current = array('i', previous)
+        current[5] = current[2500] = current[2999] = -1
+        self.assertEqual(diff_cells(previous.tobytes(), current.tobytes(), 1000), [5, 2500, 2999])
+        self.assertEqual(diff_cells(previous.tobytes(), previous.tobytes()), [])
+
+    def test_play_until_halt(self):
+        client = self.client
+        client.parse_state(make_state(5, {HexCoords(2,0):1}, {HexCoords(0,0):[50]}))
+        client.play(True)
+        while client.wait_frame() and client.haltReason=='':
+            pass
+        self.assertEqual(client.haltReason, 'No more bacteria left')
+        self.assertFalse(client.playing)
+        self.assertEqual(client.count_bacteria(), 0)
+        self.assertEqual(client.currentStep, 2)
+
+    def test_sector_model(self):
+        state = make_state(5, {HexCoords(3,0):2, HexCoords(-2,0):1}, {HexCoords(0,0):[100]})
+        engineParams = default_engine_params()._replace(model='sector_core', workers=2)
+        with SimulationClient(engineParams, make_params(), state) as client:
+            self.assertTrue(client.wait_frame())
+            self.assertEqual((client.count_bacteria(), client.count_predators()), (3, 1))
+            client.step()
+            self.assertTrue(client.wait_frame())
+            self.assertEqual(client.currentStep, 1)
+            self.assertEqual(client.count_predators_at(HexCoords(0,0))+client.count_predators_at(HexCoords(-1,0)), 1)
+            process = client._process
+        self.assertFalse(process.is_alive())
+
+    def test_parse_state(self):
+        client = self.client
+        client.step()
+        client.parse_state(make_state(3, {HexCoords(1,1):4}, {}))
+        self.assertEqual((client.currentStep, client.count_bacteria(), client.count_predators()), (0, 4, 0))
+        self.assertEqual(client.count_bacteria_at(HexCoords(1,1)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
 import unittest
+import importlib.util
 import os
+import pickle
+import tempfile
 
 from app.state_generator import generate_state
-from app.state import BacterioState, save_state, load_state
-from app.hexafield import CircleHexafield
+from app.state import BacterioState, PackedBacterioState, save_state, load_state, pack_state, unpack_state, MAGIC
+from app.hexafield import CircleHexafield, HexagonHexafield, RectangleHexafield, TorusHexafield, HexCoords, count_cells_within
+from app.creatures import Bacteria, Predator
+from app.engines import MODELS, get_model_class, create_model
+from app.config import default_engine_params
+from app.model_params import default_model_params
 
 def calculate_occupied_cells(state):
     return len(state.bacteriaPositions)+len(state.predatorPositions)
@@ -15,9 +22,6 @@ def calculate_predator(state):
     return len(state.predatorPositions)
 
 
-BACTERIO_OPTIONAL_TESTS = int(os.getenv('BACTERIO_OPTIONAL_TESTS', '0'))
-
-
 class TestGenerateState(unittest.TestCase):
     
     def test_empty(self):
@@ -45,14 +49,106 @@ class TestGenerateState(unittest.TestCase):
         self.assertEqual(calculate_predator(state),0)
 
 
-@unittest.skipUnless(BACTERIO_OPTIONAL_TESTS, "Not designed to be a regular test - creates tmp file")
-class TestStatePickling(unittest.TestCase):
-    def test(self):
-        state = BacterioState(CircleHexafield(3), {(1,1):1}, {(2,2):2, (3,3):3})
-        tmpFile = 'saved_states/test_state_pickling.bsf'
-        save_state(state, tmpFile)
-        state1 = load_state(tmpFile)
-        self.assertEqual(state.field._field,state1.field._field)
-        self.assertEqual(state.bacteriaPositions,state1.bacteriaPositions)
-        self.assertEqual(state.predatorPositions,state1.predatorPositions)
-        os.remove(tmpFile)
+class TestStateFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpDir.name, 'state.bsf')
+        self.state = BacterioState(CircleHexafield(3),
+            { HexCoords(1,1):[Bacteria()], HexCoords(0,0):[Bacteria() for i in range(300)] },
+            { HexCoords(2,-1):[Predator(20), Predator(-5)], HexCoords(-3,0):[Predator(100000)] })
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def assertSameState(self, state, state1):
+        self.assertEqual(state.field._field, state1.field._field)
+        self.assertEqual({ hc:len(v) for hc, v in state.bacteriaPositions.items() },
+                         { hc:len(v) for hc, v in state1.bacteriaPositions.items() })
+        self.assertEqual({ hc:[pr.energy for pr in v] for hc, v in state.predatorPositions.items() },
+                         { hc:[pr.energy for pr in v] for hc, v in state1.predatorPositions.items() })
+
+    def test_binary(self):
+        for compression in (None, 'zlib', 'lzma', 'bz2'):
+            save_state(self.state, self.fileName, compression)
+            with open(self.fileName, 'rb') as f:
+                self.assertEqual(f.read(4), MAGIC)
+            for useMmap in (True, False):
+                state1 = load_state(self.fileName, useMmap)
+                self.assertIsInstance(state1, PackedBacterioState)
+                self.assertSameState(self.state, state1)
+                self.assertEqual(state1.get_bacteria_counts(), {HexCoords(1,1):1, HexCoords(0,0):300})
+
+    def test_packed_roundtrip(self):
+        save_state(self.state, self.fileName)
+        state1 = load_state(self.fileName)
+        self.assertEqual(list(state1.bacteria), list(pack_state(self.state).bacteria))
+        save_state(state1, self.fileName, 'zlib')
+        self.assertSameState(self.state, load_state(self.fileName))
+
+    def test_empty(self):
+        state = BacterioState(CircleHexafield(0), dict(), dict())
+        save_state(state, self.fileName)
+        self.assertSameState(state, load_state(self.fileName))
+
+    def test_field_shapes(self):
+        for field in (HexagonHexafield(3), RectangleHexafield(6, 4), TorusHexafield(6, 4)):
+            state = BacterioState(field, { HexCoords(1,-1):[Bacteria()] }, { HexCoords(-2,1):[Predator(50)] })
+            save_state(state, self.fileName)
+            state1 = load_state(self.fileName)
+            self.assertIs(type(state1.field), type(field))
+            self.assertEqual(state1.field.get_params(), field.get_params())
+            self.assertEqual(state1.get_bacteria_counts(), {HexCoords(1,-1):1})
+            self.assertEqual(list(state1.predatorEnergies), [50])
+        self.assertRaises(ValueError, save_state, BacterioState(RectangleHexafield(40000, 1), dict(), dict()), self.fileName)
+
+    def test_errors(self):
+        save_state(self.state, self.fileName)
+        with open(self.fileName, 'rb') as f:
+            data = f.read()
+        self.assertRaises(ValueError, unpack_state, data[:-3])
+        self.assertRaises(ValueError, unpack_state, data[:10])
+        self.assertRaises(ValueError, unpack_state, data[:4]+bytes((99,0))+data[6:])
+        self.assertRaises(ValueError, save_state, self.state, self.fileName, 'zip')
+
+    def test_legacy(self):
+        with open(self.fileName, 'wb') as f:
+            pickle.dump(self.state, f)
+        state1 = load_state(self.fileName)
+        self.assertIsInstance(state1, BacterioState)
+        self.assertSameState(self.state, state1)
+
+    def test_legacy_modules(self):
+        # saved before modules were moved to 'app' package
+        state = load_state('saved_states/blank_r15.bsf')
+        self.assertEqual(len(state.field._field), count_cells_within(15))
+        self.assertEqual(len(state.bacteriaPositions), 0)
+        self.assertEqual(state.field.get_neighbours(HexCoords(0,0)), CircleHexafield(15).get_neighbours(HexCoords(0,0)))
+        self.assertEqual(state.field.get_params(), (15,))
+        self.assertEqual(state.field.get_columns(), CircleHexafield(15).get_columns())
+        # models build cell index and column geometry (see hexdisc.HexDiscSums) of the legacy field
+        engines = ['core', 'dense_core']
+        if importlib.util.find_spec('numpy') is not None:
+            engines.append('vector_core')
+        for name in engines:
+            model = create_model(default_engine_params()._replace(model=name), default_model_params(),
+                load_state('saved_states/blank_r15.bsf'))
+            for x in range(-15, 16, 3):
+                model.add_bacteria(HexCoords(x,0))
+            model.add_predator(HexCoords(0,15))
+            model.step()
+            packed = pack_state(model.get_state())
+            self.assertEqual(sum(packed.bacteria), model.count_bacteria())
+            self.assertEqual(sum(packed.predatorCounts), model.count_predators())
+            self.assertGreater(model.count_bacteria(), 0)
+
+    def test_models(self):
+        save_state(self.state, self.fileName)
+        for name in sorted(MODELS):
+            if name.startswith('vector') and importlib.util.find_spec('numpy') is None:
+                continue
+            model = get_model_class(name)(default_model_params(), load_state(self.fileName))
+            self.assertEqual(model.count_bacteria(), 301)
+            self.assertEqual(model.count_predators(), 3)
+            self.assertEqual(model.get_predator_energies(HexCoords(2,-1)), [20, -5])
+            self.assertSameState(self.state, model.get_state())
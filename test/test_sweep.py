@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+from app.sweep import parse_value, parse_grid_option, iter_grid, load_cases, derive_seed, iter_tasks, \
+    run_task, run_sweep, read_done_runs, describe_sweep, RESULT_COLUMNS
+from app.config import Rules, FieldParams, default_engine_params
+from app.model_params import default_model_params
+
+
+def make_rules():
+    return Rules(FieldParams(None, 4, 10, 2, 'circle', 0, 0, None, 1, None), default_model_params(), default_engine_params())
+
+
+class TestSweepCases(unittest.TestCase):
+
+    def test_parse_value(self):
+        self.assertEqual(parse_value('P_BACT_DIVIDE', '0.25'), Decimal('0.25'))
+        self.assertEqual(parse_value('PR_SIGHT', '3'), 3)
+        self.assertRaises(ValueError, parse_value, 'NO_SUCH_PARAM', '1')
+        self.assertRaises(ValueError, parse_value, 'PR_SIGHT', '0.5')
+
+    def test_parse_grid_option(self):
+        self.assertEqual(parse_grid_option('PR_SIGHT=3, 4'), ('PR_SIGHT', [3, 4]))
+        self.assertRaises(ValueError, parse_grid_option, 'PR_SIGHT')
+
+    def test_iter_grid(self):
+        cases = list(iter_grid([('PR_SIGHT', [3, 4]), ('PR_FEED_VALUE', [10, 20, 30])]))
+        self.assertEqual(len(cases), 6)
+        self.assertEqual(cases[0], (('PR_SIGHT', 3), ('PR_FEED_VALUE', 10)))
+        self.assertEqual(cases[1], (('PR_SIGHT', 3), ('PR_FEED_VALUE', 20)))
+        self.assertEqual(list(iter_grid([])), [()])
+
+    def test_load_cases(self):
+        with tempfile.TemporaryDirectory() as dirName:
+            fileName = os.path.join(dirName, 'cases.txt')
+            with open(fileName, 'w') as f:
+                f.write('; comment\nPR_SIGHT=3 P_BACT_DIVIDE=0.5\n\nPR_SIGHT=5\n')
+            self.assertEqual(load_cases(fileName),
+                [(('PR_SIGHT', 3), ('P_BACT_DIVIDE', Decimal('0.5'))), (('PR_SIGHT', 5),)])
+
+    def test_iter_tasks(self):
+        cases = [(('PR_SIGHT', 3),), (('PR_SIGHT', 5),)]
+        tasks = list(iter_tasks(make_rules(), cases, 3, 7, 10, skip={1, 4}))
+        self.assertEqual([t.runId for t in tasks], [0, 2, 3, 5])
+        self.assertEqual([t.rules.modelParams.PR_SIGHT for t in tasks], [3, 3, 5, 5])
+        self.assertEqual(len(set(t.seed for t in tasks)), 4)
+        self.assertEqual(tasks[0].seed, derive_seed(7, 0))
+        self.assertNotEqual(derive_seed(7, 0), derive_seed(8, 0))
+
+
+class TestSweepRuns(unittest.TestCase):
+
+    def test_run_task_is_reproducible(self):
+        task = next(iter_tasks(make_rules(), [()], 1, 0, 20))
+        first = run_task(task)
+        second = run_task(task)
+        self.assertEqual(len(first), len(RESULT_COLUMNS))
+        self.assertEqual(first[:-1], second[:-1])
+
+    def test_sweep_resume(self):
+        cases = [(('PR_SIGHT', 3),), (('PR_SIGHT', 5),)]
+        with tempfile.TemporaryDirectory() as dirName:
+            fileName = os.path.join(dirName, 'sweep.tsv')
+            self.assertEqual(run_sweep(iter_tasks(make_rules(), cases, 2, 0, 10), fileName, ['PR_SIGHT'], workers=2), 4)
+            with open(fileName) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[0].split('\t')[:3], ['runId', 'seed', 'PR_SIGHT'])
+            # simulate sweep killed while writing the last row
+            with open(fileName, 'w') as f:
+                f.write('\n'.join(lines[:3])+'\n'+lines[3][:5])
+            done = read_done_runs(fileName)
+            self.assertEqual(len(done), 2)
+            self.assertEqual(run_sweep(iter_tasks(make_rules(), cases, 2, 0, 10, done), fileName, ['PR_SIGHT'], workers=2), 2)
+            with open(fileName) as f:
+                rows = [line.split('\t') for line in f.read().splitlines()[1:]]
+            self.assertEqual(sorted(int(row[0]) for row in rows), [0, 1, 2, 3])
+            self.assertTrue(all(len(row)==len(lines[0].split('\t')) for row in rows))
+
+    def test_resume_checks_settings(self):
+        rules = make_rules()
+        cases = [(('PR_SIGHT', 3),), (('PR_SIGHT', 5),)]
+        description = describe_sweep(rules, cases, 1, 0, 10)
+        self.assertTrue(description.startswith('# cases=2 seeds=1 base-seed=0 steps=10 digest='))
+        with tempfile.TemporaryDirectory() as dirName:
+            fileName = os.path.join(dirName, 'sweep.tsv')
+            run_sweep(iter_tasks(rules, cases, 1, 0, 10), fileName, ['PR_SIGHT'], workers=1, description=description)
+            with open(fileName) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[0]+'\n', description)
+            self.assertEqual(lines[1].split('\t')[:3], ['runId', 'seed', 'PR_SIGHT'])
+            self.assertEqual(read_done_runs(fileName, description), {0, 1})
+            for other in (describe_sweep(rules, cases, 2, 0, 10), describe_sweep(rules, cases, 1, 1, 10),
+                    describe_sweep(rules, cases[:1]+[(('PR_SIGHT', 4),)], 1, 0, 10),
+                    describe_sweep(rules._replace(modelParams=rules.modelParams._replace(PR_FEED_VALUE=1)), cases, 1, 0, 10)):
+                self.assertNotEqual(other, description)
+                self.assertRaises(ValueError, read_done_runs, fileName, other)
+            with open(fileName) as f:
+                self.assertEqual(f.read().splitlines(), lines)
+            # table without settings line could not be resumed either
+            with open(fileName, 'w') as f:
+                f.write('\n'.join(lines[1:])+'\n')
+            self.assertRaises(ValueError, read_done_runs, fileName, description)
+            self.assertEqual(read_done_runs(fileName), {0, 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
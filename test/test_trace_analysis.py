@@ -0,0 +1,149 @@
+import io
+import math
+import os
+import tempfile
+import unittest
+
+from app.trace_analysis import RunningMoments, OscillationDetector, TraceAnalyzer, analyze_traces, main, \
+    SUMMARY_COLUMNS, WINDOW_COLUMNS
+from app.tracewriter import TraceReader, create_trace_writer
+from app.config import default_rules
+
+
+def make_rows(steps, period=200, lag=50, extinctAt=None):
+    rows = []
+    for step in range(steps):
+        numBacteria = round(1000+500*math.sin(2*math.pi*step/period))
+        numPredators = round(300+100*math.sin(2*math.pi*(step-lag)/period))
+        if extinctAt is not None and step>=extinctAt:
+            numPredators = 0
+        rows.append((step, numBacteria, numPredators))
+    return rows
+
+
+class TestStatistics(unittest.TestCase):
+
+    def test_moments(self):
+        moments = RunningMoments()
+        self.assertEqual(moments.variance(), 0)
+        for value in (2, 4, 4, 4, 5, 5, 7, 9):
+            moments.push(value)
+        self.assertEqual((moments.count, moments.mean), (8, 5))
+        self.assertAlmostEqual(moments.variance(), 4)
+
+    def test_oscillations(self):
+        detector = OscillationDetector(1000, 0.05)
+        crossings = [step for step, numBacteria, numPredators in make_rows(2000) if detector.push(step, numBacteria)]
+        # trace starts at the average, so the first upward crossing is after a full period
+        self.assertEqual(len(crossings), 9)
+        self.assertEqual(detector.numCycles, 8)
+        self.assertAlmostEqual(detector.period(), 200, delta=1)
+        self.assertAlmostEqual(detector.amplitude(), 500, delta=1)
+
+    def test_noise(self):
+        # small noise around constant value is not an oscillation
+        detector = OscillationDetector(100, 0.05)
+        for step in range(1000):
+            detector.push(step, 1000+(step%2)*20)
+        self.assertEqual(detector.numCycles, 0)
+        self.assertEqual(detector.period(), None)
+
+
+class TestTraceAnalyzer(unittest.TestCase):
+
+    def analyze(self, rows, **kwargs):
+        analyzer = TraceAnalyzer(**kwargs)
+        for row in rows:
+            analyzer.push(*row)
+        return analyzer
+
+    def test_summary(self):
+        summary = self.analyze(make_rows(2000)).get_summary('a')
+        self.assertEqual(summary[:4], ('a', 2000, 0, 1999))
+        self.assertAlmostEqual(summary.meanBacteria, 1000, delta=1)
+        self.assertAlmostEqual(summary.varBacteria, 500**2/2, delta=500)
+        self.assertAlmostEqual(summary.meanPredators, 300, delta=1)
+        self.assertEqual((summary.bacteriaExtinct, summary.predatorsExtinct), (None, None))
+        self.assertAlmostEqual(summary.bacteriaPeriod, 200, delta=1)
+        self.assertAlmostEqual(summary.predatorPeriod, 200, delta=1)
+        self.assertAlmostEqual(summary.predatorAmplitude, 100, delta=1)
+        self.assertAlmostEqual(summary.phaseLag, 50, delta=2)
+
+    def test_extinction_and_skip(self):
+        summary = self.analyze(make_rows(1000, extinctAt=700), skip=100).get_summary('b')
+        self.assertEqual((summary.rows, summary.firstStep), (900, 100))
+        self.assertEqual((summary.bacteriaExtinct, summary.predatorsExtinct), (None, 700))
+        self.assertEqual(self.analyze(make_rows(1000, extinctAt=50), skip=100).get_summary('c').predatorsExtinct, 50)
+
+    def test_windows(self):
+        analyzer = self.analyze(make_rows(1050), window=200, keepWindows=True)
+        windows = analyzer.pop_windows()
+        self.assertEqual([(w.firstStep, w.lastStep, w.rows) for w in windows], [(i, i+199, 200) for i in range(0, 1000, 200)])
+        for w in windows:
+            self.assertAlmostEqual(w.meanBacteria, 1000, delta=1)
+            self.assertAlmostEqual(w.varPredators, 100**2/2, delta=100)
+        self.assertEqual(analyzer.pop_windows(), [])
+        self.assertEqual([(w.firstStep, w.lastStep, w.rows) for w in analyzer.pop_windows(final=True)], [(1000, 1049, 50)])
+        self.assertEqual(self.analyze(make_rows(10)).pop_windows(final=True), [])
+        self.assertRaises(ValueError, TraceAnalyzer, 0)
+
+
+class TestTraceFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpDir.cleanup)
+
+    def write_trace(self, name, traceFormat, rows):
+        with create_trace_writer(default_rules(), os.path.join(self.tmpDir.name, name), traceFormat) as writer:
+            for row in rows:
+                writer.write(*row)
+        return writer.fileName
+
+    def test_reader(self):
+        rows = make_rows(70000)
+        for traceFormat in ('btf', 'btc'):
+            with TraceReader(self.write_trace(traceFormat, traceFormat, rows)) as reader:
+                self.assertEqual(reader.columnar, traceFormat=='btc')
+                self.assertEqual(reader.columns[:3], ['Step', 'Bacteria', 'Predators'])
+                self.assertTrue(reader.text.startswith(repr(default_rules().fieldParams)))
+                chunks = list(reader.iter_chunks())
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual([row for chunk in chunks for row in zip(*chunk)], rows)
+
+    def test_analyze_traces(self):
+        fileNames = [self.write_trace('a', 'btf', make_rows(3000)), self.write_trace('b', 'btc', make_rows(3000, extinctAt=2500)),
+            self.write_trace('c', 'btf', make_rows(3000, period=300, lag=100))]
+        windowsOut = io.StringIO()
+        summaries = list(analyze_traces(fileNames, window=500, windowsOut=windowsOut, workers=2))
+        self.assertEqual([summary.trace for summary in summaries], fileNames)
+        windowsOut1 = io.StringIO()
+        self.assertEqual(list(analyze_traces(fileNames, window=500, windowsOut=windowsOut1, workers=1)), summaries)
+        self.assertEqual(list(analyze_traces(fileNames, window=500, workers=2)), summaries)
+        self.assertEqual([s.predatorsExtinct for s in summaries], [None, 2500, None])
+        self.assertAlmostEqual(summaries[2].bacteriaPeriod, 300, delta=1)
+        self.assertAlmostEqual(summaries[2].phaseLag, 100, delta=2)
+        self.assertEqual(windowsOut1.getvalue(), windowsOut.getvalue())
+        rows = [ line.split('\t') for line in windowsOut.getvalue().splitlines() ]
+        self.assertEqual([row[0] for row in rows], [name for name in fileNames for i in range(6)])
+        self.assertEqual(rows[6][1:4], ['0', '499', '500'])
+
+    def test_main(self):
+        fileName = self.write_trace('a', 'btc', make_rows(1000))
+        out = os.path.join(self.tmpDir.name, 'summary.tsv')
+        windowsOut = os.path.join(self.tmpDir.name, 'windows.tsv')
+        self.assertEqual(main([fileName, '--window', '300', '--out', out, '--windows', windowsOut, '--workers', '1']), 0)
+        with open(out) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0].split('\t'), list(SUMMARY_COLUMNS))
+        row = lines[1].split('\t')
+        self.assertEqual(row[:4], [fileName, '1000', '0', '999'])
+        self.assertEqual(row[SUMMARY_COLUMNS.index('bacteriaExtinct')], '')
+        with open(windowsOut) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0].split('\t'), list(WINDOW_COLUMNS))
+        self.assertEqual(len(lines), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
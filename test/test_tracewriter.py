@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from app.tracewriter import Decimator, TraceWriter, ColumnarTraceWriter, create_trace_writer, \
+    read_columnar_trace, export_btf
+from app.config import default_rules
+
+
+class TestDecimator(unittest.TestCase):
+
+    def push_all(self, decimator, rows):
+        res = []
+        for row in rows:
+            res.extend(decimator.push(row))
+        return res+decimator.flush()
+
+    def test_every(self):
+        rows = [(i, i, 0) for i in range(10)]
+        self.assertEqual(self.push_all(Decimator(), rows), rows)
+        self.assertEqual([row[0] for row in self.push_all(Decimator(3), rows)], [0, 3, 6, 9])
+        self.assertEqual([row[0] for row in self.push_all(Decimator(4), rows)], [0, 4, 8, 9])
+        self.assertRaises(ValueError, Decimator, 0)
+
+    def test_min_max(self):
+        bacteria = [5, 7, 1, 3,  2, 2, 2, 2,  9, 0]
+        predators = [1, 1, 1, 4,  0, 5, 1, 1,  1, 1]
+        rows = [(i, b, p) for i, (b, p) in enumerate(zip(bacteria, predators))]
+        res = self.push_all(Decimator(4, True), rows)
+        self.assertEqual([row[0] for row in res], [0, 1, 2, 3,  4, 5,  8, 9])
+
+
+class TestTraceWriters(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.prefix = os.path.join(self.tmpDir.name, 'trace')
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def read(self, fileName):
+        with open(fileName) as f:
+            return f.read()
+
+    def test_text(self):
+        with TraceWriter(default_rules(), self.prefix) as writer:
+            writer.write(0, 10, 2)
+            writer.flush()
+            self.assertTrue(self.read(writer.fileName).endswith('\nStep\tBacteria\tPredators\n0\t10\t2\n'))
+            writer.write(1, 12, 1)
+        writer.close()
+        lines = self.read(writer.fileName).splitlines()
+        self.assertEqual(lines[0], repr(default_rules().fieldParams))
+        self.assertEqual(lines[1], repr(default_rules().modelParams))
+        self.assertEqual(lines[2:], ['', 'Step\tBacteria\tPredators', '0\t10\t2', '1\t12\t1'])
+
+    def test_columnar_export(self):
+        rows = [(i, 100+i, i%7, i/4) for i in range(100001)]
+        text = create_trace_writer(default_rules(), self.prefix, 'btf', [('Energy', 'd')], every=3)
+        binary = create_trace_writer(default_rules(), self.prefix, 'btc', [('Energy', 'd')], every=3)
+        self.assertIsInstance(binary, ColumnarTraceWriter)
+        for row in rows:
+            text.write(*row)
+            binary.write(*row)
+        text.close()
+        binary.close()
+        binary.close()
+        trace = read_columnar_trace(binary.fileName)
+        self.assertEqual(trace.columns, ['Step', 'Bacteria', 'Predators', 'Energy'])
+        self.assertEqual(list(trace.data['Step']), list(range(0, 100001, 3))+[100000])
+        self.assertEqual(trace.data['Energy'][-1], 100000/4)
+        btfFileName = os.path.join(self.tmpDir.name, 'exported.btf')
+        export_btf(binary.fileName, btfFileName)
+        self.assertEqual(self.read(btfFileName), self.read(text.fileName))
+
+    def test_incomplete_chunk(self):
+        writer = ColumnarTraceWriter(default_rules(), self.prefix)
+        for i in range(5):
+            writer.write(i, i, i)
+        writer.flush()
+        writer.write(5, 5, 5)
+        writer.close()
+        with open(writer.fileName, 'rb') as f:
+            data = f.read()
+        with open(writer.fileName, 'wb') as f:
+            f.write(data[:-5])
+        self.assertEqual(list(read_columnar_trace(writer.fileName).data['Step']), [0, 1, 2, 3, 4])
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, create_trace_writer, default_rules(), self.prefix, 'csv')
+
+
+if __name__ == '__main__':
+    unittest.main()